@@ -0,0 +1,19 @@
+"""
+Benchmarks for SWAIF-MSG
+========================
+
+- synthetic.py: Synthetic WhatsApp traffic written straight into messages_l1
+- bench_l2_rebuild.py: Full L2 rebuild at 10M messages
+- bench_l2_memory.py: Bytes per pending message in the L2 grouping loop
+- bench_read_contention.py: Ingestion latency under dashboard load
+- bench_sla_sketch.py: Response-time percentiles, sketches vs. exact
+- bench_priority.py: Fresh-message latency while draining a backlog
+- bench_classifier.py: Keyword classifier throughput, automaton vs. per-keyword regex
+- bench_faq.py: FAQ clustering throughput, purity and match latency
+- bench_media.py: Inline base64 media vs. the content-addressed blob store
+- bench_content_store.py: Database size and history reads, plain vs. compressed text
+- bench_outbox.py: Following L2 changes, table diffing vs. outbox offsets
+- bench_batching.py: Fixed batch sizes vs. the AIMD controller over a traffic peak
+- soak.py: Crash-recovery soak run with SIGKILLs and injected faults
+- bench_writer_daemon.py: Concurrent writer processes, direct SQLite vs. the writer daemon
+"""
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: lote fixo vs. controlador AIMD ao longo de um "dia"
+
+    python -m depths.benchmarks.bench_batching --peak-messages 20000
+
+Tráfego sintético em três fases - vale, pico e vale - gravado com
+`SwaifDatabase.insert_l1_batch`. O relógio das chegadas é virtual (não
+espera de verdade), mas cada commit é real e seu tempo medido avança o
+relógio. Compara um lote pequeno fixo, um lote grande com varredura lenta
+e o `BatchController`: commits, tempo gravando, latência p50/p99 da
+chegada até o commit e o tempo para drenar o pico.
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from depths.core.batching import BatchController
+from depths.core.database import SwaifDatabase
+from depths.core.sketches import DDSketch
+
+logger = logging.getLogger(__name__)
+
+
+def arrivals(quiet_seconds: float, quiet_rate: float, peak_messages: int,
+             peak_seconds: float, seed: int = 5) -> List[float]:
+    """Instantes de chegada (s): vale, pico, vale"""
+    rng = random.Random(seed)
+    times, t = [], 0.0
+    for rate, until in ((quiet_rate, quiet_seconds),
+                        (peak_messages / peak_seconds, quiet_seconds + peak_seconds),
+                        (quiet_rate, 2 * quiet_seconds + peak_seconds)):
+        while True:
+            t += rng.expovariate(rate)
+            if t > until:
+                t = until
+                break
+            times.append(t)
+    return times
+
+
+def _message(i: int) -> Dict:
+    return {
+        "host_n8n": "bench", "evo_api_instance_name": "bench", "host_evoapi": "bench",
+        "sender_raw_data": f"55{11000000000 + i % 3000}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": f"mensagem {i}",
+        "timestamp": f"2025-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}Z",
+    }
+
+
+def simulate(times: List[float], batch_size: int = 0, interval: float = 0.0,
+             controller: Optional[BatchController] = None) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        queue = deque()
+        latency = DDSketch()
+        clock, nxt, commits, writing = 0.0, 0, 0, 0.0
+        peak_drained = 0.0
+        while nxt < len(times) or queue:
+            while nxt < len(times) and times[nxt] <= clock:
+                queue.append((times[nxt], nxt))
+                nxt += 1
+            if not queue:
+                clock += controller.interval if controller else interval
+                continue
+            size = controller.batch_size if controller else batch_size
+            batch = [queue.popleft() for _ in range(min(size, len(queue)))]
+            started = time.perf_counter()
+            db.insert_l1_batch([_message(i) for _, i in batch])
+            elapsed = time.perf_counter() - started
+            clock += elapsed
+            writing += elapsed
+            commits += 1
+            for arrived, _ in batch:
+                latency.add(clock - arrived)
+            if controller:
+                controller.observe(len(batch), elapsed, len(queue),
+                                   oldest_wait=clock - elapsed - batch[0][0])
+            if len(queue) > 1000:
+                peak_drained = clock
+            if not queue:
+                clock += controller.interval if controller else interval
+    return {
+        "commits": commits,
+        "writing": writing,
+        "p50": latency.quantile(0.5),
+        "p99": latency.quantile(0.99),
+        "max": latency.max,
+        "drained_at": peak_drained,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixed batches vs. the AIMD batch controller")
+    parser.add_argument("--quiet-seconds", type=float, default=300)
+    parser.add_argument("--quiet-rate", type=float, default=2.0, help="msg/s off-peak")
+    parser.add_argument("--peak-messages", type=int, default=20_000)
+    parser.add_argument("--peak-seconds", type=float, default=2)
+    parser.add_argument("--target", type=float, default=2.0, help="Target latency (s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    logging.getLogger("depths").setLevel(logging.WARNING)
+
+    times = arrivals(args.quiet_seconds, args.quiet_rate, args.peak_messages, args.peak_seconds)
+    peak_end = args.quiet_seconds + args.peak_seconds
+    controller = BatchController(target_latency=args.target)
+    policies = {
+        "fixed 20 / 0.1s": dict(batch_size=20, interval=0.1),
+        "fixed 5000 / 5s": dict(batch_size=5000, interval=5.0),
+        "AIMD": dict(controller=controller),
+    }
+    logger.info(f"📈 {len(times)} messages: {args.peak_messages} in a {args.peak_seconds:.0f}s "
+                f"peak between {args.quiet_seconds:.0f}s valleys at {args.quiet_rate} msg/s")
+    for name, policy in policies.items():
+        r = simulate(times, **policy)
+        logger.info(
+            f"{name:>16}: {r['commits']:>5} commits, {r['writing']:.1f}s writing, latency "
+            f"p50 {r['p50']:.2f}s / p99 {r['p99']:.2f}s / max {r['max']:.1f}s, "
+            f"peak drained {max(r['drained_at'] - peak_end, 0):.1f}s after it ended"
+        )
+    stats = controller.stats()
+    logger.info(f"🎛️ AIMD decisions {stats['actions']}, final batch {stats['batch_size']}, "
+                f"commit p99 {stats['commit_p99'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
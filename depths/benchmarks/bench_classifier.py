@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: classificador por dicionário em milhões de mensagens
+
+    python -m depths.benchmarks.bench_classifier --messages 1000000
+
+Compara o autômato (`KeywordAutomaton`, uma passada por mensagem) com o
+laço ingênuo de uma regex por palavra-chave, e mede o estágio completo
+(`MessageClassifier.run`: leitura do histórico + gravação das tags).
+"""
+
+import argparse
+import logging
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set
+
+from depths.core.database import SwaifDatabase
+from depths.core.keywords import KeywordAutomaton, fold
+from depths.layers.l2_classifier import DEFAULT_RULES, MessageClassifier
+
+logger = logging.getLogger(__name__)
+
+FILLER = (
+    "oi", "bom", "dia", "tudo", "bem", "queria", "saber", "se", "a", "doutora", "pode",
+    "me", "ajudar", "com", "isso", "por", "favor", "obrigada", "amanhã", "semana",
+    "que", "vem", "minha", "filha", "ontem", "à", "tarde", "está", "certo", "até", "logo",
+)
+
+
+def synthetic_texts(count: int, seed: int = 7) -> Iterator[str]:
+    """Mensagens curtas em português; ~1/3 com alguma palavra do dicionário"""
+    rng = random.Random(seed)
+    phrases = [phrase for values in DEFAULT_RULES.values() for phrase in values]
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(4, 16))]
+        if rng.random() < 0.35:
+            phrase = rng.choice(phrases)
+            words.insert(rng.randrange(len(words)), phrase.upper() if rng.random() < 0.1 else phrase)
+        yield " ".join(words).capitalize()
+
+
+def naive_classifier(rules: Dict[str, Iterable[str]]):
+    """Uma regex por palavra-chave, testadas uma a uma em cada mensagem"""
+    patterns = [
+        (tag, re.compile(r"\b" + re.escape(fold(phrase)) + r"\b"))
+        for tag, phrases in rules.items() for phrase in phrases
+    ]
+
+    def tags(text: str) -> Set[str]:
+        folded = fold(text)
+        return {tag for tag, pattern in patterns if pattern.search(folded)}
+    return tags
+
+
+def throughput(classify, texts: List[str]) -> float:
+    started = time.perf_counter()
+    for text in texts:
+        classify(text)
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword classifier throughput")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--naive-sample", type=int, default=200_000,
+                        help="Messages run through the per-keyword loop")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    texts = list(synthetic_texts(args.messages))
+    automaton = KeywordAutomaton(DEFAULT_RULES)
+    naive = naive_classifier(DEFAULT_RULES)
+
+    sample = texts[:args.naive_sample]
+    assert all(automaton.tags(t) == naive(t) for t in sample[:20000])
+    naive_rate = throughput(naive, sample)
+    automaton_rate = throughput(automaton.tags, texts)
+    logger.info(
+        f"🔤 {len(automaton)} dictionary nodes: per-keyword regex {naive_rate:,.0f} msg/s, "
+        f"automaton {automaton_rate:,.0f} msg/s ({automaton_rate / naive_rate:.1f}x)"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        with sqlite3.connect(db.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO conversation_messages (conversation_id, sender_type, content) "
+                "VALUES ('bench', 'lead', ?)",
+                ((text,) for text in texts),
+            )
+        started = time.perf_counter()
+        counts = MessageClassifier(db).run()
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"🏷️ Stage: {len(texts)} messages, {sum(counts.values())} tags in {elapsed:.1f}s "
+            f"({len(texts) / elapsed:,.0f} msg/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark: texto das mensagens em texto puro vs. compactado
+
+    python -m depths.benchmarks.bench_content_store --messages 500000
+
+Gera tráfego sintético (perguntas de lead, mensagens livres e respostas
+curtas repetidas), agrupa a L2 com `L2Rebuilder` e mede, antes e depois
+de `ContentStore.compact`: tamanho do banco após VACUUM e latência de
+leitura de páginas do histórico (sem o cache LRU).
+"""
+
+import argparse
+import logging
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from depths.benchmarks.bench_classifier import synthetic_texts
+from depths.benchmarks.bench_faq import synthetic_questions
+from depths.benchmarks.synthetic import synthetic_messages
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_rebuild import L2Rebuilder
+
+logger = logging.getLogger(__name__)
+
+REPLIES = (
+    "ok", "Ok", "obrigada", "Obrigado!", "bom dia", "Bom dia!", "boa tarde", "sim", "👍",
+    "Olá! Aqui é da clínica, como posso ajudar?",
+    "Temos horário amanhã às 14h, posso confirmar?",
+    "O valor da consulta é R$ 350,00. Aceitamos pix e cartão.",
+    "Vou verificar com a doutora e já retorno.",
+)
+
+
+def traffic(count: int, seed: int = 5) -> Iterator[Tuple]:
+    """Linhas de messages_l1 (processadas) com texto realista"""
+    rng = random.Random(seed)
+    questions = synthetic_questions(count, seed=seed)
+    texts = synthetic_texts(count, seed=seed)
+    for row in synthetic_messages(count, seed=seed):
+        pick = rng.random()
+        if row[3] and pick < 0.4:
+            content = next(questions)[1]
+        elif pick < 0.75:
+            content = next(texts)
+        else:
+            content = rng.choice(REPLIES)
+        yield row[:6] + (content, row[7], True)
+
+
+def vacuumed_size(db_path: Path) -> int:
+    """Tamanho do banco sem páginas livres (VACUUM INTO uma cópia)"""
+    copy = db_path.with_suffix(".vacuum.db")
+    copy.unlink(missing_ok=True)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("VACUUM INTO ?", (str(copy),))
+    size = copy.stat().st_size
+    copy.unlink()
+    return size
+
+
+def read_latency(db: SwaifDatabase, conversations, page_size: int) -> Dict[str, float]:
+    """ms por página de histórico, com o cache desligado"""
+    samples = []
+    for conversation_id in conversations:
+        db.history_cache.clear()
+        started = time.perf_counter()
+        db.get_history_page(conversation_id, limit=page_size)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {"p50": samples[len(samples) // 2], "p99": samples[int(len(samples) * 0.99)]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message text storage: plain vs. compressed")
+    parser.add_argument("--messages", type=int, default=500_000)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        with sqlite3.connect(db.db_path) as conn:
+            conn.executemany(
+                """
+                INSERT INTO messages_l1
+                (n8n_host, evo_instance, evo_host, sender_phone, receiver_phone,
+                 message_type, content, timestamp, processed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                traffic(args.messages),
+            )
+        L2Rebuilder(db).rebuild()
+        with sqlite3.connect(db.db_path) as conn:
+            text_bytes = conn.execute(
+                "SELECT SUM(LENGTH(CAST(content AS BLOB))) FROM messages_l1"
+            ).fetchone()[0]
+            ids = [row[0] for row in conn.execute("SELECT conversation_id FROM conversations_l2")]
+        conversations = random.Random(3).choices(ids, k=args.reads)
+
+        plain_size = vacuumed_size(db.db_path)
+        plain_reads = read_latency(db, conversations, args.page_size)
+
+        started = time.perf_counter()
+        stats = db.contents.compact()
+        elapsed = time.perf_counter() - started
+        compact_size = vacuumed_size(db.db_path)
+        compact_reads = read_latency(db, conversations, args.page_size)
+
+        with sqlite3.connect(db.db_path) as conn:
+            bodies, body_bytes = conn.execute(
+                "SELECT COUNT(*), SUM(LENGTH(body)) FROM contents"
+            ).fetchone()
+
+    moved = stats["messages_l1"] + stats["conversation_messages"]
+    logger.info(
+        f"🗜️ {moved} message texts -> {bodies} bodies in {elapsed:.1f}s "
+        f"({moved / elapsed:,.0f} msg/s)"
+    )
+    logger.info(
+        f"   L1 text {text_bytes / 1e6:.1f} MB -> bodies {body_bytes / 1e6:.1f} MB "
+        f"(x{text_bytes / body_bytes:.1f}, and L2 no longer keeps a copy)"
+    )
+    logger.info(
+        f"💾 Database after VACUUM: {plain_size / 1e6:.1f} MB -> {compact_size / 1e6:.1f} MB "
+        f"({100 * (1 - compact_size / plain_size):.0f}% smaller)"
+    )
+    logger.info(
+        f"📖 History page ({args.page_size} msgs): p50 {plain_reads['p50']:.2f} -> "
+        f"{compact_reads['p50']:.2f} ms, p99 {plain_reads['p99']:.2f} -> "
+        f"{compact_reads['p99']:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: agrupamento de perguntas frequentes e busca por similaridade
+
+    python -m depths.benchmarks.bench_faq --messages 200000
+
+Gera perguntas de lead a partir de modelos (assunto x intenção) com
+saudações e ruído, agrupa com `FaqClusters` e mede a vazão do estágio, a
+pureza dos grupos e a latência de `match` (contra os líderes) e `similar`
+(contra todos os vetores de mensagens).
+"""
+
+import argparse
+import logging
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterator, Tuple
+
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_faq import FaqClusters
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS = (
+    "consulta", "retorno", "exame de sangue", "ultrassom", "raio x", "ressonância",
+    "limpeza de pele", "botox", "preenchimento", "vacina da gripe",
+)
+INTENTS = (
+    "qual o valor da {s}", "como faço para agendar {s}", "precisa de preparo para {s}",
+    "tem horário para {s} amanhã", "o convênio cobre {s}", "quanto tempo demora a {s}",
+)
+GREETINGS = ("", "oi", "olá", "bom dia", "boa tarde", "oi tudo bem")
+TAILS = ("", "?", " por favor", " obrigada", "??")
+
+
+def synthetic_questions(count: int, seed: int = 11) -> Iterator[Tuple[str, str]]:
+    """(modelo, texto) - o modelo é o grupo esperado"""
+    rng = random.Random(seed)
+    templates = [intent.format(s=subject) for subject in SUBJECTS for intent in INTENTS]
+    for _ in range(count):
+        template = rng.choice(templates)
+        text = f"{rng.choice(GREETINGS)} {template}{rng.choice(TAILS)}".strip()
+        yield template, text.capitalize() if rng.random() < 0.5 else text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ clustering and similarity search")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    questions = list(synthetic_questions(args.messages + args.queries))
+    history, queries = questions[:args.messages], questions[args.messages:]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        with sqlite3.connect(db.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO conversation_messages (conversation_id, sender_type, content) "
+                "VALUES ('bench', 'lead', ?)",
+                ((text,) for _, text in history),
+            )
+        faq = FaqClusters(db, threshold=args.threshold)
+        started = time.perf_counter()
+        stats = faq.run()
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"❓ {stats['messages']} messages -> {len(faq.leaders)} clusters in {elapsed:.1f}s "
+            f"({stats['messages'] / elapsed:,.0f} msg/s)"
+        )
+
+        # Pureza: fração das mensagens no modelo majoritário do seu grupo
+        with sqlite3.connect(db.db_path) as conn:
+            assigned = conn.execute(
+                "SELECT message_id, cluster_id FROM message_clusters ORDER BY message_id"
+            ).fetchall()
+        by_cluster = defaultdict(Counter)
+        for message_id, cluster_id in assigned:
+            by_cluster[cluster_id][history[message_id - 1][0]] += 1
+        purity = sum(c.most_common(1)[0][1] for c in by_cluster.values()) / len(assigned)
+        logger.info(f"🎯 Purity {purity * 100:.1f}% ({len(SUBJECTS) * len(INTENTS)} templates)")
+
+        texts = [text for _, text in queries]
+        started = time.perf_counter()
+        for text in texts:
+            faq.match([text])
+        single = (time.perf_counter() - started) / len(texts)
+        started = time.perf_counter()
+        faq.match(texts)
+        batch = time.perf_counter() - started
+        started = time.perf_counter()
+        for text in texts[:100]:
+            faq.similar(text, k=5)
+        similar = (time.perf_counter() - started) / 100
+        logger.info(
+            f"⏱️ match: {single * 1000:.2f} ms/message, batch of {len(texts)} in {batch * 1000:.1f} ms; "
+            f"similar (top-5 over {len(faq.messages)} vectors): {similar * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
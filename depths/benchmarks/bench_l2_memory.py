@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memória por mensagem pendente no laço de agrupamento da L2
+
+    python -m depths.benchmarks.bench_l2_memory --messages 1000000
+"""
+
+import argparse
+import gc
+import logging
+import sqlite3
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from depths.benchmarks.synthetic import populate
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import L2Grouper
+
+logger = logging.getLogger(__name__)
+
+
+def measure(load) -> int:
+    """Bytes retidos pelo resultado de `load()`"""
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="L2 pending-message memory benchmark")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        populate(db.db_path, args.messages)
+        grouper = L2Grouper(db)
+
+        def rows_as_dicts():
+            # Caminho anterior: SELECT * + dict(row) por mensagem
+            with sqlite3.connect(db.db_path) as conn:
+                conn.row_factory = sqlite3.Row
+                return [dict(row) for row in conn.execute(
+                    "SELECT * FROM messages_l1 WHERE processed = FALSE ORDER BY timestamp ASC"
+                )]
+
+        def pending_records():
+            with sqlite3.connect(db.db_path) as conn:
+                return grouper._fetch_pending(conn)
+
+        for label, load in (("dict(row)", rows_as_dicts), ("PendingMessage", pending_records)):
+            retained = measure(load)
+            logger.info(f"🧮 {label:>15}: {retained / args.messages:6.0f} bytes/message")
+
+
+if __name__ == "__main__":
+    main()
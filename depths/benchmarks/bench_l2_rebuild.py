@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark: reconstrução completa da L2 (--rebuild-l2)
+
+    python -m depths.benchmarks.bench_l2_rebuild --messages 10000000
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from depths.benchmarks.synthetic import populate
+from depths.core.database import SwaifDatabase
+from depths.core.maintenance import file_size
+from depths.layers.l2_rebuild import L2Rebuilder
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="L2 rebuild benchmark")
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--leads", type=int, default=None,
+                        help="Distinct leads (default: messages / 40)")
+    parser.add_argument("--db", default=None,
+                        help="Reuse/keep this database (default: temporary file)")
+    parser.add_argument("--tolerance-hours", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(args.db or str(Path(tmp) / "bench.db"))
+
+        started = time.perf_counter()
+        # Cenário típico: regra de agrupamento mudou sobre dados já processados
+        populate(db.db_path, args.messages, leads=args.leads, processed=True)
+        logger.info(f"📥 {args.messages} messages generated in {time.perf_counter() - started:.1f}s")
+
+        stats = L2Rebuilder(db, tolerance_hours=args.tolerance_hours).rebuild()
+        logger.info(
+            f"⏱️ rebuild {stats['seconds']:.1f}s "
+            f"({stats['messages'] / stats['seconds']:.0f} msg/s), "
+            f"swap {stats['swap_seconds'] * 1000:.1f} ms, "
+            f"{stats['conversations']} conversations / {stats['leads']} leads, "
+            f"db {file_size(db.db_path) / 1e6:.0f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark: mídia em base64 dentro de messages_l1 vs. arquivos por hash
+
+    python -m depths.benchmarks.bench_media --messages 20000 --media-share 0.05
+
+Ingere o mesmo tráfego duas vezes - com o base64 no `content` (como era) e
+via `SwaifDatabase.insert_l1_message` (arquivos em `media/`) - e mede o
+tamanho do banco, a varredura das mensagens pendentes (a leitura da L2) e
+o pico de memória Python ao ingerir um vídeo grande.
+"""
+
+import argparse
+import base64
+import logging
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Iterator
+
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import PENDING_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+SECRETARY = "5511998681314@s.whatsapp.net"
+
+
+def traffic(count: int, media_share: float, media_kb: int, seed: int = 9) -> Iterator[Dict]:
+    """Mensagens do N8N; uma fração é imagem/áudio com base64 inline"""
+    rng = random.Random(seed)
+    stickers = [base64.b64encode(rng.randbytes(30 * 1024)).decode() for _ in range(5)]
+    for i in range(count):
+        msg = {
+            "host_n8n": "bench", "evo_api_instance_name": "bench", "host_evoapi": "bench",
+            "sender_raw_data": f"55{11000000000 + i % 500}@s.whatsapp.net",
+            "receiver_raw_data": SECRETARY,
+            "message_type": "conversation",
+            "sent_message": f"mensagem {i}",
+            "timestamp": f"2025-01-01T00:00:{i % 60:02d}.{i:06d}Z",
+        }
+        roll = rng.random()
+        if roll < media_share / 2:
+            msg["message_type"] = "imageMessage"
+            size = int(rng.uniform(0.5, 1.5) * media_kb * 1024)
+            msg["sent_message"] = base64.b64encode(rng.randbytes(size)).decode()
+        elif roll < media_share:
+            # Figurinhas se repetem: um arquivo só no armazenamento por hash
+            msg["message_type"] = "stickerMessage"
+            msg["sent_message"] = rng.choice(stickers)
+        yield msg
+
+
+def scan_pending(db_path) -> float:
+    """A leitura de pendentes da L2 (mesmas colunas do `L2Grouper`)"""
+    started = time.perf_counter()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(PENDING_COLUMNS)} FROM messages_l1 "
+            "WHERE processed = FALSE ORDER BY timestamp ASC"
+        ).fetchall()
+    assert rows
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inline base64 media vs. blob store")
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--media-share", type=float, default=0.05)
+    parser.add_argument("--media-kb", type=int, default=200)
+    parser.add_argument("--video-mb", type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inline = SwaifDatabase(str(Path(tmp) / "inline" / "bench.db"))
+        with sqlite3.connect(inline.db_path) as conn:
+            conn.executemany(
+                "INSERT INTO messages_l1 (sender_phone, receiver_phone, message_type, content, timestamp) "
+                "VALUES (?, ?, ?, ?, ?)",
+                ((m["sender_raw_data"], m["receiver_raw_data"], m["message_type"],
+                  m["sent_message"], m["timestamp"])
+                 for m in traffic(args.messages, args.media_share, args.media_kb)),
+            )
+
+        blobs = SwaifDatabase(str(Path(tmp) / "blobs" / "bench.db"))
+        started = time.perf_counter()
+        for msg in traffic(args.messages, args.media_share, args.media_kb):
+            blobs.insert_l1_message(msg)
+        ingest = time.perf_counter() - started
+
+        inline_size = Path(inline.db_path).stat().st_size
+        blob_db = Path(blobs.db_path).stat().st_size
+        blob_files = sum(p.stat().st_size for p in blobs.media.root.rglob("*") if p.is_file())
+        with sqlite3.connect(blobs.db_path) as conn:
+            files = conn.execute("SELECT COUNT(*) FROM media_blobs").fetchone()[0]
+            refs = conn.execute(
+                "SELECT COUNT(*) FROM messages_l1 WHERE media_hash IS NOT NULL"
+            ).fetchone()[0]
+
+        inline_scan = min(scan_pending(inline.db_path) for _ in range(3))
+        blob_scan = min(scan_pending(blobs.db_path) for _ in range(3))
+
+        # Vídeo grande vindo de arquivo salvo pelo N8N: pico de memória da ingestão
+        video = Path(tmp) / "video.mp4"
+        with open(video, "wb") as f:
+            for _ in range(args.video_mb):
+                f.write(random.randbytes(1024 * 1024))
+        tracemalloc.start()
+        blobs.insert_l1_message({
+            "evo_api_instance_name": "bench", "sender_raw_data": "5511000@s.whatsapp.net",
+            "receiver_raw_data": SECRETARY, "message_type": "videoMessage",
+            "media_path": str(video), "media_mimetype": "video/mp4",
+            "timestamp": "2025-01-02T00:00:00Z",
+        })
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    logger.info(
+        f"💾 {args.messages} messages ({args.media_share:.0%} media): inline DB "
+        f"{inline_size / 1e6:.1f} MB -> DB {blob_db / 1e6:.1f} MB + {files} files "
+        f"({refs} refs) {blob_files / 1e6:.1f} MB"
+    )
+    logger.info(
+        f"🔎 Pending scan: inline {inline_scan * 1000:.1f} ms -> "
+        f"blobs {blob_scan * 1000:.1f} ms (x{inline_scan / blob_scan:.1f})"
+    )
+    logger.info(
+        f"📥 Ingestion {args.messages / ingest:,.0f} msg/s; {args.video_mb} MB video "
+        f"peak Python memory {peak / 1e6:.2f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: banco em arquivo vs. banco em memória compartilhada
+
+    python -m depths.benchmarks.bench_memory_mode --messages 20000 --leads 500
+
+Dois cenários, cada um rodado em um banco em arquivo (o antigo
+`:memory:` também criava um arquivo temporário) e em memória:
+
+- ingestão mensagem a mensagem + agrupamento L2 incremental (o que os
+  testes fazem);
+- experimento "e se": reagrupar um banco de produção com outra
+  `tolerance_hours` - cópia em arquivo (`online_backup`) vs. `SwaifDatabase.snapshot`.
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+
+from depths.benchmarks.synthetic import populate, synthetic_messages
+from depths.core.connection import MEMORY
+from depths.core.database import SwaifDatabase
+from depths.core.maintenance import online_backup
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+
+logger = logging.getLogger(__name__)
+
+
+def _as_l1(row):
+    _, _, _, sender, receiver, message_type, content, ts = row
+    return {
+        "host_n8n": "bench", "evo_api_instance_name": "bench", "host_evoapi": "bench",
+        "sender_raw_data": sender, "receiver_raw_data": receiver,
+        "message_type": message_type, "sent_message": content, "timestamp": ts,
+    }
+
+
+def _ingest_and_group(db_path, messages, every: int) -> float:
+    started = time.perf_counter()
+    db = SwaifDatabase(db_path)
+    grouper = L2Grouper(db)
+    for i, msg in enumerate(messages, 1):
+        db.insert_l1_message(msg)
+        if i % every == 0:
+            grouper.process_pending_messages()
+    grouper.process_pending_messages()
+    db.cleanup()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File vs. in-memory database")
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--leads", type=int, default=500)
+    parser.add_argument("--group-every", type=int, default=500,
+                        help="Messages ingested between L2 runs (default: 500)")
+    parser.add_argument("--replay-messages", type=int, default=1_000_000,
+                        help="Size of the database used for the what-if replay")
+    parser.add_argument("--tolerance-hours", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    logging.getLogger("depths").setLevel(logging.WARNING)
+
+    messages = [_as_l1(row) for row in synthetic_messages(args.messages, leads=args.leads)]
+    with tempfile.TemporaryDirectory() as tmp:
+        on_disk = _ingest_and_group(str(Path(tmp) / "ingest.db"), messages, args.group_every)
+    in_memory = _ingest_and_group(MEMORY, messages, args.group_every)
+    logger.info(f"📥 Ingest + group {args.messages} messages, L2 every {args.group_every}")
+    logger.info(f"   file:   {on_disk:.2f}s")
+    logger.info(f"   memory: {in_memory:.2f}s (x{on_disk / in_memory:.1f})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        production = SwaifDatabase(str(Path(tmp) / "production.db"))
+        populate(production.db_path, args.replay_messages, processed=True)
+        L2Rebuilder(production).rebuild()
+
+        started = time.perf_counter()
+        copy = Path(tmp) / "what_if.db"
+        online_backup(production.db_path, copy)
+        L2Rebuilder(SwaifDatabase(str(copy)), tolerance_hours=args.tolerance_hours).rebuild()
+        on_disk = time.perf_counter() - started
+
+        started = time.perf_counter()
+        experiment = SwaifDatabase.snapshot(production.db_path)
+        stats = L2Rebuilder(experiment, tolerance_hours=args.tolerance_hours).rebuild()
+        experiment.cleanup()
+        in_memory = time.perf_counter() - started
+
+    logger.info(
+        f"🧪 What-if regroup of {args.replay_messages} messages with "
+        f"{args.tolerance_hours}h tolerance ({stats['conversations']} conversations)"
+    )
+    logger.info(f"   file copy:       {on_disk:.2f}s")
+    logger.info(f"   memory snapshot: {in_memory:.2f}s (x{on_disk / in_memory:.1f})")
+
+
+if __name__ == "__main__":
+    main()
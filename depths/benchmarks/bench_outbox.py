@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: consumidor que varre conversations_l2 vs. outbox de mudanças
+
+    python -m depths.benchmarks.bench_outbox --leads 20000 --rounds 20
+
+Popula a L2 com `--leads` conversas e depois, a cada rodada, grava um lote
+pequeno de mensagens novas e agrupa. Dois consumidores acompanham as
+mudanças: um relê a tabela inteira e compara `version` com a leitura
+anterior (como os dashboards faziam), o outro lê o outbox a partir do seu
+offset. Mede o custo por rodada e se algum dos dois perdeu mudanças.
+"""
+
+import argparse
+import logging
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import L2Grouper
+
+logger = logging.getLogger(__name__)
+
+
+def _message(lead: int, i: int):
+    return {
+        "host_n8n": "bench", "evo_api_instance_name": "bench", "host_evoapi": "bench",
+        "sender_raw_data": f"55{11000000000 + lead}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": f"mensagem {i}",
+        "timestamp": f"2025-01-01T10:{i // 60 % 60:02d}:{i % 60:02d}Z",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Table diffing vs. the change outbox")
+    parser.add_argument("--leads", type=int, default=20_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--per-round", type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    logging.getLogger("depths").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        grouper = L2Grouper(db)
+        db.insert_l1_batch([_message(lead, 0) for lead in range(args.leads)])
+        grouper.process_pending_messages()
+
+        changes = db.changes("bench", from_latest=True)
+        with sqlite3.connect(db.db_path) as conn:
+            seen = dict(conn.execute("SELECT id, version FROM conversations_l2"))
+
+        write = diff = read = 0.0
+        diffed = streamed = expected = 0
+        for r in range(1, args.rounds + 1):
+            leads = range(r * args.per_round, (r + 1) * args.per_round)
+            started = time.perf_counter()
+            db.insert_l1_batch([_message(lead, r) for lead in leads])
+            expected += len(grouper.process_pending_messages())
+            write += time.perf_counter() - started
+
+            started = time.perf_counter()
+            with sqlite3.connect(db.db_path) as conn:
+                current = dict(conn.execute("SELECT id, version FROM conversations_l2"))
+            diffed += sum(1 for conv, version in current.items() if seen.get(conv) != version)
+            seen = current
+            diff += time.perf_counter() - started
+
+            started = time.perf_counter()
+            while True:
+                events = changes.poll(limit=1000)
+                if not events:
+                    break
+                streamed += sum(1 for e in events if e["topic"] == "conversation")
+                changes.commit(events)
+            read += time.perf_counter() - started
+
+    logger.info(
+        f"🔁 {args.rounds} rounds of {args.per_round} messages over {args.leads} conversations "
+        f"(write+group {write / args.rounds * 1000:.1f} ms/round)"
+    )
+    logger.info(f"   diff conversations_l2: {diff / args.rounds * 1000:.2f} ms/round, "
+                f"{diffed}/{expected} changes")
+    logger.info(f"   outbox offsets:        {read / args.rounds * 1000:.2f} ms/round, "
+                f"{streamed}/{expected} changes (x{diff / read:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark: tempo até agrupar mensagens novas durante a drenagem de um backlog
+
+    python -m depths.benchmarks.bench_priority --backlog 10000
+
+Simula a volta de uma queda: `--backlog` mensagens antigas pendentes e, a
+cada ciclo, `--fresh` mensagens novas de pacientes. Em FIFO cada ciclo
+agrupa tudo o que está pendente; com `PriorityScheduler` as novas vão no
+mesmo ciclo e o backlog sai a `--rate` mensagens por segundo ocioso.
+"""
+
+import argparse
+import logging
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+from depths.benchmarks.bench_sla_sketch import exact_quantile
+from depths.benchmarks.synthetic import SECRETARY, populate
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_scheduler import PriorityScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def insert_fresh(db_path, cycle: int, count: int) -> List[int]:
+    """Mensagens de agora, de leads que não estão no backlog"""
+    now = datetime.now(timezone.utc).isoformat()
+    ids = []
+    with sqlite3.connect(db_path) as conn:
+        for i in range(count):
+            cursor = conn.execute(
+                """
+                INSERT INTO messages_l1
+                (n8n_host, evo_instance, evo_host, sender_phone, receiver_phone,
+                 message_type, content, timestamp)
+                VALUES ('bench', 'bench', 'bench', ?, ?, 'conversation', 'Oi, tudo bem?', ?)
+                """,
+                (f"55{99000000000 + cycle * count + i}@s.whatsapp.net", SECRETARY, now),
+            )
+            ids.append(cursor.lastrowid)
+    return ids
+
+
+def run(mode: str, backlog: int, fresh: int, cycles: int, interval: float, rate: float) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        populate(db.db_path, backlog)
+        grouper = L2Grouper(db)
+        waiting: Dict[int, float] = {}
+        latencies = []
+        process = grouper.process_messages
+
+        def timed_process(messages):
+            # Instante em que cada lote termina (quentes e backlog são lotes separados)
+            conversations = process(messages)
+            done = time.perf_counter()
+            latencies.extend(done - waiting.pop(m["id"]) for m in messages if m["id"] in waiting)
+            return conversations
+
+        grouper.process_messages = timed_process
+        scheduler = PriorityScheduler(grouper, backlog_rate=rate)
+        for cycle in range(cycles):
+            inserted = time.perf_counter()
+            waiting.update((msg_id, inserted) for msg_id in insert_fresh(db.db_path, cycle, fresh))
+            if mode == "fifo":
+                grouper.process_pending_messages()
+            else:
+                scheduler.run_once()
+            time.sleep(interval)
+        with sqlite3.connect(db.db_path) as conn:
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM messages_l1 WHERE processed = FALSE"
+            ).fetchone()[0]
+        return {"latencies": latencies, "remaining": remaining}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fresh-message latency while draining a backlog")
+    parser.add_argument("--backlog", type=int, default=10_000)
+    parser.add_argument("--fresh", type=int, default=20, help="Fresh messages per cycle")
+    parser.add_argument("--cycles", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between cycles")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Backlog messages per second")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    for mode in ("fifo", "priority"):
+        result = run(mode, args.backlog, args.fresh, args.cycles, args.interval, args.rate)
+        latencies = result["latencies"]
+        logger.info(
+            f"🚦 {mode}: {len(latencies)} fresh messages, time-to-group "
+            f"p50 {exact_quantile(latencies, 0.5) * 1000:.0f} ms, "
+            f"p99 {exact_quantile(latencies, 0.99) * 1000:.0f} ms, "
+            f"max {max(latencies) * 1000:.0f} ms; {result['remaining']} backlog messages left"
+        )
+
+
+if __name__ == "__main__":
+    main()
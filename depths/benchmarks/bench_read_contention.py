@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: latência da ingestão L1 sob carga de painel/relatórios
+
+    python -m depths.benchmarks.bench_read_contention --seconds 10
+
+Compara o modo legado (journal DELETE, leituras no banco de escrita) com
+leituras em snapshot WAL e com a réplica em memória (journal DELETE).
+"""
+
+import argparse
+import gc
+import logging
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from depths.benchmarks.synthetic import populate
+from depths.core.database import SwaifDatabase
+from depths.core.replica import MemoryReplica, read_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Agregação longa típica de relatório
+REPORT_QUERY = """
+    SELECT sender_phone, COUNT(*), MAX(content), MIN(timestamp)
+    FROM messages_l1
+    GROUP BY sender_phone
+    ORDER BY COUNT(*) DESC
+"""
+
+
+def _legacy_read(path):
+    return closing(sqlite3.connect(path))
+
+
+def run(mode: str, base_path: Path, seconds: float) -> dict:
+    db = SwaifDatabase(str(base_path))
+    if mode in ("legacy", "replica"):
+        # Sem WAL (bancos antigos / réplica); conexões não fechadas só saem no gc
+        gc.collect()
+        with closing(sqlite3.connect(base_path)) as conn:
+            conn.execute("PRAGMA journal_mode = DELETE")
+
+    replica = MemoryReplica(db.db_path, max_age_seconds=1.0) if mode == "replica" else None
+    if mode == "legacy":
+        reader = _legacy_read
+    elif mode == "replica":
+        reader = lambda _path: replica.read()
+    else:
+        reader = read_snapshot
+
+    stop = threading.Event()
+    reports = [0]
+
+    def dashboard():
+        while not stop.is_set():
+            with reader(db.db_path) as conn:
+                conn.execute(REPORT_QUERY).fetchall()
+            reports[0] += 1
+
+    thread = threading.Thread(target=dashboard)
+    thread.start()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        db.insert_l1_message({
+            "evo_api_instance_name": "bench",
+            "sender_raw_data": f"55{i % 5000}@s.whatsapp.net",
+            "receiver_raw_data": "5511998681314@s.whatsapp.net",
+            "sent_message": f"contention {i}",
+            "timestamp": f"2025-06-01T10:00:{i % 60:02d}",
+        })
+        latencies.append(time.perf_counter() - started)
+        i += 1
+    stop.set()
+    thread.join()
+    if replica:
+        replica.close()
+
+    latencies.sort()
+    return {
+        "inserts": len(latencies),
+        "reports": reports[0],
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion vs. dashboard contention benchmark")
+    parser.add_argument("--messages", type=int, default=300_000,
+                        help="Rows preloaded so report queries take a while")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with tempfile.TemporaryDirectory() as tmp:
+        seed = SwaifDatabase(str(Path(tmp) / "seed.db"))
+        populate(seed.db_path, args.messages, processed=True)
+        for mode in ("legacy", "wal", "replica"):
+            path = Path(tmp) / f"{mode}.db"
+            with closing(sqlite3.connect(seed.db_path)) as src, \
+                    closing(sqlite3.connect(path)) as dest:
+                src.backup(dest)
+            result = run(mode, path, args.seconds)
+            logger.info(
+                f"✍️ {mode:>7}: {result['inserts']} inserts, {result['reports']} reports | "
+                f"insert p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+                f"max {result['max_ms']:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SLA de resposta por sketches vs. percentis exatos
+
+    python -m depths.benchmarks.bench_sla_sketch --messages 50000
+
+O caminho exato ordena todo o histórico (conversation_messages) a cada
+consulta; o caminho por sketches faz merge dos rollups diários.
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+from depths.benchmarks.synthetic import populate
+from depths.core.database import SwaifDatabase
+from depths.core.replica import read_snapshot
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l2_closure import to_epoch
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rollups import DailyRollups
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def exact_reply_latencies(conn) -> Dict[str, List[float]]:
+    """Latências exatas lead -> secretária por dia, relendo o histórico inteiro"""
+    latencies = defaultdict(list)
+    current, waiting = None, None
+    for conv_ref, sender_type, timestamp in conn.execute(
+        """
+        SELECT conversation_ref, sender_type, timestamp FROM conversation_messages
+        ORDER BY conversation_ref, timestamp, id
+        """
+    ):
+        if conv_ref != current:
+            current, waiting = conv_ref, None
+        if sender_type == "lead":
+            waiting = waiting if waiting is not None else to_epoch(timestamp)
+        elif waiting is not None:
+            latencies[timestamp[:10]].append(to_epoch(timestamp) - waiting)
+            waiting = None
+    return latencies
+
+
+def exact_quantile(values: List[float], q: float) -> float:
+    """Mesma definição de posto do DDSketch (posto inferior)"""
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response-time SLA sketch benchmark")
+    parser.add_argument("--messages", type=int, default=50_000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        populate(db.db_path, args.messages)
+        started = time.perf_counter()
+        L2Grouper(db, listeners=[DailyRollups(db)]).process_pending_messages()
+        logger.info(f"🔗 Grouped {args.messages} messages in {time.perf_counter() - started:.1f}s")
+
+        display = TerminalDisplay(db.db_path)
+        started = time.perf_counter()
+        with read_snapshot(db.db_path) as conn:
+            exact = exact_reply_latencies(conn)
+        all_values = [v for values in exact.values() for v in values]
+        exact_q = {q: exact_quantile(all_values, q) for q in QUANTILES}
+        exact_seconds = time.perf_counter() - started
+
+        days = sorted(exact)
+        started = time.perf_counter()
+        report = display.report(days[0], days[-1])
+        sketch_seconds = time.perf_counter() - started
+
+        for q in QUANTILES:
+            approx = report[f"first_response_p{int(q * 100)}"]
+            logger.info(
+                f"📐 p{int(q * 100)}: exact {exact_q[q]:.0f}s, sketch {approx:.0f}s "
+                f"({abs(approx - exact_q[q]) / exact_q[q] * 100:.2f}% error)"
+            )
+        logger.info(
+            f"⏱️ {len(all_values)} replies over {len(days)} days: exact {exact_seconds * 1000:.0f} ms, "
+            f"sketch merge {sketch_seconds * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
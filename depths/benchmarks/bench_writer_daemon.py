@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark: processos gravando direto no banco vs. pelo daemon de escrita
+
+    python -m depths.benchmarks.bench_writer_daemon --writers 4 --messages 2000
+
+Alguns processos ingerem mensagens (como vários `run-monitor`) enquanto
+dois rodam a L2 a cada `--group-every` segundos (como `--process-l2` em
+cron, com execuções que se sobrepõem). Direto no SQLite
+cada processo disputa o lock de escrita; pelo daemon os pedidos viram
+lotes de uma única thread. Mede vazão, latência por mensagem, erros
+"database is locked" e mensagens agrupadas em duplicidade.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from depths.core.daemon import DaemonClient, WriterDaemon
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import L2Grouper
+
+logger = logging.getLogger(__name__)
+
+
+def _message(writer: int, i: int) -> Dict:
+    return {
+        "host_n8n": "bench", "evo_api_instance_name": "bench", "host_evoapi": "bench",
+        "sender_raw_data": f"55{11000000000 + writer * 1000 + i % 50}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": f"mensagem {writer}-{i}",
+        "timestamp": f"2025-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}.{writer:03d}Z",
+    }
+
+
+def _writer(mode: str, target: str, writer: int, count: int, out):
+    logging.disable(logging.CRITICAL)
+    db = DaemonClient(target) if mode == "daemon" else SwaifDatabase(target)
+    latencies: List[float] = []
+    errors = 0
+    for i in range(count):
+        started = time.perf_counter()
+        try:
+            db.insert_l1_message(_message(writer, i))
+        except sqlite3.OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    out.put((latencies, errors))
+
+
+def _grouper(mode: str, target: str, every: float, stop, out):
+    logging.disable(logging.CRITICAL)
+    errors = 0
+    grouper = None if mode == "daemon" else L2Grouper(SwaifDatabase(target))
+    client = DaemonClient(target) if mode == "daemon" else None
+    while not stop.is_set():
+        try:
+            client.group() if client else grouper.process_pending_messages(flush=True)
+        except sqlite3.OperationalError:
+            errors += 1
+        stop.wait(every)
+    out.put(([], errors))
+
+
+def run(mode: str, writers: int, count: int, group_every: float) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SwaifDatabase(str(Path(tmp) / "bench.db"))
+        daemon = None
+        target = str(db.db_path)
+        if mode == "daemon":
+            target = str(Path(tmp) / "swaif.sock")
+            daemon = WriterDaemon(L2Grouper(db), socket_path=target, group_interval=None)
+            daemon.start()
+
+        out = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        procs = [multiprocessing.Process(target=_writer, args=(mode, target, w, count, out))
+                 for w in range(writers)]
+        groupers = [multiprocessing.Process(target=_grouper,
+                                            args=(mode, target, group_every, stop, out))
+                    for _ in range(2)]
+        started = time.perf_counter()
+        for p in groupers + procs:
+            p.start()
+        results = [out.get() for _ in procs]
+        elapsed = time.perf_counter() - started
+        stop.set()
+        results.extend(out.get() for _ in groupers)
+        for p in procs + groupers:
+            p.join()
+        if daemon:
+            DaemonClient(target).group()
+            daemon.stop()
+        else:
+            L2Grouper(db).process_pending_messages(flush=True)
+
+        with sqlite3.connect(db.db_path) as conn:
+            stored = conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0]
+            history = conn.execute("SELECT COUNT(*) FROM conversation_messages").fetchone()[0]
+
+    latencies = sorted(x for lat, _ in results for x in lat)
+    return {
+        "rate": stored / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max": latencies[-1] * 1000,
+        "errors": sum(e for _, e in results),
+        "stored": stored,
+        "double_grouped": history - stored,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Direct SQLite writers vs. the writer daemon")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=2000, help="Per writer process")
+    parser.add_argument("--group-every", type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+    for mode in ("direct", "daemon"):
+        r = run(mode, args.writers, args.messages, args.group_every)
+        logger.info(
+            f"{mode:>6}: {r['stored']} stored at {r['rate']:,.0f} msg/s, latency p50 "
+            f"{r['p50']:.1f} / p99 {r['p99']:.1f} / max {r['max']:.0f} ms, "
+            f"{r['errors']} lock errors, {r['double_grouped']} double-grouped"
+        )
+
+
+if __name__ == "__main__":
+    main()
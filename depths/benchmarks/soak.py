@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Soak e recuperação de quedas: pipeline L1 -> L2 morto e reiniciado
+
+    python -m depths.benchmarks.soak --minutes 10 --messages 200000
+    python -m depths.benchmarks.soak --minutes 240 --messages 5000000   # horas
+
+Um processo filho ingere o tráfego de `synthetic.py` em ticks (cada tick é
+um lote de mensagens em ordem de horário, com algumas entregas atrasadas;
+semanas de tráfego passam em minutos) e agrupa a L2 após cada tick. O pai
+o mata em momentos aleatórios (SIGKILL) e o filho também cai de propósito
+em pontos sensíveis (`--fault-rate`): logo após gravar uma conversa, após
+`generate_conversation_id`, após o commit da L1. A cada reinício:
+
+- o filho retoma do último tick confirmado (o tick em andamento é
+  reenviado; a deduplicação da L1 descarta o que já entrou);
+- o pai confere a idempotência: uma linha de histórico por mensagem L1
+  processada e `message_count` igual ao histórico de cada conversa.
+
+No fim: vazão por tick (estabilidade), crescimento de memória do filho e
+tempo de recuperação (do reinício ao primeiro tick concluído). Sai com
+código 1 se alguma checagem falhar.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from depths.benchmarks.synthetic import synthetic_messages
+from depths.core.sketches import DDSketch
+
+logger = logging.getLogger(__name__)
+
+# Código de saída das quedas provocadas pelo próprio filho
+CRASH_EXIT = 86
+
+
+def traffic(count: int, seed: int, late_share: float = 0.02) -> List[Dict]:
+    """Tráfego sintético em ordem de horário; `late_share` chega alguns ticks depois"""
+    rng = random.Random(seed)
+    rows = sorted(synthetic_messages(count, seed=seed), key=lambda row: row[7])
+    messages = [{
+        "host_n8n": row[0], "evo_api_instance_name": row[1], "host_evoapi": row[2],
+        "sender_raw_data": row[3] or None, "receiver_raw_data": row[4],
+        "message_type": row[5], "sent_message": row[6], "timestamp": row[7],
+    } for row in rows]
+    # Entregas atrasadas: exercitam encaixe e fusão de conversas na L2
+    arrival = [i + (rng.randrange(50, 2000) if rng.random() < late_share else 0)
+               for i in range(len(messages))]
+    order = sorted(range(len(messages)), key=arrival.__getitem__)
+    return [messages[i] for i in order]
+
+
+class FaultPlan:
+    """Derruba o processo com probabilidade `rate` em cada ponto instrumentado"""
+
+    def __init__(self, rate: float, seed: int):
+        self.rate = rate
+        self.rng = random.Random(seed)
+
+    def wrap(self, obj, name: str, point: str):
+        original = getattr(obj, name)
+
+        def wrapper(*args, **kwargs):
+            result = original(*args, **kwargs)
+            if self.rng.random() < self.rate:
+                # Sem flush nem cleanup, como um kill
+                os._exit(CRASH_EXIT)
+            return result
+
+        wrapper.point = point
+        setattr(obj, name, wrapper)
+
+
+def _rss_mb() -> float:
+    """RSS atual do processo (MB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _last_tick(progress: Path) -> int:
+    """Último tick confirmado no arquivo de progresso (linhas cortadas são ignoradas)"""
+    last = -1
+    if progress.exists():
+        for line in progress.read_text().splitlines():
+            try:
+                last = max(last, json.loads(line)["tick"])
+            except (ValueError, KeyError):
+                continue
+    return last
+
+
+def worker(db_path: str, progress: str, count: int, tick_size: int, seed: int,
+           fault_rate: float, run: int):
+    """Filho: ingere e agrupa tick a tick a partir do último confirmado"""
+    logging.disable(logging.CRITICAL)
+    from depths.core.database import SwaifDatabase
+    from depths.layers.l2_grouper import L2Grouper
+    from depths.layers.l2_rollups import DailyRollups
+
+    db = SwaifDatabase(db_path)
+    grouper = L2Grouper(db)
+    grouper.add_listener(DailyRollups(db))
+    faults = FaultPlan(fault_rate, seed * 1000 + run)
+    faults.wrap(db, "insert_l1_batch", "after L1 commit")
+    faults.wrap(grouper, "_save_conversation", "after a conversation commit")
+    faults.wrap(grouper, "generate_conversation_id", "after lead_activity commit")
+
+    messages = traffic(count, seed)
+    progress = Path(progress)
+    # Restos da execução anterior (mensagens pendentes) antes do próximo tick
+    grouper.process_pending_messages(flush=True)
+    tick = _last_tick(progress) + 1
+    resumed = tick
+    with open(progress, "a") as out:
+        while tick * tick_size < len(messages):
+            started = time.perf_counter()
+            batch = messages[tick * tick_size:(tick + 1) * tick_size]
+            db.insert_l1_batch(batch)
+            grouper.process_pending_messages(flush=True)
+            out.write(json.dumps({
+                "tick": tick, "run": run, "messages": len(batch),
+                # O primeiro tick após uma queda pode ser reenvio (quase só duplicatas)
+                "resumed": run > 1 and tick == resumed,
+                "seconds": time.perf_counter() - started, "rss_mb": _rss_mb(),
+                "at": time.time(),
+            }) + "\n")
+            out.flush()
+            tick += 1
+
+
+def verify(db_path) -> Dict:
+    """Checagens de idempotência sobre o banco"""
+    with sqlite3.connect(db_path) as conn:
+        l1, processed = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(processed), 0) FROM messages_l1"
+        ).fetchone()
+        history = conn.execute("SELECT COUNT(*) FROM conversation_messages").fetchone()[0]
+        wrong_counts = conn.execute(
+            """
+            SELECT COUNT(*) FROM conversations_l2 c
+            WHERE message_count != (
+                SELECT COUNT(*) FROM conversation_messages m WHERE m.conversation_ref = c.id)
+            """
+        ).fetchone()[0]
+        duplicate_l1 = conn.execute(
+            "SELECT COUNT(*) - COUNT(DISTINCT fingerprint) FROM messages_l1 "
+            "WHERE fingerprint IS NOT NULL"
+        ).fetchone()[0]
+    return {
+        "l1": l1,
+        "processed": processed,
+        "history": history,
+        "duplicate_history": history - processed,
+        "wrong_message_counts": wrong_counts,
+        "duplicate_l1": duplicate_l1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crash-recovery soak test for the L1 -> L2 pipeline")
+    parser.add_argument("--minutes", type=float, default=5, help="Wall-clock budget")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--tick-size", type=int, default=500, help="Messages per tick")
+    parser.add_argument("--kill-every", type=float, default=4.0,
+                        help="Mean seconds between SIGKILLs (0 = never)")
+    parser.add_argument("--fault-rate", type=float, default=0.0001,
+                        help="Crash probability at each instrumented point")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", default=None, help="Keep the database here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logger.setLevel(logging.INFO)
+
+    tmp = None if args.workdir else tempfile.TemporaryDirectory()
+    workdir = Path(args.workdir or tmp.name)
+    workdir.mkdir(parents=True, exist_ok=True)
+    db_path = str(workdir / "soak.db")
+    progress = workdir / "progress.jsonl"
+
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.minutes * 60
+    exits = {"finished": 0, "killed": 0, "injected": 0, "other": 0}
+    recoveries: List[float] = []
+    failures: List[Dict] = []
+    run = 0
+    finished = False
+    try:
+        while not finished and time.monotonic() < deadline:
+            run += 1
+            before = _last_tick(progress)
+            proc = multiprocessing.Process(target=worker, args=(
+                db_path, str(progress), args.messages, args.tick_size, args.seed,
+                args.fault_rate, run,
+            ))
+            spawned = time.monotonic()
+            proc.start()
+            kill_at: Optional[float] = (
+                spawned + rng.expovariate(1 / args.kill_every) if args.kill_every else None
+            )
+            recovered = None
+            while proc.is_alive():
+                now = time.monotonic()
+                if recovered is None and run > 1 and _last_tick(progress) > before:
+                    recovered = now - spawned
+                if (kill_at and now >= kill_at) or now >= deadline:
+                    proc.kill()
+                    break
+                time.sleep(0.02)
+            proc.join()
+            if recovered is None and run > 1 and _last_tick(progress) > before:
+                recovered = time.monotonic() - spawned
+            if recovered is not None:
+                recoveries.append(recovered)
+
+            if proc.exitcode == 0:
+                exits["finished"] += 1
+                finished = True
+            elif proc.exitcode == -9:
+                exits["killed"] += 1
+            elif proc.exitcode == CRASH_EXIT:
+                exits["injected"] += 1
+            else:
+                exits["other"] += 1
+
+            # Mensagens pendentes de uma queda ainda não contam no histórico
+            state = verify(db_path)
+            if state["duplicate_history"] > 0 or state["wrong_message_counts"] or state["duplicate_l1"]:
+                failures.append({"run": run, **state})
+                logger.error(f"❌ Run {run}: {state}")
+
+        ticks = [json.loads(line) for line in progress.read_text().splitlines()
+                 if line.endswith("}")] if progress.exists() else []
+        final = verify(db_path)
+    finally:
+        if tmp:
+            tmp.cleanup()
+
+    rates = DDSketch()
+    for t in ticks:
+        if not t["resumed"]:
+            rates.add(t["messages"] / t["seconds"])
+    runs: Dict[int, List[Dict]] = {}
+    for t in ticks:
+        runs.setdefault(t["run"], []).append(t)
+    longest = max(runs.values(), key=len) if runs else []
+    recovery = DDSketch()
+    for value in recoveries:
+        recovery.add(value)
+
+    logger.info(
+        f"🔥 {run} runs: {exits['killed']} SIGKILL, {exits['injected']} injected crashes, "
+        f"{exits['other']} other exits; stream {'finished' if finished else 'cut by --minutes'} "
+        f"({len(ticks)} ticks, {final['l1']} L1 messages)"
+    )
+    if ticks:
+        logger.info(
+            f"📈 Throughput per tick: p10 {rates.quantile(0.1):,.0f} / p50 "
+            f"{rates.quantile(0.5):,.0f} / p90 {rates.quantile(0.9):,.0f} msg/s"
+        )
+    if longest:
+        logger.info(
+            f"🧠 Longest run ({len(longest)} ticks): RSS {longest[0]['rss_mb']:.1f} -> "
+            f"{longest[-1]['rss_mb']:.1f} MB"
+        )
+    if recoveries:
+        logger.info(
+            f"⏱️ Recovery to first tick: p50 {recovery.quantile(0.5):.2f}s / "
+            f"max {recovery.max:.2f}s"
+        )
+    if final["processed"] < final["l1"]:
+        logger.info(f"   {final['l1'] - final['processed']} messages pending at the final kill")
+    if failures:
+        logger.error(f"❌ {len(failures)} runs left duplicated or inconsistent history")
+        raise SystemExit(1)
+    logger.info(
+        f"✅ Idempotent: {final['history']} history rows for {final['processed']} processed "
+        f"messages, message_count consistent, no duplicate L1 rows"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, Tuple
+
+from depths.core.connection import connect
+
+SECRETARY = "5511998681314@s.whatsapp.net"
+
+
+def synthetic_messages(count: int, leads: int = None, seed: int = 42,
+                       start: datetime = datetime(2025, 1, 1)) -> Iterator[Tuple]:
+    """Gera linhas de messages_l1: sessões curtas por lead, fora de ordem entre leads"""
+    rng = random.Random(seed)
+    leads = leads or max(1, count // 40)
+    # Relógio de cada lead; mensagens de leads diferentes chegam intercaladas
+    clocks = [start + timedelta(minutes=rng.randrange(60 * 24 * 30)) for _ in range(leads)]
+    for _ in range(count):
+        lead = rng.randrange(leads)
+        # Maioria das respostas em minutos, algumas depois de dias (nova sessão)
+        gap = rng.expovariate(1 / 600) if rng.random() < 0.9 else rng.uniform(5 * 3600, 5 * 86400)
+        clocks[lead] += timedelta(seconds=gap)
+        phone = f"55{11000000000 + lead}@s.whatsapp.net"
+        if rng.random() < 0.6:
+            sender, receiver = phone, SECRETARY
+        else:
+            sender, receiver = "", phone
+        yield ("bench", "bench", "bench", sender, receiver, "conversation",
+               f"mensagem {rng.randrange(1000)}", clocks[lead].isoformat())
+
+
+def populate(db_path, count: int, batch_size: int = 100000, processed: bool = False,
+             **kwargs) -> int:
+    """Insere `count` mensagens sintéticas direto em messages_l1"""
+    inserted = 0
+    rows = synthetic_messages(count, **kwargs)
+    with connect(db_path) as conn:
+        while inserted < count:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            conn.executemany(
+                """
+                INSERT INTO messages_l1
+                (n8n_host, evo_instance, evo_host, sender_phone, receiver_phone,
+                 message_type, content, timestamp, processed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [row + (processed,) for row in batch],
+            )
+            conn.commit()
+            inserted += len(batch)
+    return inserted
@@ -3,5 +3,23 @@ Core modules for SWAIF-MSG
 ==========================
 
 - database.py: SQLite handler 
+- migrations.py: Versioned schema migrations
+- participants.py: Phone -> integer id dictionary
+- archive.py: Monthly archive partitions for cold data
+- maintenance.py: Online backup, snapshots and compaction
+- sharding.py: Per-instance database shards and federated reads
+- daemon.py: Single writer daemon with Unix-socket IPC and write leases
+- outbox.py: Change-data-capture outbox with per-consumer offsets
+- batching.py: AIMD batch size and flush interval controller
+- dedup.py: Fingerprint-based dedup of replayed messages
+- history.py: Paginated conversation history with a versioned LRU cache
+- replica.py: Read-only WAL snapshots and in-memory replicas for reports
+- pending_replies.py: Index of leads waiting for a secretary reply
+- keywords.py: Keyword dictionary compiled into an Aho-Corasick automaton
+- vectors.py: Local hashing embedder and memory-mapped vector index
+- blobs.py: Content-addressed media files collected when no message cites them
+- content_store.py: Deduplicated message bodies compressed with a trained dictionary
+- sketches.py: Mergeable DDSketch quantiles and HyperLogLog counts
+- rollups.py: Daily rollup deltas and the recompute from L2 history
 - terminal_display.py: Console output utilities
 """
@@ -0,0 +1,280 @@
+"""
+Arquivamento de dados frios
+===========================
+
+Move mensagens L1 já processadas e conversas L2 encerradas há mais de
+`retention_days` para arquivos SQLite mensais (`archive_YYYY_MM.db`).
+O banco principal guarda apenas o índice `archived_conversations`
+(conversa -> partição), usado por `SwaifDatabase` para consultar o
+histórico e a busca de forma transparente.
+
+Os índices derivados do histórico quente (`lead_activity`,
+`pending_replies`, `response_waits`, tags e grupos de FAQ) são ajustados
+na mesma transação que move as conversas: nada fica apontando para linhas
+que saíram do banco principal.
+"""
+
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from depths.core import outbox, pending_replies
+from depths.core.content_store import content_sql
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "archive_"
+
+
+def partition_name(month: str) -> str:
+    """'2025-01' -> 'archive_2025_01.db'"""
+    return f"{PARTITION_PREFIX}{month.replace('-', '_')}.db"
+
+
+def list_partitions(archive_dir) -> List[Path]:
+    """Partições existentes, da mais recente para a mais antiga"""
+    folder = Path(archive_dir)
+    if not folder.exists():
+        return []
+    return sorted(folder.glob(f"{PARTITION_PREFIX}*.db"), reverse=True)
+
+
+def open_partition(path) -> sqlite3.Connection:
+    """Conexão somente leitura com uma partição"""
+    return sqlite3.connect(f"file:{Path(path).resolve()}?mode=ro", uri=True)
+
+
+class ArchiveManager:
+    """Move L1/L2 antigos para partições mensais anexadas"""
+
+    # Tabelas copiadas para as partições, com índices de consulta
+    ARCHIVE_INDEXES = [
+        "CREATE INDEX IF NOT EXISTS archive.idx_archive_history "
+        "ON conversation_messages(conversation_ref, timestamp)",
+        "CREATE INDEX IF NOT EXISTS archive.idx_archive_history_conv "
+        "ON conversation_messages(conversation_id)",
+    ]
+
+    def __init__(self, database, retention_days: int = 90, batch_size: int = 500):
+        self.db = database
+        self.archive_dir = Path(database.archive_dir)
+        self.retention = timedelta(days=retention_days)
+        # Conversas/mensagens movidas por transação
+        self.batch_size = batch_size
+
+    def cutoff(self, now: Optional[datetime] = None) -> str:
+        """Limite (ISO) abaixo do qual os dados são considerados frios"""
+        now = now or datetime.now()
+        return (now - self.retention).strftime("%Y-%m-%dT%H:%M:%S")
+
+    def archive(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Arquiva conversas e mensagens L1 antigas; retorna contagens"""
+        cutoff = self.cutoff(now)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+
+        stats = {"conversations": 0, "history": 0, "messages_l1": 0}
+        with self.db.connect() as conn:
+            conversations = conn.execute(
+                """
+                SELECT id, substr(start_time, 1, 7) FROM conversations_l2
+                WHERE end_time < ?
+                ORDER BY id
+                """,
+                (cutoff,),
+            ).fetchall()
+            l1_rows = conn.execute(
+                """
+                SELECT id, substr(timestamp, 1, 7) FROM messages_l1
+                WHERE processed = TRUE AND timestamp < ?
+                ORDER BY id
+                """,
+                (cutoff,),
+            ).fetchall()
+
+        for month, ids in self._by_month(conversations).items():
+            for chunk in self._chunks(ids):
+                moved = self._move_conversations(month, chunk)
+                stats["conversations"] += len(chunk)
+                stats["history"] += moved
+
+        for month, ids in self._by_month(l1_rows).items():
+            for chunk in self._chunks(ids):
+                self._move_l1(month, chunk)
+                stats["messages_l1"] += len(chunk)
+
+        logger.info(
+            f"🗄️ Archived {stats['conversations']} conversations, "
+            f"{stats['history']} history rows, {stats['messages_l1']} L1 messages"
+        )
+        return stats
+
+    def _by_month(self, rows) -> Dict[str, List[int]]:
+        months: Dict[str, List[int]] = {}
+        for row_id, month in rows:
+            months.setdefault(month or "unknown", []).append(row_id)
+        return months
+
+    def _chunks(self, ids: List[int]):
+        for start in range(0, len(ids), self.batch_size):
+            yield ids[start:start + self.batch_size]
+
+    def _attach(self, conn: sqlite3.Connection, month: str) -> str:
+        name = partition_name(month)
+        conn.execute("ATTACH DATABASE ? AS archive", (str(self.archive_dir / name),))
+        for table in ("messages_l1", "conversations_l2", "conversation_messages"):
+            self._sync_schema(conn, table)
+        for statement in self.ARCHIVE_INDEXES:
+            conn.execute(statement)
+        return name
+
+    def _sync_schema(self, conn: sqlite3.Connection, table: str):
+        """Cria/atualiza a tabela na partição com as colunas do banco principal"""
+        sql = conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+            (table,),
+        ).fetchone()[0]
+        exists = conn.execute(
+            "SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = ?",
+            (table,),
+        ).fetchone()
+        if not exists:
+            conn.execute(sql.replace(
+                f"CREATE TABLE {table}", f"CREATE TABLE archive.{table}", 1
+            ))
+            return
+
+        # Colunas adicionadas por migrações posteriores à criação da partição
+        archived = {row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")}
+        for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+            if row[1] not in archived:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {row[1]} {row[2]}")
+
+    def _columns(self, conn: sqlite3.Connection, table: str) -> str:
+        return ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+
+    def _select(self, conn: sqlite3.Connection, table: str) -> str:
+        """Colunas para copiar; texto compactado vai descompactado para a partição"""
+        exprs = {"content": content_sql(f"main.{table}"), "content_id": "NULL"}
+        return ", ".join(
+            exprs.get(row[1], row[1])
+            for row in conn.execute(f"PRAGMA main.table_info({table})")
+        )
+
+    def _move_conversations(self, month: str, ids: List[int]) -> int:
+        """Move conversas + histórico em uma transação; retorna linhas de histórico"""
+        placeholders = ",".join("?" * len(ids))
+        conn = self.db.connect(isolation_level=None)
+        try:
+            self.db.contents.register(conn)
+            name = self._attach(conn, month)
+            conv_cols = self._columns(conn, "conversations_l2")
+            hist_cols = self._columns(conn, "conversation_messages")
+            hist_select = self._select(conn, "conversation_messages")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO archive.conversations_l2 ({conv_cols}) "
+                    f"SELECT {conv_cols} FROM main.conversations_l2 WHERE id IN ({placeholders})",
+                    ids,
+                )
+                moved = conn.execute(
+                    f"INSERT INTO archive.conversation_messages ({hist_cols}) "
+                    f"SELECT {hist_select} FROM main.conversation_messages "
+                    f"WHERE conversation_ref IN ({placeholders})",
+                    ids,
+                ).rowcount
+                conn.execute(
+                    f"""
+                    INSERT OR REPLACE INTO main.archived_conversations
+                    (conversation_id, partition)
+                    SELECT conversation_id, ? FROM main.conversations_l2
+                    WHERE id IN ({placeholders})
+                    """,
+                    [name] + ids,
+                )
+                # Tags e grupos de FAQ são índice do histórico quente; não vão
+                # para a partição
+                moved_messages = (
+                    f"SELECT id FROM main.conversation_messages "
+                    f"WHERE conversation_ref IN ({placeholders})"
+                )
+                for table in ("message_tags", "message_clusters"):
+                    conn.execute(
+                        f"DELETE FROM main.{table} WHERE message_id IN ({moved_messages})", ids
+                    )
+                # Grupo cujo líder (ou última mensagem) saiu passa a apontar para
+                # um membro que ficou; sem nenhum, para NULL
+                for column, pick in (("leader_message_id", "MIN"), ("last_message_id", "MAX")):
+                    conn.execute(
+                        f"""
+                        UPDATE main.faq_clusters SET {column} = (
+                            SELECT {pick}(message_id) FROM main.message_clusters
+                            WHERE cluster_id = faq_clusters.id)
+                        WHERE {column} IN ({moved_messages})
+                        """,
+                        ids,
+                    )
+                conn.execute(
+                    f"""
+                    DELETE FROM main.lead_activity WHERE conversation_id IN (
+                        SELECT conversation_id FROM main.conversations_l2
+                        WHERE id IN ({placeholders}))
+                    """,
+                    ids,
+                )
+                conn.execute(
+                    f"DELETE FROM main.response_waits WHERE conversation_ref IN ({placeholders})",
+                    ids,
+                )
+                waiting = conn.execute(
+                    f"SELECT lead_phone, lead_id FROM main.pending_replies "
+                    f"WHERE conversation_ref IN ({placeholders})",
+                    ids,
+                ).fetchall()
+                conn.execute(
+                    f"DELETE FROM main.conversation_messages WHERE conversation_ref IN ({placeholders})",
+                    ids,
+                )
+                for conv_ref in ids:
+                    outbox.emit(conn, "conversation", "archive", conv_ref, {"partition": name})
+                conn.execute(
+                    f"DELETE FROM main.conversations_l2 WHERE id IN ({placeholders})", ids
+                )
+                # Espera refeita só com o histórico que ficou (sem ele, sai do índice)
+                for lead_phone, lead_id in waiting:
+                    pending_replies.recompute(conn, lead_phone, lead_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return moved
+        finally:
+            conn.close()
+
+    def _move_l1(self, month: str, ids: List[int]):
+        """Move mensagens L1 processadas em uma transação"""
+        placeholders = ",".join("?" * len(ids))
+        conn = self.db.connect(isolation_level=None)
+        try:
+            self.db.contents.register(conn)
+            self._attach(conn, month)
+            cols = self._columns(conn, "messages_l1")
+            select = self._select(conn, "messages_l1")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO archive.messages_l1 ({cols}) "
+                    f"SELECT {select} FROM main.messages_l1 WHERE id IN ({placeholders})",
+                    ids,
+                )
+                conn.execute(
+                    f"DELETE FROM main.messages_l1 WHERE id IN ({placeholders})", ids
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
@@ -0,0 +1,114 @@
+"""
+Tamanho de lote e intervalo adaptativos (AIMD)
+==============================================
+
+Um tamanho fixo erra em parte do dia: lotes pequenos no pico gastam um
+commit por punhado de mensagens; lotes grandes no vale seguram o lock de
+escrita e atrasam quem chegou primeiro. `BatchController` ajusta dois
+botões a partir do que cada lote mediu:
+
+- tamanho do lote, pelo tempo de commit: passou de `commit_share` da meta
+  de latência -> corta pela metade; sobrou fila -> soma `increase`
+  (aumento aditivo, redução multiplicativa, como o TCP);
+- intervalo entre varreduras, pela latência ponta a ponta (espera da
+  mensagem mais antiga + commit) quando a fila esvazia: acima da meta ->
+  corta pela metade; abaixo -> soma `interval_step` até a folga da meta.
+
+Com fila sobrando o intervalo vai ao mínimo (drenar é o que importa).
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from depths.core.sketches import DDSketch
+
+
+class BatchController:
+    """Controlador AIMD de tamanho de lote e intervalo de varredura"""
+
+    def __init__(self, target_latency: float = 2.0, min_batch: int = 50,
+                 max_batch: int = 5000, initial_batch: int = 500,
+                 min_interval: float = 0.1, max_interval: float = 5.0,
+                 commit_share: float = 0.25, increase: Optional[int] = None,
+                 decrease: float = 0.5, interval_step: float = 0.1, history: int = 100):
+        self.target_latency = target_latency
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # Um commit não pode gastar mais que esta fração da meta
+        self.commit_budget = target_latency * commit_share
+        self.increase = increase or min_batch
+        self.decrease = decrease
+        self.interval_step = interval_step
+        self.batch_size = max(min_batch, min(initial_batch, max_batch))
+        self.interval = min_interval
+        self.batches = 0
+        self.items = 0
+        self.actions = {"increase": 0, "decrease": 0, "hold": 0}
+        self.commit_seconds = DDSketch()
+        self.latency = DDSketch()
+        # Últimas decisões, para métricas e logs
+        self.decisions: Deque[Dict] = deque(maxlen=history)
+
+    def observe(self, items: int, commit_seconds: float, queue_depth: int,
+                oldest_wait: float = 0.0) -> Dict:
+        """Registra um lote gravado e ajusta lote e intervalo; retorna a decisão"""
+        latency = max(oldest_wait, 0.0) + commit_seconds
+        self.batches += 1
+        self.items += items
+        self.commit_seconds.add(commit_seconds)
+        self.latency.add(latency)
+
+        previous = self.batch_size
+        if commit_seconds > self.commit_budget and items > self.min_batch:
+            # Commit caro: o lote em si é a causa da latência
+            action = "decrease"
+            self.batch_size = max(self.min_batch, int(min(items, previous) * self.decrease))
+        elif queue_depth > 0:
+            # Sobrou fila e o commit cabe: mais vazão por commit
+            action = "increase" if items >= previous and previous < self.max_batch else "hold"
+            if action == "increase":
+                self.batch_size = min(self.max_batch, previous + self.increase)
+        else:
+            action = "hold"
+
+        if queue_depth > 0:
+            self.interval = self.min_interval
+        elif latency > self.target_latency:
+            self.interval = max(self.min_interval, self.interval * self.decrease)
+        else:
+            # Tráfego calmo: varre menos, dentro da folga da meta
+            headroom = max(self.target_latency - commit_seconds, self.min_interval)
+            self.interval = min(self.interval + self.interval_step, headroom, self.max_interval)
+
+        self.actions[action] += 1
+        decision = {
+            "at": time.time(),
+            "action": action,
+            "items": items,
+            "queue_depth": queue_depth,
+            "commit_seconds": commit_seconds,
+            "latency": latency,
+            "batch_size": self.batch_size,
+            "previous_batch_size": previous,
+            "interval": self.interval,
+        }
+        self.decisions.append(decision)
+        return decision
+
+    def stats(self) -> Dict:
+        """Estado atual, contagem de decisões e quantis medidos"""
+        return {
+            "batch_size": self.batch_size,
+            "interval": self.interval,
+            "batches": self.batches,
+            "items": self.items,
+            "actions": dict(self.actions),
+            "commit_p50": self.commit_seconds.quantile(0.5),
+            "commit_p99": self.commit_seconds.quantile(0.99),
+            "latency_p50": self.latency.quantile(0.5),
+            "latency_p99": self.latency.quantile(0.99),
+            "target_latency": self.target_latency,
+        }
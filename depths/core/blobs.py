@@ -0,0 +1,194 @@
+"""
+Mídia fora das linhas do SQLite
+===============================
+
+Áudios, imagens e documentos da Evolution API chegam em base64 (ou como
+arquivo salvo pelo N8N). Guardá-los em `messages_l1` incha as páginas
+quentes e deixa toda varredura mais lenta; aqui o conteúdo vai para um
+diretório endereçado por conteúdo e a linha guarda só `media_hash`.
+
+- Arquivos: `<raiz>/ab/cd/<sha256>` - dois níveis de diretório para não
+  acumular milhões de arquivos numa pasta. Mídia repetida (figurinhas,
+  o mesmo PDF reenviado) ocupa um arquivo só.
+- Gravação em streaming: o base64 é decodificado e o hash calculado em
+  blocos, num arquivo temporário renomeado ao final (nunca há arquivo
+  parcial com nome de hash).
+- `media_blobs` é o catálogo (tamanho, mime). A referência é a própria
+  linha da mensagem (`media_hash`), no banco principal ou numa partição de
+  arquivo: `gc` apaga os arquivos que nenhuma linha cita mais, inclusive
+  sobras de gravações interrompidas. Não há contagem a manter em cada
+  caminho que apaga ou move mensagens.
+"""
+
+import base64
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+import logging
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Optional, Set, Tuple
+
+from depths.core.archive import list_partitions, open_partition
+
+logger = logging.getLogger(__name__)
+
+# Bloco de leitura/decodificação (múltiplo de 4 para o base64)
+CHUNK = 64 * 1024
+# Tipos da Evolution API que são texto; o resto traz mídia
+TEXT_TYPES = {"conversation", "extendedTextMessage"}
+# `sent_message` de mídia acima disso sem espaços é tratado como o próprio base64
+INLINE_LIMIT = 4096
+
+
+def base64_chunks(text: str, chunk: int = CHUNK) -> Iterable[bytes]:
+    """Decodifica base64 (com ou sem prefixo data:) bloco a bloco"""
+    if text.startswith("data:"):
+        text = text[text.index(",") + 1:]
+    if any(c.isspace() for c in text[:256]) or any(c.isspace() for c in text[-256:]):
+        text = "".join(text.split())
+    for start in range(0, len(text), chunk):
+        yield base64.b64decode(text[start:start + chunk])
+
+
+def file_chunks(path, chunk: int = CHUNK) -> Iterable[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk)
+            if not block:
+                return
+            yield block
+
+
+def media_payload(data: Dict) -> Optional[Tuple[Iterable[bytes], Optional[str]]]:
+    """(blocos, mime) da mídia de uma mensagem L1 do N8N; None se for texto
+
+    Campos: `media_base64` ou `media_path` (arquivo salvo pelo N8N), e
+    `media_mimetype`. Sem eles, uma mensagem de mídia cujo `sent_message`
+    é um base64 grande (fluxos antigos) tem o próprio texto como mídia.
+    """
+    mime = data.get("media_mimetype")
+    if data.get("media_base64"):
+        return base64_chunks(data["media_base64"]), mime
+    if data.get("media_path"):
+        return file_chunks(data["media_path"]), mime
+    text = data.get("sent_message")
+    if (data.get("message_type") or "conversation") not in TEXT_TYPES and text \
+            and len(text) > INLINE_LIMIT and " " not in text[:INLINE_LIMIT]:
+        return base64_chunks(text), mime
+    return None
+
+
+class BlobStore:
+    """Arquivos endereçados por sha256, citados pelas mensagens L1"""
+
+    def __init__(self, root, archive_dir=None):
+        self.root = Path(root)
+        # Partições de arquivo também citam mídia (ver core/archive.py)
+        self.archive_dir = Path(archive_dir) if archive_dir else None
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def write(self, chunks: Iterable[bytes]) -> Tuple[str, int]:
+        """Grava o conteúdo (sem tocar o banco); retorna (sha256, tamanho)"""
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for block in chunks:
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+            target = self.path(digest.hexdigest())
+            if target.exists():
+                os.unlink(tmp)
+                # Reaproveitado agora: `gc` não apaga arquivos recentes
+                os.utime(target)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, target)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest.hexdigest(), size
+
+    def register(self, conn: sqlite3.Connection, digest: str, size: int, mime: Optional[str]):
+        """Entrada no catálogo (na transação de quem grava a mensagem)"""
+        conn.execute(
+            "INSERT OR IGNORE INTO media_blobs (hash, size, mime) VALUES (?, ?, ?)",
+            (digest, size, mime),
+        )
+
+    def referenced(self, conn: sqlite3.Connection) -> Set[str]:
+        """Hashes citados por mensagens do banco e das partições de arquivo"""
+        hashes = {row[0] for row in conn.execute(
+            "SELECT DISTINCT media_hash FROM messages_l1 WHERE media_hash IS NOT NULL"
+        )}
+        for path in list_partitions(self.archive_dir) if self.archive_dir else []:
+            partition = open_partition(path)
+            try:
+                columns = {row[1] for row in partition.execute("PRAGMA table_info(messages_l1)")}
+                # Partições anteriores à mídia fora das linhas não têm a coluna
+                if "media_hash" in columns:
+                    hashes.update(row[0] for row in partition.execute(
+                        "SELECT DISTINCT media_hash FROM messages_l1 WHERE media_hash IS NOT NULL"
+                    ))
+            finally:
+                partition.close()
+        return hashes
+
+    def open(self, digest: str) -> BinaryIO:
+        """Leitura sob demanda (o chamador fecha)"""
+        return open(self.path(digest), "rb")
+
+    def gc(self, conn: sqlite3.Connection, grace_seconds: float = 3600) -> Dict[str, int]:
+        """Apaga arquivos que nenhuma mensagem cita (órfãos)
+
+        `released` conta entradas do catálogo cujas mensagens sumiram;
+        `orphans`, arquivos que nem chegaram ao catálogo. Só arquivos sem
+        uso há `grace_seconds`: uma gravação em andamento (arquivo pronto,
+        mensagem ainda não gravada) ou a reutilização de um arquivo
+        existente (`write` renova o mtime) nunca perde o arquivo.
+        """
+        stats = {"released": 0, "orphans": 0}
+        deadline = time.time() - grace_seconds
+
+        def stale(path: Path) -> bool:
+            try:
+                return path.stat().st_mtime < deadline
+            except FileNotFoundError:
+                return False
+
+        cited = self.referenced(conn)
+        for (digest,) in conn.execute("SELECT hash FROM media_blobs").fetchall():
+            if digest in cited or (self.path(digest).exists() and not stale(self.path(digest))):
+                continue
+            # `cited` é uma foto: uma mensagem gravada depois dela ainda segura
+            # o arquivo, então a citação é conferida de novo no próprio DELETE
+            deleted = conn.execute(
+                "DELETE FROM media_blobs WHERE hash = ? AND NOT EXISTS "
+                "(SELECT 1 FROM messages_l1 WHERE media_hash = ?)",
+                (digest, digest),
+            ).rowcount
+            conn.commit()
+            if deleted:
+                self.path(digest).unlink(missing_ok=True)
+                stats["released"] += 1
+
+        # Sobras de transações desfeitas e de gravações interrompidas
+        known = cited | {row[0] for row in conn.execute("SELECT hash FROM media_blobs")}
+        leftovers = [p for p in self.root.glob("*/*/*") if p.name not in known]
+        leftovers.extend((self.root / "tmp").glob("*"))
+        for path in leftovers:
+            if stale(path):
+                path.unlink(missing_ok=True)
+                stats["orphans"] += 1
+        if any(stats.values()):
+            logger.info(f"🧹 Media gc: {stats['released']} released, {stats['orphans']} orphans")
+        return stats
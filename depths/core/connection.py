@@ -0,0 +1,37 @@
+"""
+Conexões com o banco: arquivo ou memória compartilhada
+======================================================
+
+Cada método abre a própria conexão, então um `:memory:` simples sumiria a
+cada `connect`. O modo em memória usa uma URI de cache compartilhado
+(`file:<nome>?mode=memory&cache=shared`): todas as conexões do processo
+com o mesmo nome veem o mesmo banco, que vive enquanto houver ao menos uma
+aberta (`SwaifDatabase` segura uma). Sem disco: sem WAL nem fsync, o
+banco não é visível para outros processos e leitura e escrita simultâneas
+na mesma tabela falham com "database table is locked" em vez de esperar.
+"""
+
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+MEMORY = ":memory:"
+
+DbPath = Union[str, Path]
+
+
+def memory_uri(name: Optional[str] = None) -> str:
+    """URI de um banco em memória compartilhado dentro do processo"""
+    return f"file:swaif-{name or uuid.uuid4().hex}?mode=memory&cache=shared"
+
+
+def is_memory(db_path: DbPath) -> bool:
+    return isinstance(db_path, str) and db_path.startswith("file:") and "mode=memory" in db_path
+
+
+def connect(db_path: DbPath, **kwargs) -> sqlite3.Connection:
+    """`sqlite3.connect` que também abre URIs `file:` (bancos em memória)"""
+    if isinstance(db_path, str) and db_path.startswith("file:"):
+        kwargs.setdefault("uri", True)
+    return sqlite3.connect(db_path, **kwargs)
@@ -0,0 +1,254 @@
+"""
+Armazenamento compactado do texto das mensagens
+===============================================
+
+O mesmo texto de WhatsApp aparece em `messages_l1` e em
+`conversation_messages` (e muitas vezes em várias mensagens: "ok",
+"bom dia"). O texto das mensagens processadas fica em `contents`: uma
+linha por texto distinto (hash), com `content_id` nas duas tabelas - o
+histórico L2 referencia o mesmo corpo da L1 em vez de uma cópia. O
+agrupador L2 grava assim desde a transação que salva a conversa
+(`intern`); `ContentStore.compact` cuida das linhas antigas, gravadas
+com o texto em linha.
+
+Mensagens curtas comprimem mal sozinhas; cada corpo é comprimido com
+deflate usando um dicionário pré-carregado (`zdict`) treinado com as
+próprias mensagens da clínica (`content_dicts`). Mensagens pendentes
+continuam em texto puro: a ingestão e a leitura do lote pela L2 não pagam
+descompressão.
+
+Leitura: `register(conn)` cria a função SQL `swaif_inflate`, usada por
+`content_sql()` - `COALESCE(content, <texto de contents>)`.
+"""
+
+import sqlite3
+import time
+import zlib
+import logging
+from collections import Counter
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional
+
+from depths.core.connection import connect
+
+logger = logging.getLogger(__name__)
+
+# Deflate cru: sem cabeçalho/checksum do zlib (6 bytes por mensagem)
+WBITS = -15
+# Corpo gravado sem compressão (menor que a versão comprimida)
+RAW = 0
+
+
+def content_sql(table: str = "") -> str:
+    """Expressão SQL do texto da mensagem (coluna ou corpo compactado)"""
+    prefix = f"{table}." if table else ""
+    return (
+        f"COALESCE({prefix}content, (SELECT swaif_inflate(dict_id, body) "
+        f"FROM contents WHERE id = {prefix}content_id))"
+    )
+
+
+def train_dictionary(samples: Iterable[str], size: int = 32768) -> bytes:
+    """Dicionário deflate com os trechos que mais se repetem nas amostras
+
+    Pontua sequências de 1 a 4 palavras por bytes economizados (ocorrências
+    x tamanho) e preenche até `size` bytes, o máximo útil do deflate. Os
+    melhores trechos ficam no fim, onde as distâncias são mais curtas.
+    """
+    counts: Counter = Counter()
+    for text in samples:
+        words = (text or "").split()
+        for n in (1, 2, 3, 4):
+            for i in range(len(words) - n + 1):
+                counts[" ".join(words[i:i + n])] += 1
+
+    picked: List[str] = []
+    total = 0
+    joined = ""
+    for gram, count in sorted(counts.items(), key=lambda item: -item[1] * len(item[0])):
+        if count < 2 or total >= size:
+            break
+        # Trecho já contido em outro escolhido não acrescenta nada
+        if gram in joined:
+            continue
+        piece = gram + " "
+        if total + len(piece.encode()) > size:
+            continue
+        picked.append(piece)
+        total += len(piece.encode())
+        joined += piece
+    return "".join(reversed(picked)).encode()
+
+
+class ContentStore:
+    """Corpos de mensagem deduplicados por hash e comprimidos por dicionário"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._dicts: Dict[int, bytes] = {}
+
+    def register(self, conn: sqlite3.Connection) -> sqlite3.Connection:
+        """Habilita `content_sql()` nesta conexão"""
+        # Dicionário lido pela própria conexão: abrir outra dentro da função
+        # SQL trava no cache compartilhado do modo em memória
+        conn.create_function(
+            "swaif_inflate", 2,
+            lambda dict_id, body: self.inflate(dict_id, body, conn),
+            deterministic=True,
+        )
+        return conn
+
+    def _dictionary(self, dict_id: int, conn: Optional[sqlite3.Connection] = None) -> bytes:
+        data = self._dicts.get(dict_id)
+        if data is None:
+            # Dicionários são imutáveis: lidos uma vez
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT data FROM content_dicts WHERE id = ?", (dict_id,)
+                ).fetchone()
+            else:
+                with connect(self.db_path) as own:
+                    row = own.execute(
+                        "SELECT data FROM content_dicts WHERE id = ?", (dict_id,)
+                    ).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown content dictionary {dict_id}")
+            data = self._dicts[dict_id] = row[0]
+        return data
+
+    def inflate(self, dict_id: Optional[int], body: Optional[bytes],
+                conn: Optional[sqlite3.Connection] = None) -> Optional[str]:
+        if body is None:
+            return None
+        if not dict_id:
+            return body.decode("utf-8")
+        decoder = zlib.decompressobj(WBITS, zdict=self._dictionary(dict_id, conn))
+        return (decoder.decompress(body) + decoder.flush()).decode("utf-8")
+
+    def deflate(self, text: str, dict_id: Optional[int]) -> tuple:
+        """(dict_id, corpo) - cru quando a compressão não compensa"""
+        raw = text.encode("utf-8")
+        if dict_id:
+            encoder = zlib.compressobj(9, zlib.DEFLATED, WBITS, zdict=self._dictionary(dict_id))
+            body = encoder.compress(raw) + encoder.flush()
+            if len(body) < len(raw):
+                return dict_id, body
+        return RAW, raw
+
+    def train(self, conn: sqlite3.Connection, sample_size: int = 20000,
+              size: int = 32768) -> Optional[int]:
+        """Treina um dicionário com as mensagens mais recentes; retorna o id
+
+        Amostra o texto de cada mensagem, em linha ou já em `contents` (as
+        processadas não têm mais `content`), mantendo as repetições.
+        """
+        samples = [
+            content if content is not None else self.inflate(dict_id, body, conn)
+            for content, dict_id, body in conn.execute(
+                """
+                SELECT m.content, c.dict_id, c.body
+                FROM messages_l1 m LEFT JOIN contents c ON c.id = m.content_id
+                WHERE m.content IS NOT NULL OR m.content_id IS NOT NULL
+                ORDER BY m.id DESC LIMIT ?
+                """,
+                (sample_size,),
+            )
+        ]
+        data = train_dictionary(samples, size)
+        if not data:
+            return None
+        dict_id = conn.execute(
+            "INSERT INTO content_dicts (data, samples) VALUES (?, ?)", (data, len(samples))
+        ).lastrowid
+        self._dicts[dict_id] = data
+        logger.info(f"📚 Content dictionary {dict_id}: {len(data)} bytes from {len(samples)} messages")
+        return dict_id
+
+    def current_dictionary(self, conn: sqlite3.Connection) -> Optional[int]:
+        row = conn.execute("SELECT MAX(id) FROM content_dicts").fetchone()
+        return row[0]
+
+    def intern(self, conn: sqlite3.Connection, texts: List[str]) -> Dict[str, int]:
+        """content_id de cada texto, na transação de quem grava as mensagens"""
+        if not texts:
+            return {}
+        return self._put_many(conn, texts, self.current_dictionary(conn))
+
+    def _put_many(self, conn: sqlite3.Connection, texts: List[str],
+                  dict_id: Optional[int]) -> Dict[str, int]:
+        """content_id de cada texto distinto, inserindo os novos"""
+        hashes = {text: blake2b(text.encode("utf-8"), digest_size=16).digest() for text in set(texts)}
+        ids: Dict[bytes, int] = {}
+        values = list(hashes.values())
+        for start in range(0, len(values), 900):
+            chunk = values[start:start + 900]
+            ids.update(conn.execute(
+                f"SELECT hash, id FROM contents WHERE hash IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall())
+        for text, digest in hashes.items():
+            if digest not in ids:
+                used_dict, body = self.deflate(text, dict_id)
+                ids[digest] = conn.execute(
+                    "INSERT INTO contents (hash, dict_id, body) VALUES (?, ?, ?)",
+                    (digest, used_dict, body),
+                ).lastrowid
+        return {text: ids[digest] for text, digest in hashes.items()}
+
+    def prune(self, conn: sqlite3.Connection) -> int:
+        """Remove corpos sem referência (mensagens arquivadas ou regravadas)"""
+        removed = conn.execute("""
+            DELETE FROM contents WHERE id NOT IN (
+                SELECT content_id FROM messages_l1 WHERE content_id IS NOT NULL
+                UNION
+                SELECT content_id FROM conversation_messages WHERE content_id IS NOT NULL
+            )
+        """).rowcount
+        conn.commit()
+        return removed
+
+    def compact(self, batch_size: int = 5000, retrain: bool = False) -> Dict[str, int]:
+        """Move o texto das mensagens processadas para `contents`
+
+        Trabalha em faixas de id, uma transação curta por faixa (a ingestão
+        continua). O espaço liberado volta ao sistema com `--compact`.
+        """
+        started = time.perf_counter()
+        stats = {"messages_l1": 0, "conversation_messages": 0, "contents": 0, "pruned": 0}
+        with connect(self.db_path) as conn:
+            dict_id = self.current_dictionary(conn)
+            if dict_id is None or retrain:
+                dict_id = self.train(conn) or dict_id
+                conn.commit()
+            before = conn.execute("SELECT COUNT(*) FROM contents").fetchone()[0]
+
+            for table, condition in (
+                ("messages_l1", "processed = TRUE"),
+                ("conversation_messages", "1 = 1"),
+            ):
+                last = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                for start in range(0, last, batch_size):
+                    rows = conn.execute(
+                        f"""
+                        SELECT id, content FROM {table}
+                        WHERE id > ? AND id <= ? AND content IS NOT NULL AND {condition}
+                        """,
+                        (start, start + batch_size),
+                    ).fetchall()
+                    if not rows:
+                        continue
+                    content_ids = self._put_many(conn, [content for _, content in rows], dict_id)
+                    conn.executemany(
+                        f"UPDATE {table} SET content = NULL, content_id = ? WHERE id = ?",
+                        [(content_ids[content], msg_id) for msg_id, content in rows],
+                    )
+                    conn.commit()
+                    stats[table] += len(rows)
+            stats["contents"] = conn.execute("SELECT COUNT(*) FROM contents").fetchone()[0] - before
+            stats["pruned"] = self.prune(conn)
+
+        logger.info(
+            f"🗜️ Compacted {stats['messages_l1']} L1 + {stats['conversation_messages']} L2 "
+            f"messages into {stats['contents']} new bodies in {time.perf_counter() - started:.1f}s"
+        )
+        return stats
@@ -0,0 +1,487 @@
+"""
+Daemon de escrita único
+=======================
+
+`run-monitor`, `--process-l2`, `run-pipe` e os comandos de manutenção abrem
+o mesmo `data/swaif_msg.db` em processos separados: rodando juntos, brigam
+pelo lock de escrita do SQLite ("database is locked") e duas execuções da
+L2 podem agrupar as mesmas mensagens pendentes.
+
+`WriterDaemon` é o único processo que grava. Os outros falam com ele por
+um socket Unix (`data/swaif.sock`), em linhas JSON:
+
+- `ingest`: mensagens L1. Pedidos de vários clientes que chegam juntos
+  viram uma transação só (`SwaifDatabase.insert_l1_batch`).
+- `group`: roda a L2. Pedidos simultâneos viram uma execução só.
+- `lease` / `release`: locação exclusiva com prazo (renovada pelo dono).
+  Enquanto alguém tem a locação `writer`, o daemon não grava, e o dono
+  pode gravar direto (rebuild, arquivamento, compactação) sem disputar o
+  lock. Uma locação não renovada expira sozinha (processo morto).
+- `stats`, `ping`.
+
+Todas as gravações acontecem em uma única thread do daemon, em ordem.
+Leituras (painel, relatórios) continuam direto no banco, via WAL. Nos
+intervalos ociosos a mesma thread devolve páginas livres ao sistema, um
+passo curto de `incremental_vacuum` por vez (core/maintenance.py).
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from depths.core.maintenance import incremental_compact
+
+logger = logging.getLogger(__name__)
+
+SOCKET_PATH = Path("data/swaif.sock")
+# Locação que pausa as gravações do daemon
+WRITER = "writer"
+
+
+class DaemonError(RuntimeError):
+    """Erro devolvido pelo daemon para um pedido"""
+
+
+class LeaseTable:
+    """Locações exclusivas por nome, com prazo"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name: str, owner: str, ttl: float) -> Dict:
+        """Concede (ou renova, se for do mesmo dono) a locação"""
+        with self._lock:
+            now = self.clock()
+            holder = self._leases.get(name)
+            if holder and holder[0] != owner and holder[1] > now:
+                return {"granted": False, "holder": holder[0], "expires_in": holder[1] - now}
+            self._leases[name] = (owner, now + ttl)
+            return {"granted": True, "holder": owner, "expires_in": ttl}
+
+    def release(self, name: str, owner: str) -> bool:
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder and holder[0] == owner:
+                del self._leases[name]
+                return True
+            return False
+
+    def holder(self, name: str) -> Optional[str]:
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is None or holder[1] <= self.clock():
+                self._leases.pop(name, None)
+                return None
+            return holder[0]
+
+
+class _Request:
+    """Pedido de escrita aguardando a thread de gravação"""
+
+    def __init__(self, op: str, messages: Optional[List[Dict]] = None):
+        self.op = op
+        self.messages = messages or []
+        self.result: Dict = {}
+        self.done = threading.Event()
+        self._state = threading.Lock()
+        self._started = False
+        self._cancelled = False
+
+    def start(self) -> bool:
+        """A gravação vai começar; False se quem pediu já desistiu"""
+        with self._state:
+            self._started = not self._cancelled
+            return self._started
+
+    def cancel(self) -> bool:
+        """Desiste de um pedido ainda na fila; False se a gravação já começou"""
+        with self._state:
+            self._cancelled = not self._started
+            return self._cancelled
+
+    def finish(self, result: Dict):
+        self.result = result
+        self.done.set()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.owner.handle(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(response, default=str).encode() + b"\n")
+            self.wfile.flush()
+
+
+class WriterDaemon:
+    """Dono das gravações: ingestão e L2 em uma thread, pedidos por socket"""
+
+    def __init__(self, grouper, socket_path=SOCKET_PATH, batch_size: int = 1000,
+                 group_interval: Optional[float] = 5.0,
+                 vacuum_interval: Optional[float] = 60.0, vacuum_pages: int = 200,
+                 request_timeout: float = 120.0):
+        self.grouper = grouper
+        self.db = grouper.db
+        self.socket_path = Path(socket_path)
+        # Mensagens por transação de ingestão
+        self.batch_size = batch_size
+        # L2 automática após ingestões (None: só com pedidos `group`); o
+        # intervalo adaptado pelo controlador da L2 encurta a espera
+        self.group_interval = group_interval
+        # Um passo de `incremental_vacuum(vacuum_pages)` quando ocioso, no
+        # máximo a cada `vacuum_interval` segundos (None: só com --compact)
+        self.vacuum_interval = vacuum_interval
+        self.vacuum_pages = vacuum_pages
+        # Espera máxima de um pedido na fila (locação longa, L2 travada)
+        self.request_timeout = request_timeout
+        self.leases = LeaseTable()
+        self._requests: "queue.Queue[_Request]" = queue.Queue()
+        # Segurado durante cada gravação; a locação `writer` espera por ele
+        self._writing = threading.Lock()
+        self._stop = threading.Event()
+        self._server: Optional[_Server] = None
+        self._writer: Optional[threading.Thread] = None
+        self._ingested_since_group = 0
+        self.stats = {"ingest_requests": 0, "ingest_batches": 0, "messages": 0,
+                      "duplicates": 0, "group_runs": 0, "conversations": 0,
+                      "pages_vacuumed": 0}
+
+    # --- socket ---------------------------------------------------------
+
+    def start(self):
+        """Abre o socket e a thread de gravação (retorna em seguida)"""
+        if self.socket_path.exists():
+            if DaemonClient(self.socket_path).available():
+                raise DaemonError(f"Another writer daemon is running on {self.socket_path}")
+            # Sobra de um daemon que morreu
+            self.socket_path.unlink()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self._server = _Server(str(self.socket_path), _Handler)
+        self._server.owner = self
+        self._writer = threading.Thread(target=self._write_loop, name="writer", daemon=True)
+        self._writer.start()
+        threading.Thread(target=self._server.serve_forever, name="ipc", daemon=True).start()
+        logger.info(f"🔌 Writer daemon listening on {self.socket_path}")
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            logger.info("⏹️ Writer daemon stopped")
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self.socket_path.unlink(missing_ok=True)
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+    def handle(self, request: Dict) -> Dict:
+        """Um pedido JSON -> resposta JSON (threads do socket)"""
+        op = request.get("op")
+        if op in ("ingest", "group"):
+            if self._stop.is_set():
+                return {"ok": False, "error": "writer daemon stopping"}
+            pending = _Request(op, request.get("messages"))
+            self._requests.put(pending)
+            # Gravação já começada vai até o fim: a resposta diz o que gravou
+            if pending.done.wait(self.request_timeout) or not pending.cancel():
+                pending.done.wait()
+                return pending.result
+            return {"ok": False, "error": f"writer busy: request not started after "
+                                          f"{self.request_timeout:.0f}s (nothing was written)"}
+        if op == "lease":
+            name = request.get("name", WRITER)
+            if name == WRITER:
+                # Concedida entre duas gravações, nunca no meio de uma
+                with self._writing:
+                    result = self.leases.acquire(name, request["owner"], float(request["ttl"]))
+            else:
+                result = self.leases.acquire(name, request["owner"], float(request["ttl"]))
+            return {"ok": True, **result}
+        if op == "release":
+            return {"ok": True,
+                    "released": self.leases.release(request.get("name", WRITER), request["owner"])}
+        if op == "stats":
+            return {"ok": True, "stats": dict(self.stats), "dedup": self.db.dedup.stats(),
+                    "queued": self._requests.qsize(), "writer_lease": self.leases.holder(WRITER),
+                    "l2_batching": self.grouper.controller.stats()}
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        return {"ok": False, "error": f"Unknown op {op!r}"}
+
+    # --- gravação -------------------------------------------------------
+
+    def _next_batch(self, timeout: float) -> List[_Request]:
+        """Primeiro pedido da fila (espera até `timeout`) + os que já chegaram"""
+        try:
+            batch = [self._requests.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        size = len(batch[0].messages)
+        while size < self.batch_size:
+            try:
+                pending = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.messages)
+        return batch
+
+    def _write_loop(self):
+        last_group = last_vacuum = time.monotonic()
+        while not self._stop.is_set():
+            batch = self._next_batch(timeout=0.2)
+            if not batch and self.vacuum_interval is not None \
+                    and time.monotonic() - last_vacuum >= self.vacuum_interval:
+                self._vacuum_step()
+                last_vacuum = time.monotonic()
+            while not self._stop.is_set():
+                with self._writing:
+                    if self.leases.holder(WRITER):
+                        paused = True
+                    else:
+                        paused = False
+                        last_group = self._write(batch, last_group)
+                if not paused:
+                    break
+                # Outro processo está gravando: os pedidos esperam na fila
+                time.sleep(0.05)
+        # Pedidos que chegaram durante o desligamento
+        for pending in batch + list(self._requests.queue):
+            if not pending.done.is_set():
+                pending.finish({"ok": False, "error": "writer daemon stopping"})
+
+    def _write(self, batch: List[_Request], last_group: float) -> float:
+        """Executa um lote de pedidos; retorna o instante da última L2"""
+        # Pedidos cujo cliente desistiu de esperar ficam de fora
+        batch = [r for r in batch if r.start()]
+        ingest = [r for r in batch if r.op == "ingest"]
+        groups = [r for r in batch if r.op == "group"]
+        if ingest:
+            self._ingest(ingest)
+        due = (self.group_interval is not None and self._ingested_since_group
+               and time.monotonic() - last_group >= self.group_wait())
+        if groups or due:
+            self._group(groups)
+            return time.monotonic()
+        return last_group
+
+    def _vacuum_step(self):
+        """Um passo de `incremental_vacuum`, fora da locação de outro processo"""
+        with self._writing:
+            if self.leases.holder(WRITER):
+                return
+            try:
+                report = incremental_compact(self.db.db_path, pages_per_step=self.vacuum_pages,
+                                             sleep_seconds=0, max_steps=1)
+            except Exception as e:
+                logger.error(f"Incremental vacuum step failed: {e}")
+                return
+        self.stats["pages_vacuumed"] += report["pages_freed"]
+
+    def group_wait(self) -> float:
+        """Espera entre L2 automáticas: intervalo do controlador, até `group_interval`"""
+        return min(self.group_interval, self.grouper.controller.interval)
+
+    def _ingest(self, requests: List[_Request]):
+        messages = [msg for r in requests for msg in r.messages]
+        errors: Dict[int, str] = {}
+        try:
+            ids = self.db.insert_l1_batch(messages)
+        except Exception as e:
+            # Uma mensagem ruim não derruba o lote: repete uma a uma
+            logger.error(f"❌ Batch of {len(messages)} failed ({e}); retrying one by one")
+            ids = []
+            for i, msg in enumerate(messages):
+                try:
+                    ids.append(self.db.insert_l1_message(msg))
+                except Exception as msg_error:
+                    ids.append(None)
+                    errors[i] = str(msg_error)
+        self.stats["ingest_requests"] += len(requests)
+        self.stats["ingest_batches"] += 1
+        stored = sum(i is not None for i in ids)
+        self.stats["messages"] += stored
+        self.stats["duplicates"] += len(ids) - stored - len(errors)
+        self._ingested_since_group += stored
+
+        offset = 0
+        for r in requests:
+            own = range(offset, offset + len(r.messages))
+            failed = [errors[i] for i in own if i in errors]
+            result = {"ok": not failed, "ids": ids[own.start:own.stop]}
+            if failed:
+                result["error"] = f"{len(failed)} message(s) failed: {failed[0]}"
+            r.finish(result)
+            offset = own.stop
+
+    def _group(self, requests: List[_Request]):
+        try:
+            conversations = self.grouper.process_pending_messages()
+            result = {"ok": True,
+                      "conversations": [c["conversation_id"] for c in conversations]}
+            self.stats["group_runs"] += 1
+            self.stats["conversations"] += len(conversations)
+            self._ingested_since_group = 0
+        except Exception as e:
+            logger.error(f"❌ L2 failed in writer daemon: {e}")
+            result = {"ok": False, "error": str(e)}
+        for r in requests:
+            r.finish(result)
+
+
+class DaemonClient:
+    """Cliente do daemon; imita a interface de escrita de `SwaifDatabase`"""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout: Optional[float] = None):
+        self.socket_path = Path(socket_path)
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(str(self.socket_path))
+        self._sock, self._file = sock, sock.makefile("rb")
+
+    def call(self, request: Dict) -> Dict:
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                self._sock.sendall(json.dumps(request).encode() + b"\n")
+                line = self._file.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise ConnectionError(f"Writer daemon closed the connection ({self.socket_path})")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise DaemonError(response.get("error", "unknown error"))
+        return response
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def available(self) -> bool:
+        """True se há um daemon respondendo no socket"""
+        if not self.socket_path.exists():
+            return False
+        try:
+            self.call({"op": "ping"})
+            return True
+        except (OSError, DaemonError):
+            return False
+
+    def insert_l1_batch(self, messages: List[Dict]) -> List[Optional[int]]:
+        return self.call({"op": "ingest", "messages": messages})["ids"]
+
+    def insert_l1_message(self, data: Dict) -> Optional[int]:
+        return self.insert_l1_batch([data])[0]
+
+    def group(self) -> List[str]:
+        """Roda a L2 no daemon; ids das conversas criadas/atualizadas"""
+        return self.call({"op": "group"})["conversations"]
+
+    def stats(self) -> Dict:
+        return self.call({"op": "stats"})
+
+    def dedup_stats(self) -> Dict:
+        return self.stats()["dedup"]
+
+    @contextmanager
+    def lease(self, name: str = WRITER, ttl: float = 60.0, wait: float = 0.5) -> Iterator[str]:
+        """Segura a locação (esperando se estiver com outro) e a renova em segundo plano
+
+        Renovação negada (a locação expirou e outro dono a pegou) ou falha:
+        a renovação para e o bloco termina com DaemonError.
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        while True:
+            result = self.call({"op": "lease", "name": name, "owner": owner, "ttl": ttl})
+            if result["granted"]:
+                break
+            logger.info(f"⏳ Waiting for lease {name!r} held by {result['holder']}")
+            time.sleep(min(wait, result["expires_in"]))
+
+        stop = threading.Event()
+        lost: List[str] = []
+
+        def renew():
+            # Conexão própria: não disputa o socket com o dono da locação
+            renewer = DaemonClient(self.socket_path, self.timeout)
+            try:
+                while not stop.wait(ttl / 3):
+                    try:
+                        result = renewer.call({"op": "lease", "name": name,
+                                               "owner": owner, "ttl": ttl})
+                    except (OSError, DaemonError) as e:
+                        lost.append(f"renewal failed: {e}")
+                        return
+                    if not result["granted"]:
+                        lost.append(f"now held by {result['holder']}")
+                        return
+            finally:
+                renewer.close()
+
+        thread = threading.Thread(target=renew, daemon=True)
+        thread.start()
+        try:
+            yield owner
+        finally:
+            stop.set()
+            thread.join()
+            if lost:
+                logger.error(f"❌ Lease {name!r} lost while held ({lost[0]})")
+            else:
+                self.call({"op": "release", "name": name, "owner": owner})
+        # Fora do `finally`: não esconde um erro do próprio bloco
+        if lost:
+            raise DaemonError(f"Lease {name!r} lost before the block finished ({lost[0]})")
+
+
+@contextmanager
+def exclusive_writes(socket_path=SOCKET_PATH, ttl: float = 60.0) -> Iterator[bool]:
+    """Pausa o daemon (se houver) enquanto o bloco grava direto no banco"""
+    client = DaemonClient(socket_path)
+    if not client.available():
+        yield False
+        return
+    try:
+        with client.lease(WRITER, ttl=ttl):
+            logger.info(f"🔒 Writer daemon paused ({socket_path})")
+            yield True
+    finally:
+        client.close()
@@ -1,38 +1,95 @@
+import gc
 import sqlite3
+import tempfile
 from pathlib import Path
-from typing import Dict, List
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from depths.core import outbox
+from depths.core.archive import list_partitions, open_partition
+from depths.core.blobs import BlobStore, media_payload
+from depths.core.connection import MEMORY, connect, is_memory, memory_uri
+from depths.core.content_store import ContentStore, content_sql
+from depths.core.dedup import Deduplicator, message_fingerprint
+from depths.core.history import Cursor, HistoryCache, query_history_page
+from depths.core.migrations import MigrationRunner
+from depths.core.participants import ParticipantRegistry
+from depths.core.replica import open_readonly
 
 class SwaifDatabase:
     """SQLite handler para as 3 camadas"""
     
-    def __init__(self, db_path: str = "data/swaif_msg.db"):
-        self._temp_db = None
-        if db_path == ":memory:":
-            # Para testes, usar um arquivo temporário em vez de :memory:
-            # pois :memory: não persiste entre conexões
-            import tempfile
-            import os
-            fd, temp_path = tempfile.mkstemp(suffix=".db")
-            os.close(fd)  # Fechar o file descriptor, usar apenas o path
-            self.db_path = temp_path
-            self._temp_db = temp_path  # Guardar o caminho para cleanup
+    def __init__(self, db_path: str = "data/swaif_msg.db", archive_dir: str = None,
+                 vector_dir: str = None, media_dir: str = None):
+        self._anchor = None
+        self._workdir = None
+        if db_path == MEMORY or is_memory(db_path):
+            # Banco em memória compartilhado (ver core/connection.py); a conexão
+            # âncora o mantém vivo entre as conexões abertas por cada método
+            self.db_path = memory_uri() if db_path == MEMORY else db_path
+            self._anchor = connect(self.db_path, check_same_thread=False)
+            # Mídia, vetores e partições continuam em arquivos: diretório temporário
+            self._workdir = tempfile.TemporaryDirectory(prefix="swaif-")
+            base = Path(self._workdir.name)
         else:
             self.db_path = Path(db_path)
             self.db_path.parent.mkdir(exist_ok=True)
+            base = self.db_path.parent
+        # Partições mensais de dados frios (ver core/archive.py)
+        self.archive_dir = Path(archive_dir) if archive_dir else base / "archive"
+        # Índices de vetores em memmap (ver core/vectors.py)
+        self.vector_dir = Path(vector_dir) if vector_dir else base / "vectors"
+        # Áudios, imagens e documentos fora das linhas (ver core/blobs.py)
+        self.media = BlobStore(media_dir if media_dir else base / "media", self.archive_dir)
+        self.participants = ParticipantRegistry()
+        self.dedup = Deduplicator()
+        self.history_cache = HistoryCache()
+        self.contents = ContentStore(self.db_path)
         self._init_tables()
-    
+
+    @classmethod
+    def snapshot(cls, source_path, **kwargs) -> "SwaifDatabase":
+        """Cópia em memória de um banco (experimentos sem tocar no original)"""
+        uri = memory_uri()
+        source = open_readonly(source_path)
+        target = connect(uri)
+        try:
+            # Um passo só: a cópia sai de um snapshot consistente da origem
+            source.backup(target)
+            db = cls(uri, **kwargs)
+        finally:
+            source.close()
+            target.close()
+        return db
+
+    @property
+    def in_memory(self) -> bool:
+        return self._anchor is not None
+
+    def connect(self, **kwargs) -> sqlite3.Connection:
+        """Nova conexão com o banco (arquivo ou memória compartilhada)"""
+        return connect(self.db_path, **kwargs)
+
     def cleanup(self):
-        """Remove arquivo temporário (para testes)"""
-        if self._temp_db:
-            import os
-            try:
-                os.unlink(self._temp_db)
-            except (FileNotFoundError, PermissionError):
-                pass
+        """Libera o banco em memória e o diretório temporário (para testes)"""
+        if self._anchor:
+            # Última conexão fechada: o SQLite descarta o banco. As de
+            # `with self.connect()` só fecham quando coletadas (ciclo com o
+            # cache de statements)
+            self._anchor.close()
+            self._anchor = None
+            gc.collect()
+        if self._workdir:
+            self._workdir.cleanup()
+            self._workdir = None
     
     def _init_tables(self):
-        """Cria tabelas L1, L2, L3"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Cria tabelas L1, L2, L3 e aplica migrações pendentes"""
+        with self.connect() as conn:
+            # Só tem efeito em bancos novos; existentes usam --compact
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            # WAL: leituras de relatório não bloqueiam a ingestão (core/replica.py)
+            conn.execute("PRAGMA journal_mode = WAL")
+
             # L1 - Mensagens brutas do N8N
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS messages_l1 (
@@ -101,38 +158,190 @@ class SwaifDatabase:
             """)
 
             conn.commit()
+
+        self.schema_version = MigrationRunner(self.db_path).run()
     
-    def insert_l1_message(self, data: Dict) -> int:
-        """Insere mensagem L1 do N8N"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                INSERT INTO messages_l1
-                (n8n_host, evo_instance, evo_host, sender_phone,
-                 receiver_phone, message_type, content, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                data.get("host_n8n"),
-                data.get("evo_api_instance_name"),
-                data.get("host_evoapi"),
-                data.get("sender_raw_data"),
-                data.get("receiver_raw_data"),
-                data.get("message_type"),
-                data.get("sent_message"),
-                data.get("timestamp")
-            ))
-            return cursor.lastrowid
+    def insert_l1_message(self, data: Dict) -> Optional[int]:
+        """Insere mensagem L1 do N8N (None se for reenvio já gravado)"""
+        return self.insert_l1_batch([data])[0]
+
+    def insert_l1_batch(self, messages: List[Dict]) -> List[Optional[int]]:
+        """Insere várias mensagens em uma transação (ids; None = reenvio)"""
+        try:
+            with self.connect() as conn:
+                return [self._insert_l1_message(conn, data) for data in messages]
+        except Exception:
+            # Ids e impressões da transação desfeita não podem ficar em cache
+            self.participants.clear()
+            self.dedup.forget_recent()
+            raise
+
+    def _insert_l1_message(self, conn: sqlite3.Connection, data: Dict) -> Optional[int]:
+        key = message_fingerprint(data)
+        if self.dedup.is_duplicate(conn, key):
+            return None
+
+        content = data.get("sent_message")
+        media_hash = None
+        payload = media_payload(data)
+        if payload is not None:
+            # Arquivo gravado antes do INSERT (o lock de escrita só começa no primeiro)
+            chunks, mime = payload
+            media_hash, size = self.media.write(chunks)
+            if not (data.get("media_base64") or data.get("media_path")):
+                # O próprio `sent_message` era o base64
+                content = None
+
+        instance = data.get("evo_api_instance_name")
+        cursor = conn.execute("""
+            INSERT OR IGNORE INTO messages_l1
+            (n8n_host, evo_instance, evo_host, sender_phone,
+             receiver_phone, message_type, content, timestamp,
+             sender_id, receiver_id, fingerprint, media_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            data.get("host_n8n"),
+            instance,
+            data.get("host_evoapi"),
+            data.get("sender_raw_data"),
+            data.get("receiver_raw_data"),
+            data.get("message_type"),
+            content,
+            data.get("timestamp"),
+            self.participants.get_id(
+                conn, data.get("sender_raw_data"), instance=instance
+            ),
+            self.participants.get_id(
+                conn, data.get("receiver_raw_data"), instance=instance
+            ),
+            key,
+            media_hash,
+        ))
+        if cursor.rowcount == 0:
+            # Outro processo gravou a mesma mensagem entre a checagem e o INSERT
+            # (o arquivo de mídia, se novo, fica para o `gc`)
+            self.dedup.record_duplicate(key)
+            return None
+        if media_hash is not None:
+            self.media.register(conn, media_hash, size, mime)
+        outbox.emit(conn, "message", "insert", cursor.lastrowid, {
+            "sender_phone": data.get("sender_raw_data"),
+            "receiver_phone": data.get("receiver_raw_data"),
+            "message_type": data.get("message_type"),
+            "timestamp": data.get("timestamp"),
+            "evo_instance": instance,
+        })
+        self.dedup.remember(key)
+        return cursor.lastrowid
+
+    def changes(self, consumer: str, from_latest: bool = False) -> outbox.OutboxConsumer:
+        """Leitor do outbox de mudanças com offset próprio (ver outbox.py)"""
+        return outbox.OutboxConsumer(self.db_path, consumer, from_latest=from_latest)
+
+    def open_media(self, message_id: int) -> Optional[BinaryIO]:
+        """Mídia de uma mensagem L1, lida sob demanda (None se não houver)"""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT media_hash FROM messages_l1 WHERE id = ?", (message_id,)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self.media.open(row[0])
 
     def get_conversation_history(self, conversation_id: str) -> List[Dict]:
         """Recupera o histórico de mensagens de uma conversa"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute(
-                """
-                SELECT sender_type, content, timestamp
-                FROM conversation_messages
-                WHERE conversation_id = ?
-                ORDER BY timestamp ASC
-                """,
+        return list(self.iter_conversation_history(conversation_id, page_size=1000))
+
+    def iter_conversation_history(self, conversation_id: str,
+                                  page_size: int = 500) -> Iterator[Dict]:
+        """Percorre o histórico página a página (memória O(página))"""
+        cursor = None
+        while True:
+            page = self.get_history_page(conversation_id, after=cursor, limit=page_size)
+            yield from page["messages"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    def get_history_page(self, conversation_id: str, after: Optional[Cursor] = None,
+                         limit: int = 100) -> Dict:
+        """Página do histórico após o cursor (timestamp, id), com cache LRU
+
+        Retorna {"messages": [...], "next_cursor": cursor ou None}. As páginas
+        em cache são compartilhadas: não altere o resultado.
+        """
+        key = (conversation_id, after, limit)
+        with self.contents.register(self.connect()) as conn:
+            conv = conn.execute(
+                "SELECT id, version FROM conversations_l2 WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+            if conv is not None:
+                # A versão muda a cada gravação da L2 nesta conversa
+                token = tuple(conv)
+                page = self.history_cache.get(key, token)
+                if page is None:
+                    page = query_history_page(conn, conv[0], after, limit, content_sql())
+                    self.history_cache.put(key, token, page)
+                return page
+
+            archived = conn.execute(
+                "SELECT partition FROM archived_conversations WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+
+        if archived is None:
+            return {"messages": [], "next_cursor": None}
+        # Conversas arquivadas não mudam mais
+        token = ("archive", archived[0])
+        page = self.history_cache.get(key, token)
+        if page is not None:
+            return page
+
+        archive_conn = open_partition(self.archive_dir / archived[0])
+        try:
+            conv = archive_conn.execute(
+                "SELECT id FROM conversations_l2 WHERE conversation_id = ?",
                 (conversation_id,),
-            )
-            return [dict(row) for row in cursor.fetchall()]
+            ).fetchone()
+            if conv is None:
+                return {"messages": [], "next_cursor": None}
+            page = query_history_page(archive_conn, conv[0], after, limit)
+        finally:
+            archive_conn.close()
+        self.history_cache.put(key, token, page)
+        return page
+
+    def search_messages(self, term: str, limit: int = 50) -> List[Dict]:
+        """Busca texto no histórico (banco principal + partições arquivadas)"""
+        query = """
+            SELECT conversation_id, sender_type, {content} AS content, timestamp
+            FROM conversation_messages
+            WHERE {content} LIKE ?
+            ORDER BY timestamp DESC
+            LIMIT ?
+        """
+        pattern = f"%{term}%"
+        results: List[Dict] = []
+
+        with self.contents.register(self.connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(query.format(content=content_sql()), (pattern, limit))
+            results.extend(dict(r) for r in rows)
+
+        # Partições são mensais e vêm da mais recente para a mais antiga
+        for path in list_partitions(self.archive_dir):
+            if len(results) >= limit:
+                break
+            archive_conn = open_partition(path)
+            try:
+                archive_conn.row_factory = sqlite3.Row
+                rows = archive_conn.execute(
+                    query.format(content="content"), (pattern, limit - len(results))
+                )
+                results.extend(dict(r) for r in rows)
+            finally:
+                archive_conn.close()
+
+        results.sort(key=lambda r: r["timestamp"] or "", reverse=True)
+        return results[:limit]
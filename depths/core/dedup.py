@@ -0,0 +1,170 @@
+"""
+Deduplicação de mensagens reenviadas
+====================================
+
+Retentativas do N8N, reentregas de webhook da Evolution API e a
+releitura de pastas após reinício geram a mesma mensagem várias vezes.
+Cada mensagem L1 recebe uma impressão digital estável (instância,
+remetente, destinatário, timestamp, hash do conteúdo) protegida por um
+índice único em `messages_l1.fingerprint`.
+
+Antes de tocar o banco, o `Deduplicator` consulta:
+1. um cache limitado das impressões mais recentes (duplicata certa);
+2. um filtro de Bloom com todas as impressões conhecidas - se ele diz
+   "nunca vi", a mensagem é nova e vai direto para o INSERT, sem sondar
+   o índice. Só os positivos do Bloom pagam um SELECT no índice.
+"""
+
+import hashlib
+import math
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from depths.core.participants import clean_phone
+
+
+def fingerprint(instance: Optional[str], sender: Optional[str], receiver: Optional[str],
+                timestamp: Optional[str], content: Optional[str]) -> str:
+    """Impressão digital estável de uma mensagem"""
+    content_hash = hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+    key = "\x1f".join([
+        instance or "",
+        clean_phone(sender),
+        clean_phone(receiver),
+        timestamp or "",
+        content_hash,
+    ])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def message_fingerprint(data: Dict) -> str:
+    """Impressão digital a partir do JSON L1 do N8N"""
+    return fingerprint(
+        data.get("evo_api_instance_name"),
+        data.get("sender_raw_data"),
+        data.get("receiver_raw_data"),
+        data.get("timestamp"),
+        data.get("sent_message"),
+    )
+
+
+class BloomFilter:
+    """Filtro de Bloom com hashing duplo sobre blake2b"""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.size = bits
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        self.bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class FingerprintCache:
+    """Conjunto LRU limitado das impressões mais recentes"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[str, None]" = OrderedDict()
+
+    def add(self, key: str):
+        self._items[key] = None
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def __contains__(self, key: str) -> bool:
+        if key in self._items:
+            self._items.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Deduplicator:
+    """Filtro de Bloom + cache recente na frente do índice único"""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001,
+                 recent_size: int = 10000):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.recent = FingerprintCache(recent_size)
+        self._seeded = False
+        self.counters = {
+            "checked": 0,
+            "duplicates": 0,
+            "recent_hits": 0,
+            "bloom_negatives": 0,
+            "index_probes": 0,
+        }
+
+    def seed(self, conn: sqlite3.Connection):
+        """Carrega no Bloom as impressões já gravadas (uma vez por processo)"""
+        if self._seeded:
+            return
+        for (value,) in conn.execute(
+            "SELECT fingerprint FROM messages_l1 WHERE fingerprint IS NOT NULL"
+        ):
+            self.bloom.add(value)
+        self._seeded = True
+
+    def is_duplicate(self, conn: sqlite3.Connection, key: str) -> bool:
+        """True se a mensagem já foi gravada"""
+        self.seed(conn)
+        self.counters["checked"] += 1
+
+        if key in self.recent:
+            self.counters["recent_hits"] += 1
+            self.counters["duplicates"] += 1
+            return True
+
+        if key not in self.bloom:
+            # Caso comum: mensagem nova, sem consulta ao índice
+            self.counters["bloom_negatives"] += 1
+            return False
+
+        self.counters["index_probes"] += 1
+        found = conn.execute(
+            "SELECT 1 FROM messages_l1 WHERE fingerprint = ?", (key,)
+        ).fetchone()
+        if found:
+            self.recent.add(key)
+            self.counters["duplicates"] += 1
+            return True
+        return False
+
+    def remember(self, key: str):
+        """Registra uma impressão recém-gravada"""
+        self.bloom.add(key)
+        self.recent.add(key)
+
+    def forget_recent(self):
+        """Descarta o cache recente (transação desfeita); o Bloom só gera sondas a mais"""
+        self.recent = FingerprintCache(self.recent.maxsize)
+
+    def record_duplicate(self, key: str):
+        """Duplicata detectada pelo índice único (ex.: outro processo gravou)"""
+        self.counters["duplicates"] += 1
+        self.remember(key)
+
+    def stats(self) -> Dict:
+        """Contadores e taxas de acerto"""
+        stats = dict(self.counters)
+        checked = stats["checked"] or 1
+        stats["hit_rate"] = stats["duplicates"] / checked
+        stats["probe_rate"] = stats["index_probes"] / checked
+        return stats
@@ -0,0 +1,103 @@
+"""
+Histórico paginado de conversas
+===============================
+
+`query_history_page` lê o histórico de uma conversa em páginas com cursor
+(timestamp, id) em vez de OFFSET: cada página custa o mesmo, usando o
+índice por `conversation_ref`. `HistoryCache` guarda as páginas mais
+lidas, validadas pela `version` da conversa em `conversations_l2`.
+"""
+
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# Cursor de paginação: (timestamp, id) da última mensagem entregue
+Cursor = Tuple[str, int]
+
+PAGE_QUERY = """
+    SELECT id, sender_type, {content}, timestamp
+    FROM conversation_messages
+    WHERE conversation_ref = ? {after}
+    ORDER BY timestamp ASC, id ASC
+    LIMIT ?
+"""
+# Continuação após o cursor; timestamps NULL vêm primeiro na ordenação
+AFTER_TIMESTAMP = "AND (timestamp, id) > (?, ?)"
+AFTER_NULL_TIMESTAMP = "AND (timestamp IS NOT NULL OR id > ?)"
+
+
+def query_history_page(conn: sqlite3.Connection, conversation_ref: int,
+                       after: Optional[Cursor], limit: int,
+                       content: str = "content") -> Dict:
+    """Uma página do histórico a partir do cursor (usa o índice por conversation_ref)
+
+    `content`: expressão do texto (`content_store.content_sql()` no banco
+    principal, onde o texto pode estar compactado).
+    """
+    if after is None:
+        sql, params = PAGE_QUERY.format(content=content, after=""), (conversation_ref, limit)
+    elif after[0] is None:
+        sql = PAGE_QUERY.format(content=content, after=AFTER_NULL_TIMESTAMP)
+        params = (conversation_ref, after[1], limit)
+    else:
+        sql = PAGE_QUERY.format(content=content, after=AFTER_TIMESTAMP)
+        params = (conversation_ref, after[0], after[1], limit)
+
+    rows = conn.execute(sql, params).fetchall()
+    messages = [
+        {"sender_type": sender_type, "content": content, "timestamp": timestamp}
+        for _, sender_type, content, timestamp in rows
+    ]
+    next_cursor = (rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+    return {"messages": messages, "next_cursor": next_cursor}
+
+
+class HistoryCache:
+    """LRU de páginas de histórico validadas pela versão da conversa
+
+    Cada entrada guarda o token (id, version) da conversa no momento da
+    leitura; gravações da L2 incrementam `conversations_l2.version`, então
+    uma página obsoleta nunca é servida - nem entre processos.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._pages: "OrderedDict[Tuple, Tuple[Hashable, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple, token: Hashable) -> Optional[Dict]:
+        entry = self._pages.get(key)
+        if entry is None or entry[0] != token:
+            self.misses += 1
+            return None
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Tuple, token: Hashable, page: Dict):
+        self._pages[key] = (token, page)
+        self._pages.move_to_end(key)
+        if len(self._pages) > self.maxsize:
+            self._pages.popitem(last=False)
+
+    def invalidate(self, conversation_id: str):
+        """Descarta as páginas de uma conversa"""
+        for key in [k for k in self._pages if k[0] == conversation_id]:
+            del self._pages[key]
+
+    def clear(self):
+        self._pages.clear()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "pages": len(self._pages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
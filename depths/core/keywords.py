@@ -0,0 +1,89 @@
+"""
+Dicionário de palavras-chave compilado
+======================================
+
+`KeywordAutomaton` compila um dicionário {tag: [palavras ou frases]} em um
+único autômato Aho-Corasick sobre palavras: o texto é normalizado (sem
+acentos, minúsculas), quebrado em palavras e percorrido uma vez, com uma
+transição por palavra - o custo não cresce com o número de palavras-chave.
+Frases casam só com palavras inteiras ("dor" não casa com "doutor").
+"""
+
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Set
+
+WORD = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Remove acentos e diferenças de maiúsculas ("Urgência" -> "urgencia")"""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(fold(text))
+
+
+class KeywordAutomaton:
+    """Aho-Corasick sobre palavras normalizadas: tags presentes em um texto"""
+
+    def __init__(self, rules: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[FrozenSet[str]] = [frozenset()]
+        outputs: List[Set[str]] = [set()]
+        for tag, phrases in rules.items():
+            for phrase in phrases:
+                words = tokenize(phrase)
+                if not words:
+                    continue
+                node = 0
+                for word in words:
+                    nxt = self._goto[node].get(word)
+                    if nxt is None:
+                        nxt = self._goto[node][word] = len(self._goto)
+                        self._goto.append({})
+                        self._fail.append(0)
+                        outputs.append(set())
+                    node = nxt
+                outputs[node].add(tag)
+
+        # Links de falha em largura: cada nó herda as tags do seu sufixo
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(word, 0)
+                outputs[child] |= outputs[self._fail[child]]
+        self._out = [frozenset(tags) for tags in outputs]
+
+    def __len__(self):
+        return len(self._goto) - 1
+
+    def tags(self, text) -> Set[str]:
+        """Tags de todas as frases encontradas no texto, em uma passada"""
+        found: Set[str] = set()
+        if not text:
+            return found
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for word in tokenize(text):
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+    def matches(self, text) -> bool:
+        """Alguma frase do dicionário aparece no texto?"""
+        return bool(self.tags(text))
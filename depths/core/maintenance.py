@@ -0,0 +1,295 @@
+"""
+Backup online e compactação
+===========================
+
+- `online_backup`: cópia consistente via API de backup do SQLite, em um
+  passo só sobre um snapshot de leitura. Em WAL o escritor não espera pela
+  cópia; o custo para ele é o WAL que cresce enquanto o snapshot segura o
+  checkpoint, amostrado sem locks (tamanho do `-wal`) durante a cópia.
+- `page_diff_snapshot` / `restore_snapshot`: snapshots por diferença de
+  páginas. Cada snapshot lê o banco inteiro (cópia de staging) e grava só
+  as páginas alteradas desde o anterior: economiza espaço, não leitura.
+- `convert_to_incremental_vacuum`: conversão única de bancos antigos para
+  `auto_vacuum` incremental - um VACUUM completo, que bloqueia as gravações.
+- `incremental_compact`: devolve páginas livres ao sistema com
+  `PRAGMA incremental_vacuum(N)` em passos curtos; o daemon de gravação
+  roda um passo por vez nos intervalos ociosos (core/daemon.py).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from depths.core.connection import connect, is_memory
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 16
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class _WalSampler(threading.Thread):
+    """Amostra o tamanho do WAL durante a cópia, sem abrir o banco
+
+    Só `stat` do arquivo `-wal`: não disputa lock com o escritor nem altera
+    o que está medindo.
+    """
+
+    def __init__(self, db_path, interval: float):
+        super().__init__(daemon=True)
+        self.wal_path = Path(f"{db_path}-wal")
+        self.interval = interval
+        self.sizes: List[int] = []
+        self._done = threading.Event()
+
+    def sample(self):
+        try:
+            self.sizes.append(self.wal_path.stat().st_size)
+        except FileNotFoundError:
+            self.sizes.append(0)
+
+    def run(self):
+        while not self._done.is_set():
+            self.sample()
+            self._done.wait(self.interval)
+
+    def stop(self) -> List[int]:
+        self._done.set()
+        self.join()
+        self.sample()
+        return self.sizes
+
+
+def online_backup(db_path, dest_path, sample_interval: float = 0.005) -> Dict:
+    """Copia o banco em um passo; mede bytes copiados e o crescimento do WAL"""
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # A origem pode ser um banco em memória (ver core/connection.py)
+    src = connect(db_path)
+    dst = sqlite3.connect(dest_path)
+    # Memória: sem WAL, não há o que amostrar
+    sampler = None if is_memory(db_path) else _WalSampler(db_path, sample_interval)
+
+    started = time.perf_counter()
+    try:
+        if sampler:
+            sampler.start()
+        # Um passo só, dentro de um snapshot de leitura: em passos, cada commit
+        # de outra conexão reiniciaria a cópia e com o pipeline rodando ela
+        # nunca terminaria. Em WAL o escritor segue gravando durante a cópia
+        src.backup(dst)
+        elapsed = time.perf_counter() - started
+        page_size = src.execute("PRAGMA page_size").fetchone()[0]
+        page_count = dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        sizes = sampler.stop() if sampler else []
+        dst.close()
+        src.close()
+
+    return {
+        "path": str(dest_path),
+        "pages": page_count,
+        "bytes_copied": page_count * page_size,
+        "samples": len(sizes),
+        "wal_bytes_max": max(sizes, default=0),
+        "wal_growth": max(sizes, default=0) - (sizes[0] if sizes else 0),
+        "elapsed": elapsed,
+    }
+
+
+def _page_hashes(path: Path, page_size: int):
+    with open(path, "rb") as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            yield page, hashlib.blake2b(page, digest_size=HASH_SIZE).digest()
+
+
+def _read_hashes(path: Path) -> List[bytes]:
+    data = path.read_bytes()
+    return [data[i:i + HASH_SIZE] for i in range(0, len(data), HASH_SIZE)]
+
+
+def _latest_snapshot(snapshot_dir: Path) -> Optional[Dict]:
+    manifests = sorted(snapshot_dir.glob("*.json"))
+    if not manifests:
+        return None
+    return json.loads(manifests[-1].read_text())
+
+
+def page_diff_snapshot(db_path, snapshot_dir, sample_interval: float = 0.005) -> Dict:
+    """Snapshot com apenas as páginas alteradas desde o snapshot anterior
+
+    Incremental no que grava, não no que lê: o banco inteiro é copiado para
+    um staging (`online_backup`) e comparado página a página.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    staging = snapshot_dir / ".staging.db"
+
+    report = online_backup(db_path, staging, sample_interval)
+    with sqlite3.connect(staging) as conn:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+
+    parent = _latest_snapshot(snapshot_dir)
+    previous = _read_hashes(snapshot_dir / f"{parent['id']}.hashes") if parent else []
+
+    snapshot_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    changed = 0
+    hashes = bytearray()
+    with open(snapshot_dir / f"{snapshot_id}.pages", "wb") as out:
+        for page_no, (page, digest) in enumerate(_page_hashes(staging, page_size)):
+            hashes += digest
+            if page_no >= len(previous) or previous[page_no] != digest:
+                out.write(page_no.to_bytes(4, "big"))
+                out.write(page)
+                changed += 1
+
+    (snapshot_dir / f"{snapshot_id}.hashes").write_bytes(bytes(hashes))
+    manifest = {
+        "id": snapshot_id,
+        "parent": parent["id"] if parent else None,
+        "page_size": page_size,
+        "page_count": len(hashes) // HASH_SIZE,
+        "changed_pages": changed,
+    }
+    (snapshot_dir / f"{snapshot_id}.json").write_text(json.dumps(manifest))
+    staging.unlink()
+
+    report.update({
+        "snapshot_id": snapshot_id,
+        "parent": manifest["parent"],
+        "changed_pages": changed,
+        "bytes_written": changed * page_size,
+    })
+    logger.info(
+        f"💾 Snapshot {snapshot_id}: {changed}/{manifest['page_count']} pages changed "
+        f"({report['bytes_written']} bytes written, {report['bytes_copied']} read), "
+        f"WAL grew {report['wal_growth']} bytes"
+    )
+    return report
+
+
+def restore_snapshot(snapshot_dir, snapshot_id: str, dest_path) -> Path:
+    """Reconstrói o banco aplicando a cadeia de snapshots até `snapshot_id`"""
+    snapshot_dir = Path(snapshot_dir)
+    chain = []
+    current = snapshot_id
+    while current:
+        manifest = json.loads((snapshot_dir / f"{current}.json").read_text())
+        chain.append(manifest)
+        current = manifest["parent"]
+    chain.reverse()
+
+    target = chain[-1]
+    page_size = target["page_size"]
+    dest_path = Path(dest_path)
+    with open(dest_path, "wb") as out:
+        for manifest in chain:
+            with open(snapshot_dir / f"{manifest['id']}.pages", "rb") as pages:
+                while True:
+                    header = pages.read(4)
+                    if not header:
+                        break
+                    out.seek(int.from_bytes(header, "big") * page_size)
+                    out.write(pages.read(page_size))
+        out.truncate(target["page_count"] * page_size)
+    return dest_path
+
+
+def convert_to_incremental_vacuum(db_path) -> bool:
+    """Converte um banco antigo para auto_vacuum incremental
+
+    O SQLite só muda o modo com um VACUUM completo, que reescreve o banco e
+    bloqueia as gravações até o fim: rodar com as gravações pausadas
+    (`--compact`). Bancos novos já nascem incrementais e retornam False.
+    """
+    conn = connect(db_path, isolation_level=None)
+    try:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode == AUTO_VACUUM_INCREMENTAL:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info("🧹 auto_vacuum switched to INCREMENTAL")
+        return True
+    finally:
+        conn.close()
+
+
+def incremental_compact(db_path, pages_per_step: int = 1000, sleep_seconds: float = 0.01,
+                        min_free_ratio: float = 0.0, max_steps: Optional[int] = None) -> Dict:
+    """Libera páginas livres em passos curtos de `incremental_vacuum`
+
+    `max_steps` limita o trabalho de uma chamada (o daemon roda um passo
+    por intervalo ocioso); o restante fica para a próxima.
+    """
+    conn = connect(db_path, isolation_level=None)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        report = {
+            "free_pages_before": free,
+            "pages_freed": 0,
+            "bytes_freed": 0,
+            "steps": 0,
+            "writer_stall_max": 0.0,
+            "writer_stall_total": 0.0,
+            "skipped": False,
+        }
+
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != AUTO_VACUUM_INCREMENTAL or not page_count or free / page_count < min_free_ratio:
+            report["skipped"] = True
+            return report
+
+        while free > 0:
+            started = time.perf_counter()
+            # Cada passo do statement libera uma página: `execute` daria um
+            # só; `executescript` roda o PRAGMA até o fim
+            conn.executescript(f"PRAGMA incremental_vacuum({pages_per_step})")
+            stall = time.perf_counter() - started
+            report["steps"] += 1
+            report["writer_stall_total"] += stall
+            report["writer_stall_max"] = max(report["writer_stall_max"], stall)
+
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            report["pages_freed"] += free - remaining
+            if remaining >= free:
+                break
+            free = remaining
+            if max_steps is not None and report["steps"] >= max_steps:
+                break
+            if free and sleep_seconds:
+                time.sleep(sleep_seconds)
+
+        report["bytes_freed"] = report["pages_freed"] * page_size
+        return report
+    finally:
+        conn.close()
+
+
+def default_backup_path(db_path, backup_dir: Optional[str] = None) -> Path:
+    """data/backups/swaif_msg_YYYYmmdd_HHMMSS.db"""
+    db_path = Path(db_path)
+    folder = Path(backup_dir) if backup_dir else db_path.parent / "backups"
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return folder / f"{db_path.stem}_{stamp}{db_path.suffix}"
+
+
+def file_size(path) -> int:
+    """Tamanho em bytes (0 se o arquivo não existir)"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,575 @@
+"""
+Migrações versionadas do schema SQLite
+======================================
+
+As tabelas base continuam sendo criadas por `SwaifDatabase._init_tables`
+(versão 0). Toda alteração posterior entra aqui como uma `Migration`
+numerada, registrada na tabela `schema_version`.
+
+Migrações que precisam preencher dados em tabelas grandes declaram
+`Backfill`s: o preenchimento roda em faixas de rowid, cada faixa em uma
+transação curta, com progresso salvo em `schema_backfills` para retomar
+após uma interrupção sem travar a ingestão.
+"""
+
+import sqlite3
+import time
+import logging
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from depths.core import pending_replies, rollups
+from depths.core.connection import connect
+from depths.core.dedup import fingerprint
+from depths.core.participants import CLEAN_PHONE_SQL
+
+logger = logging.getLogger(__name__)
+
+
+def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    """Verifica se a coluna já existe na tabela"""
+    rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, decl: str):
+    """ALTER TABLE ADD COLUMN idempotente"""
+    if not column_exists(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+class Backfill:
+    """Preenchimento online executado em lotes de rowid"""
+
+    def __init__(self, name: str, table: str,
+                 apply_chunk: Callable[[sqlite3.Connection, int, int], None]):
+        self.name = name
+        self.table = table
+        # apply_chunk(conn, first_rowid, last_rowid) - faixa inclusiva
+        self.apply_chunk = apply_chunk
+
+
+class Migration:
+    """Alteração de schema numerada"""
+
+    def __init__(self, version: int, description: str,
+                 statements: Sequence[str] = (),
+                 apply: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 backfills: Sequence[Backfill] = ()):
+        self.version = version
+        self.description = description
+        self.statements = list(statements)
+        self.apply = apply
+        self.backfills = list(backfills)
+
+    def upgrade(self, conn: sqlite3.Connection):
+        """Executa a parte de schema (DDL): `apply` e depois `statements`"""
+        if self.apply:
+            self.apply(conn)
+        for statement in self.statements:
+            conn.execute(statement)
+
+
+def _create_participants(conn: sqlite3.Connection):
+    """v2 - tabela de participantes e chaves inteiras"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT NOT NULL UNIQUE,
+            role TEXT,
+            instance TEXT
+        )
+    """)
+    add_column(conn, "messages_l1", "sender_id", "INTEGER REFERENCES participants(id)")
+    add_column(conn, "messages_l1", "receiver_id", "INTEGER REFERENCES participants(id)")
+    add_column(conn, "conversations_l2", "lead_id", "INTEGER REFERENCES participants(id)")
+    add_column(conn, "conversations_l2", "secretary_id", "INTEGER REFERENCES participants(id)")
+    add_column(conn, "lead_activity", "lead_id", "INTEGER REFERENCES participants(id)")
+    add_column(conn, "conversation_messages", "conversation_ref",
+               "INTEGER REFERENCES conversations_l2(id)")
+    add_column(conn, "analyses_l3", "conversation_ref",
+               "INTEGER REFERENCES conversations_l2(id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversation_messages_ref "
+        "ON conversation_messages(conversation_ref, timestamp)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_l2_lead_id "
+        "ON conversations_l2(lead_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_analyses_l3_ref ON analyses_l3(conversation_ref)"
+    )
+
+
+def _intern_phones(conn, table, phone_column, role, first, last, instance_column=None):
+    """Cadastra em `participants` os telefones de uma faixa de rowid"""
+    clean = CLEAN_PHONE_SQL.format(column=phone_column)
+    instance = instance_column or "NULL"
+    conn.execute(
+        f"""
+        INSERT OR IGNORE INTO participants (phone, role, instance)
+        SELECT {clean}, {role}, MIN({instance}) FROM {table}
+        WHERE rowid BETWEEN ? AND ? AND {clean} != ''
+        GROUP BY {clean}
+        """,
+        (first, last),
+    )
+
+
+def _participant_id_sql(phone_column: str) -> str:
+    clean = CLEAN_PHONE_SQL.format(column=phone_column)
+    return f"(SELECT id FROM participants WHERE phone = {clean})"
+
+
+def _backfill_l1_participants(conn, first, last):
+    _intern_phones(conn, "messages_l1", "sender_phone", "NULL", first, last, "evo_instance")
+    _intern_phones(conn, "messages_l1", "receiver_phone", "NULL", first, last, "evo_instance")
+    conn.execute(
+        f"""
+        UPDATE messages_l1
+        SET sender_id = {_participant_id_sql("sender_phone")},
+            receiver_id = {_participant_id_sql("receiver_phone")}
+        WHERE rowid BETWEEN ? AND ?
+        """,
+        (first, last),
+    )
+
+
+def _backfill_l2_participants(conn, first, last):
+    _intern_phones(conn, "conversations_l2", "lead_phone", "'lead'", first, last)
+    _intern_phones(conn, "conversations_l2", "secretary_phone", "'secretary'", first, last)
+    conn.execute(
+        f"""
+        UPDATE conversations_l2
+        SET lead_id = {_participant_id_sql("lead_phone")},
+            secretary_id = {_participant_id_sql("secretary_phone")}
+        WHERE rowid BETWEEN ? AND ?
+        """,
+        (first, last),
+    )
+
+
+def _backfill_lead_activity(conn, first, last):
+    _intern_phones(conn, "lead_activity", "lead_phone", "'lead'", first, last)
+    conn.execute(
+        f"""
+        UPDATE lead_activity SET lead_id = {_participant_id_sql("lead_phone")}
+        WHERE rowid BETWEEN ? AND ?
+        """,
+        (first, last),
+    )
+
+
+def _conversation_ref_backfill(table: str) -> Callable:
+    def backfill(conn, first, last):
+        conn.execute(
+            f"""
+            UPDATE {table}
+            SET conversation_ref = (
+                SELECT id FROM conversations_l2 c
+                WHERE c.conversation_id = {table}.conversation_id
+            )
+            WHERE rowid BETWEEN ? AND ?
+            """,
+            (first, last),
+        )
+    return backfill
+
+
+def _backfill_fingerprints(conn, first, last):
+    """Calcula impressões digitais; reenvios antigos ficam com NULL"""
+    rows = conn.execute(
+        """
+        SELECT id, evo_instance, sender_phone, receiver_phone, timestamp, content
+        FROM messages_l1
+        WHERE rowid BETWEEN ? AND ? AND fingerprint IS NULL
+        ORDER BY id
+        """,
+        (first, last),
+    ).fetchall()
+    conn.executemany(
+        "UPDATE OR IGNORE messages_l1 SET fingerprint = ? WHERE id = ?",
+        [(fingerprint(*row[1:]), row[0]) for row in rows],
+    )
+
+
+def _add_content_refs(conn: sqlite3.Connection):
+    """Referência ao corpo compactado (ver core/content_store.py)"""
+    add_column(conn, "messages_l1", "content_id", "INTEGER REFERENCES contents(id)")
+    add_column(conn, "conversation_messages", "content_id", "INTEGER REFERENCES contents(id)")
+
+
+def _backfill_pending_replies(conn, first, last):
+    """Espera de resposta de cada lead a partir do histórico já agrupado"""
+    rows = conn.execute(
+        "SELECT lead_phone, lead_id FROM lead_activity WHERE rowid BETWEEN ? AND ?",
+        (first, last),
+    ).fetchall()
+    for lead_phone, lead_id in rows:
+        pending_replies.recompute(conn, lead_phone, lead_id)
+
+
+def _backfill_rollups(conn, first, last):
+    """Rollups diários a partir das conversas já agrupadas"""
+    rollups.recompute_rollups(conn, first, last)
+
+
+# Migrações do SWAIF-MSG, sempre em ordem crescente de versão
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "Índices para mensagens pendentes, histórico e leads",
+        statements=[
+            "CREATE INDEX IF NOT EXISTS idx_messages_l1_pending "
+            "ON messages_l1(processed, timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_conversation_messages_conv "
+            "ON conversation_messages(conversation_id, timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_conversations_l2_lead "
+            "ON conversations_l2(lead_phone)",
+        ],
+    ),
+    Migration(
+        2,
+        "Participantes com ids inteiros e chaves estrangeiras",
+        apply=_create_participants,
+        backfills=[
+            Backfill("messages_l1.participants", "messages_l1",
+                     _backfill_l1_participants),
+            Backfill("conversations_l2.participants", "conversations_l2",
+                     _backfill_l2_participants),
+            Backfill("lead_activity.lead_id", "lead_activity",
+                     _backfill_lead_activity),
+            Backfill("conversation_messages.conversation_ref", "conversation_messages",
+                     _conversation_ref_backfill("conversation_messages")),
+            Backfill("analyses_l3.conversation_ref", "analyses_l3",
+                     _conversation_ref_backfill("analyses_l3")),
+        ],
+    ),
+    Migration(
+        3,
+        "Índice de conversas arquivadas em partições mensais",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS archived_conversations (
+                conversation_id TEXT PRIMARY KEY,
+                partition TEXT NOT NULL,
+                archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ],
+    ),
+    Migration(
+        4,
+        "Impressão digital única para deduplicar mensagens L1",
+        apply=lambda conn: add_column(conn, "messages_l1", "fingerprint", "TEXT"),
+        statements=[
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_l1_fingerprint "
+            "ON messages_l1(fingerprint)",
+        ],
+        backfills=[
+            Backfill("messages_l1.fingerprint", "messages_l1", _backfill_fingerprints),
+        ],
+    ),
+    Migration(
+        5,
+        "Encerramento de conversas (closed_at)",
+        apply=lambda conn: add_column(conn, "conversations_l2", "closed_at", "DATETIME"),
+        statements=[
+            "CREATE INDEX IF NOT EXISTS idx_conversations_l2_open "
+            "ON conversations_l2(end_time) WHERE closed_at IS NULL",
+        ],
+    ),
+    Migration(
+        6,
+        "Versão das conversas para invalidar o cache de histórico",
+        apply=lambda conn: add_column(conn, "conversations_l2", "version", "INTEGER DEFAULT 0"),
+    ),
+    Migration(
+        7,
+        "Rollups diários por instância e secretária",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS daily_rollups (
+                day TEXT NOT NULL,
+                instance TEXT NOT NULL DEFAULT '',
+                secretary_id INTEGER NOT NULL DEFAULT 0,
+                conversations INTEGER DEFAULT 0,
+                messages INTEGER DEFAULT 0,
+                lead_messages INTEGER DEFAULT 0,
+                secretary_messages INTEGER DEFAULT 0,
+                first_response TEXT,
+                active_leads BLOB,
+                PRIMARY KEY (day, instance, secretary_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS response_waits (
+                conversation_ref INTEGER PRIMARY KEY,
+                lead_since DATETIME
+            )
+            """,
+        ],
+        backfills=[
+            Backfill("daily_rollups", "conversations_l2", _backfill_rollups),
+        ],
+    ),
+    Migration(
+        8,
+        "Índice de leads aguardando resposta",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS pending_replies (
+                lead_phone TEXT PRIMARY KEY,
+                lead_id INTEGER REFERENCES participants(id),
+                conversation_ref INTEGER,
+                waiting_since TEXT,
+                last_message_at TEXT,
+                unanswered INTEGER DEFAULT 0
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_pending_replies_waiting "
+            "ON pending_replies(waiting_since) WHERE waiting_since IS NOT NULL",
+        ],
+        backfills=[
+            Backfill("pending_replies", "lead_activity", _backfill_pending_replies),
+        ],
+    ),
+    Migration(
+        9,
+        "Tags de mensagens por dicionário e offsets de estágios",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS message_tags (
+                tag TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                PRIMARY KEY (tag, message_id)
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_message_tags_message ON message_tags(message_id)",
+            """
+            CREATE TABLE IF NOT EXISTS stage_offsets (
+                stage TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+        ],
+    ),
+    Migration(
+        10,
+        "Grupos de perguntas frequentes por similaridade",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS faq_clusters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                leader_message_id INTEGER,
+                size INTEGER DEFAULT 0,
+                last_message_id INTEGER
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_faq_clusters_size ON faq_clusters(size)",
+            """
+            CREATE TABLE IF NOT EXISTS message_clusters (
+                message_id INTEGER PRIMARY KEY,
+                cluster_id INTEGER NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_message_clusters_cluster "
+            "ON message_clusters(cluster_id)",
+        ],
+    ),
+    Migration(
+        11,
+        "Corpos de mensagem deduplicados e comprimidos por dicionário",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS content_dicts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data BLOB NOT NULL,
+                samples INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS contents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash BLOB NOT NULL UNIQUE,
+                dict_id INTEGER NOT NULL DEFAULT 0,
+                body BLOB NOT NULL
+            )
+            """,
+        ],
+        apply=_add_content_refs,
+    ),
+    Migration(
+        12,
+        "Mídia em arquivos endereçados por conteúdo",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS media_blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mime TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_messages_l1_media "
+            "ON messages_l1(media_hash) WHERE media_hash IS NOT NULL",
+        ],
+        apply=lambda conn: add_column(conn, "messages_l1", "media_hash", "TEXT"),
+    ),
+    Migration(
+        13,
+        "Outbox de mudanças da L1/L2 para consumidores",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                op TEXT NOT NULL,
+                entity_id INTEGER,
+                payload TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ],
+    ),
+]
+
+
+class MigrationRunner:
+    """Aplica migrações pendentes e backfills em lotes"""
+
+    def __init__(self, db_path, migrations: Optional[Iterable[Migration]] = None,
+                 chunk_size: int = 5000, pause_seconds: float = 0.0):
+        self.db_path = db_path
+        self.migrations = sorted(
+            MIGRATIONS if migrations is None else migrations,
+            key=lambda m: m.version,
+        )
+        self.chunk_size = chunk_size
+        # Pausa entre lotes para ceder o lock de escrita à ingestão
+        self.pause_seconds = pause_seconds
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit: as transações são controladas explicitamente
+        conn = connect(self.db_path, isolation_level=None)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_backfills (
+                name TEXT PRIMARY KEY,
+                last_rowid INTEGER DEFAULT 0,
+                completed_at DATETIME
+            )
+        """)
+        return conn
+
+    def current_version(self) -> int:
+        """Versão atual do schema (0 = apenas tabelas base)"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+            return row[0] or 0
+        finally:
+            conn.close()
+
+    def pending(self) -> List[Migration]:
+        """Migrações ainda não aplicadas"""
+        current = self.current_version()
+        return [m for m in self.migrations if m.version > current]
+
+    def run(self) -> int:
+        """Aplica migrações pendentes e conclui backfills; retorna a versão"""
+        conn = self._connect()
+        try:
+            current = conn.execute(
+                "SELECT MAX(version) FROM schema_version"
+            ).fetchone()[0] or 0
+
+            for migration in self.migrations:
+                if migration.version > current:
+                    self._upgrade(conn, migration)
+                    current = migration.version
+                # Backfills de versões já aplicadas podem ter sido
+                # interrompidos; retomar sempre antes da próxima versão
+                for backfill in migration.backfills:
+                    self._run_backfill(conn, backfill)
+            return current
+        finally:
+            conn.close()
+
+    def _upgrade(self, conn: sqlite3.Connection, migration: Migration):
+        """DDL + registro da versão em uma única transação"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration.upgrade(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (migration.version, migration.description),
+            )
+            for backfill in migration.backfills:
+                conn.execute(
+                    "INSERT OR IGNORE INTO schema_backfills (name) VALUES (?)",
+                    (backfill.name,),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"🧱 Schema v{migration.version}: {migration.description}")
+
+    def _run_backfill(self, conn: sqlite3.Connection, backfill: Backfill) -> int:
+        """Processa o backfill em lotes curtos; retorna linhas visitadas"""
+        row = conn.execute(
+            "SELECT last_rowid, completed_at FROM schema_backfills WHERE name = ?",
+            (backfill.name,),
+        ).fetchone()
+        if row is None or row[1] is not None:
+            return 0
+
+        last_rowid = row[0] or 0
+        visited = 0
+        while True:
+            bounds = conn.execute(
+                f"""
+                SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM (
+                    SELECT rowid FROM {backfill.table}
+                    WHERE rowid > ? ORDER BY rowid LIMIT ?
+                )
+                """,
+                (last_rowid, self.chunk_size),
+            ).fetchone()
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if not bounds[2]:
+                    conn.execute(
+                        "UPDATE schema_backfills SET completed_at = CURRENT_TIMESTAMP "
+                        "WHERE name = ?",
+                        (backfill.name,),
+                    )
+                    conn.execute("COMMIT")
+                    break
+                backfill.apply_chunk(conn, bounds[0], bounds[1])
+                conn.execute(
+                    "UPDATE schema_backfills SET last_rowid = ? WHERE name = ?",
+                    (bounds[1], backfill.name),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            last_rowid = bounds[1]
+            visited += bounds[2]
+            if self.pause_seconds:
+                time.sleep(self.pause_seconds)
+
+        if visited:
+            logger.info(f"🧱 Backfill {backfill.name}: {visited} rows")
+        return visited
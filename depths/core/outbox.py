@@ -0,0 +1,156 @@
+"""
+Outbox de mudanças (change data capture)
+========================================
+
+Cada gravação da L1/L2 anexa um evento em `outbox` na mesma transação, então
+um evento existe se e somente se a mudança foi gravada. Consumidores (L3,
+dashboards, exportadores) guardam o último id lido em `stage_offsets`
+(estágio `outbox:<nome>`) e leem por faixa de chave primária - sem varrer
+`conversations_l2` nem comparar com a leitura anterior.
+
+O SQLite tem um escritor por vez e o id é atribuído dentro da transação,
+então a ordem dos ids é a ordem de commit: nada aparece "atrás" de um
+offset já lido. AUTOINCREMENT impede que ids podados sejam reusados.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from depths.core.connection import connect
+
+# Prefixo dos consumidores em stage_offsets
+STAGE_PREFIX = "outbox:"
+
+CONVERSATION_COLUMNS = ("id", "conversation_id", "lead_phone", "message_count",
+                        "start_time", "end_time", "closed_at", "version")
+
+
+def emit(conn: sqlite3.Connection, topic: str, op: str, entity_id: Optional[int],
+         payload: Optional[Dict] = None) -> int:
+    """Anexa um evento na transação corrente de `conn`"""
+    cursor = conn.execute(
+        "INSERT INTO outbox (topic, op, entity_id, payload) VALUES (?, ?, ?, ?)",
+        (topic, op, entity_id, json.dumps(payload, default=str) if payload else None),
+    )
+    return cursor.lastrowid
+
+
+def emit_conversation(conn: sqlite3.Connection, conversation_ref: int, op: str) -> Optional[int]:
+    """Evento com o estado da conversa como está na transação"""
+    row = conn.execute(
+        f"SELECT {', '.join(CONVERSATION_COLUMNS)} FROM conversations_l2 WHERE id = ?",
+        (conversation_ref,),
+    ).fetchone()
+    if row is None:
+        return None
+    return emit(conn, "conversation", op, conversation_ref, dict(zip(CONVERSATION_COLUMNS, row)))
+
+
+def prune(conn: sqlite3.Connection, retention_days: int = 7) -> int:
+    """Remove eventos já lidos por todos os consumidores (ou antigos, sem consumidores)"""
+    row = conn.execute(
+        "SELECT MIN(last_id), COUNT(*) FROM stage_offsets WHERE stage LIKE ?",
+        (STAGE_PREFIX + "%",),
+    ).fetchone()
+    if row[1]:
+        deleted = conn.execute("DELETE FROM outbox WHERE id <= ?", (row[0],)).rowcount
+    else:
+        deleted = conn.execute(
+            "DELETE FROM outbox WHERE created_at < datetime('now', ?)",
+            (f"-{retention_days} days",),
+        ).rowcount
+    conn.commit()
+    return deleted
+
+
+class OutboxConsumer:
+    """Leitor do outbox com offset próprio, lotes e espera por novidades
+
+        consumer = OutboxConsumer(db.db_path, "dashboard")
+        while True:
+            events = consumer.poll(timeout=30)
+            ...  # processar
+            consumer.commit(events)
+
+    Entrega pelo menos uma vez: o offset só avança em `commit`, então um
+    consumidor que cai no meio do lote relê os eventos não confirmados.
+    """
+
+    def __init__(self, db_path, name: str, from_latest: bool = False,
+                 poll_interval: float = 0.05):
+        self.db_path = db_path
+        self.name = name
+        self.stage = STAGE_PREFIX + name
+        self.poll_interval = poll_interval
+        # Conexão própria: `PRAGMA data_version` só muda para commits de outras conexões
+        self._conn = connect(db_path, check_same_thread=False)
+        start = "(SELECT COALESCE(MAX(id), 0) FROM outbox)" if from_latest else "0"
+        with self._conn:
+            self._conn.execute(
+                f"INSERT OR IGNORE INTO stage_offsets (stage, last_id) VALUES (?, {start})",
+                (self.stage,),
+            )
+        self.offset = self._conn.execute(
+            "SELECT last_id FROM stage_offsets WHERE stage = ?", (self.stage,)
+        ).fetchone()[0]
+
+    def read(self, limit: int = 500) -> List[Dict]:
+        """Próximos eventos após a posição lida (não avança o offset confirmado)"""
+        rows = self._conn.execute(
+            "SELECT id, topic, op, entity_id, payload, created_at FROM outbox "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (self.offset, limit),
+        ).fetchall()
+        return [
+            {"id": r[0], "topic": r[1], "op": r[2], "entity_id": r[3],
+             "payload": json.loads(r[4]) if r[4] else None, "created_at": r[5]}
+            for r in rows
+        ]
+
+    def poll(self, limit: int = 500, timeout: float = 0.0) -> List[Dict]:
+        """Como `read`, esperando até `timeout` segundos se não houver eventos"""
+        deadline = time.monotonic() + timeout
+        version = None
+        while True:
+            current = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if current != version:
+                # Só consulta o outbox quando alguém gravou desde a última olhada
+                version = current
+                events = self.read(limit)
+                if events:
+                    return events
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            time.sleep(min(self.poll_interval, remaining))
+
+    def commit(self, events) -> int:
+        """Confirma até o último evento do lote (ou um id)"""
+        if isinstance(events, list):
+            last_id = events[-1]["id"] if events else 0
+        else:
+            last_id = events
+        if not last_id or last_id <= self.offset:
+            return self.offset
+        with self._conn:
+            self._conn.execute(
+                "UPDATE stage_offsets SET last_id = ? WHERE stage = ?", (last_id, self.stage)
+            )
+        self.offset = last_id
+        return self.offset
+
+    def lag(self) -> int:
+        """Eventos ainda não confirmados"""
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM outbox WHERE id > ?", (self.offset,)
+        ).fetchone()[0]
+
+    def unregister(self):
+        """Remove o consumidor (deixa de segurar a poda)"""
+        with self._conn:
+            self._conn.execute("DELETE FROM stage_offsets WHERE stage = ?", (self.stage,))
+
+    def close(self):
+        self._conn.close()
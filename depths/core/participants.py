@@ -0,0 +1,75 @@
+"""
+Dicionário de participantes
+===========================
+
+Cada telefone limpo (lead ou secretária) recebe um id inteiro na tabela
+`participants`. As tabelas L1/L2 guardam esses ids como chaves
+estrangeiras, de modo que joins e agrupamentos comparam inteiros em vez
+de strings como `5511999887766@s.whatsapp.net`.
+"""
+
+import sqlite3
+import sys
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+PHONE_SUFFIXES = ("@s.whatsapp.net", "@g.us")
+
+# Mesma limpeza de `clean_phone` em SQL, usada pelos backfills
+CLEAN_PHONE_SQL = "trim(replace(replace({column}, '@s.whatsapp.net', ''), '@g.us', ''))"
+
+
+@lru_cache(maxsize=65536)
+def clean_phone(phone: Optional[str]) -> str:
+    """Remove sufixos do WhatsApp; resultado internado para reuso"""
+    if not phone:
+        return ""
+    for suffix in PHONE_SUFFIXES:
+        phone = phone.replace(suffix, "")
+    return sys.intern(phone.strip())
+
+
+class ParticipantRegistry:
+    """Cache em processo de telefone -> id de participante"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._roles: Dict[str, Optional[str]] = {}
+
+    def get_id(self, conn: sqlite3.Connection, phone: Optional[str],
+               role: Optional[str] = None,
+               instance: Optional[str] = None) -> Optional[int]:
+        """Retorna (criando se preciso) o id do telefone informado"""
+        phone = clean_phone(phone)
+        if not phone:
+            return None
+
+        participant_id = self._ids.get(phone)
+        if participant_id is not None and (role is None or self._roles.get(phone)):
+            return participant_id
+
+        conn.execute(
+            "INSERT OR IGNORE INTO participants (phone, role, instance) VALUES (?, ?, ?)",
+            (phone, role, instance),
+        )
+        if role is not None:
+            # O primeiro papel identificado pela L2 prevalece
+            conn.execute(
+                "UPDATE participants SET role = ? WHERE phone = ? AND role IS NULL",
+                (role, phone),
+            )
+        row = conn.execute(
+            "SELECT id, role FROM participants WHERE phone = ?", (phone,)
+        ).fetchone()
+        self._ids[phone] = row[0]
+        self._roles[phone] = row[1]
+        return row[0]
+
+    def clear(self):
+        """Esvazia o cache (ex.: após trocar de banco)"""
+        self._ids.clear()
+        self._roles.clear()
+
+    def cache_info(self) -> Tuple[int, int]:
+        """(ids em cache, entradas de limpeza de telefone em cache)"""
+        return len(self._ids), clean_phone.cache_info().currsize
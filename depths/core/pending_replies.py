@@ -0,0 +1,132 @@
+"""
+Índice de mensagens sem resposta
+================================
+
+`pending_replies` tem uma linha por lead: o instante da última mensagem
+(de qualquer lado) e, enquanto a secretária não responder, o da primeira
+mensagem do lead ainda sem resposta (`waiting_since`). A L2 atualiza a
+linha na mesma transação que grava a conversa; "leads esperando há mais
+tempo" é uma leitura do índice parcial em `waiting_since` (O(log n) + k),
+sem varrer o histórico.
+
+Horários são gravados em UTC com resolução de segundos, então a ordem
+textual é a ordem cronológica. Uma mensagem anterior à última já vista do
+lead (entrega atrasada) recalcula a linha a partir do histórico do lead.
+"""
+
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dateutil.parser import parse as dateutil_parse
+
+# (é do lead?, horário normalizado, conversation_ref)
+Event = Tuple[bool, str, int]
+
+
+def normalize(value) -> str:
+    """datetime/ISO -> ISO UTC em segundos (sem fuso = UTC)"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = dateutil_parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def fold(state: Dict, events: Iterable[Event]) -> Dict:
+    """Aplica mensagens em ordem: do lead abre/estende a espera, da secretária fecha"""
+    for is_lead, when, conversation_ref in sorted(events, key=lambda e: e[1]):
+        if is_lead:
+            if state["waiting_since"] is None:
+                state["waiting_since"] = when
+                state["unanswered"] = 0
+            state["unanswered"] += 1
+            state["conversation_ref"] = conversation_ref
+        else:
+            state["waiting_since"] = None
+            state["unanswered"] = 0
+        state["last_message_at"] = max(state["last_message_at"] or when, when)
+    return state
+
+
+def record(conn: sqlite3.Connection, lead_phone: str, lead_id: Optional[int],
+           events: List[Event]):
+    """Atualiza a espera do lead com as mensagens recém-gravadas"""
+    if not events:
+        return
+    row = conn.execute(
+        """
+        SELECT conversation_ref, waiting_since, last_message_at, unanswered
+        FROM pending_replies WHERE lead_phone = ?
+        """,
+        (lead_phone,),
+    ).fetchone()
+    if row and min(when for _, when, _ in events) < row[2]:
+        # Entrega atrasada: a ordem só é conhecida relendo o histórico
+        recompute(conn, lead_phone, lead_id)
+        return
+    state = dict(zip(("conversation_ref", "waiting_since", "last_message_at", "unanswered"),
+                     row or (None, None, None, 0)))
+    _write(conn, lead_phone, lead_id, fold(state, events))
+
+
+def recompute(conn: sqlite3.Connection, lead_phone: str, lead_id: Optional[int] = None):
+    """Refaz a linha do lead a partir de todo o seu histórico L2"""
+    rows = conn.execute(
+        """
+        SELECT m.sender_type, m.timestamp, m.conversation_ref
+        FROM conversations_l2 c
+        JOIN conversation_messages m ON m.conversation_ref = c.id
+        WHERE c.lead_phone = ? AND m.timestamp IS NOT NULL
+        """,
+        (lead_phone,),
+    ).fetchall()
+    if not rows:
+        conn.execute("DELETE FROM pending_replies WHERE lead_phone = ?", (lead_phone,))
+        return
+    state = {"conversation_ref": None, "waiting_since": None,
+             "last_message_at": None, "unanswered": 0}
+    events = [(sender_type == "lead", normalize(ts), ref) for sender_type, ts, ref in rows]
+    _write(conn, lead_phone, lead_id, fold(state, events))
+
+
+def _write(conn: sqlite3.Connection, lead_phone: str, lead_id: Optional[int], state: Dict):
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO pending_replies
+        (lead_phone, lead_id, conversation_ref, waiting_since, last_message_at, unanswered)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (lead_phone, lead_id, state["conversation_ref"], state["waiting_since"],
+         state["last_message_at"], state["unanswered"]),
+    )
+
+
+def oldest_waiting(conn: sqlite3.Connection, limit: int = 20) -> List[Dict]:
+    """Leads esperando resposta há mais tempo (índice parcial, sem varredura)"""
+    rows = conn.execute(
+        """
+        SELECT p.lead_phone, p.waiting_since, p.unanswered, c.conversation_id
+        FROM pending_replies p
+        LEFT JOIN conversations_l2 c ON c.id = p.conversation_ref
+        WHERE p.waiting_since IS NOT NULL
+        ORDER BY p.waiting_since
+        LIMIT ?
+        """,
+        (limit,),
+    ).fetchall()
+    return [
+        {"lead_phone": lead, "waiting_since": since, "unanswered": unanswered,
+         "conversation_id": conversation_id}
+        for lead, since, unanswered, conversation_id in rows
+    ]
+
+
+def count_waiting(conn: sqlite3.Connection) -> int:
+    """Total de leads sem resposta (conta só as entradas do índice parcial)"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM pending_replies WHERE waiting_since IS NOT NULL"
+    ).fetchone()[0]
@@ -0,0 +1,88 @@
+"""
+Leitura para relatórios
+=======================
+
+O banco principal roda em WAL (ver `SwaifDatabase._init_tables`): leitores
+não bloqueiam a ingestão e a ingestão não bloqueia leitores. Consultas de
+painel e relatórios usam `read_snapshot`, uma conexão somente leitura em
+que todas as consultas enxergam o mesmo instante do banco.
+
+`MemoryReplica` é a alternativa para bancos que não podem usar WAL (por
+exemplo em sistemas de arquivos de rede): uma cópia em memória atualizada
+periodicamente pela API de backup (cópia de memória: o lock de leitura
+dura milissegundos, não o tempo de uma agregação).
+"""
+
+import sqlite3
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from depths.core.connection import connect, is_memory
+
+logger = logging.getLogger(__name__)
+
+
+def open_readonly(db_path) -> sqlite3.Connection:
+    """Conexão somente leitura, em autocommit (transações explícitas)"""
+    if is_memory(db_path):
+        # `mode=ro` não combina com `mode=memory`: fica só o query_only
+        conn = connect(db_path, isolation_level=None)
+    else:
+        conn = sqlite3.connect(
+            f"file:{Path(db_path).resolve()}?mode=ro", uri=True, isolation_level=None
+        )
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+@contextmanager
+def read_snapshot(db_path) -> Iterator[sqlite3.Connection]:
+    """Conexão somente leitura com todas as consultas no mesmo snapshot"""
+    conn = open_readonly(db_path)
+    try:
+        conn.execute("BEGIN")
+        yield conn
+    finally:
+        conn.close()
+
+
+class MemoryReplica:
+    """Réplica em memória do banco, renovada a cada `max_age_seconds`"""
+
+    def __init__(self, db_path, max_age_seconds: float = 30.0):
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.refreshed_at = None
+
+    def refresh(self) -> float:
+        """Copia o banco para a memória; retorna a duração em segundos"""
+        started = time.perf_counter()
+        source = open_readonly(self.db_path)
+        try:
+            # Cópia em um passo só: em passos, cada escrita na origem
+            # reiniciaria o backup e a réplica nunca ficaria pronta
+            source.backup(self._conn)
+        finally:
+            source.close()
+        self.refreshed_at = time.monotonic()
+        elapsed = time.perf_counter() - started
+        logger.debug(f"🪞 Replica refreshed in {elapsed * 1000:.1f} ms")
+        return elapsed
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexão com a réplica, renovada se estiver velha"""
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.max_age_seconds:
+            self.refresh()
+        return self._conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Mesma interface de `read_snapshot`"""
+        yield self.connection()
+
+    def close(self):
+        self._conn.close()
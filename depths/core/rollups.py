@@ -0,0 +1,171 @@
+"""
+Rollups diários
+===============
+
+`daily_rollups` guarda, por (dia, instância, secretária), contagens de
+conversas e mensagens, o sketch do tempo de primeira resposta (DDSketch) e
+o de leads ativos (HyperLogLog) - ambos mesclam, então um período é a
+união das linhas dos seus dias. A espera de resposta que atravessa lotes
+fica em `response_waits`.
+
+A L2 soma cada conversa gravada (`layers/l2_rollups.py`); a migração v7 e
+a reconstrução da L2 recalculam a partir do histórico com
+`recompute_rollups`. Os dois caminhos usam as mesmas funções e as mesmas
+dimensões, então chegam aos mesmos rollups.
+"""
+
+import sqlite3
+import sys
+from collections import defaultdict
+from datetime import timezone
+from itertools import groupby
+from typing import Dict, Optional, Tuple
+
+from dateutil.parser import parse as dateutil_parse
+
+from depths.core.sketches import DDSketch, HyperLogLog
+
+# Dimensões do rollup, sempre da linha gravada da conversa: instância do
+# lead e secretária registrada na criação. Gravação ao vivo, recálculo e
+# fusão usam as mesmas colunas, então chegam aos mesmos rollups.
+DIMENSIONS_SQL = "COALESCE(p.instance, ''), COALESCE(c.secretary_id, 0)"
+DIMENSIONS_FROM = "conversations_l2 c LEFT JOIN participants p ON p.id = c.lead_id"
+
+
+class RollupDelta:
+    """Agregados de um (dia, instância, secretária) em um lote"""
+
+    __slots__ = ("conversations", "messages", "lead_messages", "secretary_messages",
+                 "first_response", "active_leads")
+
+    def __init__(self):
+        self.conversations = 0
+        self.messages = 0
+        self.lead_messages = 0
+        self.secretary_messages = 0
+        self.first_response = DDSketch()
+        self.active_leads = HyperLogLog()
+
+def epoch(value) -> float:
+    """datetime/ISO -> epoch (horários sem fuso são tratados como UTC)"""
+    if isinstance(value, str):
+        value = dateutil_parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def fold(deltas: Dict[Tuple[str, str], RollupDelta], lead_phone: str, timed,
+         waiting_since: Optional[str], created: bool = False) -> Optional[str]:
+    """Soma mensagens (horário, instância, é do lead?) em ordem aos deltas
+
+    Retorna a mensagem do lead que continua sem resposta (ou None).
+    """
+    for msg_time, instance, from_lead in timed:
+        delta = deltas[(msg_time.strftime("%Y-%m-%d"), instance)]
+        delta.messages += 1
+        delta.active_leads.add(lead_phone)
+        if from_lead:
+            delta.lead_messages += 1
+            if waiting_since is None:
+                waiting_since = msg_time.isoformat()
+        else:
+            delta.secretary_messages += 1
+            if waiting_since is not None:
+                delta.first_response.add(epoch(msg_time) - epoch(waiting_since))
+                waiting_since = None
+
+    if created and timed:
+        first_time, instance, _ = timed[0]
+        deltas[(first_time.strftime("%Y-%m-%d"), instance)].conversations += 1
+    return waiting_since
+
+
+def apply_delta(conn: sqlite3.Connection, day: str, instance: str,
+                secretary_id: int, delta: RollupDelta):
+    """Soma o delta à linha do rollup (merge dos sketches)"""
+    row = conn.execute(
+        """
+        SELECT first_response, active_leads FROM daily_rollups
+        WHERE day = ? AND instance = ? AND secretary_id = ?
+        """,
+        (day, instance, secretary_id),
+    ).fetchone()
+    if row:
+        delta.first_response.merge(DDSketch.from_json(row[0]))
+        delta.active_leads.merge(HyperLogLog.from_bytes(row[1]))
+    conn.execute(
+        """
+        INSERT INTO daily_rollups
+        (day, instance, secretary_id, conversations, messages, lead_messages,
+         secretary_messages, first_response, active_leads)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (day, instance, secretary_id) DO UPDATE SET
+            conversations = conversations + excluded.conversations,
+            messages = messages + excluded.messages,
+            lead_messages = lead_messages + excluded.lead_messages,
+            secretary_messages = secretary_messages + excluded.secretary_messages,
+            first_response = excluded.first_response,
+            active_leads = excluded.active_leads
+        """,
+        (
+            day, instance, secretary_id,
+            delta.conversations, delta.messages, delta.lead_messages,
+            delta.secretary_messages,
+            delta.first_response.to_json(), delta.active_leads.to_bytes(),
+        ),
+    )
+
+
+def clear_live_rollups(conn: sqlite3.Connection):
+    """Apaga rollups e esperas dos dias que a L2 ainda tem (os arquivados ficam)"""
+    first_day = conn.execute(
+        "SELECT MIN(substr(start_time, 1, 10)) FROM conversations_l2"
+    ).fetchone()[0]
+    if first_day:
+        conn.execute("DELETE FROM daily_rollups WHERE day >= ?", (first_day,))
+    conn.execute("DELETE FROM response_waits")
+
+
+def recompute_rollups(conn: sqlite3.Connection, first_ref: int = 0,
+                      last_ref: Optional[int] = None) -> int:
+    """Soma aos rollups as conversas da L2 com id em [first_ref, last_ref]
+
+    Mesma contagem e mesmas dimensões (DIMENSIONS_SQL) do `DailyRollups`, a
+    partir do histórico; a conversa conta no dia da primeira mensagem. Chame `clear_live_rollups` antes de recalcular
+    tudo. Retorna o número de conversas.
+    """
+    rows = conn.execute(
+        f"""
+        SELECT c.id, c.lead_phone, {DIMENSIONS_SQL}, m.sender_type, m.timestamp
+        FROM {DIMENSIONS_FROM}
+        JOIN conversation_messages m ON m.conversation_ref = c.id
+        WHERE c.id BETWEEN ? AND ? AND m.timestamp IS NOT NULL
+        ORDER BY c.id
+        """,
+        (first_ref, last_ref if last_ref is not None else sys.maxsize),
+    )
+    totals: Dict[int, Dict[Tuple[str, str], RollupDelta]] = defaultdict(
+        lambda: defaultdict(RollupDelta)
+    )
+    conversations = 0
+    for conv_ref, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        _, lead_phone, instance, secretary_id = group[0][:4]
+        timed = sorted(
+            ((dateutil_parse(ts), instance, sender_type == "lead")
+             for *_, sender_type, ts in group),
+            key=lambda item: epoch(item[0]),
+        )
+        waiting_since = fold(totals[secretary_id], lead_phone, timed, None, created=True)
+        if waiting_since:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_waits (conversation_ref, lead_since) VALUES (?, ?)",
+                (conv_ref, waiting_since),
+            )
+        conversations += 1
+
+    for secretary_id, deltas in totals.items():
+        for (day, instance), delta in deltas.items():
+            apply_delta(conn, day, instance, secretary_id, delta)
+    return conversations
@@ -0,0 +1,209 @@
+"""
+Shards por instância da Evolution API
+=====================================
+
+No modo multi-clínica cada `evo_api_instance_name` tem seu próprio arquivo
+SQLite (`data/shards/<instancia>.db`) e seu próprio worker de pipeline,
+de modo que uma clínica não disputa o lock de escrita com outra.
+
+- `ShardRouter`: resolve/cria o banco de cada instância e roteia inserts L1
+- `ShardWorkerPool`: uma thread por shard (ingestão em lote + L2)
+- `FederatedReader`: leituras que consultam todos os shards e unem o resultado
+  (um lead atendido por duas instâncias tem uma conversa em cada shard)
+"""
+
+import queue
+import re
+import threading
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from depths.core.database import SwaifDatabase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD = "default"
+
+
+def shard_slug(instance: Optional[str]) -> str:
+    """Nome de arquivo seguro para a instância"""
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", (instance or "").strip()).strip("._")
+    return slug or DEFAULT_SHARD
+
+
+class ShardRouter:
+    """Um SwaifDatabase por instância da Evolution API"""
+
+    def __init__(self, shard_dir: str = "data/shards"):
+        self.shard_dir = Path(shard_dir)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self._shards: Dict[str, SwaifDatabase] = {}
+        self._lock = threading.Lock()
+
+    def for_instance(self, instance: Optional[str]) -> SwaifDatabase:
+        """Banco da instância (criado na primeira mensagem)"""
+        slug = shard_slug(instance)
+        with self._lock:
+            db = self._shards.get(slug)
+            if db is None:
+                db = SwaifDatabase(
+                    str(self.shard_dir / f"{slug}.db"),
+                    archive_dir=str(self.shard_dir / "archive" / slug),
+                    vector_dir=str(self.shard_dir / "vectors" / slug),
+                    media_dir=str(self.shard_dir / "media" / slug),
+                )
+                self._shards[slug] = db
+            return db
+
+    def shards(self) -> Dict[str, SwaifDatabase]:
+        """Todos os shards, incluindo os criados por execuções anteriores"""
+        for path in sorted(self.shard_dir.glob("*.db")):
+            self.for_instance(path.stem)
+        with self._lock:
+            return dict(self._shards)
+
+    def db_paths(self) -> List[str]:
+        return [str(db.db_path) for db in self.shards().values()]
+
+    def insert_l1_message(self, data: Dict) -> Optional[int]:
+        """Mesma interface do SwaifDatabase, roteando pela instância"""
+        return self.for_instance(data.get("evo_api_instance_name")).insert_l1_message(data)
+
+
+class ShardWorkerPool:
+    """Worker dedicado por shard: grava L1 em lote e agrupa L2"""
+
+    _STOP = object()
+
+    def __init__(self, router: ShardRouter, grouper_factory: Optional[Callable] = None,
+                 batch_size: int = 100):
+        from depths.layers.l2_grouper import L2Grouper
+
+        self.router = router
+        self.grouper_factory = grouper_factory or (lambda db: L2Grouper(db))
+        self.batch_size = batch_size
+        self._queues: Dict[str, queue.Queue] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def submit(self, message: Dict):
+        """Enfileira a mensagem no worker da instância"""
+        self._queue_for(shard_slug(message.get("evo_api_instance_name"))).put(message)
+
+    def _queue_for(self, slug: str) -> queue.Queue:
+        with self._lock:
+            q = self._queues.get(slug)
+            if q is None:
+                q = queue.Queue()
+                self._queues[slug] = q
+                self.stats[slug] = {"ingested": 0, "conversations": 0}
+                thread = threading.Thread(
+                    target=self._run, args=(slug, q), name=f"shard-{slug}", daemon=True
+                )
+                self._threads[slug] = thread
+                thread.start()
+            return q
+
+    def _run(self, slug: str, q: queue.Queue):
+        db = self.router.for_instance(slug)
+        grouper = self.grouper_factory(db)
+        while True:
+            batch = [q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(item is self._STOP for item in batch)
+            messages = [item for item in batch if item is not self._STOP]
+            try:
+                if messages:
+                    # Lote inteiro em uma transação (um commit por lote do shard)
+                    db.insert_l1_batch(messages)
+                    conversations = grouper.process_pending_messages()
+                    self.stats[slug]["ingested"] += len(messages)
+                    self.stats[slug]["conversations"] += len(conversations)
+            except Exception as e:
+                logger.error(f"❌ Shard {slug} worker error: {e}")
+            finally:
+                for _ in batch:
+                    q.task_done()
+            if stop:
+                break
+
+    def join(self):
+        """Aguarda os workers esvaziarem suas filas"""
+        with self._lock:
+            queues = list(self._queues.values())
+        for q in queues:
+            q.join()
+
+    def close(self):
+        """Finaliza todas as threads"""
+        with self._lock:
+            items = list(self._queues.items())
+        for _, q in items:
+            q.put(self._STOP)
+        for slug, _ in items:
+            self._threads[slug].join()
+        with self._lock:
+            self._queues.clear()
+            self._threads.clear()
+
+    def process_l2(self) -> List[Dict]:
+        """Agrupa L2 em todos os shards em paralelo"""
+        results: Dict[str, List[Dict]] = {}
+
+        def work(slug, db):
+            results[slug] = self.grouper_factory(db).process_pending_messages()
+
+        threads = [
+            threading.Thread(target=work, args=(slug, db), name=f"l2-{slug}")
+            for slug, db in self.router.shards().items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [conv for slug in sorted(results) for conv in results[slug]]
+
+
+class FederatedReader:
+    """Consultas de leitura distribuídas entre os shards"""
+
+    def __init__(self, router: ShardRouter):
+        self.router = router
+
+    def get_conversation_history(self, conversation_id: str,
+                                 instance: Optional[str] = None) -> List[Dict]:
+        """Histórico da conversa, unido entre os shards
+
+        O id é lead + dia: o mesmo lead falando com duas instâncias no mesmo
+        dia tem uma conversa em cada shard, com o mesmo id. As mensagens de
+        todos saem juntas em ordem de tempo, cada uma com `instance`;
+        `instance` limita a leitura ao shard daquela instância.
+        """
+        shards = self.router.shards()
+        if instance is not None:
+            slug = shard_slug(instance)
+            shards = {slug: shards[slug]} if slug in shards else {}
+        history = []
+        for slug, db in shards.items():
+            # Páginas do cache são compartilhadas: cópia com a instância
+            history.extend(dict(message, instance=slug)
+                           for message in db.get_conversation_history(conversation_id))
+        history.sort(key=lambda m: m["timestamp"] or "")
+        return history
+
+    def search_messages(self, term: str, limit: int = 50) -> List[Dict]:
+        """Busca em todos os shards, resultados mais recentes primeiro"""
+        results = []
+        for slug, db in self.router.shards().items():
+            for row in db.search_messages(term, limit):
+                row["instance"] = slug
+                results.append(row)
+        results.sort(key=lambda r: r["timestamp"] or "", reverse=True)
+        return results[:limit]
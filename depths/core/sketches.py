@@ -0,0 +1,164 @@
+"""
+Sketches mergeáveis para rollups
+================================
+
+- DDSketch: quantis com erro relativo limitado (p50/p90/p99 de tempos)
+- HyperLogLog: contagem aproximada de distintos (leads ativos)
+
+Ambos somam por união: o sketch de um período é o merge dos sketches
+diários, sem reler as linhas brutas.
+"""
+
+import json
+import math
+from hashlib import blake2b
+from typing import Dict, Iterable, Optional
+
+
+class DDSketch:
+    """Quantis com erro relativo `relative_accuracy` (DDSketch, positivo)"""
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        # Valores <= 0 (resposta no mesmo segundo, relógios divergentes)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1):
+        if value > 0:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        else:
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def _collapse(self):
+        """Funde os bins mais baixos: o erro fica nos quantis menores"""
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        merged = sum(self.bins.pop(k) for k in keys[:excess + 1])
+        self.bins[keys[excess]] = self.bins.get(keys[excess], 0) + merged
+
+    def merge(self, other: "DDSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        while len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Valor no quantil q (0..1); None se vazio"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def rank(self, value: float) -> Optional[float]:
+        """Fração dos valores <= value (ex.: respostas dentro do SLA)"""
+        if not self.count:
+            return None
+        if value <= 0:
+            return self.zero_count / self.count
+        limit = math.ceil(math.log(value) / self._log_gamma)
+        below = self.zero_count + sum(c for k, c in self.bins.items() if k <= limit)
+        return below / self.count
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "a": self.relative_accuracy,
+            # Bins em ordem: o mesmo sketch sempre gera o mesmo texto
+            "b": dict(sorted(self.bins.items())),
+            "z": self.zero_count,
+            "n": self.count,
+            "s": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> "DDSketch":
+        if not data:
+            return cls()
+        raw = json.loads(data)
+        sketch = cls(relative_accuracy=raw["a"])
+        sketch.bins = {int(k): v for k, v in raw["b"].items()}
+        sketch.zero_count = raw["z"]
+        sketch.count = raw["n"]
+        sketch.sum = raw["s"]
+        if raw["min"] is not None:
+            sketch.min, sketch.max = raw["min"], raw["max"]
+        return sketch
+
+
+class HyperLogLog:
+    """Contagem aproximada de distintos em 2**precision registradores"""
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+
+    def add(self, item):
+        value = int.from_bytes(blake2b(str(item).encode(), digest_size=8).digest(), "big")
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, items: Iterable):
+        for item in items:
+            self.add(item)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        estimate = self._alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Cardinalidades pequenas: contagem linear é exata o bastante
+            estimate = self.m * math.log(self.m / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], precision: int = 12) -> "HyperLogLog":
+        if data:
+            precision = len(data).bit_length() - 1
+        return cls(precision, data)
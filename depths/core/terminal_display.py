@@ -1,81 +1,132 @@
-from typing import Dict
-import sqlite3
-from datetime import datetime
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
 import logging
 
+from depths.core import pending_replies
+from depths.core.content_store import ContentStore, content_sql
+from depths.core.replica import MemoryReplica, read_snapshot
+from depths.core.sketches import DDSketch, HyperLogLog
+
 logger = logging.getLogger(__name__)
 
 class TerminalDisplay:
     """Exibe métricas no terminal"""
-    
-    def __init__(self, db_path="data/swaif_msg.db"):
+
+    def __init__(self, db_path="data/swaif_msg.db", shard_paths: Optional[List[str]] = None,
+                 replica_max_age: Optional[float] = None):
         self.db_path = db_path
-    
-    def show_l1_metrics(self):
-        """Mostra métricas L1"""
-        with sqlite3.connect(self.db_path) as conn:
+        # Modo multi-clínica: consulta cada shard e une os resultados
+        self.db_paths = list(shard_paths) if shard_paths else [db_path]
+        # Sem WAL disponível: consultar réplicas em memória em vez do banco
+        self.replicas = {
+            path: MemoryReplica(path, max_age_seconds=replica_max_age)
+            for path in self.db_paths
+        } if replica_max_age is not None else {}
+        # Texto compactado das mensagens processadas (core/content_store.py)
+        self.contents = {path: ContentStore(path) for path in self.db_paths}
+
+    def _read(self, path):
+        """Snapshot somente leitura do banco (ou da réplica) - nunca bloqueia a ingestão"""
+        if path in self.replicas:
+            return self.replicas[path].read()
+        return read_snapshot(path)
+
+    def _collect_l1(self, path) -> Dict:
+        with self._read(path) as conn:
+            self.contents[path].register(conn)
             # Total mensagens
             total = conn.execute(
                 "SELECT COUNT(*) FROM messages_l1"
             ).fetchone()[0]
-            
+
             # Últimas 3 mensagens
-            recent = conn.execute("""
-                SELECT sender_phone, receiver_phone, content, timestamp
+            recent = conn.execute(f"""
+                SELECT sender_phone, receiver_phone, {content_sql()}, timestamp, ingested_at
                 FROM messages_l1
                 ORDER BY ingested_at DESC
                 LIMIT 3
             """).fetchall()
-            
+        return {"total": total, "recent": recent}
+
+    def show_l1_metrics(self):
+        """Mostra métricas L1"""
+        total = 0
+        recent = []
+        for path in self.db_paths:
+            shard = self._collect_l1(path)
+            total += shard["total"]
+            recent.extend(shard["recent"])
+        recent = sorted(recent, key=lambda r: r[4] or "", reverse=True)[:3]
+
         logger.info("\n" + "="*50)
         logger.info("📊 SWAIF-MSG L1 METRICS")
         logger.info("="*50)
         logger.info(f"Total messages: {total}")
         logger.info(f"Last update: {datetime.now().strftime('%H:%M:%S')}")
-        
+
         if recent:
             logger.info("\n📱 Recent messages:")
-            for i, (sender, receiver, content, ts) in enumerate(recent, 1):
+            for i, (sender, receiver, content, ts, _) in enumerate(recent, 1):
                 logger.info(f"  {i}. {sender or 'Unknown'} → {receiver}")
-                logger.info(f"     💬 {content[:50]}...")
+                logger.info(f"     💬 {(content or '[media]')[:50]}...")
                 logger.info(f"     ⏰ {ts}\n")
-        
+
         if total > 3:
             logger.info(f"... and {total - 3} more messages")
         logger.info("="*50)
-        
-    def show_l2_metrics(self):
-        """Mostra métricas L2 - Conversas"""
-        with sqlite3.connect(self.db_path) as conn:
+
+    def _collect_l2(self, path, today: str) -> Dict:
+        with self._read(path) as conn:
             # Total conversas
             total_conv = conn.execute(
                 "SELECT COUNT(*) FROM conversations_l2"
             ).fetchone()[0]
-            
+
             # Conversas hoje
-            today = datetime.now().strftime('%Y-%m-%d')
             today_conv = conn.execute(
                 "SELECT COUNT(*) FROM conversations_l2 WHERE date(start_time) = ?",
                 (today,)
             ).fetchone()[0]
-            
+
             # Top leads (mais mensagens)
             top_leads = conn.execute("""
-                SELECT lead_phone, COUNT(*) as conv_count, 
+                SELECT MAX(lead_phone), COUNT(*) as conv_count,
                        SUM(message_count) as total_messages
                 FROM conversations_l2
-                GROUP BY lead_phone
+                GROUP BY lead_id
                 ORDER BY total_messages DESC
                 LIMIT 3
             """).fetchall()
-            
+        return {"total": total_conv, "today": today_conv, "top_leads": top_leads}
+
+    def show_l2_metrics(self):
+        """Mostra métricas L2 - Conversas"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        total_conv = 0
+        today_conv = 0
+        leads: Dict[str, List[int]] = {}
+        for path in self.db_paths:
+            shard = self._collect_l2(path, today)
+            total_conv += shard["total"]
+            today_conv += shard["today"]
+            # Um lead que fala com mais de uma clínica soma os shards
+            for phone, convs, msgs in shard["top_leads"]:
+                entry = leads.setdefault(phone, [0, 0])
+                entry[0] += convs
+                entry[1] += msgs or 0
+        top_leads = sorted(
+            ((phone, convs, msgs) for phone, (convs, msgs) in leads.items()),
+            key=lambda lead: lead[2],
+            reverse=True,
+        )[:3]
+
         logger.info("\n" + "="*50)
         logger.info("📊 SWAIF-MSG L2 METRICS - CONVERSATIONS")
         logger.info("="*50)
         logger.info(f"Total conversations: {total_conv}")
         logger.info(f"Conversations today: {today_conv}")
         logger.info(f"Last update: {datetime.now().strftime('%H:%M:%S')}")
-        
+
         if top_leads:
             logger.info("\n🏆 Top Leads (by message volume):")
             for i, (phone, convs, msgs) in enumerate(top_leads, 1):
@@ -84,7 +135,190 @@ class TerminalDisplay:
                 logger.info(f"     💬 {msgs} total messages\n")
 
         logger.info("="*50)
-    
+
+    def _collect_rollups(self, path, since: str, until: str,
+                         instance: Optional[str]) -> List:
+        query = """
+            SELECT conversations, messages, lead_messages, secretary_messages,
+                   first_response, active_leads
+            FROM daily_rollups
+            WHERE day BETWEEN ? AND ?
+        """
+        params = [since, until]
+        if instance is not None:
+            query += " AND instance = ?"
+            params.append(instance)
+        with self._read(path) as conn:
+            return conn.execute(query, params).fetchall()
+
+    def report(self, since: str, until: str, instance: Optional[str] = None) -> Dict:
+        """Relatório de um período (dias YYYY-MM-DD, inclusivos) a partir dos rollups
+
+        Soma contadores e faz merge dos sketches diários - o custo depende
+        do número de dias, não do volume de mensagens.
+        """
+        totals = {"conversations": 0, "messages": 0, "lead_messages": 0, "secretary_messages": 0}
+        first_response = DDSketch()
+        leads = HyperLogLog()
+        for path in self.db_paths:
+            for row in self._collect_rollups(path, since, until, instance):
+                for key, value in zip(totals, row[:4]):
+                    totals[key] += value or 0
+                first_response.merge(DDSketch.from_json(row[4]))
+                if row[5]:
+                    leads.merge(HyperLogLog.from_bytes(row[5]))
+
+        totals.update({
+            "since": since,
+            "until": until,
+            "active_leads": leads.count(),
+            "responses": first_response.count,
+            "first_response_p50": first_response.quantile(0.5),
+            "first_response_p90": first_response.quantile(0.9),
+            "first_response_p99": first_response.quantile(0.99),
+        })
+        return totals
+
+    def show_report(self, since: str, until: str, instance: Optional[str] = None):
+        """Mostra o relatório consolidado do período"""
+        report = self.report(since, until, instance)
+
+        def minutes(seconds):
+            return "-" if seconds is None else f"{seconds / 60:.1f} min"
+
+        logger.info("\n" + "="*50)
+        logger.info(f"📈 SWAIF-MSG REPORT {since} → {until}")
+        logger.info("="*50)
+        logger.info(f"Conversations: {report['conversations']}")
+        logger.info(f"Messages: {report['messages']} "
+                    f"({report['lead_messages']} lead / {report['secretary_messages']} secretary)")
+        logger.info(f"Active leads: ~{report['active_leads']}")
+        logger.info(f"First response ({report['responses']} replies): "
+                    f"p50 {minutes(report['first_response_p50'])}, "
+                    f"p90 {minutes(report['first_response_p90'])}, "
+                    f"p99 {minutes(report['first_response_p99'])}")
+        logger.info("="*50)
+        return report
+
+    def sla(self, since: str, until: str, target_seconds: float = 900,
+            by: str = "day") -> List[Dict]:
+        """Tempo de resposta da secretária por dia ou por clínica (instância)
+
+        Cada bucket é o merge dos sketches diários (e dos shards): p50/p90/p99
+        com erro relativo de 1% e a fração de respostas dentro do alvo.
+        """
+        if by not in ("day", "instance"):
+            raise ValueError(f"Unknown SLA bucket: {by}")
+        buckets: Dict[str, DDSketch] = {}
+        for path in self.db_paths:
+            with self._read(path) as conn:
+                rows = conn.execute(
+                    f"SELECT {by}, first_response FROM daily_rollups WHERE day BETWEEN ? AND ?",
+                    (since, until),
+                ).fetchall()
+            for key, data in rows:
+                buckets.setdefault(key, DDSketch()).merge(DDSketch.from_json(data))
+
+        return [
+            {
+                by: key,
+                "replies": sketch.count,
+                "p50": sketch.quantile(0.5),
+                "p90": sketch.quantile(0.9),
+                "p99": sketch.quantile(0.99),
+                "within_target": sketch.rank(target_seconds),
+            }
+            for key, sketch in sorted(buckets.items())
+            if sketch.count
+        ]
+
+    def show_sla(self, since: str, until: str, target_seconds: float = 900, by: str = "day"):
+        """Mostra o SLA de resposta por bucket"""
+        rows = self.sla(since, until, target_seconds, by)
+        logger.info("\n" + "="*50)
+        logger.info(f"⏱️ RESPONSE SLA {since} → {until} (target {target_seconds / 60:.0f} min)")
+        logger.info("="*50)
+        for row in rows:
+            logger.info(
+                f"{row[by] or '-'}: {row['replies']} replies | "
+                f"p50 {row['p50'] / 60:.1f} / p90 {row['p90'] / 60:.1f} / "
+                f"p99 {row['p99'] / 60:.1f} min | "
+                f"{row['within_target'] * 100:.0f}% within target"
+            )
+        if not rows:
+            logger.info("No replies in this period")
+        logger.info("="*50)
+        return rows
+
+    def pending(self, limit: int = 20) -> Dict:
+        """Leads aguardando resposta, dos mais antigos para os mais novos
+
+        Cada shard devolve só os `limit` primeiros do índice parcial; o
+        resultado é a união ordenada, cortada em `limit`.
+        """
+        waiting, total = [], 0
+        for path in self.db_paths:
+            with self._read(path) as conn:
+                waiting.extend(pending_replies.oldest_waiting(conn, limit))
+                total += pending_replies.count_waiting(conn)
+        waiting.sort(key=lambda row: row["waiting_since"])
+        return {"total": total, "oldest": waiting[:limit]}
+
+    def show_pending(self, limit: int = 20, now: Optional[datetime] = None):
+        """Mostra os leads esperando resposta há mais tempo"""
+        result = self.pending(limit)
+        now = now or datetime.now(timezone.utc)
+
+        logger.info("\n" + "="*50)
+        logger.info(f"🕒 UNANSWERED LEADS: {result['total']}")
+        logger.info("="*50)
+        for row in result["oldest"]:
+            waited = now - datetime.fromisoformat(row["waiting_since"])
+            hours, rest = divmod(int(waited.total_seconds()), 3600)
+            logger.info(
+                f"📱 {row['lead_phone']} waiting {hours}h{rest // 60:02d}m "
+                f"({row['unanswered']} messages) - {row['conversation_id'] or '-'}"
+            )
+        if not result["oldest"]:
+            logger.info("Every lead has been answered ✅")
+        logger.info("="*50)
+        return result
+
+    def faq(self, limit: int = 10) -> List[Dict]:
+        """Perguntas mais repetidas (grupos de FAQ), com o texto do líder"""
+        clusters = []
+        for path in self.db_paths:
+            with self._read(path) as conn:
+                self.contents[path].register(conn)
+                clusters.extend(
+                    {"cluster_id": cluster_id, "size": size, "example": example}
+                    for cluster_id, size, example in conn.execute(
+                        f"""
+                        SELECT c.id, c.size, {content_sql('m')}
+                        FROM faq_clusters c
+                        LEFT JOIN conversation_messages m ON m.id = c.leader_message_id
+                        ORDER BY c.size DESC
+                        LIMIT ?
+                        """,
+                        (limit,),
+                    )
+                )
+        return sorted(clusters, key=lambda c: c["size"], reverse=True)[:limit]
+
+    def show_faq(self, limit: int = 10):
+        """Mostra os grupos de perguntas mais frequentes"""
+        clusters = self.faq(limit)
+        logger.info("\n" + "="*50)
+        logger.info("❓ FREQUENT QUESTIONS")
+        logger.info("="*50)
+        for cluster in clusters:
+            example = (cluster["example"] or "-")[:60]
+            logger.info(f"{cluster['size']:>6}x  {example}")
+        if not clusters:
+            logger.info("No question clusters yet")
+        logger.info("="*50)
+        return clusters
+
     def show_all_metrics(self):
         """Mostra todas as métricas (L1 + L2)"""
         self.show_l1_metrics()
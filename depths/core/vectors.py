@@ -0,0 +1,198 @@
+"""
+Vetores locais para similaridade de mensagens
+=============================================
+
+- `Embedder`: interface plugável (texto -> vetor float32 normalizado)
+- `HashingEmbedder`: TF-IDF com hashing trick, sem rede nem vocabulário
+- `VectorIndex`: matriz NumPy em arquivo mapeado em memória (np.memmap),
+  com ids paralelos, anexos incrementais e busca top-k por cosseno em lote
+
+Arquivos de um índice (um diretório): `vectors.f32` (linhas float32),
+`ids.i64` e `meta.json`. `meta.json` é gravado por último (rename
+atômico): linhas além de `count` após uma queda são ignoradas.
+"""
+
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from depths.core.keywords import tokenize
+
+
+class Embedder:
+    """Transforma textos em vetores de norma 1 (linhas de uma matriz)"""
+
+    name = "embedder"
+    dim = 0
+
+    def fit(self, texts: List[str]):
+        """Atualiza estatísticas com textos novos (opcional)"""
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def state(self) -> Dict:
+        """Estado persistido junto do índice"""
+        return {}
+
+    def load_state(self, state: Dict):
+        pass
+
+
+class HashingEmbedder(Embedder):
+    """TF-IDF por hashing: palavras e pares de palavras em `dim` posições
+
+    O IDF é incremental (`fit` a cada lote): vetores antigos guardam o peso
+    da época em que foram gravados, o que basta para agrupar perguntas.
+    """
+
+    name = "hashing-tfidf"
+
+    def __init__(self, dim: int = 512, bigrams: bool = True):
+        self.dim = dim
+        self.bigrams = bigrams
+        self.df = np.zeros(dim, dtype=np.float64)
+        self.docs = 0
+
+    def _features(self, text: Optional[str]) -> Dict[int, float]:
+        words = tokenize(text) if text else []
+        grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])] if self.bigrams else words
+        features: Dict[int, float] = {}
+        for gram in grams:
+            h = zlib.crc32(gram.encode())
+            index = h % self.dim
+            # Sinal pelo bit alto: colisões tendem a se cancelar
+            features[index] = features.get(index, 0.0) + (1.0 if h >> 31 else -1.0)
+        return features
+
+    def fit(self, texts: List[str]):
+        for text in texts:
+            for index in self._features(text):
+                self.df[index] += 1
+        self.docs += len(texts)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index, count in self._features(text).items():
+                matrix[row, index] = count
+        # tf sublinear x idf suavizado, linhas com norma 1
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        matrix *= (np.log((1 + self.docs) / (1 + self.df)) + 1).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def state(self) -> Dict:
+        return {"dim": self.dim, "bigrams": self.bigrams,
+                "df": self.df.tolist(), "docs": self.docs}
+
+    def load_state(self, state: Dict):
+        if state.get("dim") != self.dim:
+            raise ValueError(f"Embedder dim {self.dim} != stored {state.get('dim')}")
+        self.bigrams = state["bigrams"]
+        self.df = np.asarray(state["df"], dtype=np.float64)
+        self.docs = state["docs"]
+
+
+class VectorIndex:
+    """Matriz de vetores em memmap com ids; cresce por duplicação"""
+
+    def __init__(self, directory, dim: int, chunk_rows: int = 65536):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        # Linhas por multiplicação na busca (limita a memória temporária)
+        self.chunk_rows = chunk_rows
+        self.count = 0
+        self.meta: Dict = {}
+        meta_path = self.directory / "meta.json"
+        if meta_path.exists():
+            stored = json.loads(meta_path.read_text())
+            if stored["dim"] != dim:
+                raise ValueError(f"Index {self.directory} has dim {stored['dim']}, not {dim}")
+            self.count = stored["count"]
+            self.meta = stored.get("meta", {})
+        self._open(max(self.count, 1024))
+
+    def _open(self, capacity: int):
+        """(Re)mapeia os arquivos com pelo menos `capacity` linhas"""
+        for name, dtype, width in (("vectors.f32", np.float32, self.dim), ("ids.i64", np.int64, 1)):
+            path = self.directory / name
+            size = capacity * width * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        rows = os.path.getsize(self.directory / "ids.i64") // 8
+        self._vectors = np.memmap(self.directory / "vectors.f32", dtype=np.float32,
+                                  mode="r+", shape=(rows, self.dim))
+        self._ids = np.memmap(self.directory / "ids.i64", dtype=np.int64, mode="r+", shape=(rows,))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self.count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.count]
+
+    def append(self, ids: Iterable[int], vectors: np.ndarray):
+        """Anexa linhas (vetores já normalizados) e grava o novo tamanho"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+        if not len(ids):
+            return
+        end = self.count + len(ids)
+        if end > len(self._ids):
+            self._open(max(end, 2 * len(self._ids)))
+        self._vectors[self.count:end] = vectors
+        self._ids[self.count:end] = ids
+        self._vectors.flush()
+        self._ids.flush()
+        self.count = end
+        self.save()
+
+    def save(self):
+        """Grava meta.json (tamanho + metadados) com rename atômico"""
+        tmp = self.directory / "meta.json.tmp"
+        tmp.write_text(json.dumps({"dim": self.dim, "count": self.count, "meta": self.meta}))
+        os.replace(tmp, self.directory / "meta.json")
+
+    def clear(self):
+        self.count = 0
+        self.meta = {}
+        self.save()
+
+    def search(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k por cosseno para cada linha de `queries` -> (ids, scores)
+
+        Ids -1 (score -inf) completam resultados com menos de k vetores.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, self.count, self.chunk_rows):
+            chunk = self._vectors[start:min(start + self.chunk_rows, self.count)]
+            scores = queries @ chunk.T
+            take = min(k, scores.shape[1])
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            # Junta com o melhor até aqui e mantém k
+            merged_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, 1)], 1)
+            merged_rows = np.concatenate([best_rows, top + start], 1)
+            keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(merged_scores, keep, 1)
+            best_rows = np.take_along_axis(merged_rows, keep, 1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, 1)
+        best_rows = np.take_along_axis(best_rows, order, 1)
+        ids = np.where(best_rows >= 0, self._ids[np.maximum(best_rows, 0)], -1)
+        return ids, best_scores
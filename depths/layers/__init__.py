@@ -3,6 +3,13 @@ Processing layers for SWAIF-MSG
 ===============================
 
 - l1_ingestion.py: JSON ingestion from N8N
+- l2_grouper.py: Conversation grouping (L2)
+- l2_closure.py: Conversation-closed events (tolerance expiry)
+- l2_rebuild.py: Full L2 rebuild (sorted single pass + shadow tables)
+- l2_scheduler.py: Priority scheduling (fresh/urgent leads before the backlog)
+- l2_classifier.py: Keyword tagging of conversation history (owner, urgency)
+- l2_faq.py: Frequent-question clusters by text similarity
+- l2_rollups.py: Daily rollups (per instance and secretary) for reports
 - l2_analytics.py: Data analysis (future)  
 - l3_ai.py: AI processing (future)
 """
@@ -1,21 +1,32 @@
 import json
 import time
+from collections import deque
 from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime
 import logging
 
+from depths.core.batching import BatchController
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class L1Ingestion:
     """Monitora pasta N8N e ingere JSONs L1"""
     
-    def __init__(self, database=None, watch_folder="docker/n8n/data"):
+    def __init__(self, database=None, watch_folder="docker/n8n/data", router=None,
+                 controller: Optional[BatchController] = None):
         self.watch_folder = Path(watch_folder)
         self.processed_files = set()
+        # Lote/intervalo ajustados pelo tempo de commit e pela fila
+        self.controller = controller or BatchController()
+        # (chegada epoch, mensagem) lidas e ainda não gravadas
+        self.queue = deque()
         
-        if database:
+        if router:
+            # Modo multi-clínica: cada instância grava no próprio shard
+            self.db = router
+        elif database:
             self.db = database
         else:
             from depths.core.database import SwaifDatabase
@@ -38,6 +49,13 @@ class L1Ingestion:
         """Processa e armazena mensagem L1"""
         try:
             message_id = self.db.insert_l1_message(message_data)
+            if message_id is None:
+                logger.info("🔁 L1 duplicate skipped")
+                return {
+                    "status": "duplicate",
+                    "message_id": None,
+                    "timestamp": datetime.now().isoformat()
+                }
             logger.info(f"✅ L1 stored: ID {message_id}")
             return {
                 "status": "stored",
@@ -48,31 +66,103 @@ class L1Ingestion:
             logger.error(f"❌ Error storing L1: {e}")
             return {"status": "error", "error": str(e)}
     
+    def process_l1_batch(self, messages: List[Dict]) -> Dict:
+        """Armazena um lote em uma transação (se o destino permitir)"""
+        if not hasattr(self.db, "insert_l1_batch"):
+            # Shards: cada mensagem vai para o banco da sua instância
+            results = [self.process_l1_data(msg) for msg in messages]
+            return {status: sum(r["status"] == status for r in results)
+                    for status in ("stored", "duplicate", "error")}
+        try:
+            ids = self.db.insert_l1_batch(messages)
+        except Exception as e:
+            # Lote desfeito: uma a uma, para que só a mensagem ruim falhe
+            logger.error(f"❌ Error storing L1 batch, retrying one by one: {e}")
+            results = [self.process_l1_data(msg) for msg in messages]
+            return {status: sum(r["status"] == status for r in results)
+                    for status in ("stored", "duplicate", "error")}
+        stored = sum(i is not None for i in ids)
+        logger.info(f"✅ L1 stored: {stored} messages, {len(ids) - stored} duplicates skipped")
+        return {"stored": stored, "duplicate": len(ids) - stored, "error": 0}
+
+    def enqueue_new_files(self) -> int:
+        """Lê os JSONs ainda não vistos para a fila; retorna mensagens enfileiradas"""
+        queued = 0
+        for file_path in self.scan_folder():
+            if file_path in self.processed_files:
+                continue
+            logger.info(f"📄 New file: {file_path.name}")
+            # Chegada = quando o N8N gravou o arquivo
+            arrived = file_path.stat().st_mtime if file_path.exists() else time.time()
+            for msg in self.read_json_file(file_path):
+                self.queue.append((arrived, msg))
+                queued += 1
+            self.processed_files.add(file_path)
+        return queued
+
+    def flush(self) -> Dict:
+        """Grava a fila em lotes do tamanho escolhido pelo controlador"""
+        totals = {"stored": 0, "duplicate": 0, "error": 0}
+        while self.queue:
+            size = min(self.controller.batch_size, len(self.queue))
+            batch = [self.queue.popleft() for _ in range(size)]
+            started = time.perf_counter()
+            result = self.process_l1_batch([msg for _, msg in batch])
+            elapsed = time.perf_counter() - started
+            decision = self.controller.observe(
+                size, elapsed, len(self.queue), oldest_wait=time.time() - elapsed - batch[0][0]
+            )
+            if decision["batch_size"] != decision["previous_batch_size"]:
+                logger.info(
+                    f"🎛️ L1 batch {decision['previous_batch_size']} -> {decision['batch_size']} "
+                    f"(commit {elapsed * 1000:.0f} ms, {len(self.queue)} queued)"
+                )
+            for status, count in result.items():
+                totals[status] += count
+        return totals
+
+    def ingest_pending(self) -> Dict:
+        """Uma varredura: enfileira arquivos novos e grava em lotes adaptativos"""
+        self.enqueue_new_files()
+        return self.flush()
+
+    def dedup_stats(self) -> Dict:
+        """Taxas de deduplicação do banco (ou de cada shard)"""
+        if hasattr(self.db, "dedup_stats"):
+            # Daemon de escrita: os contadores são do processo dele
+            return self.db.dedup_stats()
+        if hasattr(self.db, "shards"):
+            return {slug: db.dedup.stats() for slug, db in self.db.shards().items()}
+        return self.db.dedup.stats()
+
+    def log_dedup_stats(self):
+        """Registra no log as duplicatas descartadas"""
+        stats = self.dedup_stats()
+        per_db = {"L1": stats} if "checked" in stats else stats
+        for name, shard in per_db.items():
+            if shard["duplicates"]:
+                logger.info(
+                    f"🔁 {name} dedup: {shard['duplicates']}/{shard['checked']} duplicates "
+                    f"({shard['hit_rate']:.1%}), index probes {shard['probe_rate']:.1%}"
+                )
+
     def scan_folder(self, folder_path=None) -> List[Path]:
         """Escaneia pasta por novos JSONs"""
         folder = Path(folder_path or self.watch_folder)
         return list(folder.glob("*.json"))
     
     def monitor_continuous(self, interval=5):
-        """Monitor contínuo da pasta N8N"""
+        """Monitor contínuo da pasta N8N (interval = espera máxima entre varreduras)"""
         logger.info(f"👁️ Monitoring {self.watch_folder}")
         
         while True:
             try:
-                json_files = self.scan_folder()
+                result = self.ingest_pending()
+                if any(result.values()):
+                    self.log_dedup_stats()
                 
-                for file_path in json_files:
-                    if file_path not in self.processed_files:
-                        logger.info(f"📄 New file: {file_path.name}")
-                        
-                        # Processar arquivo
-                        messages = self.read_json_file(file_path)
-                        for msg in messages:
-                            self.process_l1_data(msg)
-                        
-                        self.processed_files.add(file_path)
-                
-                time.sleep(interval)
+                # Intervalo do controlador: curto com fila, longo no vale
+                time.sleep(min(interval, self.controller.interval))
                 
             except KeyboardInterrupt:
                 logger.info("⏹️ Monitor stopped")
@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from depths.core.content_store import content_sql
+from depths.core.keywords import KeywordAutomaton
+from depths.layers.l2_grouper import L2Listener
+
+logger = logging.getLogger(__name__)
+
+# Dicionário inicial: responsável pela tarefa e urgência (ver README)
+DEFAULT_RULES: Dict[str, List[str]] = {
+    "owner:secretary": [
+        "agendar", "agendamento", "marcar consulta", "remarcar", "desmarcar",
+        "cancelar", "horário", "horario disponível", "vaga", "confirmar consulta",
+        "endereço", "estacionamento",
+    ],
+    "owner:doctor": [
+        "receita", "exame", "resultado do exame", "laudo", "medicamento", "remédio",
+        "dosagem", "efeito colateral", "sintoma", "dor", "febre", "sangramento",
+        "pós-operatório", "atestado",
+    ],
+    "owner:management": [
+        "reclamação", "nota fiscal", "reembolso", "pagamento", "boleto", "pix",
+        "convênio", "plano de saúde", "orçamento", "valor da consulta", "cobrança",
+    ],
+    "urgency:high": [
+        "urgente", "urgência", "emergência", "socorro", "sangramento", "muita dor",
+        "dor forte", "febre alta", "falta de ar", "desmaio", "hoje",
+    ],
+}
+
+# Nome do estágio em stage_offsets
+STAGE = "classifier"
+
+# Dicionário da clínica; sem o arquivo vale DEFAULT_RULES
+RULES_PATH = Path("data/keyword_rules.json")
+
+
+def load_rules(path) -> Dict[str, List[str]]:
+    """Dicionário em JSON: {"tag": ["palavra", "frase com palavras"]}"""
+    with open(Path(path), encoding="utf-8") as f:
+        rules = json.load(f)
+    if not isinstance(rules, dict) or not all(isinstance(v, list) for v in rules.values()):
+        raise ValueError(f"Invalid keyword rules in {path}")
+    return rules
+
+
+def configured_rules(path=RULES_PATH) -> Dict[str, List[str]]:
+    """Dicionário do arquivo de configuração, se existir"""
+    return load_rules(path) if Path(path).exists() else DEFAULT_RULES
+
+
+class MessageClassifier(L2Listener):
+    """Estágio entre L2 e L3: marca `conversation_messages` com tags do dicionário
+
+    Lê o histórico a partir do último id marcado (`stage_offsets`), em lotes,
+    e grava as tags em `message_tags` (chave tag, message_id - consulta por
+    tag pelo índice). Registrado na L2, roda após cada lote gravado; sozinho
+    (`run_depths.py --classify`) recupera o histórico inteiro.
+    """
+
+    def __init__(self, database, rules: Optional[Dict[str, Iterable[str]]] = None,
+                 batch_size: int = 20000):
+        self.db = database
+        self.automaton = KeywordAutomaton(rules or DEFAULT_RULES)
+        self.batch_size = batch_size
+
+    def on_batch_complete(self, conversations: List[Dict]):
+        if conversations:
+            self.run()
+
+    def run(self) -> Dict[str, int]:
+        """Marca todas as mensagens novas; retorna a contagem por tag"""
+        counts: Counter = Counter()
+        tags_for = self.automaton.tags
+        with self.db.contents.register(self.db.connect()) as conn:
+            row = conn.execute(
+                "SELECT last_id FROM stage_offsets WHERE stage = ?", (STAGE,)
+            ).fetchone()
+            last_id = row[0] if row else 0
+            while True:
+                rows = conn.execute(
+                    f"SELECT id, {content_sql()} FROM conversation_messages "
+                    "WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                tagged = [(tag, msg_id) for msg_id, content in rows for tag in tags_for(content)]
+                conn.executemany(
+                    "INSERT OR IGNORE INTO message_tags (tag, message_id) VALUES (?, ?)", tagged
+                )
+                last_id = rows[-1][0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO stage_offsets (stage, last_id) VALUES (?, ?)",
+                    (STAGE, last_id),
+                )
+                conn.commit()
+                counts.update(tag for tag, _ in tagged)
+        if counts:
+            logger.info(f"🏷️ Tagged messages: {dict(counts)}")
+        return dict(counts)
+
+    def reset(self):
+        """Descarta as tags (dicionário mudou): o próximo `run` remarca tudo"""
+        with self.db.connect() as conn:
+            conn.execute("DELETE FROM message_tags")
+            conn.execute("DELETE FROM stage_offsets WHERE stage = ?", (STAGE,))
+
+
+def tagged_messages(conn: sqlite3.Connection, tag: str, limit: int = 50) -> List[Dict]:
+    """Mensagens mais recentes com a tag (índice por tag, sem varrer o histórico)
+
+    `conn` precisa de `database.contents.register(conn)` (texto compactado).
+    """
+    rows = conn.execute(
+        f"""
+        SELECT m.id, m.conversation_id, m.sender_type, {content_sql('m')}, m.timestamp
+        FROM message_tags t
+        JOIN conversation_messages m ON m.id = t.message_id
+        WHERE t.tag = ?
+        ORDER BY t.message_id DESC
+        LIMIT ?
+        """,
+        (tag, limit),
+    ).fetchall()
+    return [
+        {"id": msg_id, "conversation_id": conv_id, "sender_type": sender_type,
+         "content": content, "timestamp": timestamp}
+        for msg_id, conv_id, sender_type, content, timestamp in rows
+    ]
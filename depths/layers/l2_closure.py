@@ -0,0 +1,143 @@
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from dateutil.parser import parse as dateutil_parse
+
+from depths.core import outbox
+from depths.layers.l2_grouper import L2Listener
+
+logger = logging.getLogger(__name__)
+
+
+def to_epoch(value) -> float:
+    """datetime/ISO -> epoch (horários sem fuso são tratados como UTC)"""
+    if isinstance(value, str):
+        value = dateutil_parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ConversationClosureDetector(L2Listener):
+    """Emite "conversa encerrada" quando a janela de tolerância do lead expira
+
+    Mantém um heap de prazos (fim da conversa + tolerância) com remoção
+    preguiçosa: cada atualização é O(log n) e entradas obsoletas são
+    descartadas ao sair do heap. O estado persistido é o próprio banco -
+    `conversations_l2.closed_at` - então `load()` reconstrói o heap após
+    um reinício.
+    """
+
+    def __init__(self, database, tolerance_hours: int = 4,
+                 on_close: Optional[Callable[[Dict], None]] = None):
+        self.db = database
+        self.tolerance = timedelta(hours=tolerance_hours).total_seconds()
+        self.on_close = on_close
+        self._heap: List[Tuple[float, str]] = []
+        # conversation_id -> (prazo, lead_phone)
+        self._open: Dict[str, Tuple[float, str]] = {}
+
+    def __len__(self):
+        return len(self._open)
+
+    def load(self) -> int:
+        """Reconstrói o heap com as conversas ainda abertas no banco"""
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT conversation_id, lead_phone, end_time
+                FROM conversations_l2
+                WHERE closed_at IS NULL AND end_time IS NOT NULL
+                """
+            ).fetchall()
+        for conversation_id, lead_phone, end_time in rows:
+            self.observe(conversation_id, lead_phone, end_time)
+        return len(rows)
+
+    def observe(self, conversation_id: str, lead_phone: str, last_activity):
+        """Atualiza o prazo de uma conversa com nova atividade"""
+        deadline = to_epoch(last_activity) + self.tolerance
+        current = self._open.get(conversation_id)
+        if current and current[0] >= deadline:
+            return
+        self._open[conversation_id] = (deadline, lead_phone)
+        heapq.heappush(self._heap, (deadline, conversation_id))
+
+        # Compacta quando as entradas obsoletas dominam o heap
+        if len(self._heap) > 2 * len(self._open) + 1024:
+            self._heap = [(d, c) for c, (d, _) in self._open.items()]
+            heapq.heapify(self._heap)
+
+    def next_deadline(self) -> Optional[float]:
+        """Próximo prazo (epoch) ou None se não há conversas abertas"""
+        while self._heap:
+            deadline, conversation_id = self._heap[0]
+            current = self._open.get(conversation_id)
+            if current and current[0] == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def poll(self, now=None) -> List[Dict]:
+        """Encerra as conversas cujo prazo passou; retorna os eventos"""
+        now_epoch = to_epoch(now) if now is not None else datetime.now(timezone.utc).timestamp()
+        expired = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now_epoch:
+                break
+            _, conversation_id = heapq.heappop(self._heap)
+            _, lead_phone = self._open.pop(conversation_id)
+            expired.append((conversation_id, lead_phone, deadline))
+
+        if not expired:
+            return []
+
+        events = []
+        with self.db.connect() as conn:
+            for conversation_id, lead_phone, deadline in expired:
+                closed_at = datetime.fromtimestamp(deadline, timezone.utc).isoformat()
+                # closed_at IS NULL: outro detector já pode ter emitido o evento
+                updated = conn.execute(
+                    "UPDATE conversations_l2 SET closed_at = ? "
+                    "WHERE conversation_id = ? AND closed_at IS NULL",
+                    (closed_at, conversation_id),
+                ).rowcount
+                if updated:
+                    ref = conn.execute(
+                        "SELECT id FROM conversations_l2 WHERE conversation_id = ?",
+                        (conversation_id,),
+                    ).fetchone()[0]
+                    outbox.emit_conversation(conn, ref, "close")
+                    events.append({
+                        "event": "conversation_closed",
+                        "conversation_id": conversation_id,
+                        "lead_phone": lead_phone,
+                        "closed_at": closed_at,
+                    })
+
+        for event in events:
+            logger.info(f"🔒 Conversation closed: {event['conversation_id']}")
+            if self.on_close:
+                self.on_close(event)
+        return events
+
+    def on_batch_complete(self, conversations: List[Dict]):
+        """Alimentado pela L2 a cada lote gravado"""
+        if not conversations:
+            return
+        # O fim real vem do banco: mensagens atrasadas e fusões podem deixar
+        # o end_time do lote atrás do end_time da conversa
+        conv_ids = [conv["conversation_id"] for conv in conversations]
+        placeholders = ",".join("?" * len(conv_ids))
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT conversation_id, lead_phone, end_time FROM conversations_l2
+                WHERE conversation_id IN ({placeholders}) AND closed_at IS NULL
+                """,
+                conv_ids,
+            ).fetchall()
+        for conversation_id, lead_phone, end_time in rows:
+            self.observe(conversation_id, lead_phone, end_time)
@@ -0,0 +1,153 @@
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from depths.core.content_store import content_sql
+from depths.core.vectors import Embedder, HashingEmbedder, VectorIndex
+from depths.layers.l2_grouper import L2Listener
+
+logger = logging.getLogger(__name__)
+
+# Nome do estágio em stage_offsets
+STAGE = "faq"
+
+
+class FaqClusters(L2Listener):
+    """Agrupa perguntas repetidas dos leads por similaridade de texto
+
+    Cada mensagem nova de lead vira um vetor (`Embedder`, local) e é
+    comparada aos líderes dos grupos: com cosseno >= `threshold` entra no
+    grupo do líder mais parecido, senão abre um grupo novo e vira líder.
+    A busca é só contra os líderes (poucos, pois as perguntas se repetem);
+    todos os vetores de mensagens ficam no índice `messages` para `similar`.
+
+    Grupos e atribuições ficam no SQLite (`faq_clusters`,
+    `message_clusters`); os vetores, em `database.vector_dir`. O SQLite é
+    gravado antes dos vetores: uma queda entre os dois deixa um grupo sem
+    líder no índice (o próximo parecido abre outro grupo), nunca um líder
+    sem grupo.
+    """
+
+    def __init__(self, database, index_dir=None, embedder: Optional[Embedder] = None,
+                 threshold: float = 0.6, batch_size: int = 5000):
+        self.db = database
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.batch_size = batch_size
+        directory = Path(index_dir) if index_dir else Path(database.vector_dir)
+        self.messages = VectorIndex(directory / "messages", self.embedder.dim)
+        self.leaders = VectorIndex(directory / "leaders", self.embedder.dim)
+        if self.messages.meta.get("embedder") == self.embedder.name:
+            self.embedder.load_state(self.messages.meta["state"])
+
+    def on_batch_complete(self, conversations: List[Dict]):
+        if conversations:
+            self.run()
+
+    def run(self) -> Dict[str, int]:
+        """Vetoriza e agrupa as mensagens de lead novas"""
+        stats = {"messages": 0, "new_clusters": 0}
+        with self.db.contents.register(self.db.connect()) as conn:
+            row = conn.execute(
+                "SELECT last_id FROM stage_offsets WHERE stage = ?", (STAGE,)
+            ).fetchone()
+            if row is None and len(self.messages):
+                # Histórico reconstruído (ids novos): recomeça os índices
+                self.messages.clear()
+                self.leaders.clear()
+            last_id = row[0] if row else 0
+            while True:
+                rows = conn.execute(
+                    f"""
+                    SELECT id, {content_sql()} FROM conversation_messages
+                    WHERE id > ? AND sender_type = 'lead'
+                      AND (content IS NOT NULL OR content_id IS NOT NULL)
+                    ORDER BY id LIMIT ?
+                    """,
+                    (last_id, self.batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                vectors, new_clusters = self._assign(conn, rows)
+                last_id = rows[-1][0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO stage_offsets (stage, last_id) VALUES (?, ?)",
+                    (STAGE, last_id),
+                )
+                conn.commit()
+                self._append(rows, vectors, new_clusters)
+                stats["messages"] += len(rows)
+                stats["new_clusters"] += len(new_clusters)
+        if stats["messages"]:
+            logger.info(
+                f"❓ FAQ: {stats['messages']} lead messages, "
+                f"{stats['new_clusters']} new clusters ({len(self.leaders)} total)"
+            )
+        return stats
+
+    def _assign(self, conn: sqlite3.Connection, rows: List) -> Tuple[np.ndarray, Dict[int, int]]:
+        """Grava o grupo de cada mensagem; retorna (vetores, {linha do lote: grupo novo})"""
+        texts = [content for _, content in rows]
+        self.embedder.fit(texts)
+        vectors = self.embedder.embed(texts)
+        leader_ids, leader_scores = self.leaders.search(vectors, k=1)
+
+        new_clusters: Dict[int, int] = {}
+        assignments = []
+        for i, (msg_id, _) in enumerate(rows):
+            if not vectors[i].any():
+                # Sem palavras (só emoji, mídia): não há pergunta a agrupar
+                continue
+            cluster, score = int(leader_ids[i, 0]), float(leader_scores[i, 0])
+            if new_clusters:
+                # Líderes abertos neste mesmo lote ainda não estão no índice
+                rows_new = list(new_clusters)
+                local = vectors[rows_new] @ vectors[i]
+                best = int(np.argmax(local))
+                if local[best] > score:
+                    cluster, score = new_clusters[rows_new[best]], float(local[best])
+            if score < self.threshold:
+                cluster = conn.execute(
+                    "INSERT INTO faq_clusters (leader_message_id, size) VALUES (?, 0)", (msg_id,)
+                ).lastrowid
+                new_clusters[i] = cluster
+            assignments.append((msg_id, cluster))
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO message_clusters (message_id, cluster_id) VALUES (?, ?)",
+            assignments,
+        )
+        conn.executemany(
+            "UPDATE faq_clusters SET size = size + 1, last_message_id = ? WHERE id = ?",
+            assignments,
+        )
+        return vectors, new_clusters
+
+    def _append(self, rows: List, vectors: np.ndarray, new_clusters: Dict[int, int]):
+        self.messages.meta = {"embedder": self.embedder.name, "state": self.embedder.state()}
+        self.messages.append([msg_id for msg_id, _ in rows], vectors)
+        leader_rows = list(new_clusters)
+        self.leaders.append([new_clusters[i] for i in leader_rows], vectors[leader_rows])
+
+    def match(self, texts: List[str]) -> List[Optional[Dict]]:
+        """Grupo de perguntas de cada texto (sem gravar nada); None se nenhum"""
+        if not texts:
+            return []
+        ids, scores = self.leaders.search(self.embedder.embed(texts), k=1)
+        return [
+            {"cluster_id": int(cluster), "score": float(score)}
+            if cluster >= 0 and score >= self.threshold else None
+            for cluster, score in zip(ids[:, 0], scores[:, 0])
+        ]
+
+    def similar(self, text: str, k: int = 5) -> List[Dict]:
+        """Mensagens de lead do histórico mais parecidas com o texto"""
+        ids, scores = self.messages.search(self.embedder.embed([text]), k=k)
+        return [
+            {"message_id": int(msg_id), "score": float(score)}
+            for msg_id, score in zip(ids[0], scores[0]) if msg_id >= 0
+        ]
+
@@ -1,17 +1,78 @@
 import sqlite3
-from datetime import datetime, timedelta
+import sys
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional
 from collections import defaultdict
 import logging
 from dateutil.parser import parse as dateutil_parse
 
+from depths.core import outbox, pending_replies
+from depths.core.batching import BatchController
+from depths.core.history import AFTER_NULL_TIMESTAMP, AFTER_TIMESTAMP
+from depths.core.participants import clean_phone
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class L2Listener:
+    """Extensão notificada pelas gravações da L2"""
+
+    def on_conversation_saved(self, conn: sqlite3.Connection, conv_data: Dict):
+        """Chamado dentro da transação que grava a conversa"""
+
+    def on_batch_complete(self, conversations: List[Dict]):
+        """Chamado após o lote ser gravado e marcado como processado"""
+
+    def on_conversations_merged(self, conn: sqlite3.Connection, target, others):
+        """Chamado na transação que funde `others` em `target` (antes do DELETE)"""
+
+
+# Colunas de messages_l1 que a L2 realmente usa
+PENDING_COLUMNS = ("id", "sender_phone", "receiver_phone", "content", "timestamp",
+                   "ingested_at", "evo_instance")
+
+# Página de pendentes após o cursor (timestamp, id); usa idx_messages_l1_pending
+PENDING_PAGE = f"""
+    SELECT {', '.join(PENDING_COLUMNS)} FROM messages_l1
+    WHERE processed = FALSE {{after}}
+    ORDER BY timestamp ASC, id ASC
+    LIMIT ?
+"""
+
+
+class PendingMessage:
+    """Mensagem L1 pendente, compacta (__slots__) e só com os campos da L2
+
+    Aceita msg["campo"] e msg.get("campo") como os dicts que substitui.
+    """
+
+    __slots__ = PENDING_COLUMNS
+
+    def __init__(self, id, sender_phone, receiver_phone, content, timestamp,
+                 ingested_at=None, evo_instance=None):
+        self.id = id
+        # Telefones se repetem a cada mensagem do lead: uma cópia só
+        self.sender_phone = sys.intern(sender_phone) if sender_phone else sender_phone
+        self.receiver_phone = sys.intern(receiver_phone) if receiver_phone else receiver_phone
+        self.content = content
+        self.timestamp = timestamp
+        self.ingested_at = ingested_at
+        self.evo_instance = sys.intern(evo_instance) if evo_instance else evo_instance
+
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+
 class L2Grouper:
     """Agrupa mensagens L1 em conversas L2"""
 
-    def __init__(self, database=None, tolerance_hours: int = 4, secretary_phone: str = "clinic_secretary"):
+    def __init__(self, database=None, tolerance_hours: int = 4, secretary_phone: str = "clinic_secretary",
+                 listeners: Optional[List[L2Listener]] = None, allowed_lateness_minutes: int = 0,
+                 controller: Optional[BatchController] = None):
         if database:
             self.db = database
         else:
@@ -20,9 +81,31 @@ class L2Grouper:
 
         self.secretary_phone = self._clean_phone(secretary_phone)
         self.tolerance = timedelta(hours=tolerance_hours)
+        self.listeners: List[L2Listener] = list(listeners or [])
+        # Atraso tolerado: mensagens mais novas que a marca d'água esperam o
+        # próximo lote, para que retentativas cheguem antes do agrupamento
+        self.allowed_lateness = timedelta(minutes=allowed_lateness_minutes)
+        # Pendentes vão em lotes do tamanho escolhido pelo tempo de gravação
+        self.controller = controller or BatchController()
+
+    def add_listener(self, listener: L2Listener):
+        """Registra uma extensão da L2"""
+        self.listeners.append(listener)
     
-    def generate_conversation_id(self, lead_phone: str, timestamp: str) -> str:
-        """Gera ID considerando janela de tolerância"""
+    def generate_conversation_id(self, lead_phone: str, timestamp: str,
+                                 merges: Optional[Dict[str, str]] = None) -> str:
+        """Gera ID considerando janela de tolerância
+
+        O id é lead + dia da primeira mensagem da sessão: uma sessão nova no
+        mesmo dia de outra do lead (intervalo acima da tolerância) reutiliza o
+        id e continua a mesma conversa. Se ela já foi encerrada, a gravação a
+        reabre de forma explícita (closed_at volta a NULL, evento "reopen" no
+        outbox) e o detector de encerramento a fecha de novo com o novo fim.
+        A reconstrução (l2_rebuild.py) segue a mesma regra. Fusões que uma
+        mensagem atrasada exige vão para `merges` (id absorvido -> id alvo) e
+        são gravadas na transação da conversa; sem `merges` (chamada avulsa)
+        são feitas na hora.
+        """
         if isinstance(timestamp, str):
             # Usar python-dateutil que é mais robusto e compatível
             try:
@@ -33,31 +116,125 @@ class L2Grouper:
         else:
             dt = timestamp
 
-        clean_phone = lead_phone.replace('@s.whatsapp.net', '').strip()
+        lead = clean_phone(lead_phone)
 
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             conn.row_factory = sqlite3.Row
             row = conn.execute(
                 "SELECT last_activity, conversation_id FROM lead_activity WHERE lead_phone = ?",
-                (clean_phone,),
+                (lead,),
             ).fetchone()
 
             if row:
                 last_activity = dateutil_parse(row["last_activity"])
+                if dt < last_activity:
+                    # Mensagem atrasada: reagrupa só a janela do lead, sem
+                    # retroceder lead_activity
+                    target, others = self._place_late_message(conn, lead, dt)
+                    if merges is None:
+                        if others:
+                            self._merge_conversations(conn, target, others)
+                            conn.commit()
+                    else:
+                        merges.update((row["conversation_id"], target["conversation_id"])
+                                      for row in others)
+                    return target["conversation_id"]
                 if dt - last_activity <= self.tolerance:
                     conversation_id = row["conversation_id"]
                 else:
-                    conversation_id = f"{clean_phone}_{dt.strftime('%Y-%m-%d')}"
+                    conversation_id = f"{lead}_{dt.strftime('%Y-%m-%d')}"
             else:
-                conversation_id = f"{clean_phone}_{dt.strftime('%Y-%m-%d')}"
+                conversation_id = f"{lead}_{dt.strftime('%Y-%m-%d')}"
 
             conn.execute(
-                "INSERT OR REPLACE INTO lead_activity (lead_phone, last_activity, conversation_id) VALUES (?, ?, ?)",
-                (clean_phone, dt.isoformat(), conversation_id),
+                "INSERT OR REPLACE INTO lead_activity (lead_phone, last_activity, conversation_id, lead_id) VALUES (?, ?, ?, ?)",
+                (lead, dt.isoformat(), conversation_id,
+                 self.db.participants.get_id(conn, lead, role="lead")),
             )
             conn.commit()
 
         return conversation_id
+
+    def _place_late_message(self, conn: sqlite3.Connection, lead: str, dt: datetime):
+        """Conversa da mensagem atrasada e as que ela liga a essa (a fundir)
+
+        Sem conversa do lead ao redor de `dt`, vale a regra do id lead + dia:
+        se o lead já tem conversa nesse dia (mesmo que horas distante), a
+        mensagem entra nela, como no caminho em ordem, reabrindo-a se já
+        estava encerrada.
+        """
+        rows = conn.execute(
+            """
+            SELECT id, conversation_id, start_time, end_time
+            FROM conversations_l2
+            WHERE lead_phone = ?
+            ORDER BY start_time ASC
+            """,
+            (lead,),
+        ).fetchall()
+
+        nearby = [
+            row for row in rows
+            if dateutil_parse(row["start_time"]) - self.tolerance <= dt
+            <= dateutil_parse(row["end_time"]) + self.tolerance
+        ]
+        if not nearby:
+            return {"conversation_id": f"{lead}_{dt.strftime('%Y-%m-%d')}"}, []
+        # Mais de uma: a mensagem liga conversas antes separadas pela tolerância
+        return nearby[0], nearby[1:]
+
+    def _merge_conversations(self, conn: sqlite3.Connection, target, others):
+        """Funde `others` na conversa `target` (histórico, L3 e lead_activity)"""
+        ids = [row["id"] for row in others]
+        conv_ids = [row["conversation_id"] for row in others]
+        placeholders = ",".join("?" * len(ids))
+
+        for table in ("conversation_messages", "analyses_l3"):
+            conn.execute(
+                f"""
+                UPDATE {table} SET conversation_id = ?, conversation_ref = ?
+                WHERE conversation_ref IN ({placeholders})
+                """,
+                [target["conversation_id"], target["id"]] + ids,
+            )
+        conn.execute(
+            f"""
+            UPDATE conversations_l2
+            SET message_count = message_count + (
+                    SELECT COALESCE(SUM(message_count), 0) FROM conversations_l2
+                    WHERE id IN ({placeholders})),
+                start_time = MIN(start_time, (
+                    SELECT MIN(start_time) FROM conversations_l2 WHERE id IN ({placeholders}))),
+                end_time = MAX(end_time, (
+                    SELECT MAX(end_time) FROM conversations_l2 WHERE id IN ({placeholders}))),
+                closed_at = CASE WHEN EXISTS (
+                    SELECT 1 FROM conversations_l2
+                    WHERE id IN ({placeholders}) AND closed_at IS NULL
+                ) THEN NULL ELSE closed_at END,
+                version = version + 1
+            WHERE id = ?
+            """,
+            ids * 4 + [target["id"]],
+        )
+        for row in others:
+            outbox.emit(conn, "conversation", "merge", row["id"], {
+                "conversation_id": row["conversation_id"],
+                "into_id": target["id"],
+                "into": target["conversation_id"],
+            })
+        outbox.emit_conversation(conn, target["id"], "update")
+        conn.execute(
+            f"UPDATE lead_activity SET conversation_id = ? WHERE conversation_id IN ({placeholders})",
+            [target["conversation_id"]] + conv_ids,
+        )
+        conn.execute(
+            f"UPDATE pending_replies SET conversation_ref = ? WHERE conversation_ref IN ({placeholders})",
+            [target["id"]] + ids,
+        )
+        for listener in self.listeners:
+            listener.on_conversations_merged(conn, target, others)
+        conn.execute(f"DELETE FROM conversations_l2 WHERE id IN ({placeholders})", ids)
+        logger.info(f"🔀 Merged {conv_ids} into {target['conversation_id']} (late message)")
     
     def identify_participants(self, sender: Optional[str], receiver: str) -> Dict:
         """Identifica lead e secretária na conversa"""
@@ -81,30 +258,87 @@ class L2Grouper:
             }
     
     def _clean_phone(self, phone: str) -> str:
-        """Limpa número de telefone"""
-        if not phone:
-            return ""
-        return phone.replace('@s.whatsapp.net', '').replace('@g.us', '').strip()
+        """Limpa número de telefone (cache de strings internadas)"""
+        return clean_phone(phone)
     
-    def process_pending_messages(self) -> List[Dict]:
-        """Processa mensagens L1 não agrupadas"""
-        
-        with sqlite3.connect(self.db.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            
-            # Buscar mensagens não processadas
-            cursor = conn.execute("""
-                SELECT * FROM messages_l1 
-                WHERE processed = FALSE
-                ORDER BY timestamp ASC
-            """)
-            
-            messages = cursor.fetchall()
-            
-        if not messages:
+    def process_pending_messages(self, flush: bool = False) -> List[Dict]:
+        """Processa mensagens L1 não agrupadas (flush ignora a marca d'água)
+
+        Em lotes do tamanho escolhido por `self.controller`, lidos um a um
+        com LIMIT e cursor (timestamp, id): só o lote corrente fica em
+        memória. Uma conversa que recebe mensagens em dois lotes aparece uma
+        vez por lote no retorno.
+        """
+        with self.db.connect() as conn:
+            pending, newest = conn.execute(
+                "SELECT COUNT(*), MAX(timestamp) FROM messages_l1 WHERE processed = FALSE"
+            ).fetchone()
+
+        if not pending:
             logger.info("No pending messages to group")
             return []
-        
+        watermark = None if flush else self._watermark(newest)
+
+        # Ordem global de timestamp: cada lote vem depois do anterior para todo lead
+        saved: List[Dict] = []
+        cursor = None
+        read = 0
+        while True:
+            size = self.controller.batch_size
+            with self.db.connect() as conn:
+                page = self._fetch_pending(conn, after=cursor, limit=size)
+            if not page:
+                break
+            # Gravações que falharem ficam atrás do cursor: só na próxima execução
+            cursor = (page[-1].timestamp, page[-1].id)
+            read += len(page)
+            remaining = max(pending - read, 0) if len(page) == size else 0
+
+            batch = self._apply_watermark(page, watermark)
+            if batch:
+                started = time.perf_counter()
+                saved.extend(self.process_messages(batch))
+                elapsed = time.perf_counter() - started
+                decision = self.controller.observe(
+                    len(batch), elapsed, remaining,
+                    oldest_wait=self._waited(min(m["ingested_at"] or "" for m in batch)),
+                )
+                if decision["batch_size"] != decision["previous_batch_size"]:
+                    logger.info(
+                        f"🎛️ L2 batch {decision['previous_batch_size']} -> {decision['batch_size']} "
+                        f"({elapsed * 1000:.0f} ms, {remaining} pending)"
+                    )
+            if len(page) < size:
+                break
+        return saved
+
+    @staticmethod
+    def _waited(ingested_at: str) -> float:
+        """Segundos desde o ingested_at (UTC do SQLite) da mensagem"""
+        if not ingested_at:
+            return 0.0
+        moment = datetime.fromisoformat(ingested_at)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - moment).total_seconds()
+
+    def process_messages(self, messages: List[PendingMessage]) -> List[Dict]:
+        """Agrupa, grava e marca como processado um lote já selecionado
+
+        As mensagens de cada lead devem vir em ordem de timestamp (ver
+        l2_scheduler.py, que escolhe lotes por lead).
+        """
+        if not messages:
+            return []
+
+        # Sem horário não há sessão: marcada como processada e fora da L2
+        # (a reconstrução faz o mesmo)
+        untimed = [m.get("id") for m in messages if not m.get("timestamp")]
+        if untimed:
+            logger.warning(f"⚠️ Skipping {len(untimed)} messages without timestamp")
+            self._mark_messages_processed([i for i in untimed if i is not None])
+            messages = [m for m in messages if m.get("timestamp")]
+
         # Agrupar por conversa
         conversations = self._group_into_conversations(messages)
         
@@ -115,13 +349,76 @@ class L2Grouper:
             if conv_id:
                 saved_conversations.append(conv_data)
                 
-        # Marcar mensagens como processadas
-        self._mark_messages_processed([m['id'] for m in messages])
+        # Cada conversa já marcou as suas mensagens no próprio commit; as de
+        # uma gravação que falhou ficam pendentes para a próxima execução
+
+        for listener in self.listeners:
+            listener.on_batch_complete(saved_conversations)
         
         logger.info(f"✅ Grouped {len(messages)} messages into {len(saved_conversations)} conversations")
         
         return saved_conversations
     
+    def _fetch_pending(self, conn: sqlite3.Connection, after=None,
+                       limit: int = -1) -> List[PendingMessage]:
+        """Mensagens não processadas após o cursor, só com as colunas da L2
+
+        `after`: (timestamp, id) da última mensagem do lote anterior;
+        `limit` -1 lê todas.
+        """
+        if after is None:
+            sql, params = PENDING_PAGE.format(after=""), (limit,)
+        elif after[0] is None:
+            sql, params = PENDING_PAGE.format(after=AFTER_NULL_TIMESTAMP), (after[1], limit)
+        else:
+            sql, params = PENDING_PAGE.format(after=AFTER_TIMESTAMP), (after[0], after[1], limit)
+        return [PendingMessage(*row) for row in conn.execute(sql, params)]
+
+    def fetch_messages(self, message_ids: List[int]) -> List[PendingMessage]:
+        """Mensagens pendentes pelos ids, em ordem de timestamp"""
+        messages: List[PendingMessage] = []
+        with self.db.connect() as conn:
+            # Lotes abaixo do limite de variáveis do SQLite
+            for start in range(0, len(message_ids), 900):
+                chunk = message_ids[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT {', '.join(PENDING_COLUMNS)} FROM messages_l1 "
+                    f"WHERE id IN ({placeholders}) AND processed = FALSE",
+                    chunk,
+                )
+                messages.extend(PendingMessage(*row) for row in cursor)
+        messages.sort(key=lambda m: (m.timestamp or "", m.id))
+        return messages
+
+    def _watermark(self, newest: Optional[str]) -> Optional[datetime]:
+        """Marca d'água de atraso: timestamp pendente mais novo - atraso tolerado"""
+        if not self.allowed_lateness or not newest:
+            return None
+        return dateutil_parse(newest) - self.allowed_lateness
+
+    def _apply_watermark(self, messages: List, watermark: Optional[datetime]) -> List:
+        """Retém mensagens mais novas que a marca d'água de atraso"""
+        if watermark is None:
+            return messages
+
+        # Sem timestamp: segue adiante, `process_messages` a descarta
+        times = [dateutil_parse(m['timestamp']) if m['timestamp'] else None for m in messages]
+        # Sem tráfego novo a marca d'água não avança: libera pelo tempo de ingestão
+        ingested_cutoff = (
+            datetime.now(timezone.utc) - self.allowed_lateness
+        ).strftime('%Y-%m-%d %H:%M:%S')
+
+        ready = [
+            msg for msg, msg_time in zip(messages, times)
+            if msg_time is None or msg_time <= watermark
+            or (msg['ingested_at'] or '') <= ingested_cutoff
+        ]
+        held = len(messages) - len(ready)
+        if held:
+            logger.info(f"⏳ Holding {held} messages below the lateness watermark")
+        return ready
+
     def _group_into_conversations(self, messages: List) -> Dict:
         """Agrupa mensagens em conversas"""
         conversations = defaultdict(lambda: {
@@ -130,7 +427,9 @@ class L2Grouper:
             "start_time": None,
             "end_time": None
         })
-        
+        # Conversa absorvida -> alvo, para fusões pedidas por mensagens atrasadas
+        merges: Dict[str, str] = {}
+
         for msg in messages:
             # Identificar participantes
             participants = self.identify_participants(
@@ -144,17 +443,19 @@ class L2Grouper:
                 msg_time = dateutil_parse(msg_time)
 
             # Gerar ID da conversa
-            conv_id = self.generate_conversation_id(
+            conv_id = self._resolve(merges, self.generate_conversation_id(
                 participants['lead_phone'],
-                msg_time
-            )
+                msg_time,
+                merges,
+            ))
 
             # Adicionar à conversa
             conv = conversations[conv_id]
             conv["conversation_id"] = conv_id
             conv["lead_phone"] = participants['lead_phone']
-            conv["secretary_phone"] = participants['secretary_phone']
-            conv["messages"].append(dict(msg))
+            # Secretária da primeira mensagem: a mesma que a reconstrução grava
+            conv.setdefault("secretary_phone", participants['secretary_phone'])
+            conv["messages"].append(msg)
             conv["message_count"] += 1
 
             # Atualizar timestamps
@@ -162,13 +463,44 @@ class L2Grouper:
                 conv["start_time"] = msg_time
             if not conv["end_time"] or msg_time > conv["end_time"]:
                 conv["end_time"] = msg_time
-        
+
+        # A fusão grava junto com a conversa alvo (mesma transação)
+        for absorbed in merges:
+            target = conversations[self._resolve(merges, absorbed)]
+            target.setdefault("merges", []).append(absorbed)
+            conv = conversations.pop(absorbed, None)
+            if conv is None:
+                continue
+            # Mensagens do lote que entraram na absorvida antes da fusão
+            target["messages"].extend(conv["messages"])
+            target["messages"].sort(key=lambda m: (m["timestamp"] or "", m["id"]))
+            target["message_count"] += conv["message_count"]
+            target["start_time"] = min(target["start_time"], conv["start_time"])
+            target["end_time"] = max(target["end_time"], conv["end_time"])
+
         return conversations
+
+    @staticmethod
+    def _resolve(merges: Dict[str, str], conversation_id: str) -> str:
+        """Id final depois de fusões em cadeia"""
+        while conversation_id in merges:
+            conversation_id = merges[conversation_id]
+        return conversation_id
     
     def _save_conversation(self, conv_data: Dict) -> Optional[int]:
         """Salva conversa L2 no banco e armazena histórico de mensagens"""
         try:
-            with sqlite3.connect(self.db.db_path) as conn:
+            with self.db.connect() as conn:
+                # Lock de escrita desde a leitura: conversa, histórico e a
+                # marcação das mensagens L1 saem no mesmo commit
+                conn.execute("BEGIN IMMEDIATE")
+                if not self._claim_messages(conn, conv_data):
+                    logger.info(f"⏭️ {conv_data['conversation_id']}: messages already grouped")
+                    return None
+
+                if conv_data.get("merges"):
+                    self._apply_merges(conn, conv_data)
+
                 # Converter timestamps para string
                 start_time = conv_data["start_time"]
                 end_time = conv_data["end_time"]
@@ -179,34 +511,42 @@ class L2Grouper:
 
                 # Verificar se conversa já existe
                 existing = conn.execute(
-                    "SELECT id FROM conversations_l2 WHERE conversation_id = ?",
+                    "SELECT id, closed_at FROM conversations_l2 WHERE conversation_id = ?",
                     (conv_data["conversation_id"],),
                 ).fetchone()
 
                 if existing:
-                    # Atualizar conversa existente
+                    # Atualizar conversa existente; uma já encerrada é reaberta
+                    # e o detector de encerramento volta a acompanhá-la
                     conn.execute(
                         """
                         UPDATE conversations_l2
                         SET message_count = message_count + ?,
-                            end_time = ?
+                            start_time = MIN(start_time, ?),
+                            end_time = MAX(end_time, ?),
+                            closed_at = NULL,
+                            version = version + 1
                         WHERE conversation_id = ?
                         """,
                         (
                             conv_data["message_count"],
+                            start_time,
                             end_time,
                             conv_data["conversation_id"],
                         ),
                     )
                     conv_row_id = existing[0]
+                    conv_data["created"] = False
+                    conv_data["reopened"] = existing[1] is not None
                 else:
                     # Inserir nova conversa
                     cursor = conn.execute(
                         """
                         INSERT INTO conversations_l2
                         (conversation_id, lead_phone, secretary_phone,
-                         message_count, start_time, end_time)
-                        VALUES (?, ?, ?, ?, ?, ?)
+                         message_count, start_time, end_time,
+                         lead_id, secretary_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                         """,
                         (
                             conv_data["conversation_id"],
@@ -215,11 +555,35 @@ class L2Grouper:
                             conv_data["message_count"],
                             start_time,
                             end_time,
+                            self.db.participants.get_id(
+                                conn, conv_data["lead_phone"], role="lead"
+                            ),
+                            self.db.participants.get_id(
+                                conn, conv_data["secretary_phone"], role="secretary"
+                            ),
                         ),
                     )
                     conv_row_id = cursor.lastrowid
+                    conv_data["created"] = True
+                    conv_data["reopened"] = False
+
+                # Texto direto em `contents`: o histórico e a L1 já processada
+                # citam o mesmo corpo (ver core/content_store.py)
+                messages = conv_data.get("messages", [])
+                content_ids = self.db.contents.intern(
+                    conn, [m.get("content") for m in messages if m.get("content")]
+                )
+                conn.executemany(
+                    "UPDATE messages_l1 SET content = NULL, content_id = ? WHERE id = ?",
+                    [
+                        (content_ids[m.get("content")], m.get("id"))
+                        for m in messages if m.get("content") and m.get("id") is not None
+                    ],
+                )
 
-                for msg in conv_data.get("messages", []):
+                # Mensagens do lead abrem/estendem a espera; da secretária, fecham
+                wait_events = []
+                for msg in messages:
                     participants = self.identify_participants(
                         msg.get("sender_phone"),
                         msg.get("receiver_phone"),
@@ -227,31 +591,117 @@ class L2Grouper:
                     msg_time = msg.get("timestamp")
                     if isinstance(msg_time, datetime):
                         msg_time = msg_time.isoformat()
+                    if msg_time:
+                        wait_events.append((
+                            participants["sender_type"] == "lead",
+                            pending_replies.normalize(msg_time),
+                            conv_row_id,
+                        ))
                     conn.execute(
                         """
                         INSERT INTO conversation_messages
-                        (conversation_id, sender_type, content, timestamp)
-                        VALUES (?, ?, ?, ?)
+                        (conversation_id, conversation_ref, sender_type,
+                         content_id, timestamp)
+                        VALUES (?, ?, ?, ?, ?)
                         """,
                         (
                             conv_data["conversation_id"],
+                            conv_row_id,
                             participants["sender_type"],
-                            msg.get("content"),
+                            content_ids.get(msg.get("content")),
                             msg_time,
                         ),
                     )
 
+                pending_replies.record(
+                    conn,
+                    conv_data["lead_phone"],
+                    self.db.participants.get_id(conn, conv_data["lead_phone"], role="lead"),
+                    wait_events,
+                )
+
+                conv_data["conversation_ref"] = conv_row_id
+                if conv_data["created"]:
+                    op = "insert"
+                else:
+                    op = "reopen" if conv_data["reopened"] else "update"
+                if conv_data["reopened"]:
+                    logger.info(f"🔓 Reopened {conv_data['conversation_id']} (closed at {existing[1]})")
+                outbox.emit_conversation(conn, conv_row_id, op)
+                for listener in self.listeners:
+                    listener.on_conversation_saved(conn, conv_data)
+
                 return conv_row_id
 
         except Exception as e:
             logger.error(f"Error saving conversation: {e}")
+            # Ids criados na transação desfeita não podem ficar em cache
+            self.db.participants.clear()
             return None
 
+    def _apply_merges(self, conn: sqlite3.Connection, conv_data: Dict):
+        """Funde na conversa as absorvidas por mensagens atrasadas do lote"""
+        names = [conv_data["conversation_id"]] + conv_data["merges"]
+        placeholders = ",".join("?" * len(names))
+        rows = {
+            row[1]: {"id": row[0], "conversation_id": row[1]}
+            for row in conn.execute(
+                f"SELECT id, conversation_id FROM conversations_l2 "
+                f"WHERE conversation_id IN ({placeholders})",
+                names,
+            )
+        }
+        target = rows.get(conv_data["conversation_id"])
+        others = [rows[name] for name in conv_data["merges"] if name in rows]
+        if target and others:
+            self._merge_conversations(conn, target, others)
+
+    def _claim_messages(self, conn: sqlite3.Connection, conv_data: Dict) -> bool:
+        """Marca as mensagens L1 da conversa como processadas na transação corrente
+
+        Mensagens já processadas (execução anterior que caiu após o commit, ou
+        outro agrupador) saem da conversa; False se nenhuma sobrar.
+        """
+        messages = conv_data.get("messages", [])
+        ids = [m.get("id") for m in messages if m.get("id") is not None]
+        if not ids:
+            return True
+
+        claimed = set()
+        # Lotes abaixo do limite de variáveis do SQLite
+        for start in range(0, len(ids), 900):
+            chunk = ids[start:start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            claimed.update(row[0] for row in conn.execute(
+                f"SELECT id FROM messages_l1 WHERE id IN ({placeholders}) AND processed = FALSE",
+                chunk,
+            ))
+        ordered = sorted(claimed)
+        for start in range(0, len(ordered), 900):
+            chunk = ordered[start:start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            conn.execute(
+                f"UPDATE messages_l1 SET processed = TRUE WHERE id IN ({placeholders})", chunk
+            )
+        if len(claimed) == len(ids):
+            return True
+
+        kept = [m for m in messages if m.get("id") is None or m.get("id") in claimed]
+        if not kept:
+            return False
+        times = [
+            dateutil_parse(m["timestamp"]) if isinstance(m["timestamp"], str) else m["timestamp"]
+            for m in kept
+        ]
+        conv_data.update(messages=kept, message_count=len(kept),
+                         start_time=min(times), end_time=max(times))
+        return True
+
     def _mark_messages_processed(self, message_ids: List[int]):
         """Marca mensagens L1 como processadas"""
         if not message_ids:
             return
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             placeholders = ','.join(['?'] * len(message_ids))
             conn.execute(
                 f"UPDATE messages_l1 SET processed = TRUE WHERE id IN ({placeholders})",
@@ -0,0 +1,299 @@
+import re
+import sqlite3
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from dateutil.parser import parse as dateutil_parse
+
+from depths.core import outbox, pending_replies
+from depths.core.participants import CLEAN_PHONE_SQL, clean_phone
+from depths.core.rollups import clear_live_rollups, recompute_rollups
+from depths.layers.l2_classifier import STAGE as CLASSIFIER_STAGE
+from depths.layers.l2_closure import to_epoch
+from depths.layers.l2_faq import STAGE as FAQ_STAGE
+
+logger = logging.getLogger(__name__)
+
+# Tabelas derivadas de messages_l1 que a reconstrução substitui
+REBUILT_TABLES = ("conversations_l2", "conversation_messages", "lead_activity",
+                  "pending_replies")
+SHADOW_SUFFIX = "__rebuild"
+
+# Lead de cada mensagem, com a mesma regra de L2Grouper.identify_participants
+LEAD_SQL = (
+    "CASE WHEN sender_phone IS NULL OR sender_phone = '' "
+    f"THEN {CLEAN_PHONE_SQL.format(column='receiver_phone')} "
+    f"ELSE {CLEAN_PHONE_SQL.format(column='sender_phone')} END"
+)
+
+
+def parse_time(value: str) -> datetime:
+    """ISO 8601 pelo caminho rápido; demais formatos via dateutil"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil_parse(value)
+
+
+class L2Rebuilder:
+    """Reconstrói a L2 inteira a partir de messages_l1 em uma passada ordenada
+
+    As mensagens são lidas em ORDER BY lead, timestamp - o ordenador do
+    SQLite faz merge sort externo em arquivos temporários quando os dados
+    não cabem na memória - e as fronteiras de sessão são decididas em uma
+    única varredura. O resultado vai para tabelas sombra que substituem as
+    originais em uma transação. Comando de manutenção: rode com o pipeline
+    parado (mensagens que chegarem durante a reconstrução ficam pendentes
+    para o agrupamento normal).
+    """
+
+    def __init__(self, database, tolerance_hours: int = 4,
+                 secretary_phone: str = "clinic_secretary", commit_every: int = 50000):
+        self.db = database
+        self.tolerance = timedelta(hours=tolerance_hours)
+        self.secretary_phone = clean_phone(secretary_phone)
+        # Linhas de histórico por transação nas tabelas sombra
+        self.commit_every = commit_every
+        self.version = 1
+
+    def rebuild(self) -> Dict:
+        """Executa a reconstrução completa; retorna estatísticas"""
+        started = time.perf_counter()
+        conn = self.db.connect(isolation_level=None)
+        try:
+            conn.execute("PRAGMA temp_store = FILE")
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages_l1").fetchone()[0]
+            # Versões acima de todas as anteriores invalidam caches de histórico
+            self.version = conn.execute(
+                "SELECT COALESCE(MAX(version), 0) + 1 FROM conversations_l2"
+            ).fetchone()[0]
+            indexes = self._create_shadow_tables(conn)
+            stats = self._sweep(conn, max_id)
+            stats["swap_seconds"] = self._swap(conn, indexes, max_id)
+        except Exception:
+            # Ids de participantes criados em transações desfeitas
+            self.db.participants.clear()
+            raise
+        finally:
+            conn.close()
+
+        stats["seconds"] = time.perf_counter() - started
+        logger.info(
+            f"🏗️ L2 rebuilt: {stats['messages']} messages -> "
+            f"{stats['conversations']} conversations in {stats['seconds']:.1f}s"
+        )
+        if stats["skipped"]:
+            logger.warning(f"⚠️ {stats['skipped']} messages without timestamp left out of L2")
+        return stats
+
+    def _create_shadow_tables(self, conn: sqlite3.Connection) -> List[str]:
+        """Cria tabelas sombra vazias; retorna o SQL dos índices originais"""
+        indexes = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in REBUILT_TABLES:
+                shadow = table + SHADOW_SUFFIX
+                conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+                sql = conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                    (table,),
+                ).fetchone()[0]
+                # Depois de um RENAME o SQLite guarda o nome entre aspas
+                conn.execute(re.sub(
+                    rf'^CREATE TABLE "?{table}"?', f"CREATE TABLE {shadow}", sql, count=1
+                ))
+                indexes.extend(row[0] for row in conn.execute(
+                    "SELECT sql FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                    (table,),
+                ))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return indexes
+
+    def _sweep(self, conn: sqlite3.Connection, max_id: int) -> Dict:
+        """Passada única: mensagens ordenadas -> conversas nas tabelas sombra"""
+        cursor = conn.execute(
+            f"""
+            SELECT id, {LEAD_SQL} AS lead, sender_phone, receiver_phone,
+                   content, content_id, timestamp
+            FROM messages_l1
+            WHERE id <= ?
+            ORDER BY lead, timestamp, id
+            """,
+            (max_id,),
+        )
+
+        stats = {"messages": 0, "conversations": 0, "leads": 0, "skipped": 0}
+        conv: Optional[Dict] = None
+        wait: Optional[Dict] = None
+        pending_rows = 0
+        conn.execute("BEGIN")
+        for msg_id, lead, sender, receiver, content, content_id, raw_ts in cursor:
+            if not raw_ts:
+                # Sem horário não há sessão: fica só na L1, como no agrupamento incremental
+                stats["skipped"] += 1
+                continue
+            msg_time = parse_time(raw_ts)
+            if wait is None or wait["lead_phone"] != lead:
+                if wait is not None:
+                    self._flush_wait(conn, wait)
+                wait = {"lead_phone": lead, "conversation_ref": None, "waiting_since": None,
+                        "last_message_at": None, "unanswered": 0}
+            same_lead = conv is not None and conv["lead_phone"] == lead
+            if same_lead and msg_time - conv["end_time"] <= self.tolerance:
+                pass
+            elif same_lead and f"{lead}_{msg_time.strftime('%Y-%m-%d')}" == conv["conversation_id"]:
+                # Mesmo id (lead + dia) que o agrupamento incremental reutilizaria
+                pass
+            else:
+                if conv is not None:
+                    self._flush(conn, conv, closed=same_lead)
+                    if not same_lead:
+                        stats["leads"] += 1
+                stats["conversations"] += 1
+                conv = {
+                    "id": stats["conversations"],
+                    "conversation_id": f"{lead}_{msg_time.strftime('%Y-%m-%d')}",
+                    "lead_phone": lead,
+                    "secretary_phone": None,
+                    "message_count": 0,
+                    "start_time": msg_time,
+                    "end_time": msg_time,
+                }
+
+            is_lead = bool(sender)
+            if conv["secretary_phone"] is None:
+                # Secretária da primeira mensagem, como no agrupamento incremental
+                conv["secretary_phone"] = clean_phone(receiver) if is_lead else self.secretary_phone
+            conv["message_count"] += 1
+            conv["end_time"] = max(conv["end_time"], msg_time)
+            pending_replies.fold(wait, [(is_lead, pending_replies.normalize(msg_time), conv["id"])])
+            conn.execute(
+                f"""
+                INSERT INTO conversation_messages{SHADOW_SUFFIX}
+                (conversation_id, conversation_ref, sender_type, content, content_id, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                # Texto compactado: o histórico referencia o mesmo corpo da L1
+                (conv["conversation_id"], conv["id"],
+                 "lead" if is_lead else "secretary", content, content_id, raw_ts),
+            )
+            stats["messages"] += 1
+            pending_rows += 1
+            if pending_rows >= self.commit_every:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                pending_rows = 0
+
+        if conv is not None:
+            self._flush(conn, conv, closed=False)
+            self._flush_wait(conn, wait)
+            stats["leads"] += 1
+        conn.execute("COMMIT")
+        return stats
+
+    def _flush(self, conn: sqlite3.Connection, conv: Dict, closed: bool):
+        """Grava a conversa; a última do lead também vira lead_activity"""
+        closed_at = None
+        if closed:
+            # Uma conversa seguida de outra do mesmo lead já expirou
+            deadline = to_epoch(conv["end_time"]) + self.tolerance.total_seconds()
+            closed_at = datetime.fromtimestamp(deadline, timezone.utc).isoformat()
+        conn.execute(
+            f"""
+            INSERT INTO conversations_l2{SHADOW_SUFFIX}
+            (id, conversation_id, lead_phone, secretary_phone, message_count,
+             start_time, end_time, lead_id, secretary_id, closed_at, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                conv["id"],
+                conv["conversation_id"],
+                conv["lead_phone"],
+                conv["secretary_phone"],
+                conv["message_count"],
+                conv["start_time"].isoformat(),
+                conv["end_time"].isoformat(),
+                self.db.participants.get_id(conn, conv["lead_phone"], role="lead"),
+                self.db.participants.get_id(conn, conv["secretary_phone"], role="secretary"),
+                closed_at,
+                self.version,
+            ),
+        )
+        if not closed:
+            conn.execute(
+                f"""
+                INSERT OR REPLACE INTO lead_activity{SHADOW_SUFFIX}
+                (lead_phone, last_activity, conversation_id, lead_id)
+                VALUES (?, ?, ?, ?)
+                """,
+                (
+                    conv["lead_phone"],
+                    conv["end_time"].isoformat(),
+                    conv["conversation_id"],
+                    self.db.participants.get_id(conn, conv["lead_phone"]),
+                ),
+            )
+
+    def _flush_wait(self, conn: sqlite3.Connection, wait: Dict):
+        """Espera de resposta do lead ao fim do seu histórico"""
+        conn.execute(
+            f"""
+            INSERT INTO pending_replies{SHADOW_SUFFIX}
+            (lead_phone, lead_id, conversation_ref, waiting_since, last_message_at, unanswered)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                wait["lead_phone"],
+                self.db.participants.get_id(conn, wait["lead_phone"], role="lead"),
+                wait["conversation_ref"],
+                wait["waiting_since"],
+                wait["last_message_at"],
+                wait["unanswered"],
+            ),
+        )
+
+    def _swap(self, conn: sqlite3.Connection, indexes: List[str], max_id: int) -> float:
+        """Troca atômica das tabelas sombra pelas originais"""
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in REBUILT_TABLES:
+                conn.execute(f"DROP TABLE {table}")
+                conn.execute(f"ALTER TABLE {table}{SHADOW_SUFFIX} RENAME TO {table}")
+            for sql in indexes:
+                conn.execute(sql)
+            # Análises L3 continuam apontando para a conversa de mesmo id
+            conn.execute(
+                """
+                UPDATE analyses_l3 SET conversation_ref = (
+                    SELECT id FROM conversations_l2 c
+                    WHERE c.conversation_id = analyses_l3.conversation_id
+                )
+                """
+            )
+            # Rollups e esperas de resposta saem das conversas novas
+            clear_live_rollups(conn)
+            recompute_rollups(conn)
+            # Ids do histórico mudaram: o classificador remarca tudo
+            conn.execute("DELETE FROM message_tags")
+            conn.execute("DELETE FROM stage_offsets WHERE stage = ?", (CLASSIFIER_STAGE,))
+            # Grupos de FAQ idem; FaqClusters recomeça os vetores sem o offset
+            conn.execute("DELETE FROM message_clusters")
+            conn.execute("DELETE FROM faq_clusters")
+            conn.execute("DELETE FROM stage_offsets WHERE stage = ?", (FAQ_STAGE,))
+            conn.execute(
+                "UPDATE messages_l1 SET processed = TRUE WHERE id <= ? AND processed = FALSE",
+                (max_id,),
+            )
+            # Ids de conversa mudaram: consumidores do outbox recarregam a L2
+            outbox.emit(conn, "conversation", "rebuild", None)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return time.perf_counter() - started
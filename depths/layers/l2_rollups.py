@@ -0,0 +1,98 @@
+import sqlite3
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Tuple
+from dateutil.parser import parse as dateutil_parse
+
+from depths.core.rollups import (
+    DIMENSIONS_FROM, DIMENSIONS_SQL, RollupDelta, apply_delta, fold,
+)
+from depths.layers.l2_closure import to_epoch
+from depths.layers.l2_grouper import L2Listener
+
+logger = logging.getLogger(__name__)
+
+
+class DailyRollups(L2Listener):
+    """Mantém `daily_rollups` a cada conversa gravada pela L2
+
+    Roda dentro da transação da L2, então o rollup avança junto com as
+    conversas. Tempo de primeira resposta: da primeira mensagem do lead
+    ainda sem resposta até a próxima mensagem da secretária (estado entre
+    lotes em `response_waits`). Conversas contam no dia em que são criadas.
+    A reconstrução da L2 e a migração v7 recalculam tudo com
+    `recompute_rollups` (core/rollups.py), com as mesmas dimensões.
+    """
+
+    def __init__(self, database):
+        self.db = database
+
+    def on_conversation_saved(self, conn: sqlite3.Connection, conv_data: Dict):
+        messages = conv_data.get("messages") or []
+        if not messages:
+            return
+        conv_ref = conv_data["conversation_ref"]
+        instance, secretary_id = conn.execute(
+            f"SELECT {DIMENSIONS_SQL} FROM {DIMENSIONS_FROM} WHERE c.id = ?", (conv_ref,)
+        ).fetchone()
+        row = conn.execute(
+            "SELECT lead_since FROM response_waits WHERE conversation_ref = ?", (conv_ref,)
+        ).fetchone()
+        # Mensagem do lead ainda sem resposta (de lotes anteriores)
+        waiting_since = row[0] if row else None
+
+        timed = sorted(
+            ((self._parse(m.get("timestamp")), instance, bool(m.get("sender_phone")))
+             for m in messages),
+            key=lambda item: to_epoch(item[0]),
+        )
+        deltas: Dict[Tuple[str, str], RollupDelta] = defaultdict(RollupDelta)
+        waiting_since = fold(deltas, conv_data["lead_phone"], timed, waiting_since,
+                             created=conv_data.get("created"))
+
+        if waiting_since:
+            conn.execute(
+                "INSERT OR REPLACE INTO response_waits (conversation_ref, lead_since) VALUES (?, ?)",
+                (conv_ref, waiting_since),
+            )
+        elif row:
+            conn.execute("DELETE FROM response_waits WHERE conversation_ref = ?", (conv_ref,))
+
+        for (day, instance), delta in deltas.items():
+            apply_delta(conn, day, instance, secretary_id, delta)
+
+    def on_conversations_merged(self, conn: sqlite3.Connection, target, others):
+        """A conversa absorvida deixa de contar no dia em que foi criada"""
+        ids = [row["id"] for row in others]
+        placeholders = ",".join("?" * len(ids))
+        for day, instance, secretary_id in conn.execute(
+            f"""
+            SELECT substr(c.start_time, 1, 10), {DIMENSIONS_SQL}
+            FROM {DIMENSIONS_FROM}
+            WHERE c.id IN ({placeholders})
+            """,
+            ids,
+        ).fetchall():
+            conn.execute(
+                """
+                UPDATE daily_rollups SET conversations = conversations - 1
+                WHERE day = ? AND instance = ? AND secretary_id = ? AND conversations > 0
+                """,
+                (day, instance, secretary_id),
+            )
+        # A espera mais antiga passa para a conversa que ficou
+        conn.execute(
+            f"""
+            INSERT OR REPLACE INTO response_waits (conversation_ref, lead_since)
+            SELECT ?, MIN(lead_since) FROM response_waits
+            WHERE conversation_ref IN (?, {placeholders})
+            HAVING COUNT(*) > 0
+            """,
+            [target["id"], target["id"]] + ids,
+        )
+        conn.execute(f"DELETE FROM response_waits WHERE conversation_ref IN ({placeholders})", ids)
+
+    @staticmethod
+    def _parse(value) -> datetime:
+        return dateutil_parse(value) if isinstance(value, str) else value
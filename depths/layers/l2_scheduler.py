@@ -0,0 +1,278 @@
+import time
+import heapq
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+
+from depths.core.keywords import KeywordAutomaton
+from depths.core.participants import clean_phone
+from depths.core.sketches import DDSketch
+from depths.layers.l2_closure import to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Sinais baratos de urgência no texto do paciente
+URGENT_KEYWORDS = (
+    "urgente", "urgência", "emergência", "socorro", "dor", "sangramento",
+    "sangrando", "febre", "inchaço", "hoje",
+)
+
+# Segundos de taxa de backlog que podem se acumular entre ciclos
+BUDGET_SECONDS = 5
+
+
+def keyword_matcher(keywords: Iterable[str]) -> Callable[[Optional[str]], bool]:
+    """Casa palavras inteiras, sem diferenciar acentos nem maiúsculas"""
+    return KeywordAutomaton({"urgent": keywords}).matches
+
+
+class LeadQueue:
+    """Mensagens pendentes de um lead (ids e sinais de prioridade)"""
+
+    __slots__ = ("ids", "oldest", "newest", "urgent", "ingested")
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.oldest = float("inf")
+        self.newest = float("-inf")
+        self.urgent = False
+        # ingested_at de cada mensagem (epoch), para o tempo até agrupar
+        self.ingested: List[float] = []
+
+
+class PriorityScheduler:
+    """Escolhe quais mensagens pendentes vão para a L2 a cada ciclo
+
+    A unidade é o lead: todas as mensagens pendentes de um lead escolhido
+    seguem juntas e em ordem, então a sessão continua correta. Leads
+    "quentes" (mensagem recente ou com palavra de urgência) vão primeiro,
+    no ciclo em que aparecem; o backlog antigo é drenado a partir do lead
+    que espera há mais tempo, a no máximo `backlog_rate` mensagens por
+    segundo ocioso (o orçamento só acumula entre ciclos, então uma fatia
+    lenta de backlog não aumenta a próxima). Quentes e backlog vão em lotes
+    separados de até `controller.batch_size` mensagens (o mesmo controlador
+    AIMD da L2, que observa cada lote), alternados e com os quentes
+    primeiro: um pico de leads quentes não vira um lote sem limite nem
+    segura o backlog até acabar. Só as mensagens novas são lidas a cada
+    ciclo; as que continuam pendentes depois do lote (gravação que falhou)
+    voltam à fila, e `rescan` relê as demais pendentes a cada
+    `rescan_seconds`.
+
+    Não aplica a marca d'água de atraso da L2: com `allowed_lateness_minutes`
+    use `process_pending_messages`.
+    """
+
+    def __init__(self, grouper, fresh_minutes: int = 60, backlog_rate: float = 200.0,
+                 keywords: Iterable[str] = URGENT_KEYWORDS,
+                 processor: Optional[Callable[[List], List[Dict]]] = None,
+                 rescan_seconds: float = 300.0):
+        self.grouper = grouper
+        self.db = grouper.db
+        self.fresh_window = timedelta(minutes=fresh_minutes).total_seconds()
+        self.backlog_rate = backlog_rate
+        self.is_urgent = keyword_matcher(keywords)
+        # Etapa seguinte (L2 por padrão; uma etapa L3 pode ser encadeada)
+        self.processor = processor or grouper.process_messages
+        self._leads: Dict[str, LeadQueue] = {}
+        self._last_id = 0
+        # Pendentes já vistos (id <= _last_id) que nenhum ciclo gravou: por
+        # exemplo de outro processo que caiu; relidos a cada `rescan_seconds`
+        self.rescan_seconds = rescan_seconds
+        self._last_rescan = time.monotonic()
+        self._budget = 0.0
+        self._last_run: Optional[float] = None
+        self.time_to_group = {"hot": DDSketch(), "backlog": DDSketch()}
+
+    def __len__(self):
+        return sum(len(queue.ids) for queue in self._leads.values())
+
+    def scan(self) -> int:
+        """Lê só as mensagens pendentes que chegaram desde o último ciclo"""
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, sender_phone, receiver_phone, content, timestamp, ingested_at
+                FROM messages_l1
+                WHERE id > ? AND processed = FALSE
+                ORDER BY id
+                """,
+                (self._last_id,),
+            ).fetchall()
+        self._enqueue(rows)
+        if rows:
+            self._last_id = rows[-1][0]
+        return len(rows)
+
+    def rescan(self) -> int:
+        """Reenfileira pendentes antigos (id <= _last_id) que saíram da fila"""
+        self._last_rescan = time.monotonic()
+        queued = {msg_id for queue in self._leads.values() for msg_id in queue.ids}
+        with self.db.connect() as conn:
+            rows = [
+                row for row in conn.execute(
+                    """
+                    SELECT id, sender_phone, receiver_phone, content, timestamp, ingested_at
+                    FROM messages_l1
+                    WHERE id <= ? AND processed = FALSE
+                    ORDER BY id
+                    """,
+                    (self._last_id,),
+                )
+                if row[0] not in queued
+            ]
+        self._enqueue(rows)
+        if rows:
+            logger.info(f"🚦 Requeued {len(rows)} pending messages left behind")
+        return len(rows)
+
+    def _enqueue(self, rows):
+        for msg_id, sender, receiver, content, timestamp, ingested_at in rows:
+            lead = clean_phone(sender) if sender else clean_phone(receiver)
+            queue = self._leads.get(lead)
+            if queue is None:
+                queue = self._leads[lead] = LeadQueue()
+            msg_time = to_epoch(timestamp) if timestamp else 0.0
+            queue.ids.append(msg_id)
+            queue.ingested.append(to_epoch(ingested_at) if ingested_at else time.time())
+            queue.oldest = min(queue.oldest, msg_time)
+            queue.newest = max(queue.newest, msg_time)
+            # Só mensagens do paciente contam como urgência
+            queue.urgent = queue.urgent or (bool(sender) and self.is_urgent(content))
+
+    def select(self, now: Optional[float] = None) -> Dict[str, List[str]]:
+        """Leads do próximo lote: todos os quentes + backlog dentro do orçamento"""
+        now = now if now is not None else datetime.now(timezone.utc).timestamp()
+        hot, backlog = [], []
+        for lead, queue in self._leads.items():
+            if queue.urgent or now - queue.newest <= self.fresh_window:
+                hot.append(lead)
+            else:
+                backlog.append(lead)
+
+        # Urgentes primeiro, depois os mais recentes
+        hot.sort(key=lambda lead: (not self._leads[lead].urgent, -self._leads[lead].newest))
+
+        chosen = []
+        budget = self._budget
+        cap = self.backlog_rate * BUDGET_SECONDS
+        # Quem espera há mais tempo sai primeiro; cada lead tem >= 1 mensagem,
+        # então bastam int(budget) + 1 candidatos (sem ordenar o backlog todo)
+        candidates = heapq.nsmallest(
+            max(int(budget), 0) + 1, backlog, key=lambda lead: self._leads[lead].oldest
+        )
+        for lead in candidates:
+            size = len(self._leads[lead].ids)
+            # Lead maior que o orçamento máximo: entra sozinho e gera dívida
+            if size > budget and (chosen or budget < cap):
+                break
+            chosen.append(lead)
+            budget -= size
+        self._budget = budget
+        return {"hot": hot, "backlog": chosen}
+
+    def run_once(self, now: Optional[float] = None) -> List[Dict]:
+        """Um ciclo: lê chegadas, escolhe leads e envia o lote à L2"""
+        if self._last_run is not None:
+            idle = time.monotonic() - self._last_run
+            # Orçamento acumula no máximo alguns segundos de taxa
+            self._budget = min(self._budget + idle * self.backlog_rate,
+                               self.backlog_rate * BUDGET_SECONDS)
+        else:
+            self._budget = self.backlog_rate
+
+        self.scan()
+        if time.monotonic() - self._last_rescan >= self.rescan_seconds:
+            self.rescan()
+        selected = self.select(now)
+        waiting = {kind: deque(leads) for kind, leads in selected.items()}
+        conversations, scheduled = [], 0
+        while waiting["hot"] or waiting["backlog"]:
+            for kind in ("hot", "backlog"):
+                if waiting[kind]:
+                    leads = self._take(waiting[kind], self.grouper.controller.batch_size)
+                    saved, claimed = self._run_batch(kind, leads)
+                    conversations.extend(saved)
+                    scheduled += claimed
+        self._last_run = time.monotonic()
+
+        if scheduled:
+            logger.info(
+                f"🚦 Scheduled {scheduled} messages "
+                f"({len(selected['hot'])} hot / {len(selected['backlog'])} backlog leads), "
+                f"{len(self)} still queued"
+            )
+        return conversations
+
+    def _take(self, leads: Deque[str], limit: int) -> List[str]:
+        """Leads do início da fila até `limit` mensagens (ao menos um lead)"""
+        taken, size = [], 0
+        while leads:
+            count = len(self._leads[leads[0]].ids)
+            if taken and size + count > limit:
+                break
+            taken.append(leads.popleft())
+            size += count
+        return taken
+
+    def _run_batch(self, kind: str, leads: List[str]):
+        """Envia um lote à etapa seguinte; retorna (conversas, mensagens gravadas)"""
+        queues = {lead: self._leads.pop(lead) for lead in leads}
+        ids = [msg_id for queue in queues.values() for msg_id in queue.ids]
+        oldest = min((moment for queue in queues.values() for moment in queue.ingested),
+                     default=None)
+        started = time.perf_counter()
+        try:
+            messages = self.grouper.fetch_messages(ids)
+            conversations = self.processor(messages)
+        finally:
+            # Gravação que falhou deixa as mensagens pendentes: voltam à fila
+            claimed = self._requeue_unclaimed(queues)
+        elapsed = time.perf_counter() - started
+        # ingested_at vem do SQLite em UTC, com resolução de segundos
+        done = time.time()
+        self.grouper.controller.observe(
+            len(ids), elapsed, len(self),
+            oldest_wait=done - oldest - elapsed if oldest is not None else 0.0,
+        )
+        for moment in claimed["ingested"]:
+            self.time_to_group[kind].add(done - moment)
+        return conversations, claimed["count"]
+
+    def _requeue_unclaimed(self, queues: Dict[str, LeadQueue]) -> Dict:
+        """Devolve à fila as mensagens ainda pendentes; retorna as gravadas"""
+        ids = [msg_id for queue in queues.values() for msg_id in queue.ids]
+        pending = set()
+        with self.db.connect() as conn:
+            for start in range(0, len(ids), 900):
+                chunk = ids[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                pending.update(row[0] for row in conn.execute(
+                    f"SELECT id FROM messages_l1 WHERE id IN ({placeholders}) AND processed = FALSE",
+                    chunk,
+                ))
+        claimed = {"count": 0, "ingested": []}
+        for lead, queue in queues.items():
+            kept = LeadQueue()
+            for msg_id, moment in zip(queue.ids, queue.ingested):
+                if msg_id in pending:
+                    kept.ids.append(msg_id)
+                    kept.ingested.append(moment)
+                else:
+                    claimed["count"] += 1
+                    claimed["ingested"].append(moment)
+            if kept.ids:
+                kept.oldest, kept.newest, kept.urgent = queue.oldest, queue.newest, queue.urgent
+                self._leads[lead] = kept
+        return claimed
+
+    def stats(self) -> Dict:
+        """Tempo até agrupar (s) por classe e tamanho da fila"""
+        result = {"queued_messages": len(self), "queued_leads": len(self._leads)}
+        for kind, sketch in self.time_to_group.items():
+            result[kind] = {
+                "messages": sketch.count,
+                "p50": sketch.quantile(0.5),
+                "p99": sketch.quantile(0.99),
+            }
+        return result
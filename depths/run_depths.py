@@ -5,26 +5,59 @@ Monitora N8N output e processa L1, L2, L3
 """
 
 import argparse
+import json
 import sys
 import time
+from datetime import date, timedelta
 from pathlib import Path
 import logging
 
 # Add depths to path
 sys.path.append(str(Path(__file__).parent.parent))
 
+from depths.core import outbox
+from depths.core.archive import ArchiveManager
+from depths.core.daemon import SOCKET_PATH, DaemonClient, WriterDaemon, exclusive_writes
+from depths.core.database import SwaifDatabase
+from depths.core.sharding import ShardRouter, ShardWorkerPool
+from depths.core.maintenance import (
+    convert_to_incremental_vacuum,
+    default_backup_path,
+    file_size,
+    incremental_compact,
+    online_backup,
+    page_diff_snapshot,
+)
 from depths.layers.l1_ingestion import L1Ingestion
+from depths.layers.l2_classifier import MessageClassifier, configured_rules, load_rules
+from depths.layers.l2_closure import ConversationClosureDetector
+from depths.layers.l2_faq import FaqClusters
 from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+from depths.layers.l2_rollups import DailyRollups
+from depths.layers.l2_scheduler import PriorityScheduler
 from depths.core.terminal_display import TerminalDisplay
 
 logger = logging.getLogger(__name__)
 
-def process_l2_batch():
+def make_grouper(db=None):
+    """L2Grouper com os estágios derivados: rollups, classificador e FAQ"""
+    grouper = L2Grouper(db)
+    grouper.add_listener(DailyRollups(grouper.db))
+    grouper.add_listener(MessageClassifier(grouper.db, configured_rules()))
+    grouper.add_listener(FaqClusters(grouper.db))
+    return grouper
+
+def process_l2_batch(router=None):
     """Processa L2 em batch"""
     logger.info("🔄 Processing L2 - Grouping conversations...")
     
-    grouper = L2Grouper()
-    conversations = grouper.process_pending_messages()
+    if router:
+        # Um worker L2 por shard, em paralelo
+        conversations = ShardWorkerPool(router, grouper_factory=make_grouper).process_l2()
+    else:
+        grouper = make_grouper()
+        conversations = grouper.process_pending_messages()
     
     logger.info(f"✅ Grouped into {len(conversations)} conversations")
     
@@ -33,42 +66,93 @@ def process_l2_batch():
     
     return conversations
 
-def continuous_pipeline(interval=5):
-    """Pipeline contínuo L1 -> L2"""
-    logger.info("🚀 Starting continuous pipeline (L1 -> L2)...")
+def sharded_pipeline(router, interval=5):
+    """Pipeline L1 -> L2 com um worker por instância (shard)"""
+    logger.info(f"🚀 Starting sharded pipeline in {router.shard_dir}...")
     
-    ingestion = L1Ingestion()
-    grouper = L2Grouper()
-    display = TerminalDisplay()
+    ingestion = L1Ingestion(router=router)
+    pool = ShardWorkerPool(router, grouper_factory=make_grouper)
     
     while True:
         try:
-            # L1: Ingerir novos JSONs
-            json_files = ingestion.scan_folder()
             new_messages = 0
-            
-            for file_path in json_files:
+            for file_path in ingestion.scan_folder():
                 if file_path not in ingestion.processed_files:
-                    messages = ingestion.read_json_file(file_path)
-                    for msg in messages:
-                        ingestion.process_l1_data(msg)
+                    for msg in ingestion.read_json_file(file_path):
+                        pool.submit(msg)
                         new_messages += 1
                     ingestion.processed_files.add(file_path)
             
+            if new_messages > 0:
+                pool.join()
+                logger.info(f"📥 Routed {new_messages} messages: {pool.stats}")
+            
+            logger.info("\n" + "-"*30)
+            TerminalDisplay(shard_paths=router.db_paths()).show_all_metrics()
+            logger.info("-"*30 + "\n")
+            
+            time.sleep(interval)
+            
+        except KeyboardInterrupt:
+            logger.info("\n⏹️ Pipeline stopped")
+            pool.close()
+            break
+        except Exception as e:
+            logger.error(f"❌ Error in pipeline: {e}")
+            time.sleep(interval)
+
+def show_batching(stats):
+    """Decisões do controlador de lotes (tamanho, intervalo e latências)"""
+    if not stats["batches"]:
+        return
+    actions = stats["actions"]
+    logger.info(
+        f"🎛️ Batching: {stats['batch_size']} msgs every {stats['interval']:.2f}s "
+        f"({actions['increase']} up / {actions['decrease']} down), commit p99 "
+        f"{stats['commit_p99'] * 1000:.0f} ms, latency p99 {stats['latency_p99']:.1f}s "
+        f"(target {stats['target_latency']:.1f}s)"
+    )
+
+def continuous_pipeline(interval=5, backlog_rate=200.0):
+    """Pipeline contínuo L1 -> L2"""
+    logger.info("🚀 Starting continuous pipeline (L1 -> L2)...")
+    
+    ingestion = L1Ingestion()
+    grouper = make_grouper()
+    # Mensagens recentes/urgentes primeiro; backlog drenado a backlog_rate msg/s
+    scheduler = PriorityScheduler(grouper, backlog_rate=backlog_rate)
+    display = TerminalDisplay()
+    
+    # Emite "conversa encerrada" quando a tolerância de cada lead expira
+    closure = ConversationClosureDetector(grouper.db)
+    closure.load()
+    grouper.add_listener(closure)
+    
+    while True:
+        try:
+            # L1: Ingerir novos JSONs em lotes adaptativos
+            new_messages = sum(ingestion.ingest_pending().values())
+            
             if new_messages > 0:
                 logger.info(f"📥 L1: Ingested {new_messages} new messages")
-                
-                # L2: Agrupar em conversas
-                conversations = grouper.process_pending_messages()
-                if conversations:
-                    logger.info(f"🔗 L2: Created/updated {len(conversations)} conversations")
+            
+            # L2: Agrupar em conversas (também drena backlog sem chegadas novas)
+            conversations = scheduler.run_once()
+            if conversations:
+                logger.info(f"🔗 L2: Created/updated {len(conversations)} conversations")
+            
+            closed = closure.poll()
+            if closed:
+                logger.info(f"🔒 L2: Closed {len(closed)} conversations")
             
             # Exibir métricas
             logger.info("\n" + "-"*30)
             display.show_all_metrics()
+            show_batching(ingestion.controller.stats())
             logger.info("-"*30 + "\n")
             
-            time.sleep(interval)
+            # Curto enquanto há fila, até `interval` com tráfego calmo
+            time.sleep(min(interval, ingestion.controller.interval))
             
         except KeyboardInterrupt:
             logger.info("\n⏹️ Pipeline stopped")
@@ -81,32 +165,238 @@ def main():
     parser = argparse.ArgumentParser(description="SWAIF-MSG Depths")
     parser.add_argument("--monitor", action="store_true", 
                        help="Monitor N8N folder continuously (L1 only)")
+    parser.add_argument("--daemon", action="store_true",
+                       help="Run the single writer daemon (monitor and --process-l2 go through it)")
+    parser.add_argument("--socket", default=str(SOCKET_PATH),
+                       help=f"Writer daemon socket (default: {SOCKET_PATH})")
     parser.add_argument("--pipeline", action="store_true",
                        help="Run full pipeline (L1 -> L2)")
     parser.add_argument("--process-l2", action="store_true",
                        help="Process L2 grouping once")
     parser.add_argument("--metrics", action="store_true",
                        help="Show all metrics")
+    parser.add_argument("--backlog-rate", type=float, default=200.0,
+                       help="Old backlog messages grouped per second by --pipeline (default: 200)")
+    parser.add_argument("--sharded", action="store_true",
+                       help="One database shard + worker per Evolution API instance")
+    parser.add_argument("--shard-dir", default="data/shards",
+                       help="Shard directory for --sharded (default: data/shards)")
+    parser.add_argument("--report", action="store_true",
+                       help="Consolidated report from the daily rollups")
+    parser.add_argument("--sla", choices=["day", "instance"], nargs="?", const="day",
+                       help="Secretary response-time percentiles per day or per clinic")
+    parser.add_argument("--sla-minutes", type=float, default=15,
+                       help="Response target for --sla (default: 15)")
+    parser.add_argument("--since", default=None,
+                       help="First day for --report/--sla, YYYY-MM-DD (default: 6 days ago)")
+    parser.add_argument("--until", default=None,
+                       help="Last day for --report/--sla, YYYY-MM-DD (default: today)")
+    parser.add_argument("--pending", type=int, nargs="?", const=20, metavar="N",
+                       help="Leads waiting longest for a secretary reply (default: 20)")
+    parser.add_argument("--classify", action="store_true",
+                       help="Tag conversation history with the keyword dictionary")
+    parser.add_argument("--rules", default=None, metavar="JSON",
+                       help="Keyword dictionary for --classify (default: data/keyword_rules.json)")
+    parser.add_argument("--retag", action="store_true",
+                       help="With --classify: drop existing tags and tag everything again")
+    parser.add_argument("--faq", type=int, nargs="?", const=10, metavar="N",
+                       help="Most repeated lead questions (default: 10)")
+    parser.add_argument("--rebuild-l2", action="store_true",
+                       help="Recompute all L2 tables from L1 (stop the pipeline first)")
+    parser.add_argument("--tolerance-hours", type=int, default=4,
+                       help="Conversation tolerance for --rebuild-l2 and --what-if (default: 4)")
+    parser.add_argument("--what-if", action="store_true",
+                       help="Regroup L2 in an in-memory copy with --tolerance-hours (database untouched)")
+    parser.add_argument("--migrate", action="store_true",
+                       help="Apply pending schema migrations")
+    parser.add_argument("--archive", action="store_true",
+                       help="Move cold L1/L2 data to monthly archive files")
+    parser.add_argument("--retention-days", type=int, default=90,
+                       help="Days kept in the live database (default: 90)")
+    parser.add_argument("--backup", nargs="?", const="", metavar="DEST",
+                       help="Online backup (default: data/backups/swaif_msg_<ts>.db)")
+    parser.add_argument("--incremental", action="store_true",
+                       help="With --backup: page-diff snapshot into data/backups/snapshots "
+                            "(reads the whole database, stores changed pages)")
+    parser.add_argument("--compact", action="store_true",
+                       help="Release free pages with incremental vacuum and unreferenced media")
+    parser.add_argument("--compress-content", action="store_true",
+                       help="Move processed message text to the deduplicated, compressed store")
+    parser.add_argument("--retrain", action="store_true",
+                       help="With --compress-content: train a new compression dictionary first")
+    parser.add_argument("--changes", metavar="CONSUMER",
+                       help="Stream L1/L2 changes from the outbox as JSON lines, with an offset per consumer")
+    parser.add_argument("--from-latest", action="store_true",
+                       help="With --changes: a new consumer starts at the newest change")
     parser.add_argument("--test", action="store_true",
                        help="Test with json_test.json")
     
     args = parser.parse_args()
+    router = ShardRouter(args.shard_dir) if args.sharded else None
+    # Daemon de escrita no ar: gravações passam por ele (só no banco único)
+    daemon = DaemonClient(args.socket) if not router else None
+    if daemon and not daemon.available():
+        daemon = None
+    
+    if args.daemon:
+        if router:
+            logger.error("❌ The writer daemon serves the single database; shards already "
+                         "have one writer each (--pipeline --sharded)")
+            sys.exit(1)
+        WriterDaemon(make_grouper(), socket_path=args.socket).serve_forever()
     
-    if args.pipeline:
-        continuous_pipeline()
+    elif args.pipeline:
+        if router:
+            sharded_pipeline(router)
+        elif daemon:
+            logger.error(f"❌ Writer daemon running on {args.socket}: "
+                         "use --monitor and --process-l2 instead of --pipeline")
+            sys.exit(1)
+        else:
+            continuous_pipeline(backlog_rate=args.backlog_rate)
     
     elif args.process_l2:
-        process_l2_batch()
+        if daemon:
+            conversations = daemon.group()
+            logger.info(f"✅ Grouped into {len(conversations)} conversations (writer daemon)")
+        else:
+            process_l2_batch(router)
     
     elif args.monitor:
         logger.info("🚀 Starting L1 Monitor...")
-        ingestion = L1Ingestion()
+        ingestion = L1Ingestion(database=daemon, router=router)
         ingestion.monitor_continuous()
     
     elif args.metrics:
-        display = TerminalDisplay()
+        if router:
+            display = TerminalDisplay(shard_paths=router.db_paths())
+        else:
+            display = TerminalDisplay()
         display.show_all_metrics()
     
+    elif args.report or args.sla:
+        until = args.until or date.today().isoformat()
+        since = args.since or (date.fromisoformat(until) - timedelta(days=6)).isoformat()
+        if router:
+            display = TerminalDisplay(shard_paths=router.db_paths())
+        else:
+            display = TerminalDisplay()
+        if args.sla:
+            display.show_sla(since, until, args.sla_minutes * 60, by=args.sla)
+        else:
+            display.show_report(since, until)
+    
+    elif args.pending is not None:
+        if router:
+            display = TerminalDisplay(shard_paths=router.db_paths())
+        else:
+            display = TerminalDisplay()
+        display.show_pending(args.pending)
+
+    elif args.faq is not None:
+        if router:
+            display = TerminalDisplay(shard_paths=router.db_paths())
+        else:
+            display = TerminalDisplay()
+        display.show_faq(args.faq)
+
+    elif args.classify:
+        with exclusive_writes(args.socket):
+            rules = load_rules(args.rules) if args.rules else configured_rules()
+            databases = list(router.shards().values()) if router else [SwaifDatabase()]
+            for db in databases:
+                classifier = MessageClassifier(db, rules)
+                if args.retag:
+                    classifier.reset()
+                started = time.perf_counter()
+                counts = classifier.run()
+                logger.info(
+                    f"🏷️ {db.db_path}: {sum(counts.values())} tags in "
+                    f"{time.perf_counter() - started:.1f}s"
+                )
+
+    elif args.rebuild_l2:
+        with exclusive_writes(args.socket):
+            stats = L2Rebuilder(SwaifDatabase(), tolerance_hours=args.tolerance_hours).rebuild()
+            logger.info(
+                f"   {stats['leads']} leads, swap {stats['swap_seconds'] * 1000:.1f} ms"
+            )
+    
+    elif args.what_if:
+        db = SwaifDatabase()
+        started = time.perf_counter()
+        experiment = SwaifDatabase.snapshot(db.db_path)
+        logger.info(f"🧪 In-memory copy of {db.db_path} in {time.perf_counter() - started:.1f}s")
+        try:
+            with db.connect() as conn:
+                current = conn.execute("SELECT COUNT(*) FROM conversations_l2").fetchone()[0]
+            stats = L2Rebuilder(experiment, tolerance_hours=args.tolerance_hours).rebuild()
+            logger.info(
+                f"   tolerance {args.tolerance_hours}h: {stats['conversations']} conversations "
+                f"(currently {current})"
+            )
+        finally:
+            experiment.cleanup()
+    
+    elif args.migrate:
+        db = SwaifDatabase()
+        logger.info(f"🧱 Schema version: {db.schema_version}")
+    
+    elif args.archive:
+        with exclusive_writes(args.socket):
+            ArchiveManager(SwaifDatabase(), retention_days=args.retention_days).archive()
+    
+    elif args.backup is not None:
+        db = SwaifDatabase()
+        if args.incremental:
+            report = page_diff_snapshot(db.db_path, db.db_path.parent / "backups" / "snapshots")
+        else:
+            report = online_backup(db.db_path, args.backup or default_backup_path(db.db_path))
+            logger.info(f"💾 Backup {report['path']}: {report['bytes_copied']} bytes")
+        logger.info(
+            f"   {report['elapsed']:.1f}s, WAL grew {report['wal_growth']} bytes during the copy "
+            f"(max {report['wal_bytes_max']})"
+        )
+    
+    elif args.compact:
+        with exclusive_writes(args.socket):
+            db = SwaifDatabase()
+            with db.connect() as conn:
+                db.media.gc(conn)
+                pruned = outbox.prune(conn)
+            logger.info(f"📤 {pruned} outbox changes already read by every consumer pruned")
+            size_before = file_size(db.db_path)
+            convert_to_incremental_vacuum(db.db_path)
+            report = incremental_compact(db.db_path)
+            logger.info(
+                f"🧹 Compacted {size_before} -> {file_size(db.db_path)} bytes "
+                f"({report['pages_freed']} pages freed in {report['steps']} steps, "
+                f"writer stall max {report['writer_stall_max'] * 1000:.1f} ms)"
+            )
+    
+    elif args.compress_content:
+        with exclusive_writes(args.socket):
+            databases = list(router.shards().values()) if router else [SwaifDatabase()]
+            for db in databases:
+                stats = db.contents.compact(retrain=args.retrain)
+                logger.info(
+                    f"🗜️ {db.db_path}: {stats['contents']} new bodies, "
+                    f"{stats['pruned']} pruned (run --compact to release the space)"
+                )
+    
+    elif args.changes:
+        changes = SwaifDatabase().changes(args.changes, from_latest=args.from_latest)
+        try:
+            while True:
+                events = changes.poll(timeout=30)
+                for event in events:
+                    print(json.dumps(event, ensure_ascii=False), flush=True)
+                changes.commit(events)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            changes.close()
+    
     elif args.test:
         # Testar pipeline completo com json_test.json
         logger.info("🧪 Testing full pipeline...")
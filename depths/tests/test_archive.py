@@ -0,0 +1,122 @@
+from datetime import datetime
+from depths.core import pending_replies
+from depths.core.archive import ArchiveManager, list_partitions
+from depths.core.database import SwaifDatabase
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l2_faq import FaqClusters
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rollups import DailyRollups
+
+
+def _l1(sender, receiver, text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "clinic",
+        "host_evoapi": "test",
+        "sender_raw_data": sender,
+        "receiver_raw_data": receiver,
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def _seed(db):
+    lead = "5511999887766@s.whatsapp.net"
+    clinic = "5511998681314@s.whatsapp.net"
+    db.insert_l1_message(_l1(lead, clinic, "Qual o valor da consulta?", "2025-01-14T10:00:00.000Z"))
+    db.insert_l1_message(_l1(None, lead, "R$ 300", "2025-01-14T10:05:00.000Z"))
+    db.insert_l1_message(_l1(lead, clinic, "Qual o valor do retorno?", "2025-03-20T09:00:00.000Z"))
+    return L2Grouper(db).process_pending_messages()
+
+
+def test_archive_moves_cold_rows_to_monthly_partitions(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _seed(db)
+
+    stats = ArchiveManager(db, retention_days=30).archive(now=datetime(2025, 3, 21))
+
+    assert stats == {"conversations": 1, "history": 2, "messages_l1": 2}
+    assert [p.name for p in list_partitions(db.archive_dir)] == ["archive_2025_01.db"]
+    with db.connect() as conn:
+        live_convs = [r[0] for r in conn.execute("SELECT conversation_id FROM conversations_l2")]
+        live_l1 = conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0]
+    assert live_convs == ["5511999887766_2025-03-20"]
+    assert live_l1 == 1
+
+
+def test_history_and_search_span_live_and_archive(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _seed(db)
+    ArchiveManager(db, retention_days=30).archive(now=datetime(2025, 3, 21))
+
+    history = db.get_conversation_history("5511999887766_2025-01-14")
+    assert [m["content"] for m in history] == ["Qual o valor da consulta?", "R$ 300"]
+    assert history[1]["sender_type"] == "secretary"
+
+    found = db.search_messages("valor")
+    assert [m["conversation_id"] for m in found] == [
+        "5511999887766_2025-03-20",
+        "5511999887766_2025-01-14",
+    ]
+    assert len(db.search_messages("valor", limit=1)) == 1
+
+
+def test_archive_is_incremental(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _seed(db)
+    manager = ArchiveManager(db, retention_days=30)
+    manager.archive(now=datetime(2025, 3, 21))
+
+    # Nada novo a arquivar na segunda execução
+    assert manager.archive(now=datetime(2025, 3, 21)) == {
+        "conversations": 0, "history": 0, "messages_l1": 0
+    }
+
+    # A partição acompanha colunas adicionadas depois de sua criação
+    with db.connect() as conn:
+        conn.execute("ALTER TABLE conversations_l2 ADD COLUMN extra TEXT")
+    stats = manager.archive(now=datetime(2025, 6, 1))
+    assert stats["conversations"] == 1
+    assert len(db.get_conversation_history("5511999887766_2025-03-20")) == 1
+
+
+def test_archive_leaves_no_index_pointing_at_moved_rows(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    grouper = L2Grouper(db, listeners=[FaqClusters(db, index_dir=tmp_path / "vectors"),
+                                       DailyRollups(db)])
+    clinic = "5511998681314@s.whatsapp.net"
+    # Lead que só falou em janeiro e ficou sem resposta
+    db.insert_l1_message(_l1("5522000000000@s.whatsapp.net", clinic,
+                             "Vocês atendem sábado?", "2025-01-10T10:00:00.000Z"))
+    lead = "5511999887766@s.whatsapp.net"
+    db.insert_l1_message(_l1(lead, clinic, "Qual o valor da consulta?", "2025-01-14T10:00:00.000Z"))
+    db.insert_l1_message(_l1(None, lead, "R$ 300", "2025-01-14T10:05:00.000Z"))
+    grouper.process_pending_messages()
+    db.insert_l1_message(_l1(lead, clinic, "Qual o valor do retorno?", "2025-03-20T09:00:00.000Z"))
+    db.insert_l1_message(_l1("5533000000000@s.whatsapp.net", clinic,
+                             "Vocês atendem sábado?", "2025-03-20T11:00:00.000Z"))
+    grouper.process_pending_messages()
+    with db.connect() as conn:
+        # Grupo de "sábado": líder em janeiro, outro membro em março
+        assert conn.execute("SELECT COUNT(*) FROM faq_clusters WHERE size > 1").fetchone()[0] == 1
+
+    ArchiveManager(db, retention_days=30).archive(now=datetime(2025, 3, 21))
+
+    with db.connect() as conn:
+        live = {row[0] for row in conn.execute("SELECT id FROM conversations_l2")}
+        live_ids = {row[0] for row in conn.execute("SELECT conversation_id FROM conversations_l2")}
+        messages = {row[0] for row in conn.execute("SELECT id FROM conversation_messages")}
+        waiting = pending_replies.oldest_waiting(conn)
+        assert {r[0] for r in conn.execute("SELECT conversation_id FROM lead_activity")} <= live_ids
+        assert {r[0] for r in conn.execute("SELECT conversation_ref FROM response_waits")} <= live
+        assert {r[0] for r in conn.execute("SELECT conversation_ref FROM pending_replies")} <= live
+        assert {r[0] for r in conn.execute("SELECT message_id FROM message_clusters")} <= messages
+        leaders = conn.execute(
+            "SELECT leader_message_id, last_message_id FROM faq_clusters"
+        ).fetchall()
+    assert {m for row in leaders for m in row} <= messages | {None}
+    # O lead de janeiro sai da fila; os de março continuam esperando
+    assert [row["lead_phone"] for row in waiting] == ["5511999887766", "5533000000000"]
+    assert all(row["conversation_id"] for row in waiting)
+    assert "Vocês atendem sábado?" in [c["example"] for c in TerminalDisplay(db.db_path).faq()]
@@ -0,0 +1,110 @@
+import json
+import sqlite3
+from depths.core.batching import BatchController
+from depths.core.database import SwaifDatabase
+from depths.layers.l1_ingestion import L1Ingestion
+from depths.layers.l2_grouper import L2Grouper
+
+
+def _l1(lead, text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": f"{lead}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def test_additive_increase_multiplicative_decrease():
+    controller = BatchController(target_latency=2.0, min_batch=10, initial_batch=100,
+                                 max_batch=130)
+    # Fila sobrando e commit barato: cresce de `increase` em `increase`
+    controller.observe(100, 0.05, queue_depth=5000)
+    controller.observe(110, 0.05, queue_depth=4890)
+    assert controller.batch_size == 120
+    assert controller.interval == controller.min_interval
+    controller.observe(120, 0.05, queue_depth=4770)
+    controller.observe(130, 0.05, queue_depth=4640)
+    assert controller.batch_size == 130
+    # Commit acima de 1/4 da meta: metade
+    decision = controller.observe(130, 0.9, queue_depth=4510)
+    assert decision["action"] == "decrease" and controller.batch_size == 65
+    assert controller.stats()["actions"] == {"increase": 3, "decrease": 1, "hold": 1}
+
+
+def test_interval_follows_end_to_end_latency_when_queue_is_empty():
+    controller = BatchController(target_latency=1.0, min_interval=0.1, interval_step=0.2)
+    for _ in range(10):
+        controller.observe(3, 0.01, queue_depth=0, oldest_wait=0.3)
+    # Tráfego calmo: espera mais, mas dentro da folga da meta
+    assert controller.interval == 0.99
+    controller.observe(3, 0.01, queue_depth=0, oldest_wait=1.5)
+    assert controller.interval == 0.495
+    assert controller.batch_size == 500
+    assert len(controller.decisions) == 11
+
+
+def test_l1_queue_is_written_in_controller_sized_batches(tmp_path):
+    folder = tmp_path / "n8n"
+    folder.mkdir()
+    messages = [_l1("5511", f"msg {i}", f"2025-01-14T10:{i // 60:02d}:{i % 60:02d}")
+                for i in range(120)]
+    (folder / "a.json").write_text(json.dumps(messages[:70]))
+    (folder / "b.json").write_text(json.dumps(messages[70:] + messages[:5]))
+
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    controller = BatchController(min_batch=10, initial_batch=40)
+    ingestion = L1Ingestion(database=db, watch_folder=folder, controller=controller)
+    assert ingestion.ingest_pending() == {"stored": 120, "duplicate": 5, "error": 0}
+    # 40, 50, 35: cresce enquanto sobra fila
+    assert [d["items"] for d in controller.decisions] == [40, 50, 35]
+    assert ingestion.ingest_pending() == {"stored": 0, "duplicate": 0, "error": 0}
+
+
+def test_l2_batches_group_like_a_single_pass(tmp_path):
+    messages = [_l1(f"55{lead}", f"msg {i}", f"2025-01-14T{10 + i // 60:02d}:{i % 60:02d}:00")
+                for i in range(90) for lead in range(3)]
+    single = SwaifDatabase(str(tmp_path / "single.db"))
+    batched = SwaifDatabase(str(tmp_path / "batched.db"))
+    for db in (single, batched):
+        db.insert_l1_batch(messages)
+
+    L2Grouper(single, controller=BatchController(initial_batch=10_000,
+                                                 max_batch=10_000)).process_pending_messages()
+    controller = BatchController(min_batch=20, initial_batch=20)
+    L2Grouper(batched, controller=controller).process_pending_messages()
+    assert [d["items"] for d in controller.decisions] == [20, 40, 60, 80, 70]
+
+    query = "SELECT conversation_id, message_count, start_time, end_time FROM conversations_l2 ORDER BY 1"
+    with sqlite3.connect(single.db_path) as a, sqlite3.connect(batched.db_path) as b:
+        assert a.execute(query).fetchall() == b.execute(query).fetchall()
+        assert b.execute("SELECT COUNT(*) FROM messages_l1 WHERE processed = FALSE").fetchone()[0] == 0
+
+
+def test_l2_reads_one_batch_at_a_time(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    # Ids fora da ordem de timestamp: o cursor segue (timestamp, id)
+    db.insert_l1_batch([_l1("5511", f"msg {i}", f"2025-01-14T10:{59 - i:02d}:00")
+                        for i in range(60)])
+    controller = BatchController(min_batch=10, initial_batch=10, max_batch=20)
+    grouper = L2Grouper(db, controller=controller)
+    fetch, pages = grouper._fetch_pending, []
+
+    def spy(conn, after=None, limit=-1):
+        page = fetch(conn, after=after, limit=limit)
+        pages.append((limit, len(page)))
+        return page
+
+    grouper._fetch_pending = spy
+    grouper.process_pending_messages()
+    assert pages == [(10, 10), (20, 20), (20, 20), (20, 10)]
+
+    with db.connect() as conn:
+        assert conn.execute(
+            "SELECT message_count, start_time, end_time FROM conversations_l2"
+        ).fetchall() == [(60, "2025-01-14T10:00:00", "2025-01-14T10:59:00")]
+        assert conn.execute("SELECT COUNT(*) FROM messages_l1 WHERE processed = FALSE").fetchone()[0] == 0
@@ -0,0 +1,125 @@
+import base64
+import os
+import pytest
+from datetime import datetime
+from depths.core.archive import ArchiveManager
+from depths.core.blobs import base64_chunks
+from depths.core.database import SwaifDatabase
+
+
+def _l1(ts, message_type="conversation", text=None, **media):
+    msg = {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": "5511@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": message_type,
+        "sent_message": text,
+        "timestamp": ts,
+    }
+    msg.update(media)
+    return msg
+
+
+def test_base64_chunks_handles_prefix_and_line_breaks():
+    payload = os.urandom(10_000)
+    encoded = base64.encodebytes(payload).decode()
+    assert b"".join(base64_chunks(encoded, chunk=1024)) == payload
+    assert b"".join(base64_chunks("data:image/png;base64," + base64.b64encode(payload).decode(),
+                                  chunk=1024)) == payload
+
+
+class TestMediaStore:
+    @pytest.fixture(autouse=True)
+    def _db(self, tmp_path):
+        self.db = SwaifDatabase(str(tmp_path / "swaif.db"))
+
+    def _refs(self):
+        # Mensagens que citam cada arquivo do catálogo
+        with self.db.connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(m.id) FROM media_blobs b "
+                "LEFT JOIN messages_l1 m ON m.media_hash = b.hash GROUP BY b.hash ORDER BY 1"
+            ).fetchall()
+
+    def test_media_goes_out_of_row_and_loads_on_demand(self, tmp_path):
+        sticker = os.urandom(8000)
+        encoded = base64.b64encode(sticker).decode()
+        first = self.db.insert_l1_message(_l1("2025-01-14T10:00:00", "stickerMessage", encoded))
+        second = self.db.insert_l1_message(_l1("2025-01-14T10:01:00", "stickerMessage", encoded))
+        document = tmp_path / "exame.pdf"
+        document.write_bytes(os.urandom(300_000))
+        third = self.db.insert_l1_message(_l1(
+            "2025-01-14T10:02:00", "documentMessage", "Resultado do exame",
+            media_path=str(document), media_mimetype="application/pdf",
+        ))
+        text = self.db.insert_l1_message(_l1("2025-01-14T10:03:00", text="Oi"))
+
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                "SELECT content, media_hash IS NOT NULL FROM messages_l1 ORDER BY id"
+            ).fetchall()
+        assert rows == [(None, 1), (None, 1), ("Resultado do exame", 1), ("Oi", 0)]
+        # Mesma figurinha: um arquivo, duas referências
+        assert self._refs() == [(1,), (2,)]
+        with self.db.open_media(first) as f:
+            assert f.read() == sticker
+        with self.db.open_media(third) as f:
+            assert f.read() == document.read_bytes()
+        assert self.db.open_media(second).name == self.db.open_media(first).name
+        assert self.db.open_media(text) is None
+
+        # Reenvio: nada novo no banco nem na contagem
+        assert self.db.insert_l1_message(_l1("2025-01-14T10:01:00", "stickerMessage", encoded)) is None
+        assert self._refs() == [(1,), (2,)]
+
+    def test_gc_removes_unreferenced_and_orphan_files(self):
+        encoded = base64.b64encode(os.urandom(8000)).decode()
+        msg_id = self.db.insert_l1_message(_l1("2025-01-14T10:00:00", "audioMessage", encoded))
+        with self.db.open_media(msg_id) as f:
+            kept = f.name
+        # Arquivo de uma transação que não chegou a gravar
+        orphan, _ = self.db.media.write([b"interrompido"])
+
+        with self.db.connect() as conn:
+            # Dentro da carência nada sai
+            assert self.db.media.gc(conn) == {"released": 0, "orphans": 0}
+            assert self.db.media.gc(conn, grace_seconds=-1) == {"released": 0, "orphans": 1}
+            assert not self.db.media.path(orphan).exists()
+            assert os.path.exists(kept)
+
+            # Mensagem apagada: o arquivo deixa de ser citado
+            conn.execute("DELETE FROM messages_l1 WHERE id = ?", (msg_id,))
+            conn.commit()
+            assert self.db.media.gc(conn, grace_seconds=-1) == {"released": 1, "orphans": 0}
+        assert not os.path.exists(kept)
+        assert self._refs() == []
+
+    def test_archived_messages_keep_their_media(self):
+        encoded = base64.b64encode(os.urandom(8000)).decode()
+        msg_id = self.db.insert_l1_message(_l1("2025-01-14T10:00:00", "audioMessage", encoded))
+        with self.db.open_media(msg_id) as f:
+            kept = f.name
+        with self.db.connect() as conn:
+            conn.execute("UPDATE messages_l1 SET processed = TRUE")
+
+        stats = ArchiveManager(self.db, retention_days=30).archive(now=datetime(2025, 6, 1))
+        assert stats["messages_l1"] == 1
+
+        with self.db.connect() as conn:
+            assert self.db.media.gc(conn, grace_seconds=-1) == {"released": 0, "orphans": 0}
+        assert os.path.exists(kept)
+
+    def test_gc_rechecks_citation_before_releasing(self, monkeypatch):
+        encoded = base64.b64encode(os.urandom(8000)).decode()
+        msg_id = self.db.insert_l1_message(_l1("2025-01-14T10:00:00", "audioMessage", encoded))
+        with self.db.open_media(msg_id) as f:
+            kept = f.name
+        # Foto tirada antes da mensagem ser gravada
+        monkeypatch.setattr(self.db.media, "referenced", lambda conn: set())
+
+        with self.db.connect() as conn:
+            assert self.db.media.gc(conn, grace_seconds=-1) == {"released": 0, "orphans": 0}
+        assert os.path.exists(kept)
+        assert self._refs() == [(1,)]
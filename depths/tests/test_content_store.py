@@ -0,0 +1,171 @@
+from datetime import datetime
+from depths.core.archive import ArchiveManager, list_partitions, open_partition
+from depths.core.content_store import RAW, ContentStore, content_sql, train_dictionary
+from depths.core.database import SwaifDatabase
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+
+
+def _l1(lead, text, ts, from_lead=True):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def test_dictionary_round_trip(tmp_path):
+    samples = ["Bom dia, qual o valor da consulta?", "Qual o valor da consulta de retorno?"] * 20
+    data = train_dictionary(samples)
+    assert b"valor da consulta" in data
+    assert len(train_dictionary(samples, size=64)) <= 64
+
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    store = ContentStore(db.db_path)
+    with db.connect() as conn:
+        conn.executemany(
+            "INSERT INTO messages_l1 (content) VALUES (?)", [(text,) for text in samples]
+        )
+        dict_id = store.train(conn)
+
+    text = "Oi, qual o valor da consulta?"
+    used, body = store.deflate(text, dict_id)
+    assert used == dict_id and len(body) < len(text) / 2
+    # Outra instância carrega o dicionário do banco
+    assert ContentStore(db.db_path).inflate(used, body) == text
+    assert store.deflate("👍", dict_id) == (RAW, "👍".encode())
+    assert store.inflate(RAW, "👍".encode()) == "👍"
+
+
+class TestContentStore:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+        self.grouper = L2Grouper(self.db)
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def _seed(self):
+        for msg in (
+            _l1("5511", "Bom dia, qual o valor da consulta?", "2025-01-14T10:00:00"),
+            _l1("5511", "ok", "2025-01-14T10:01:00", from_lead=False),
+            _l1("5522", "Bom dia, qual o valor da consulta?", "2025-01-14T11:00:00"),
+            _l1("5522", "ok", "2025-01-14T11:01:00", from_lead=False),
+        ):
+            self.db.insert_l1_message(msg)
+        self.grouper.process_pending_messages()
+        # Ainda não agrupada: continua em texto puro
+        self.db.insert_l1_message(_l1("5533", "Tem horário amanhã?", "2025-01-14T12:00:00"))
+
+    def _history(self, conversation_id):
+        self.db.history_cache.clear()
+        return [m["content"] for m in self.db.get_conversation_history(conversation_id)]
+
+    def test_grouper_stores_deduped_bodies_and_reads_stay_the_same(self):
+        self._seed()
+
+        with self.db.connect() as conn:
+            plain = conn.execute(
+                "SELECT content FROM messages_l1 WHERE content IS NOT NULL"
+            ).fetchall()
+            inline = conn.execute(
+                "SELECT COUNT(*) FROM conversation_messages WHERE content IS NOT NULL"
+            ).fetchone()[0]
+            refs = conn.execute(
+                "SELECT COUNT(DISTINCT content_id) FROM conversation_messages"
+            ).fetchone()[0]
+            shared = conn.execute(
+                "SELECT COUNT(*) FROM messages_l1 l JOIN conversation_messages m "
+                "ON m.content_id = l.content_id"
+            ).fetchone()[0]
+        # Só a mensagem pendente continua em texto puro; L1 e L2 citam o mesmo corpo
+        assert plain == [("Tem horário amanhã?",)]
+        assert inline == 0 and refs == 2 and shared == 8
+        assert self._history("5511_2025-01-14") == ["Bom dia, qual o valor da consulta?", "ok"]
+        assert [m["conversation_id"] for m in self.db.search_messages("valor")] == [
+            "5522_2025-01-14", "5511_2025-01-14",
+        ]
+        recent = TerminalDisplay(self.db.db_path)._collect_l1(self.db.db_path)["recent"]
+        assert len(recent) == 3 and all(row[2] for row in recent)
+
+        # Nada a compactar: os corpos já foram gravados pelo agrupador
+        stats = self.db.contents.compact()
+        assert stats["messages_l1"] == stats["conversation_messages"] == stats["contents"] == 0
+
+    def test_train_samples_stored_bodies(self):
+        self._seed()
+        with self.db.connect() as conn:
+            dict_id = self.db.contents.train(conn)
+            samples = conn.execute(
+                "SELECT samples FROM content_dicts WHERE id = ?", (dict_id,)
+            ).fetchone()[0]
+        assert samples == 5
+        assert b"o valor da consulta?" in self.db.contents._dictionary(dict_id)
+
+    def test_compact_moves_inline_text(self):
+        # Linhas gravadas antes do agrupador citar `contents`
+        with self.db.connect() as conn:
+            conn.executemany(
+                "INSERT INTO messages_l1 (content, processed) VALUES (?, TRUE)",
+                [("Bom dia, qual o valor da consulta?",), ("ok",), ("ok",)],
+            )
+            conn.execute(
+                "INSERT INTO conversation_messages (conversation_id, sender_type, content) "
+                "VALUES ('5511_2025-01-14', 'secretary', 'ok')"
+            )
+
+        stats = self.db.contents.compact()
+
+        assert stats["messages_l1"] == 3 and stats["conversation_messages"] == 1
+        assert stats["contents"] == 2
+        with self.db.contents.register(self.db.connect()) as conn:
+            texts = conn.execute(
+                f"SELECT {content_sql()} FROM conversation_messages"
+            ).fetchall()
+        assert texts == [("ok",)]
+        # Compactar de novo não regrava nada
+        assert self.db.contents.compact()["contents"] == 0
+
+    def test_rebuild_keeps_references(self):
+        self._seed()
+        self.db.contents.compact()
+        L2Rebuilder(self.db).rebuild()
+
+        with self.db.connect() as conn:
+            plain = conn.execute(
+                "SELECT COUNT(*) FROM conversation_messages WHERE content IS NOT NULL"
+            ).fetchone()[0]
+        # Só a mensagem que estava pendente volta em texto puro
+        assert plain == 1
+        assert self._history("5522_2025-01-14") == ["Bom dia, qual o valor da consulta?", "ok"]
+
+
+def test_archive_materializes_text_and_prune_drops_orphans(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    db.insert_l1_message(_l1("5511", "Resultado do exame saiu?", "2025-01-14T10:00:00"))
+    db.insert_l1_message(_l1("5511", "Saiu sim", "2025-01-14T10:05:00", from_lead=False))
+    L2Grouper(db).process_pending_messages()
+    db.contents.compact()
+
+    ArchiveManager(db, retention_days=30).archive(now=datetime(2025, 3, 21))
+
+    archive_conn = open_partition(list_partitions(db.archive_dir)[0])
+    try:
+        archived = archive_conn.execute(
+            "SELECT content, content_id FROM conversation_messages ORDER BY id"
+        ).fetchall()
+    finally:
+        archive_conn.close()
+    assert archived == [("Resultado do exame saiu?", None), ("Saiu sim", None)]
+    db.history_cache.clear()
+    assert [m["content"] for m in db.get_conversation_history("5511_2025-01-14")] == [
+        "Resultado do exame saiu?", "Saiu sim",
+    ]
+    assert db.contents.compact()["pruned"] == 2
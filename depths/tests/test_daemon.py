@@ -0,0 +1,178 @@
+import threading
+import time
+import pytest
+from depths.core.daemon import (
+    WRITER,
+    DaemonClient,
+    DaemonError,
+    LeaseTable,
+    WriterDaemon,
+    exclusive_writes,
+)
+from depths.core.database import SwaifDatabase
+from depths.layers.l1_ingestion import L1Ingestion
+from depths.layers.l2_grouper import L2Grouper
+
+
+def _l1(lead, text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": f"{lead}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def test_lease_table_expires_and_renews():
+    now = [0.0]
+    leases = LeaseTable(clock=lambda: now[0])
+    assert leases.acquire("writer", "a", ttl=10)["granted"]
+    assert not leases.acquire("writer", "b", ttl=10)["granted"]
+    now[0] = 8
+    assert leases.acquire("writer", "a", ttl=10)["granted"]
+    now[0] = 15
+    assert leases.holder("writer") == "a"
+    assert not leases.release("writer", "b")
+    now[0] = 19
+    # Dono sumiu sem liberar: a locação expira
+    assert leases.holder("writer") is None
+    assert leases.acquire("writer", "b", ttl=10)["granted"]
+
+
+def test_group_wait_follows_the_l2_controller(tmp_path):
+    grouper = L2Grouper(SwaifDatabase(str(tmp_path / "swaif.db")))
+    daemon = WriterDaemon(grouper, socket_path=tmp_path / "swaif.sock", group_interval=5.0)
+    grouper.controller.interval = 0.3
+    assert daemon.group_wait() == 0.3
+    # Tráfego calmo: nunca além do `group_interval` configurado
+    grouper.controller.interval = 8.0
+    assert daemon.group_wait() == 5.0
+
+
+def test_idle_daemon_vacuums_in_short_steps(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    with db.connect() as conn:
+        conn.executemany("INSERT INTO messages_l1 (content) VALUES (?)", [("x" * 500,)] * 300)
+    with db.connect() as conn:
+        conn.execute("DELETE FROM messages_l1")
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    daemon = WriterDaemon(L2Grouper(db), socket_path=tmp_path / "swaif.sock",
+                          group_interval=None, vacuum_interval=0, vacuum_pages=5)
+    daemon.start()
+    try:
+        deadline = time.monotonic() + 5
+        while daemon.stats["pages_vacuumed"] < free and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        daemon.stop()
+    assert daemon.stats["pages_vacuumed"] == free
+    with db.connect() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+class TestWriterDaemon:
+    @pytest.fixture(autouse=True)
+    def _daemon(self, tmp_path):
+        self.db = SwaifDatabase(str(tmp_path / "swaif.db"))
+        self.socket = tmp_path / "swaif.sock"
+        self.daemon = WriterDaemon(L2Grouper(self.db), socket_path=self.socket,
+                                   group_interval=None)
+        self.daemon.start()
+        yield
+        self.daemon.stop()
+
+    def test_concurrent_clients_share_one_writer(self):
+        def send(lead):
+            client = DaemonClient(self.socket)
+            for minute in range(5):
+                client.insert_l1_message(_l1(lead, f"msg {minute}", f"2025-01-14T10:0{minute}:00"))
+            client.close()
+
+        threads = [threading.Thread(target=send, args=(f"55{i}",)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        client = DaemonClient(self.socket)
+        assert client.insert_l1_batch([_l1("550", "msg 0", "2025-01-14T10:00:00")]) == [None]
+        # Dois pedidos de L2 ao mesmo tempo não agrupam a mesma mensagem duas vezes
+        results = []
+        groupers = [threading.Thread(target=lambda: results.append(DaemonClient(self.socket).group()))
+                    for _ in range(2)]
+        for t in groupers:
+            t.start()
+        for t in groupers:
+            t.join()
+        assert sorted(len(r) for r in results) in ([0, 8], [8, 8])
+
+        with self.db.connect() as conn:
+            counts = conn.execute(
+                "SELECT COUNT(*), SUM(processed) FROM messages_l1"
+            ).fetchone()
+            history = conn.execute("SELECT COUNT(*) FROM conversation_messages").fetchone()[0]
+        assert counts == (40, 40)
+        assert history == 40
+        stats = client.stats()["stats"]
+        assert stats["messages"] == 40 and stats["duplicates"] == 1
+        assert client.dedup_stats()["duplicates"] == 1
+
+    def test_writer_lease_pauses_the_daemon(self):
+        writes = []
+
+        def ingest():
+            writes.append(DaemonClient(self.socket).insert_l1_message(
+                _l1("5511", "Oi", "2025-01-14T10:00:00")))
+
+        with exclusive_writes(self.socket, ttl=5) as paused:
+            assert paused
+            thread = threading.Thread(target=ingest)
+            thread.start()
+            time.sleep(0.3)
+            # Pedido aceito, mas esperando a locação
+            assert writes == []
+            with pytest.raises(DaemonError):
+                DaemonClient(self.socket).call({"op": "nope"})
+        thread.join(timeout=5)
+        assert writes and writes[0] is not None
+
+    def test_denied_renewal_ends_the_lease_block_with_an_error(self):
+        client = DaemonClient(self.socket)
+        with pytest.raises(DaemonError, match="now held by other"):
+            with client.lease(WRITER, ttl=0.3) as owner:
+                # A locação expirou e outro processo a pegou
+                self.daemon.leases.release(WRITER, owner)
+                self.daemon.leases.acquire(WRITER, "other", ttl=60)
+                time.sleep(0.3)
+        # Não libera a locação de outro dono
+        assert self.daemon.leases.holder(WRITER) == "other"
+
+    def test_queued_request_times_out_without_writing(self):
+        self.daemon.request_timeout = 0.2
+        self.daemon.leases.acquire(WRITER, "other", ttl=60)
+        with pytest.raises(DaemonError, match="writer busy"):
+            DaemonClient(self.socket).insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00"))
+        self.daemon.leases.release(WRITER, "other")
+        time.sleep(0.5)
+        with self.db.connect() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0] == 0
+        assert self.daemon.stats["ingest_requests"] == 0
+
+    def test_ingestion_through_the_daemon(self, tmp_path):
+        client = DaemonClient(self.socket)
+        ingestion = L1Ingestion(database=client)
+        result = ingestion.process_l1_batch([
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+        ])
+        assert result == {"stored": 1, "duplicate": 1, "error": 0}
+        assert ingestion.dedup_stats()["duplicates"] == 1
+
+
+def test_without_daemon_nothing_is_paused(tmp_path):
+    with exclusive_writes(tmp_path / "missing.sock") as paused:
+        assert paused is False
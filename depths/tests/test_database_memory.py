@@ -0,0 +1,74 @@
+import pytest
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+
+
+def _l1(text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": "5511999887766@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def _count(db):
+    with db.connect() as conn:
+        return conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0]
+
+
+def test_memory_db_is_shared_between_connections_and_dropped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = SwaifDatabase(":memory:")
+    assert db.in_memory
+    db.insert_l1_message(_l1("Oi", "2025-01-14T10:00:00"))
+    assert _count(db) == 1
+    # Nada em disco além do diretório temporário de mídia
+    assert list(tmp_path.iterdir()) == []
+    workdir = db.archive_dir.parent
+
+    uri = db.db_path
+    db.cleanup()
+    assert not workdir.exists()
+    # Sem a conexão âncora o banco some: o mesmo nome começa vazio
+    again = SwaifDatabase(uri)
+    assert _count(again) == 0
+    again.cleanup()
+
+
+def test_memory_dbs_are_isolated():
+    a, b = SwaifDatabase(":memory:"), SwaifDatabase(":memory:")
+    a.insert_l1_message(_l1("Oi", "2025-01-14T10:00:00"))
+    assert _count(b) == 0
+    a.cleanup()
+    b.cleanup()
+
+
+def test_snapshot_runs_experiments_without_touching_the_source(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    db.insert_l1_message(_l1("Boa noite", "2025-01-14T20:00:00"))
+    db.insert_l1_message(_l1("Ainda aí?", "2025-01-15T02:00:00"))
+    L2Grouper(db, tolerance_hours=4).process_pending_messages(flush=True)
+
+    experiment = SwaifDatabase.snapshot(db.db_path)
+    try:
+        assert experiment.in_memory
+        stats = L2Rebuilder(experiment, tolerance_hours=8).rebuild()
+        assert stats["conversations"] == 1
+        with experiment.connect() as conn:
+            assert conn.execute("SELECT message_count FROM conversations_l2").fetchall() == [(2,)]
+    finally:
+        experiment.cleanup()
+
+    with db.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM conversations_l2").fetchone()[0] == 2
+
+
+def test_snapshot_of_missing_database_fails(tmp_path):
+    with pytest.raises(Exception):
+        SwaifDatabase.snapshot(tmp_path / "missing.db")
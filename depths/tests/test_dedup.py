@@ -0,0 +1,114 @@
+import sqlite3
+from depths.core.database import SwaifDatabase
+from depths.core.dedup import BloomFilter, Deduplicator, FingerprintCache, message_fingerprint
+from depths.core.migrations import MIGRATIONS, MigrationRunner
+from depths.layers.l1_ingestion import L1Ingestion
+from depths.layers.l2_grouper import L2Grouper
+
+MESSAGE = {
+    "host_n8n": "host.docker.internal:5678",
+    "evo_api_instance_name": "WAP_Diego-Menescal",
+    "host_evoapi": "http://localhost:8080",
+    "sender_raw_data": "5511999887766@s.whatsapp.net",
+    "receiver_raw_data": "5511998681314@s.whatsapp.net",
+    "message_type": "conversation",
+    "sent_message": "Gostaria de agendar",
+    "timestamp": "2025-08-20T17:44:23.965Z",
+}
+
+
+def test_fingerprint_is_stable_and_content_sensitive():
+    same = dict(MESSAGE, host_n8n="other-host", sender_raw_data="5511999887766")
+    changed = dict(MESSAGE, sent_message="Gostaria de remarcar")
+    assert message_fingerprint(MESSAGE) == message_fingerprint(same)
+    assert message_fingerprint(MESSAGE) != message_fingerprint(changed)
+
+
+def test_bloom_filter_and_recent_cache():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"key-{i}")
+    assert all(f"key-{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+    cache = FingerprintCache(maxsize=2)
+    cache.add("a")
+    cache.add("b")
+    assert "a" in cache
+    cache.add("c")
+    assert "b" not in cache and "a" in cache and len(cache) == 2
+
+
+def test_replayed_message_is_stored_once(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    ingestion = L1Ingestion(database=db)
+
+    first = ingestion.process_l1_data(MESSAGE)
+    replay = ingestion.process_l1_data(dict(MESSAGE))
+
+    assert first["status"] == "stored"
+    assert replay["status"] == "duplicate"
+    stats = ingestion.dedup_stats()
+    assert stats["duplicates"] == 1 and stats["recent_hits"] == 1
+    assert stats["bloom_negatives"] == 1
+
+    conversations = L2Grouper(db).process_pending_messages()
+    assert conversations[0]["message_count"] == 1
+
+
+def test_restart_uses_bloom_then_index(tmp_path):
+    path = str(tmp_path / "swaif.db")
+    SwaifDatabase(path).insert_l1_message(MESSAGE)
+
+    # Novo processo: cache recente vazio, Bloom carregado do banco
+    restarted = SwaifDatabase(path)
+    assert restarted.insert_l1_message(MESSAGE) is None
+    new_id = restarted.insert_l1_message(dict(MESSAGE, sent_message="Outra"))
+    assert new_id is not None
+
+    stats = restarted.dedup.stats()
+    assert stats["index_probes"] == 1
+    assert stats["bloom_negatives"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_concurrent_writer_caught_by_unique_index(tmp_path):
+    path = str(tmp_path / "swaif.db")
+    a = SwaifDatabase(path)
+    b = SwaifDatabase(path)
+    b.dedup.seed(sqlite3.connect(path))  # Bloom de b carregado antes do insert de a
+
+    assert a.insert_l1_message(MESSAGE) is not None
+    assert b.insert_l1_message(MESSAGE) is None
+    assert b.dedup.stats()["duplicates"] == 1
+
+
+def test_backfill_keeps_first_copy_of_legacy_duplicates(tmp_path):
+    path = tmp_path / "legacy.db"
+    db = SwaifDatabase(str(path))
+    with db.connect() as conn:
+        for _ in range(2):
+            conn.execute(
+                "INSERT INTO messages_l1 (evo_instance, sender_phone, receiver_phone, "
+                "content, timestamp) VALUES ('x', '55', '56', 'oi', '2025-01-14T10:00:00')"
+            )
+        conn.execute("UPDATE schema_backfills SET last_rowid = 0, completed_at = NULL")
+
+    MigrationRunner(path, MIGRATIONS).run()
+
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT fingerprint FROM messages_l1 ORDER BY id").fetchall()
+    assert rows[0][0] is not None and rows[1][0] is None
+
+
+def test_deduplicator_seeds_once(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    db.insert_l1_message(MESSAGE)
+    dedup = Deduplicator(capacity=100)
+    with db.connect() as conn:
+        dedup.seed(conn)
+        assert message_fingerprint(MESSAGE) in dedup.bloom
+        conn.execute("DELETE FROM messages_l1")
+        dedup.seed(conn)
+    assert message_fingerprint(MESSAGE) in dedup.bloom
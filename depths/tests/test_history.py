@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from depths.core.database import SwaifDatabase
+from depths.core.history import HistoryCache
+from depths.layers.l2_grouper import L2Grouper
+
+
+def _l1(text, ts, lead="5511"):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": f"{lead}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+class TestHistoryPages:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+        start = datetime(2025, 1, 14, 10)
+        for i in range(250):
+            # Pares com o mesmo timestamp: o desempate é pelo id
+            ts = (start + timedelta(seconds=i // 2)).isoformat()
+            self.db.insert_l1_message(_l1(f"m{i}", ts))
+        L2Grouper(self.db).process_pending_messages()
+        self.conv_id = "5511_2025-01-14"
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def test_cursor_pagination_covers_history_once(self):
+        pages, cursor = [], None
+        while True:
+            page = self.db.get_history_page(self.conv_id, after=cursor, limit=100)
+            pages.append(page["messages"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        assert [len(p) for p in pages] == [100, 100, 50]
+        contents = [m["content"] for p in pages for m in p]
+        assert contents == [f"m{i}" for i in range(250)]
+        assert list(self.db.iter_conversation_history(self.conv_id, page_size=64)) == \
+            self.db.get_conversation_history(self.conv_id)
+
+    def test_repeated_reads_hit_cache_until_l2_writes(self):
+        first = self.db.get_history_page(self.conv_id, limit=100)
+        again = self.db.get_history_page(self.conv_id, limit=100)
+        assert again is first
+        assert self.db.history_cache.stats()["hits"] == 1
+
+        # Outro processo grava na conversa: a versão muda e o cache é descartado
+        writer = SwaifDatabase(self.db.db_path)
+        writer.insert_l1_message(_l1("nova", "2025-01-14T09:00:00"))
+        L2Grouper(writer).process_pending_messages()
+
+        fresh = self.db.get_history_page(self.conv_id, limit=100)
+        assert fresh is not first
+        assert fresh["messages"][0]["content"] == "nova"
+
+    def test_unknown_conversation(self):
+        assert self.db.get_history_page("nope") == {"messages": [], "next_cursor": None}
+        assert self.db.get_conversation_history("nope") == []
+
+
+def test_cache_is_bounded_lru():
+    cache = HistoryCache(maxsize=2)
+    cache.put(("a", None, 10), (1, 0), {"messages": []})
+    cache.put(("b", None, 10), (2, 0), {"messages": []})
+    assert cache.get(("a", None, 10), (1, 0)) is not None
+    cache.put(("c", None, 10), (3, 0), {"messages": []})
+
+    assert cache.get(("b", None, 10), (2, 0)) is None
+    assert cache.get(("a", None, 10), (1, 1)) is None
+    cache.invalidate("a")
+    assert len(cache) == 1
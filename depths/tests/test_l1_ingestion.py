@@ -121,14 +121,15 @@ class TestL1Ingestion:
         monkeypatch.setattr(ingestion, "scan_folder", lambda: [Path("msg.json")])
         monkeypatch.setattr(ingestion, "read_json_file", lambda path: SAMPLE_L1_JSON)
         processed = []
-        monkeypatch.setattr(ingestion, "process_l1_data", lambda msg: processed.append(msg))
+        monkeypatch.setattr(ingestion, "process_l1_batch",
+                            lambda msgs: processed.extend(msgs) or {"stored": len(msgs)})
 
         def raise_keyboard(*_, **__):
             raise KeyboardInterrupt
 
         monkeypatch.setattr(l1_ingestion.time, "sleep", raise_keyboard)
         ingestion.monitor_continuous(interval=0)
-        assert processed
+        assert processed == SAMPLE_L1_JSON
 
     def test_monitor_continuous_exception(self, monkeypatch):
         """Test: Deve capturar exceções genéricas e continuar"""
@@ -0,0 +1,90 @@
+import json
+from depths.core.content_store import content_sql
+from depths.core.database import SwaifDatabase
+from depths.core.keywords import KeywordAutomaton, fold
+from depths.layers.l2_classifier import MessageClassifier, load_rules, tagged_messages
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+
+RULES = {
+    "owner:doctor": ["dor", "resultado do exame", "exame"],
+    "owner:management": ["nota fiscal", "reembolso"],
+    "urgency:high": ["urgente", "muita dor"],
+}
+
+
+def _l1(lead, text, ts, from_lead=True):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "evo_api_instance_name": "test",
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def test_fold_removes_accents_and_case():
+    assert fold("URGÊNCIA na Emissão") == "urgencia na emissao"
+
+
+def test_automaton_matches_whole_words_and_overlapping_phrases():
+    automaton = KeywordAutomaton(RULES)
+    assert automaton.tags("Estou com MUITA DOR, é urgente!") == {"owner:doctor", "urgency:high"}
+    assert automaton.tags("Saiu o resultado do exame?") == {"owner:doctor"}
+    # Frase que começa dentro de outra tentativa ("resultado da nota fiscal")
+    assert automaton.tags("quero o resultado da nota fiscal") == {"owner:management"}
+    assert automaton.tags("Quero falar com o doutor") == set()
+    assert automaton.tags(None) == set()
+
+
+class TestMessageClassifier:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+        self.grouper = L2Grouper(self.db, listeners=[MessageClassifier(self.db, RULES)])
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def _ingest(self, *messages):
+        for msg in messages:
+            self.db.insert_l1_message(msg)
+        self.grouper.process_pending_messages()
+
+    def _tags(self):
+        with self.db.contents.register(self.db.connect()) as conn:
+            return conn.execute(
+                f"SELECT {content_sql('m')}, t.tag FROM message_tags t "
+                "JOIN conversation_messages m ON m.id = t.message_id ORDER BY m.id, t.tag"
+            ).fetchall()
+
+    def test_tags_each_new_message_once(self):
+        self._ingest(
+            _l1("5511", "Preciso da nota fiscal", "2025-01-14T10:00:00"),
+            _l1("5511", "Vou verificar", "2025-01-14T10:05:00", from_lead=False),
+        )
+        self._ingest(_l1("5522", "Muita dor, urgente", "2025-01-14T11:00:00"))
+
+        assert self._tags() == [
+            ("Preciso da nota fiscal", "owner:management"),
+            ("Muita dor, urgente", "owner:doctor"),
+            ("Muita dor, urgente", "urgency:high"),
+        ]
+        with self.db.contents.register(self.db.connect()) as conn:
+            urgent = tagged_messages(conn, "urgency:high")
+        assert [m["conversation_id"] for m in urgent] == ["5522_2025-01-14"]
+
+        # Sem mensagens novas nada é relido
+        assert MessageClassifier(self.db, RULES).run() == {}
+
+    def test_rebuild_and_retag(self, tmp_path):
+        self._ingest(_l1("5511", "Reembolso urgente", "2025-01-14T10:00:00"))
+        L2Rebuilder(self.db).rebuild()
+        assert self._tags() == []
+
+        rules_file = tmp_path / "rules.json"
+        rules_file.write_text(json.dumps({"owner:management": ["reembolso"]}), encoding="utf-8")
+        classifier = MessageClassifier(self.db, load_rules(rules_file))
+        assert classifier.run() == {"owner:management": 1}
+        classifier.reset()
+        assert classifier.run() == {"owner:management": 1}
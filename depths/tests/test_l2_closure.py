@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_closure import ConversationClosureDetector, to_epoch
+from depths.layers.l2_grouper import L2Grouper
+
+
+def _l1(lead, text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": f"{lead}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+class TestConversationClosure:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+        self.events = []
+        self.detector = ConversationClosureDetector(self.db, tolerance_hours=4,
+                                                    on_close=self.events.append)
+        self.grouper = L2Grouper(self.db, listeners=[self.detector])
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def test_closes_exactly_when_tolerance_expires(self):
+        self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00Z"))
+        self.db.insert_l1_message(_l1("5522", "Olá", "2025-01-14T11:00:00Z"))
+        self.grouper.process_pending_messages()
+
+        assert self.detector.next_deadline() == to_epoch("2025-01-14T14:00:00Z")
+        assert self.detector.poll("2025-01-14T13:59:59Z") == []
+
+        closed = self.detector.poll("2025-01-14T14:00:00Z")
+        assert [e["conversation_id"] for e in closed] == ["5511_2025-01-14"]
+        assert self.events == closed
+        assert len(self.detector) == 1
+
+        with self.db.connect() as conn:
+            closed_at = conn.execute(
+                "SELECT closed_at FROM conversations_l2 WHERE conversation_id = '5511_2025-01-14'"
+            ).fetchone()[0]
+        assert closed_at.startswith("2025-01-14T14:00:00")
+
+    def test_new_activity_extends_deadline(self):
+        self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00Z"))
+        self.grouper.process_pending_messages()
+        self.db.insert_l1_message(_l1("5511", "Ainda aí?", "2025-01-14T13:00:00Z"))
+        self.grouper.process_pending_messages()
+
+        assert self.detector.poll("2025-01-14T14:30:00Z") == []
+        assert len(self.detector.poll("2025-01-14T17:00:00Z")) == 1
+
+    def test_state_survives_restart(self):
+        self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00Z"))
+        self.db.insert_l1_message(_l1("5522", "Olá", "2025-01-14T12:00:00Z"))
+        self.grouper.process_pending_messages()
+        self.detector.poll("2025-01-14T15:00:00Z")
+
+        restarted = ConversationClosureDetector(self.db, tolerance_hours=4)
+        assert restarted.load() == 1
+        closed = restarted.poll("2025-01-14T16:00:00Z")
+        assert [e["conversation_id"] for e in closed] == ["5522_2025-01-14"]
+
+        # Um segundo detector não emite o mesmo evento de novo
+        other = ConversationClosureDetector(self.db, tolerance_hours=4)
+        other.observe("5522_2025-01-14", "5522", "2025-01-14T12:00:00Z")
+        assert other.poll("2025-01-14T16:00:00Z") == []
+
+    def test_closed_conversation_reopens_and_closes_again(self):
+        self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00Z"))
+        self.grouper.process_pending_messages()
+        assert len(self.detector.poll("2025-01-14T14:00:00Z")) == 1
+
+        # Mesmo dia, depois da tolerância: a conversa encerrada volta a abrir
+        self.db.insert_l1_message(_l1("5511", "Voltei", "2025-01-14T16:00:00Z"))
+        self.grouper.process_pending_messages()
+        with self.db.connect() as conn:
+            closed_at, end_time = conn.execute(
+                "SELECT closed_at, end_time FROM conversations_l2"
+            ).fetchone()
+            ops = [row[0] for row in conn.execute(
+                "SELECT op FROM outbox WHERE topic = 'conversation' ORDER BY id"
+            )]
+        assert closed_at is None and end_time.startswith("2025-01-14T16:00:00")
+        assert ops == ["insert", "close", "reopen"]
+
+        assert self.detector.poll("2025-01-14T19:59:59Z") == []
+        closed = self.detector.poll("2025-01-14T20:00:00Z")
+        assert [e["conversation_id"] for e in closed] == ["5511_2025-01-14"]
+        assert closed[0]["closed_at"].startswith("2025-01-14T20:00:00")
+
+    def test_late_message_reopens_the_closed_day_conversation(self):
+        self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00Z"))
+        self.db.insert_l1_message(_l1("5511", "Boa noite", "2025-01-14T22:00:00Z"))
+        self.grouper.process_pending_messages()
+        assert len(self.detector.poll("2025-01-15T03:00:00Z")) == 1
+
+        # Atrasada longe das duas sessões: entra na conversa do dia, reaberta
+        self.db.insert_l1_message(_l1("5511", "Esqueci de perguntar", "2025-01-14T16:30:00Z"))
+        conversations = self.grouper.process_pending_messages()
+        assert conversations[0]["reopened"]
+        with self.db.connect() as conn:
+            assert conn.execute("SELECT closed_at FROM conversations_l2").fetchone()[0] is None
+
+        closed = self.detector.poll("2025-01-15T03:00:00Z")
+        assert [e["conversation_id"] for e in closed] == ["5511_2025-01-14"]
+        assert closed[0]["closed_at"].startswith("2025-01-15T02:00:00")
+
+
+def test_heap_scales_with_many_sessions():
+    db = SwaifDatabase(":memory:")
+    detector = ConversationClosureDetector(db, tolerance_hours=1)
+    start = datetime(2025, 1, 14)
+    for i in range(50000):
+        detector.observe(f"c{i}", f"l{i}", start + timedelta(seconds=i))
+    # Atividade repetida gera entradas obsoletas que são compactadas
+    for _ in range(3):
+        for i in range(0, 50000, 7):
+            detector.observe(f"c{i}", f"l{i}", start + timedelta(hours=2, seconds=i))
+
+    assert len(detector) == 50000
+    assert len(detector._heap) <= 2 * len(detector) + 1024
+    assert detector.next_deadline() == to_epoch(start + timedelta(hours=1, seconds=1))
+    db.cleanup()
@@ -0,0 +1,76 @@
+from depths.core.content_store import content_sql
+from depths.core.database import SwaifDatabase
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l2_faq import FaqClusters
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+
+
+def _l1(lead, text, ts, from_lead=True):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "evo_api_instance_name": "test",
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+class TestFaqClusters:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def _grouper(self, tmp_path):
+        self.faq = FaqClusters(self.db, index_dir=tmp_path)
+        return L2Grouper(self.db, listeners=[self.faq])
+
+    def _clusters(self):
+        with self.db.contents.register(self.db.connect()) as conn:
+            return dict(conn.execute(
+                f"SELECT {content_sql('m')}, c.cluster_id FROM message_clusters c "
+                "JOIN conversation_messages m ON m.id = c.message_id"
+            ).fetchall())
+
+    def test_repeated_questions_share_a_cluster(self, tmp_path):
+        grouper = self._grouper(tmp_path)
+        for lead, text in enumerate([
+            "Qual o valor da consulta?", "Oi, qual o valor da consulta", "Aceita convênio Unimed?",
+        ]):
+            self.db.insert_l1_message(_l1(f"55{lead}", text, f"2025-01-14T10:0{lead}:00"))
+        self.db.insert_l1_message(_l1("550", "Custa 300 reais", "2025-01-14T10:05:00", from_lead=False))
+        grouper.process_pending_messages()
+        # Lote seguinte compara com os líderes já gravados no índice
+        self.db.insert_l1_message(_l1("559", "qual o VALOR da consulta??", "2025-01-14T11:00:00"))
+        grouper.process_pending_messages()
+
+        clusters = self._clusters()
+        assert len(clusters) == 4
+        price = clusters["Qual o valor da consulta?"]
+        assert clusters["Oi, qual o valor da consulta"] == price
+        assert clusters["qual o VALOR da consulta??"] == price
+        assert clusters["Aceita convênio Unimed?"] != price
+
+        top = TerminalDisplay(self.db.db_path).faq(limit=1)
+        assert top == [{"cluster_id": price, "size": 3, "example": "Qual o valor da consulta?"}]
+
+        # Reabre do disco (estado do IDF + vetores) e casa sem gravar
+        reopened = FaqClusters(self.db, index_dir=tmp_path)
+        assert reopened.match(["valor da consulta?"])[0]["cluster_id"] == price
+        assert reopened.match(["Onde fica o estacionamento"]) == [None]
+        assert reopened.similar("valor da consulta", k=2)[0]["score"] > 0.6
+
+    def test_rebuild_restarts_the_index(self, tmp_path):
+        grouper = self._grouper(tmp_path)
+        self.db.insert_l1_message(_l1("5511", "Tem horário amanhã?", "2025-01-14T10:00:00"))
+        grouper.process_pending_messages()
+        assert len(self.faq.messages) == 1
+
+        L2Rebuilder(self.db).rebuild()
+        assert self._clusters() == {}
+        assert self.faq.run()["messages"] == 1
+        assert len(self.faq.messages) == 1 and len(self.faq.leaders) == 1
+        assert list(self._clusters()) == ["Tem horário amanhã?"]
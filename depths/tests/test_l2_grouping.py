@@ -2,9 +2,11 @@ import pytest
 import logging
 import sqlite3
 import builtins
+from pathlib import Path
 from datetime import datetime, timedelta
 from depths.core.database import SwaifDatabase
-from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_grouper import L2Grouper, L2Listener, PendingMessage
+from depths.layers.l2_rebuild import L2Rebuilder
 
 
 class TestL2Grouping:
@@ -259,7 +261,7 @@ class TestL2Grouping:
         row_id2 = self.grouper._save_conversation(conv_update)
         assert row_id2 == row_id
 
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.db.connect() as conn:
             data = conn.execute(
                 "SELECT message_count, end_time FROM conversations_l2 WHERE conversation_id=?",
                 ("123_2025-01-14",),
@@ -286,6 +288,222 @@ class TestL2Grouping:
         }
         assert self.grouper._save_conversation(conv_data) is None
 
+    def _insert(self, sender, text, ts):
+        self.db.insert_l1_message(
+            {
+                "host_n8n": "test",
+                "evo_api_instance_name": "test",
+                "host_evoapi": "test",
+                "sender_raw_data": sender,
+                "receiver_raw_data": "5511998681314@s.whatsapp.net"
+                if sender else "5511999887766@s.whatsapp.net",
+                "message_type": "conversation",
+                "sent_message": text,
+                "timestamp": ts,
+            }
+        )
+
+    def test_late_message_joins_existing_conversation(self):
+        """Test: Mensagem atrasada entra na conversa sem retroceder lead_activity"""
+        lead = "5511999887766@s.whatsapp.net"
+        self._insert(lead, "Oi", "2025-01-14T10:00:00.000Z")
+        self._insert(None, "Olá", "2025-01-14T10:10:00.000Z")
+        self.grouper.process_pending_messages()
+
+        # Retentativa do N8N entrega uma mensagem anterior
+        self._insert(lead, "Bom dia", "2025-01-14T09:55:00.000Z")
+        conversations = self.grouper.process_pending_messages()
+        assert conversations[0]["conversation_id"] == "5511999887766_2025-01-14"
+
+        with self.db.connect() as conn:
+            count, start, end = conn.execute(
+                "SELECT message_count, start_time, end_time FROM conversations_l2"
+            ).fetchone()
+            last_activity = conn.execute(
+                "SELECT last_activity FROM lead_activity"
+            ).fetchone()[0]
+        assert count == 3
+        assert start.startswith("2025-01-14T09:55")
+        assert end.startswith("2025-01-14T10:10")
+        assert last_activity.startswith("2025-01-14T10:10")
+
+        history = self.db.get_conversation_history("5511999887766_2025-01-14")
+        assert [m["content"] for m in history] == ["Bom dia", "Oi", "Olá"]
+
+    def test_late_message_bridging_conversations_merges_them(self):
+        """Test: Mensagem atrasada que liga duas conversas as funde"""
+        lead = "5511999887766@s.whatsapp.net"
+        self._insert(lead, "Boa noite", "2025-01-14T22:00:00.000Z")
+        self._insert(lead, "Bom dia", "2025-01-15T04:30:00.000Z")
+        conversations = self.grouper.process_pending_messages()
+        assert len(conversations) == 2
+
+        self._insert(lead, "Ainda acordada?", "2025-01-15T01:00:00.000Z")
+        self.grouper.process_pending_messages()
+
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                "SELECT conversation_id, message_count, end_time FROM conversations_l2"
+            ).fetchall()
+            activity = conn.execute("SELECT conversation_id FROM lead_activity").fetchone()[0]
+        assert len(rows) == 1
+        assert rows[0][0] == "5511999887766_2025-01-14"
+        assert rows[0][1] == 3
+        assert rows[0][2].startswith("2025-01-15T04:30")
+        assert activity == "5511999887766_2025-01-14"
+        assert len(self.db.get_conversation_history("5511999887766_2025-01-14")) == 3
+
+    def test_late_message_without_nearby_conversation_uses_the_day_id(self):
+        """Test: Atrasada longe de tudo segue a regra lead + dia, como a reconstrução"""
+        lead = "5511999887766@s.whatsapp.net"
+        self._insert(lead, "Boa noite", "2025-01-14T20:00:00.000Z")
+        self._insert(lead, "Bom dia", "2025-01-15T09:00:00.000Z")
+        self.grouper.process_pending_messages()
+
+        # 9h antes da conversa do dia 14 e sem janela que a contenha
+        self._insert(lead, "Oi", "2025-01-14T11:00:00.000Z")
+        conversations = self.grouper.process_pending_messages()
+        assert conversations[0]["conversation_id"] == "5511999887766_2025-01-14"
+
+        query = "SELECT conversation_id, message_count, start_time, end_time FROM conversations_l2 ORDER BY 1"
+        with self.db.connect() as conn:
+            incremental = conn.execute(query).fetchall()
+        assert [(row[0], row[1]) for row in incremental] == [
+            ("5511999887766_2025-01-14", 2), ("5511999887766_2025-01-15", 1),
+        ]
+
+        L2Rebuilder(self.db).rebuild()
+        with self.db.connect() as conn:
+            assert conn.execute(query).fetchall() == incremental
+
+    def test_merge_is_undone_with_a_failed_save(self):
+        """Test: Fusão e gravação da mensagem atrasada saem no mesmo commit"""
+        lead = "5511999887766@s.whatsapp.net"
+        self._insert(lead, "Boa noite", "2025-01-14T22:00:00.000Z")
+        self._insert(lead, "Bom dia", "2025-01-15T04:30:00.000Z")
+        self.grouper.process_pending_messages()
+
+        class FailOnce(L2Listener):
+            calls = 0
+
+            def on_conversation_saved(self, conn, conv_data):
+                FailOnce.calls += 1
+                if FailOnce.calls == 1:
+                    raise sqlite3.OperationalError("disk I/O error")
+
+        self.grouper.add_listener(FailOnce())
+        self._insert(lead, "Ainda acordada?", "2025-01-15T01:00:00.000Z")
+        self._insert(lead, "Oi de novo", "2025-01-15T05:00:00.000Z")
+        assert self.grouper.process_pending_messages() == []
+
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                "SELECT conversation_id, message_count FROM conversations_l2 ORDER BY 1"
+            ).fetchall()
+        assert rows == [("5511999887766_2025-01-14", 1), ("5511999887766_2025-01-15", 1)]
+
+        conversations = self.grouper.process_pending_messages()
+        assert [c["conversation_id"] for c in conversations] == ["5511999887766_2025-01-14"]
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                "SELECT conversation_id, message_count FROM conversations_l2"
+            ).fetchall()
+        assert rows == [("5511999887766_2025-01-14", 4)]
+        assert self._history_matches_l1() == (4, 4, 0)
+
+    def _history_matches_l1(self):
+        with self.db.connect() as conn:
+            history = conn.execute("SELECT COUNT(*) FROM conversation_messages").fetchone()[0]
+            processed = conn.execute(
+                "SELECT COUNT(*) FROM messages_l1 WHERE processed = TRUE"
+            ).fetchone()[0]
+            wrong_counts = conn.execute(
+                """
+                SELECT COUNT(*) FROM conversations_l2 c
+                WHERE message_count != (
+                    SELECT COUNT(*) FROM conversation_messages m WHERE m.conversation_ref = c.id)
+                """
+            ).fetchone()[0]
+        return history, processed, wrong_counts
+
+    def test_crash_after_a_saved_conversation_does_not_duplicate_history(self):
+        """Test: Queda entre conversas do lote não duplica histórico na retomada"""
+        for lead in ("5511999887766", "5511999887755"):
+            self._insert(f"{lead}@s.whatsapp.net", "Oi", "2025-01-14T10:00:00.000Z")
+            self._insert(f"{lead}@s.whatsapp.net", "Tem horário?", "2025-01-14T10:05:00.000Z")
+
+        save = self.grouper._save_conversation
+        saves = []
+
+        def crash_on_second(conv_data):
+            if saves:
+                raise KeyboardInterrupt  # processo morto no meio do lote
+            saves.append(save(conv_data))
+            return saves[-1]
+
+        self.grouper._save_conversation = crash_on_second
+        with pytest.raises(KeyboardInterrupt):
+            self.grouper.process_pending_messages()
+
+        L2Grouper(self.db).process_pending_messages()
+        assert self._history_matches_l1() == (4, 4, 0)
+
+    def test_overlapping_runs_group_each_message_once(self):
+        """Test: Dois agrupadores com o mesmo lote pendente não duplicam"""
+        self._insert("5511999887766@s.whatsapp.net", "Oi", "2025-01-14T10:00:00.000Z")
+        self._insert(None, "Olá", "2025-01-14T10:01:00.000Z")
+        with self.db.connect() as conn:
+            pending = self.grouper._fetch_pending(conn)
+        self._insert("5511999887766@s.whatsapp.net", "Amanhã?", "2025-01-14T10:02:00.000Z")
+        with self.db.connect() as conn:
+            overlapping = L2Grouper(self.db)._fetch_pending(conn)
+
+        assert len(self.grouper.process_messages(pending)) == 1
+        second = L2Grouper(self.db).process_messages(overlapping)
+        # Só a mensagem nova entra na segunda execução
+        assert second[0]["message_count"] == 1
+        assert self._history_matches_l1() == (3, 3, 0)
+
+    def test_lateness_watermark_holds_recent_messages(self):
+        """Test: Mensagens acima da marca d'água aguardam o próximo lote"""
+        grouper = L2Grouper(self.db, allowed_lateness_minutes=30)
+        lead = "5511999887766@s.whatsapp.net"
+        self._insert(lead, "Oi", "2025-01-14T10:00:00.000Z")
+        self._insert(lead, "Tudo bem?", "2025-01-14T10:45:00.000Z")
+
+        conversations = grouper.process_pending_messages()
+        assert conversations[0]["message_count"] == 1
+
+        # Mensagem atrasada chega antes da liberação: ordem correta, sem reagrupar
+        self._insert(lead, "Perdão", "2025-01-14T10:20:00.000Z")
+        conversations = grouper.process_pending_messages(flush=True)
+        assert conversations[0]["message_count"] == 2
+        history = self.db.get_conversation_history("5511999887766_2025-01-14")
+        assert [m["content"] for m in history] == ["Oi", "Perdão", "Tudo bem?"]
+
+    def test_pending_messages_are_compact_records(self):
+        """Test: Pendentes carregam só os campos da L2, sem __dict__"""
+        self._insert("5511999887766@s.whatsapp.net", "Oi", "2025-01-14T10:00:00.000Z")
+        self._insert(None, "Olá!", "2025-01-14T10:01:00.000Z")
+
+        with self.db.connect() as conn:
+            pending = self.grouper._fetch_pending(conn)
+
+        assert all(isinstance(m, PendingMessage) for m in pending)
+        assert not hasattr(pending[0], "__dict__")
+        assert pending[0]["content"] == "Oi" and pending[1].get("sender_phone") is None
+        assert pending[0].get("n8n_host") is None
+        # Mesmo telefone em mensagens diferentes: uma única string
+        assert pending[1].receiver_phone is pending[0].sender_phone
+
+        conversations = self.grouper.process_pending_messages()
+        assert conversations[0]["message_count"] == 2
+
+def _remove_db(db_path):
+    """Remove o banco padrão e os arquivos do WAL"""
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
 def test_generate_conversation_id_fallback(monkeypatch):
     """Test: Deve usar parse manual quando dateutil não estiver disponível"""
     real_import = builtins.__import__
@@ -297,10 +515,10 @@ def test_generate_conversation_id_fallback(monkeypatch):
     grouper = L2Grouper()
     conv_id = grouper.generate_conversation_id("5511@s.whatsapp.net", "2025-01-14T10:30:00Z")
     assert conv_id == "5511_2025-01-14"
-    Path(grouper.db.db_path).unlink(missing_ok=True)
+    _remove_db(grouper.db.db_path)
 
 def test_init_without_database():
     """Test: Instancia sem banco explícito"""
     grouper = L2Grouper()
     assert grouper.db is not None
-    Path(grouper.db.db_path).unlink(missing_ok=True)
+    _remove_db(grouper.db.db_path)
@@ -0,0 +1,166 @@
+from depths.benchmarks.synthetic import populate
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+
+
+def _l1(lead, text, ts, from_lead=True):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def _snapshot(db):
+    with db.connect() as conn:
+        conversations = conn.execute(
+            "SELECT conversation_id, lead_phone, secretary_phone, message_count, "
+            "start_time, end_time FROM conversations_l2 ORDER BY conversation_id"
+        ).fetchall()
+        history = conn.execute(
+            "SELECT m.conversation_id, c.conversation_id, m.sender_type, m.content "
+            "FROM conversation_messages m JOIN conversations_l2 c ON c.id = m.conversation_ref "
+            "ORDER BY m.conversation_id, m.timestamp"
+        ).fetchall()
+        activity = conn.execute(
+            "SELECT lead_phone, conversation_id FROM lead_activity ORDER BY lead_phone"
+        ).fetchall()
+    return conversations, history, activity
+
+
+class TestL2Rebuild:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def _insert_sessions(self):
+        for msg in [
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+            _l1("5511", "Bom dia", "2025-01-14T10:05:00", from_lead=False),
+            _l1("5511", "Voltei", "2025-01-14T16:00:00"),
+            _l1("5511", "Outro dia", "2025-01-15T09:00:00"),
+            _l1("5522", "Olá", "2025-01-14T11:00:00"),
+            _l1("5522", "Ainda aí?", "2025-01-14T13:00:00"),
+        ]:
+            self.db.insert_l1_message(msg)
+
+    def test_matches_incremental_grouping(self):
+        self._insert_sessions()
+        L2Grouper(self.db).process_pending_messages()
+        incremental = _snapshot(self.db)
+
+        stats = L2Rebuilder(self.db).rebuild()
+
+        assert _snapshot(self.db) == incremental
+        assert stats["messages"] == 6 and stats["leads"] == 2
+        with self.db.connect() as conn:
+            closed = conn.execute(
+                "SELECT conversation_id FROM conversations_l2 WHERE closed_at IS NOT NULL"
+            ).fetchall()
+        assert closed == [("5511_2025-01-14",)]
+
+    def test_new_tolerance_regroups_everything(self):
+        self._insert_sessions()
+        L2Grouper(self.db).process_pending_messages()
+
+        L2Rebuilder(self.db, tolerance_hours=24).rebuild()
+
+        conversations, _, activity = _snapshot(self.db)
+        assert [(c[0], c[3]) for c in conversations] == [
+            ("5511_2025-01-14", 4), ("5522_2025-01-14", 2),
+        ]
+        assert activity == [("5511", "5511_2025-01-14"), ("5522", "5522_2025-01-14")]
+
+    def test_rebuild_twice(self):
+        self._insert_sessions()
+        L2Rebuilder(self.db).rebuild()
+        first = _snapshot(self.db)
+
+        # Tabelas renomeadas pelo primeiro swap têm o nome entre aspas no schema
+        L2Rebuilder(self.db).rebuild()
+        assert _snapshot(self.db) == first
+
+    def test_swap_keeps_indexes_and_l3_refs(self):
+        self._insert_sessions()
+        L2Grouper(self.db).process_pending_messages()
+        with self.db.connect() as conn:
+            before = sorted(r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+            ))
+            conn.execute(
+                "INSERT INTO analyses_l3 (conversation_id, conversation_ref) "
+                "VALUES ('5522_2025-01-14', -1)"
+            )
+
+        L2Rebuilder(self.db).rebuild()
+
+        with self.db.connect() as conn:
+            after = sorted(r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+            ))
+            ref = conn.execute(
+                "SELECT a.conversation_ref = c.id FROM analyses_l3 a "
+                "JOIN conversations_l2 c ON c.conversation_id = a.conversation_id"
+            ).fetchone()[0]
+            shadows = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name LIKE '%rebuild%'"
+            ).fetchone()[0]
+        assert after == before
+        assert ref == 1 and shadows == 0
+
+    def test_messages_without_timestamp_are_skipped_like_the_grouper(self):
+        self._insert_sessions()
+        self.db.insert_l1_message(_l1("5511", "Sem horário", None))
+        self.db.insert_l1_message(_l1("5533", "Também sem", None))
+        L2Grouper(self.db).process_pending_messages()
+        incremental = _snapshot(self.db)
+
+        stats = L2Rebuilder(self.db).rebuild()
+
+        assert stats["skipped"] == 2 and stats["messages"] == 6
+        assert _snapshot(self.db) == incremental
+        with self.db.connect() as conn:
+            assert conn.execute(
+                "SELECT COUNT(*) FROM messages_l1 WHERE processed = FALSE"
+            ).fetchone()[0] == 0
+
+    def test_pending_messages_are_consumed_and_grouper_continues(self):
+        self._insert_sessions()
+        L2Rebuilder(self.db).rebuild()
+
+        grouper = L2Grouper(self.db)
+        assert grouper.process_pending_messages() == []
+
+        self.db.insert_l1_message(_l1("5522", "Nova", "2025-01-14T14:00:00"))
+        conversations = grouper.process_pending_messages()
+        assert conversations[0]["conversation_id"] == "5522_2025-01-14"
+        with self.db.connect() as conn:
+            count = conn.execute(
+                "SELECT message_count FROM conversations_l2 "
+                "WHERE conversation_id = '5522_2025-01-14'"
+            ).fetchone()[0]
+        assert count == 3
+
+
+def test_synthetic_traffic_rebuild(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "bench.db"))
+    populate(db.db_path, 5000, leads=50, batch_size=1000)
+
+    stats = L2Rebuilder(db, commit_every=1000).rebuild()
+
+    with db.connect() as conn:
+        total, pending = conn.execute(
+            "SELECT SUM(message_count), "
+            "(SELECT COUNT(*) FROM messages_l1 WHERE processed = FALSE) FROM conversations_l2"
+        ).fetchone()
+    assert stats["messages"] == total == 5000
+    assert stats["leads"] == 50 and pending == 0
@@ -0,0 +1,171 @@
+import pytest
+from depths.core.database import SwaifDatabase
+from depths.core.migrations import MIGRATIONS, MigrationRunner
+from depths.core.rollups import clear_live_rollups, recompute_rollups
+from depths.core.sketches import DDSketch, HyperLogLog
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+from depths.layers.l2_rollups import DailyRollups
+
+
+def _l1(lead, text, ts, from_lead=True, instance="clinic_a"):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": instance,
+        "host_evoapi": "test",
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+class TestDailyRollups:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+        self.grouper = L2Grouper(self.db, listeners=[DailyRollups(self.db)])
+        self.display = TerminalDisplay(self.db.db_path)
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def _ingest(self, *messages):
+        for msg in messages:
+            self.db.insert_l1_message(msg)
+        self.grouper.process_pending_messages()
+
+    def test_counts_and_first_response_across_batches(self):
+        self._ingest(
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+            _l1("5511", "Tem horário?", "2025-01-14T10:02:00"),
+            _l1("5511", "Temos sim", "2025-01-14T10:05:00", from_lead=False),
+            _l1("5522", "Olá", "2025-01-14T11:00:00"),
+        )
+        # Resposta ao lead 5522 chega no lote seguinte
+        self._ingest(_l1("5522", "Pois não?", "2025-01-14T11:20:00", from_lead=False))
+
+        report = self.display.report("2025-01-14", "2025-01-14")
+        assert report["conversations"] == 2
+        assert report["messages"] == 5
+        assert (report["lead_messages"], report["secretary_messages"]) == (3, 2)
+        assert report["active_leads"] == 2
+        assert report["responses"] == 2
+        assert report["first_response_p50"] == pytest.approx(300, rel=0.02)
+
+        with self.db.connect() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM response_waits").fetchone()[0] == 0
+            stored = conn.execute("SELECT first_response FROM daily_rollups").fetchone()[0]
+        assert DDSketch.from_json(stored).quantile(1.0) == pytest.approx(1200, rel=0.02)
+
+    def test_range_report_merges_days_and_instances(self):
+        self._ingest(
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+            _l1("5511", "Voltei", "2025-01-15T10:00:00"),
+            _l1("5533", "Olá", "2025-01-15T12:00:00", instance="clinic_b"),
+        )
+
+        report = self.display.report("2025-01-14", "2025-01-15")
+        assert report["conversations"] == 3
+        # O mesmo lead em dois dias conta uma vez no período
+        assert report["active_leads"] == 2
+        assert self.display.report("2025-01-15", "2025-01-15", instance="clinic_b")["messages"] == 1
+        assert self.display.report("2025-02-01", "2025-02-28")["messages"] == 0
+
+        with self.db.connect() as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM daily_rollups").fetchone()[0]
+        assert rows == 3
+
+    def _rollups(self):
+        with self.db.connect() as conn:
+            return conn.execute(
+                "SELECT day, instance, secretary_id, conversations, messages, lead_messages, "
+                "secretary_messages, first_response, active_leads FROM daily_rollups ORDER BY 1, 2, 3"
+            ).fetchall()
+
+    def _seed(self):
+        self._ingest(
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+            _l1("5511", "Temos sim", "2025-01-14T10:05:00", from_lead=False),
+            _l1("5522", "Olá", "2025-01-14T11:00:00"),
+        )
+        self._ingest(
+            _l1("5522", "Pois não?", "2025-01-14T11:20:00", from_lead=False),
+            _l1("5533", "Olá", "2025-01-15T12:00:00", instance="clinic_b"),
+        )
+
+    def test_recompute_matches_incremental_rollups(self):
+        self._seed()
+        incremental = self._rollups()
+        # Uma linha por (dia, instância): a secretária é a da conversa gravada,
+        # não a da última mensagem de cada lote
+        assert [row[:3] for row in incremental] == [
+            ("2025-01-14", "clinic_a", 2), ("2025-01-15", "clinic_b", 2),
+        ]
+
+        with self.db.connect() as conn:
+            clear_live_rollups(conn)
+            assert recompute_rollups(conn) == 3
+        assert self._rollups() == incremental
+        assert self.display.report("2025-01-14", "2025-01-15")["responses"] == 2
+
+    def test_rebuild_recomputes_rollups(self):
+        self._seed()
+        incremental = self._rollups()
+        with self.db.connect() as conn:
+            conn.execute("DELETE FROM daily_rollups")
+
+        L2Rebuilder(self.db).rebuild()
+        assert self._rollups() == incremental
+
+    def test_migration_backfills_existing_history(self):
+        self._seed()
+        incremental = self._rollups()
+        with self.db.connect() as conn:
+            conn.execute("DELETE FROM daily_rollups")
+            # Backfill interrompido no começo: a próxima execução retoma
+            conn.execute(
+                "UPDATE schema_backfills SET last_rowid = 0, completed_at = NULL "
+                "WHERE name = 'daily_rollups'"
+            )
+
+        MigrationRunner(self.db.db_path, MIGRATIONS).run()
+        assert self._rollups() == incremental
+
+    def test_merge_is_not_counted_twice(self):
+        self._ingest(
+            _l1("5511", "Boa noite", "2025-01-14T22:00:00"),
+            _l1("5511", "Bom dia", "2025-01-15T04:30:00"),
+        )
+        assert self.display.report("2025-01-14", "2025-01-15")["conversations"] == 2
+
+        # Mensagem atrasada entre as duas: vira uma conversa só
+        self._ingest(_l1("5511", "Ainda acordada?", "2025-01-15T01:00:00"))
+        report = self.display.report("2025-01-14", "2025-01-15")
+        assert report["conversations"] == 1
+        assert report["messages"] == 3
+        assert self.display.report("2025-01-15", "2025-01-15")["conversations"] == 0
+
+        merged = self._rollups()
+        with self.db.connect() as conn:
+            clear_live_rollups(conn)
+            recompute_rollups(conn)
+        assert self._rollups() == merged
+
+def test_sketches_merge_like_the_union():
+    left, right, union = DDSketch(), DDSketch(), DDSketch()
+    for i in range(1, 2001):
+        (left if i % 3 else right).add(i)
+        union.add(i)
+    left.merge(DDSketch.from_json(right.to_json()))
+    for q in (0.5, 0.9, 0.99):
+        assert left.quantile(q) == union.quantile(q)
+        assert left.quantile(q) == pytest.approx(q * 1999 + 1, rel=0.02)
+
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(range(0, 6000))
+    b.update(range(3000, 10000))
+    a.merge(HyperLogLog.from_bytes(b.to_bytes()))
+    assert a.count() == pytest.approx(10000, rel=0.05)
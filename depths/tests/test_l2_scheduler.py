@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+from depths.core.batching import BatchController
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_scheduler import PriorityScheduler, keyword_matcher
+
+NOW = datetime(2025, 1, 14, 12, 0, tzinfo=timezone.utc).timestamp()
+
+
+def _l1(lead, text, ts, from_lead=True):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "evo_api_instance_name": "test",
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def _grouped_leads(db):
+    with db.connect() as conn:
+        return {row[0] for row in conn.execute("SELECT lead_phone FROM conversations_l2")}
+
+
+class TestPriorityScheduler:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+        self.grouper = L2Grouper(self.db)
+        # Backlog de uma queda: 20 leads com mensagens de horas atrás
+        for lead in range(20):
+            for minute in range(3):
+                self.db.insert_l1_message(
+                    _l1(f"55{lead:02d}", "Oi", f"2025-01-14T0{lead % 6}:{minute:02d}:00")
+                )
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def test_fresh_and_urgent_leads_skip_the_backlog(self):
+        self.db.insert_l1_message(_l1("5599", "Bom dia", "2025-01-14T11:55:00"))
+        self.db.insert_l1_message(_l1("5598", "Estou com muita DOR", "2025-01-13T08:00:00"))
+        scheduler = PriorityScheduler(self.grouper, backlog_rate=6)
+
+        scheduler.run_once(now=NOW)
+
+        grouped = _grouped_leads(self.db)
+        assert {"5599", "5598"} <= grouped
+        # Orçamento de 6 mensagens: dois leads do backlog, os mais antigos
+        assert grouped - {"5599", "5598"} == {"5500", "5506"}
+        assert len(scheduler) == 18 * 3
+        stats = scheduler.stats()
+        assert stats["hot"]["messages"] == 2 and stats["backlog"]["messages"] == 6
+
+    def test_backlog_drains_with_same_result_as_fifo(self):
+        fifo = SwaifDatabase(":memory:")
+        for msg in [_l1(f"55{lead:02d}", "Oi", f"2025-01-14T0{lead % 6}:{minute:02d}:00")
+                    for lead in range(20) for minute in range(3)]:
+            fifo.insert_l1_message(msg)
+        L2Grouper(fifo).process_pending_messages()
+
+        scheduler = PriorityScheduler(self.grouper, backlog_rate=10)
+        cycles = 0
+        while len(scheduler) or cycles == 0:
+            scheduler._budget = 10
+            scheduler.run_once(now=NOW)
+            cycles += 1
+        assert cycles >= 6
+
+        query = "SELECT conversation_id, message_count, start_time, end_time FROM conversations_l2 ORDER BY 1"
+        with self.db.connect() as a, fifo.connect() as b:
+            assert a.execute(query).fetchall() == b.execute(query).fetchall()
+            assert a.execute("SELECT COUNT(*) FROM messages_l1 WHERE processed = FALSE").fetchone()[0] == 0
+        fifo.cleanup()
+
+    def test_only_new_rows_are_scanned(self):
+        scheduler = PriorityScheduler(self.grouper, backlog_rate=0)
+        assert scheduler.scan() == 60
+        self.db.insert_l1_message(_l1("5599", "Oi", "2025-01-14T11:59:00"))
+        assert scheduler.scan() == 1
+
+    def test_failed_save_is_retried_next_cycle(self):
+        scheduler = PriorityScheduler(self.grouper, backlog_rate=0)
+        self.db.insert_l1_message(_l1("5599", "Bom dia", "2025-01-14T11:55:00"))
+        save = self.grouper._save_conversation
+        calls = []
+
+        def fail_once(conv_data):
+            calls.append(conv_data["conversation_id"])
+            return None if len(calls) == 1 else save(conv_data)
+
+        self.grouper._save_conversation = fail_once
+        scheduler.run_once(now=NOW)
+        assert calls[0] == "5599_2025-01-14"
+        assert "5599" not in _grouped_leads(self.db)
+        assert scheduler._leads["5599"].ids
+        assert scheduler.stats()["hot"]["messages"] == 0
+
+        conversations = scheduler.run_once(now=NOW)
+        assert "5599" in [c["lead_phone"] for c in conversations]
+        assert "5599" in _grouped_leads(self.db)
+        assert "5599" not in scheduler._leads
+        assert scheduler.stats()["hot"]["messages"] == 1
+
+    def test_batches_follow_the_controller_and_alternate(self):
+        grouper = L2Grouper(self.db, controller=BatchController(min_batch=1, max_batch=2))
+        batches = []
+
+        def record(messages):
+            batches.append(sorted({m["sender_phone"][:4] for m in messages}))
+            return grouper.process_messages(messages)
+
+        for lead in ("5597", "5598", "5599"):
+            self.db.insert_l1_message(_l1(lead, "Bom dia", "2025-01-14T11:55:00"))
+        scheduler = PriorityScheduler(grouper, backlog_rate=6, processor=record)
+
+        scheduler.run_once(now=NOW)
+
+        # Quentes em lotes de até 2 mensagens, intercalados com o backlog
+        # (um lead do backlog com 3 mensagens vai sozinho)
+        assert batches == [["5597", "5598"], ["5500"], ["5599"], ["5506"]]
+        assert grouper.controller.batches == 4
+
+    def test_rescan_picks_up_rows_left_behind(self):
+        scheduler = PriorityScheduler(self.grouper, backlog_rate=0, rescan_seconds=0)
+        assert scheduler.scan() == 60
+        # Fila perdida (por exemplo, outro agendador que caiu no meio do ciclo)
+        scheduler._leads.clear()
+        assert scheduler.scan() == 0
+        assert scheduler.rescan() == 60
+        assert scheduler.rescan() == 0
+        assert len(scheduler) == 60
+
+
+def test_keyword_matcher_uses_whole_words():
+    urgent = keyword_matcher(["dor", "urgente"])
+    assert urgent("Estou com dor de dente")
+    assert urgent("É URGENTE!")
+    assert not urgent("Quero falar com o doutor")
+    assert not urgent(None)
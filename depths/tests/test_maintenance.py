@@ -0,0 +1,124 @@
+import sqlite3
+import threading
+import time
+from depths.core.database import SwaifDatabase
+from depths.core.maintenance import (
+    convert_to_incremental_vacuum,
+    default_backup_path,
+    incremental_compact,
+    online_backup,
+    page_diff_snapshot,
+    restore_snapshot,
+)
+
+
+def _fill(db_path, count, start=0):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO messages_l1 (sender_phone, content, timestamp) VALUES (?, ?, ?)",
+            [(f"55{i}", "x" * 500, "2025-01-14T10:00:00") for i in range(start, start + count)],
+        )
+
+
+def _count(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0]
+
+
+def test_online_backup_finishes_while_writer_commits(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _fill(db.db_path, 2000)
+
+    stop = threading.Event()
+
+    def writer():
+        # Um commit a cada 2 ms: reiniciaria um backup em passos indefinidamente
+        i = 2000
+        while not stop.is_set():
+            _fill(db.db_path, 1, start=i)
+            i += 1
+            time.sleep(0.002)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        report = online_backup(db.db_path, tmp_path / "backups" / "copy.db", sample_interval=0)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert report["bytes_copied"] > 0
+    assert report["samples"] >= 2
+    # O snapshot de leitura segura o checkpoint: os commits vão para o WAL
+    assert 0 <= report["wal_growth"] <= report["wal_bytes_max"]
+    assert _count(report["path"]) >= 2000
+
+
+def test_page_diff_snapshot_stores_only_changed_pages(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    snapshots = tmp_path / "snapshots"
+    _fill(db.db_path, 200)
+
+    first = page_diff_snapshot(db.db_path, snapshots, sample_interval=0)
+    _fill(db.db_path, 5, start=200)
+    second = page_diff_snapshot(db.db_path, snapshots, sample_interval=0)
+
+    assert first["parent"] is None
+    assert second["parent"] == first["snapshot_id"]
+    assert second["changed_pages"] < first["changed_pages"]
+
+    restored = restore_snapshot(snapshots, second["snapshot_id"], tmp_path / "restored.db")
+    assert _count(restored) == 205
+    older = restore_snapshot(snapshots, first["snapshot_id"], tmp_path / "older.db")
+    assert _count(older) == 200
+
+
+def test_incremental_compact_releases_free_pages(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _fill(db.db_path, 300)
+    with db.connect() as conn:
+        conn.execute("DELETE FROM messages_l1")
+
+    # Banco novo já nasce em modo incremental
+    assert convert_to_incremental_vacuum(db.db_path) is False
+    report = incremental_compact(db.db_path, pages_per_step=10, sleep_seconds=0)
+
+    assert report["pages_freed"] == report["free_pages_before"] > 0
+    assert report["steps"] > 1
+    with db.connect() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_incremental_compact_stops_after_max_steps(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _fill(db.db_path, 300)
+    with db.connect() as conn:
+        conn.execute("DELETE FROM messages_l1")
+
+    report = incremental_compact(db.db_path, pages_per_step=10, sleep_seconds=0, max_steps=1)
+
+    assert report["steps"] == 1 and report["pages_freed"] == 10
+    with db.connect() as conn:
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    assert remaining == report["free_pages_before"] - report["pages_freed"]
+
+
+def test_compact_skips_below_threshold(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    report = incremental_compact(db.db_path, min_free_ratio=0.5)
+    assert report["skipped"] is True
+
+
+def test_legacy_database_converted_to_incremental(tmp_path):
+    legacy = tmp_path / "legacy.db"
+    with sqlite3.connect(legacy) as conn:
+        conn.execute("CREATE TABLE t (x)")
+    assert convert_to_incremental_vacuum(legacy) is True
+    with sqlite3.connect(legacy) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def test_default_backup_path(tmp_path):
+    path = default_backup_path(tmp_path / "swaif_msg.db")
+    assert path.parent == tmp_path / "backups"
+    assert path.name.startswith("swaif_msg_") and path.suffix == ".db"
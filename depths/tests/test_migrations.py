@@ -0,0 +1,116 @@
+import sqlite3
+import pytest
+from depths.core.database import SwaifDatabase
+from depths.core.migrations import (
+    MIGRATIONS,
+    Backfill,
+    Migration,
+    MigrationRunner,
+    add_column,
+)
+
+
+def _insert_messages(db_path, count):
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO messages_l1 (sender_phone, content, timestamp) VALUES (?, ?, ?)",
+            [(f"55{i}", f"msg {i}", "2025-01-14T10:00:00") for i in range(count)],
+        )
+
+
+def _length_migration(calls):
+    def fill(conn, first, last):
+        calls.append((first, last))
+        conn.execute(
+            "UPDATE messages_l1 SET content_length = length(content) "
+            "WHERE rowid BETWEEN ? AND ?",
+            (first, last),
+        )
+
+    return Migration(
+        100,
+        "Tamanho do conteúdo",
+        apply=lambda conn: add_column(conn, "messages_l1", "content_length", "INTEGER"),
+        backfills=[Backfill("messages_l1.content_length", "messages_l1", fill)],
+    )
+
+
+def test_new_database_is_at_latest_version(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    assert db.schema_version == MIGRATIONS[-1].version
+
+    with db.connect() as conn:
+        indexes = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )}
+    assert "idx_messages_l1_pending" in indexes
+
+
+def test_run_is_idempotent(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    runner = MigrationRunner(db.db_path)
+    assert runner.pending() == []
+    assert runner.run() == db.schema_version
+
+
+def test_backfill_runs_in_chunks(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _insert_messages(db.db_path, 25)
+
+    calls = []
+    migrations = MIGRATIONS + [_length_migration(calls)]
+    version = MigrationRunner(db.db_path, migrations, chunk_size=10).run()
+
+    assert version == 100
+    assert calls == [(1, 10), (11, 20), (21, 25)]
+    with db.connect() as conn:
+        missing = conn.execute(
+            "SELECT COUNT(*) FROM messages_l1 WHERE content_length IS NULL"
+        ).fetchone()[0]
+    assert missing == 0
+
+
+def test_backfill_resumes_after_failure(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    _insert_messages(db.db_path, 30)
+
+    calls = []
+    migration = _length_migration(calls)
+    original = migration.backfills[0].apply_chunk
+
+    def flaky(conn, first, last):
+        if first == 11:
+            raise RuntimeError("crash")
+        original(conn, first, last)
+
+    migration.backfills[0].apply_chunk = flaky
+    runner = MigrationRunner(db.db_path, MIGRATIONS + [migration], chunk_size=10)
+    with pytest.raises(RuntimeError):
+        runner.run()
+
+    # Schema já está na versão nova; apenas o backfill ficou pendente
+    assert runner.current_version() == 100
+
+    migration.backfills[0].apply_chunk = original
+    calls.clear()
+    runner.run()
+    assert calls == [(11, 20), (21, 30)]
+
+
+def test_failed_schema_step_is_rolled_back(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+
+    def broken(conn):
+        conn.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+
+    runner = MigrationRunner(db.db_path, MIGRATIONS + [Migration(200, "broken", apply=broken)])
+    with pytest.raises(RuntimeError):
+        runner.run()
+
+    assert runner.current_version() == db.schema_version
+    with db.connect() as conn:
+        tables = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+    assert "half_done" not in tables
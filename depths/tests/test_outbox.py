@@ -0,0 +1,99 @@
+import threading
+import time
+import pytest
+from depths.core import outbox
+from depths.core.database import SwaifDatabase
+from depths.layers.l2_closure import ConversationClosureDetector
+from depths.layers.l2_grouper import L2Grouper
+
+
+def _l1(lead, text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": f"{lead}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+class TestOutbox:
+    @pytest.fixture(autouse=True)
+    def _db(self, tmp_path):
+        self.db = SwaifDatabase(str(tmp_path / "swaif.db"))
+        self.grouper = L2Grouper(self.db)
+
+    def test_l1_and_l2_changes_in_commit_order(self):
+        changes = self.db.changes("l3")
+        first = self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00"))
+        self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00"))
+        self.grouper.process_pending_messages()
+        self.db.insert_l1_message(_l1("5511", "Tem horário?", "2025-01-14T10:05:00"))
+        self.grouper.process_pending_messages()
+
+        events = changes.poll()
+        # Reenvio descartado pela deduplicação não gera evento
+        assert [(e["topic"], e["op"]) for e in events] == [
+            ("message", "insert"), ("conversation", "insert"),
+            ("message", "insert"), ("conversation", "update"),
+        ]
+        assert events[0]["entity_id"] == first
+        assert events[3]["payload"]["message_count"] == 2
+        assert events[3]["payload"]["version"] == events[1]["payload"]["version"] + 1
+
+        changes.commit(events[:2])
+        # Outro consumidor tem offset próprio; o offset sobrevive à reabertura
+        assert len(self.db.changes("dashboard").poll()) == 4
+        assert [e["id"] for e in self.db.changes("l3").poll()] == [e["id"] for e in events[2:]]
+        assert self.db.changes("export", from_latest=True).poll() == []
+
+    def test_merge_and_close_are_published(self):
+        self.db.insert_l1_message(_l1("5511", "Boa noite", "2025-01-14T22:00:00"))
+        self.db.insert_l1_message(_l1("5511", "Bom dia", "2025-01-15T04:30:00"))
+        self.grouper.process_pending_messages()
+        changes = self.db.changes("l3", from_latest=True)
+        # Mensagem atrasada liga as duas conversas
+        self.db.insert_l1_message(_l1("5511", "Ainda acordada?", "2025-01-15T01:00:00"))
+        self.grouper.process_pending_messages()
+        ops = [(e["op"], e["payload"]["conversation_id"]) for e in changes.poll()
+               if e["topic"] == "conversation"]
+        assert ("merge", "5511_2025-01-15") in ops
+        assert ops[-1] == ("update", "5511_2025-01-14")
+        changes.commit(changes.poll())
+
+        detector = ConversationClosureDetector(self.db)
+        detector.on_batch_complete([{"conversation_id": "5511_2025-01-14"}])
+        detector.poll(now="2030-01-01T00:00:00+00:00")
+        closed = changes.poll()
+        assert [e["op"] for e in closed] == ["close"]
+        assert closed[0]["payload"]["closed_at"]
+
+    def test_poll_waits_for_new_changes(self):
+        changes = self.db.changes("l3")
+        started = time.monotonic()
+        assert changes.poll(timeout=0.2) == []
+        assert time.monotonic() - started >= 0.2
+
+        writer = threading.Timer(
+            0.1, lambda: self.db.insert_l1_message(_l1("5511", "Oi", "2025-01-14T10:00:00"))
+        )
+        writer.start()
+        events = changes.poll(timeout=5)
+        writer.join()
+        assert [e["op"] for e in events] == ["insert"]
+
+    def test_prune_keeps_what_the_slowest_consumer_has_not_read(self):
+        fast, slow = self.db.changes("fast"), self.db.changes("slow")
+        for minute in range(3):
+            self.db.insert_l1_message(_l1("5511", f"msg {minute}", f"2025-01-14T10:0{minute}:00"))
+        fast.commit(fast.poll())
+        slow.commit(slow.poll()[:1])
+        with self.db.connect() as conn:
+            assert outbox.prune(conn) == 1
+        assert slow.lag() == 2 and len(slow.poll()) == 2
+        slow.unregister()
+        with self.db.connect() as conn:
+            assert outbox.prune(conn) == 2
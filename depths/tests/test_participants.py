@@ -0,0 +1,99 @@
+import sqlite3
+from depths.core.database import SwaifDatabase
+from depths.core.migrations import MIGRATIONS, MigrationRunner
+from depths.core.participants import ParticipantRegistry, clean_phone
+from depths.layers.l2_grouper import L2Grouper
+
+
+def _l1(sender, receiver, text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "clinic",
+        "host_evoapi": "test",
+        "sender_raw_data": sender,
+        "receiver_raw_data": receiver,
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def test_clean_phone_is_interned():
+    a = clean_phone("5511999887766@s.whatsapp.net")
+    b = clean_phone("".join(["5511999887766", "@s.whatsapp.net"]))
+    assert a == "5511999887766"
+    assert a is b
+    assert clean_phone(None) == ""
+
+
+def test_registry_reuses_ids(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    registry = ParticipantRegistry()
+    with db.connect() as conn:
+        first = registry.get_id(conn, "5511@s.whatsapp.net")
+        again = registry.get_id(conn, "5511")
+        with_role = registry.get_id(conn, "5511", role="lead")
+        role = conn.execute(
+            "SELECT role FROM participants WHERE id = ?", (first,)
+        ).fetchone()[0]
+    assert first == again == with_role
+    assert role == "lead"
+    assert registry.cache_info()[0] == 1
+
+
+def test_integer_keys_written_by_l1_and_l2(tmp_path):
+    db = SwaifDatabase(str(tmp_path / "swaif.db"))
+    db.insert_l1_message(_l1("5511999887766@s.whatsapp.net", "5511998681314@s.whatsapp.net",
+                             "Oi", "2025-01-14T10:00:00.000Z"))
+    db.insert_l1_message(_l1(None, "5511999887766@s.whatsapp.net",
+                             "Olá", "2025-01-14T10:05:00.000Z"))
+
+    conversations = L2Grouper(db).process_pending_messages()
+
+    with db.connect() as conn:
+        lead_id = conn.execute(
+            "SELECT id FROM participants WHERE phone = '5511999887766'"
+        ).fetchone()[0]
+        senders = [r[0] for r in conn.execute("SELECT sender_id FROM messages_l1 ORDER BY id")]
+        conv = conn.execute("SELECT id, lead_id FROM conversations_l2").fetchone()
+        refs = {r[0] for r in conn.execute("SELECT conversation_ref FROM conversation_messages")}
+        activity = conn.execute("SELECT lead_id FROM lead_activity").fetchone()[0]
+
+    assert senders == [lead_id, None]
+    assert conv[1] == lead_id
+    assert refs == {conv[0]}
+    assert activity == lead_id
+    assert len(db.get_conversation_history(conversations[0]["conversation_id"])) == 2
+
+
+def test_backfill_of_legacy_rows(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    db = SwaifDatabase(str(db_path))
+
+    # Simula um banco anterior à v2: linhas sem chaves inteiras
+    with db.connect() as conn:
+        conn.execute(
+            "INSERT INTO messages_l1 (sender_phone, receiver_phone, evo_instance) "
+            "VALUES ('5511@s.whatsapp.net', '5599@s.whatsapp.net', 'clinic')"
+        )
+        conn.execute(
+            "INSERT INTO conversations_l2 (conversation_id, lead_phone, secretary_phone) "
+            "VALUES ('5511_2025-01-14', '5511', '5599')"
+        )
+        conn.execute(
+            "INSERT INTO conversation_messages (conversation_id, content) "
+            "VALUES ('5511_2025-01-14', 'Oi')"
+        )
+        conn.execute("UPDATE schema_backfills SET last_rowid = 0, completed_at = NULL")
+
+    MigrationRunner(db_path, MIGRATIONS, chunk_size=1).run()
+
+    with sqlite3.connect(db_path) as conn:
+        ids = dict(conn.execute("SELECT phone, id FROM participants"))
+        l1 = conn.execute("SELECT sender_id, receiver_id FROM messages_l1").fetchone()
+        l2 = conn.execute("SELECT id, lead_id, secretary_id FROM conversations_l2").fetchone()
+        ref = conn.execute("SELECT conversation_ref FROM conversation_messages").fetchone()[0]
+
+    assert l1 == (ids["5511"], ids["5599"])
+    assert l2[1:] == (ids["5511"], ids["5599"])
+    assert ref == l2[0]
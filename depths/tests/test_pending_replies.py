@@ -0,0 +1,96 @@
+from depths.benchmarks.synthetic import populate
+from depths.core import pending_replies
+from depths.core.database import SwaifDatabase
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rebuild import L2Rebuilder
+
+
+def _l1(lead, text, ts, from_lead=True):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": "test",
+        "host_evoapi": "test",
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def _waits(db):
+    with db.connect() as conn:
+        return conn.execute(
+            "SELECT lead_phone, waiting_since, last_message_at, unanswered "
+            "FROM pending_replies ORDER BY lead_phone"
+        ).fetchall()
+
+
+class TestPendingReplies:
+    def setup_method(self):
+        self.db = SwaifDatabase(":memory:")
+        self.grouper = L2Grouper(self.db)
+
+    def teardown_method(self):
+        self.db.cleanup()
+
+    def _ingest(self, *messages):
+        for msg in messages:
+            self.db.insert_l1_message(msg)
+        self.grouper.process_pending_messages()
+
+    def test_lead_opens_and_secretary_closes_the_wait(self):
+        self._ingest(
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+            _l1("5511", "Tem horário?", "2025-01-14T10:02:00"),
+            _l1("5522", "Olá", "2025-01-14T09:00:00-03:00"),
+            _l1("5533", "Bom dia", "2025-01-14T11:00:00"),
+        )
+        self._ingest(_l1("5533", "Bom dia!", "2025-01-14T11:05:00", from_lead=False))
+
+        result = TerminalDisplay(self.db.db_path).pending(limit=5)
+        assert result["total"] == 2
+        assert [(r["lead_phone"], r["waiting_since"], r["unanswered"]) for r in result["oldest"]] == [
+            ("5511", "2025-01-14T10:00:00+00:00", 2),
+            ("5522", "2025-01-14T12:00:00+00:00", 1),
+        ]
+        assert result["oldest"][0]["conversation_id"] == "5511_2025-01-14"
+        assert ("5533", None, "2025-01-14T11:05:00+00:00", 0) in _waits(self.db)
+
+    def test_late_reply_recomputes_the_wait(self):
+        self._ingest(
+            _l1("5511", "Oi", "2025-01-14T10:00:00"),
+            _l1("5511", "Alguém?", "2025-01-14T10:30:00"),
+        )
+        # Resposta das 10:10 entregue depois da segunda mensagem do lead
+        self._ingest(_l1("5511", "Olá!", "2025-01-14T10:10:00", from_lead=False))
+        assert _waits(self.db) == [("5511", "2025-01-14T10:30:00+00:00",
+                                    "2025-01-14T10:30:00+00:00", 1)]
+
+    def test_oldest_waiting_reads_the_partial_index(self):
+        with self.db.connect() as conn:
+            plan = " ".join(row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT lead_phone FROM pending_replies "
+                "WHERE waiting_since IS NOT NULL ORDER BY waiting_since LIMIT 20"
+            ))
+        assert "idx_pending_replies_waiting" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_rebuild_and_backfill_match_incremental(self):
+        populate(self.db.db_path, 2000, leads=50)
+        self.grouper.process_pending_messages()
+        incremental = _waits(self.db)
+        assert any(row[1] for row in incremental) and any(not row[1] for row in incremental)
+
+        L2Rebuilder(self.db).rebuild()
+        assert _waits(self.db) == incremental
+
+        with self.db.connect() as conn:
+            conn.execute("DELETE FROM pending_replies")
+            for lead_phone, lead_id in conn.execute(
+                "SELECT lead_phone, lead_id FROM lead_activity"
+            ).fetchall():
+                pending_replies.recompute(conn, lead_phone, lead_id)
+        assert _waits(self.db) == incremental
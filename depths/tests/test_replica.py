@@ -0,0 +1,67 @@
+import sqlite3
+import pytest
+from depths.core.database import SwaifDatabase
+from depths.core.replica import MemoryReplica, read_snapshot
+from depths.core.terminal_display import TerminalDisplay
+
+
+def _l1(text):
+    return {
+        "evo_api_instance_name": "test",
+        "sender_raw_data": "5511999887766@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "sent_message": text,
+        "timestamp": "2025-01-14T10:00:00",
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    return SwaifDatabase(str(tmp_path / "swaif.db"))
+
+
+def test_database_uses_wal(db):
+    with db.connect() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_snapshot_is_consistent_and_does_not_block_writers(db):
+    db.insert_l1_message(_l1("antes"))
+    with read_snapshot(db.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0] == 1
+
+        # Escrita concorrente com o snapshot aberto: sem espera por lock
+        writer = sqlite3.connect(db.db_path, timeout=0)
+        writer.execute("INSERT INTO messages_l1 (content) VALUES ('durante')")
+        writer.commit()
+        writer.close()
+
+        assert conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM messages_l1")
+
+    with read_snapshot(db.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0] == 2
+
+
+def test_memory_replica_refreshes_when_stale(db):
+    db.insert_l1_message(_l1("um"))
+    replica = MemoryReplica(db.db_path, max_age_seconds=3600)
+    with replica.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0] == 1
+
+    db.insert_l1_message(_l1("dois"))
+    with replica.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0] == 1
+    replica.max_age_seconds = 0
+    with replica.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM messages_l1").fetchone()[0] == 2
+    replica.close()
+
+
+def test_terminal_display_reads_snapshot_or_replica(db, caplog):
+    db.insert_l1_message(_l1("Olá"))
+    caplog.set_level("INFO")
+    TerminalDisplay(db.db_path).show_l1_metrics()
+    TerminalDisplay(db.db_path, replica_max_age=60).show_l1_metrics()
+    assert caplog.text.count("Total messages: 1") == 2
@@ -0,0 +1,110 @@
+import logging
+from depths.core.sharding import FederatedReader, ShardRouter, ShardWorkerPool, shard_slug
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l1_ingestion import L1Ingestion
+
+
+def _l1(instance, lead, text, ts):
+    return {
+        "host_n8n": "test",
+        "evo_api_instance_name": instance,
+        "host_evoapi": "test",
+        "sender_raw_data": f"{lead}@s.whatsapp.net",
+        "receiver_raw_data": "5511998681314@s.whatsapp.net",
+        "message_type": "conversation",
+        "sent_message": text,
+        "timestamp": ts,
+    }
+
+
+def _count(db, table):
+    with db.connect() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_shard_slug():
+    assert shard_slug("WAP_Diego-Menescal") == "WAP_Diego-Menescal"
+    assert shard_slug("../clínica 1") == "cl_nica_1"
+    assert shard_slug(None) == "default"
+
+
+def test_l1_ingestion_routes_by_instance(tmp_path):
+    router = ShardRouter(str(tmp_path / "shards"))
+    ingestion = L1Ingestion(router=router)
+
+    ingestion.process_l1_data(_l1("clinic_a", "5511", "Oi A", "2025-01-14T10:00:00Z"))
+    ingestion.process_l1_data(_l1("clinic_b", "5522", "Oi B", "2025-01-14T10:00:00Z"))
+    ingestion.process_l1_data(_l1("clinic_a", "5533", "Oi A2", "2025-01-14T11:00:00Z"))
+
+    shards = router.shards()
+    assert sorted(shards) == ["clinic_a", "clinic_b"]
+    assert _count(shards["clinic_a"], "messages_l1") == 2
+    assert _count(shards["clinic_b"], "messages_l1") == 1
+
+    # Uma nova instância do roteador redescobre os shards existentes
+    assert sorted(ShardRouter(str(tmp_path / "shards")).shards()) == ["clinic_a", "clinic_b"]
+
+
+def test_worker_pool_ingests_and_groups_per_shard(tmp_path):
+    router = ShardRouter(str(tmp_path / "shards"))
+    pool = ShardWorkerPool(router)
+    for i in range(5):
+        pool.submit(_l1("clinic_a", "5511", f"A{i}", f"2025-01-14T10:0{i}:00Z"))
+        pool.submit(_l1("clinic_b", "5522", f"B{i}", f"2025-01-14T10:0{i}:00Z"))
+    pool.join()
+    pool.close()
+
+    assert pool.stats["clinic_a"]["ingested"] == 5
+    assert pool.stats["clinic_b"]["ingested"] == 5
+    for db in router.shards().values():
+        with db.connect() as conn:
+            assert conn.execute("SELECT SUM(message_count) FROM conversations_l2").fetchone()[0] == 5
+            assert conn.execute(
+                "SELECT COUNT(*) FROM messages_l1 WHERE processed = FALSE"
+            ).fetchone()[0] == 0
+
+
+def test_federated_reads(tmp_path, caplog):
+    router = ShardRouter(str(tmp_path / "shards"))
+    ingestion = L1Ingestion(router=router)
+    ingestion.process_l1_data(_l1("clinic_a", "5511", "Quero agendar", "2025-01-14T10:00:00Z"))
+    ingestion.process_l1_data(_l1("clinic_b", "5522", "Quero remarcar", "2025-01-15T10:00:00Z"))
+    conversations = ShardWorkerPool(router).process_l2()
+    assert len(conversations) == 2
+
+    reader = FederatedReader(router)
+    history = reader.get_conversation_history("5522_2025-01-15")
+    assert [m["content"] for m in history] == ["Quero remarcar"]
+
+    found = reader.search_messages("Quero")
+    assert [(m["instance"], m["content"]) for m in found] == [
+        ("clinic_b", "Quero remarcar"),
+        ("clinic_a", "Quero agendar"),
+    ]
+
+    with caplog.at_level(logging.INFO):
+        TerminalDisplay(shard_paths=router.db_paths()).show_all_metrics()
+    assert "Total messages: 2" in caplog.text
+    assert "Total conversations: 2" in caplog.text
+
+
+def test_same_lead_and_day_in_two_shards_merges_history(tmp_path):
+    router = ShardRouter(str(tmp_path / "shards"))
+    ingestion = L1Ingestion(router=router)
+    ingestion.process_l1_data(_l1("clinic_a", "5511", "Oi clínica A", "2025-01-14T10:00:00Z"))
+    ingestion.process_l1_data(_l1("clinic_b", "5511", "Oi clínica B", "2025-01-14T09:00:00Z"))
+    ingestion.process_l1_data(_l1("clinic_a", "5511", "Ainda aí?", "2025-01-14T11:00:00Z"))
+    ShardWorkerPool(router).process_l2()
+
+    reader = FederatedReader(router)
+    history = reader.get_conversation_history("5511_2025-01-14")
+    assert [(m["instance"], m["content"]) for m in history] == [
+        ("clinic_b", "Oi clínica B"),
+        ("clinic_a", "Oi clínica A"),
+        ("clinic_a", "Ainda aí?"),
+    ]
+    only_a = reader.get_conversation_history("5511_2025-01-14", instance="clinic_a")
+    assert [m["content"] for m in only_a] == ["Oi clínica A", "Ainda aí?"]
+    assert reader.get_conversation_history("5511_2025-01-14", instance="clinic_c") == []
+    # O cache de cada shard continua sem `instance`
+    assert "instance" not in router.for_instance("clinic_a").get_conversation_history("5511_2025-01-14")[0]
@@ -0,0 +1,84 @@
+import random
+import pytest
+from depths.benchmarks.bench_sla_sketch import exact_quantile, exact_reply_latencies
+from depths.core.database import SwaifDatabase
+from depths.core.replica import read_snapshot
+from depths.core.sketches import DDSketch
+from depths.core.terminal_display import TerminalDisplay
+from depths.layers.l2_grouper import L2Grouper
+from depths.layers.l2_rollups import DailyRollups
+
+
+def _l1(lead, ts, from_lead, instance):
+    phone = f"{lead}@s.whatsapp.net"
+    return {
+        "evo_api_instance_name": instance,
+        "sender_raw_data": phone if from_lead else None,
+        "receiver_raw_data": "5511998681314@s.whatsapp.net" if from_lead else phone,
+        "sent_message": f"{lead} {ts}",
+        "timestamp": ts,
+    }
+
+
+@pytest.fixture(scope="module")
+def grouped(tmp_path_factory):
+    """Três dias, duas clínicas, respostas com latências log-normais"""
+    db = SwaifDatabase(str(tmp_path_factory.mktemp("sla") / "swaif.db"))
+    rng = random.Random(7)
+    for day in ("2025-01-14", "2025-01-15", "2025-01-16"):
+        for lead in range(40):
+            instance = "clinic_a" if lead % 2 else "clinic_b"
+            clock = 8 * 3600 + lead * 60
+            for _ in range(3):
+                db.insert_l1_message(_l1(lead, _ts(day, clock), True, instance))
+                clock += min(rng.lognormvariate(5, 1), 3000)
+                db.insert_l1_message(_l1(lead, _ts(day, clock), False, instance))
+                clock += 600
+    L2Grouper(db, listeners=[DailyRollups(db)]).process_pending_messages()
+    return db
+
+
+def _ts(day, seconds):
+    return f"{day}T{int(seconds) // 3600:02d}:{int(seconds) % 3600 // 60:02d}:{int(seconds) % 60:02d}"
+
+
+def test_sketch_quantiles_match_exact_within_relative_error(grouped):
+    with read_snapshot(grouped.db_path) as conn:
+        exact = exact_reply_latencies(conn)
+    display = TerminalDisplay(grouped.db_path)
+
+    for row in display.sla("2025-01-14", "2025-01-16"):
+        values = exact[row["day"]]
+        assert row["replies"] == len(values) == 120
+        for q in (0.5, 0.9, 0.99):
+            assert row[f"p{int(q * 100)}"] == pytest.approx(exact_quantile(values, q), rel=0.011)
+
+
+def test_buckets_merge_across_days_and_instances(grouped):
+    display = TerminalDisplay(grouped.db_path)
+    by_instance = display.sla("2025-01-14", "2025-01-16", by="instance")
+    assert [row["instance"] for row in by_instance] == ["clinic_a", "clinic_b"]
+    assert sum(row["replies"] for row in by_instance) == 360
+
+    with read_snapshot(grouped.db_path) as conn:
+        values = [v for day in exact_reply_latencies(conn).values() for v in day]
+    report = display.report("2025-01-14", "2025-01-16")
+    assert report["first_response_p90"] == pytest.approx(exact_quantile(values, 0.9), rel=0.011)
+
+    within = display.sla("2025-01-14", "2025-01-16", target_seconds=300, by="instance")
+    exact_within = sum(v <= 300 for v in values) / len(values)
+    merged = sum(r["within_target"] * r["replies"] for r in within) / 360
+    assert merged == pytest.approx(exact_within, abs=0.02)
+
+
+def test_sketch_stays_small_and_accurate_on_large_streams():
+    rng = random.Random(3)
+    values = [rng.lognormvariate(6, 2) for _ in range(200000)]
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+
+    assert len(sketch.bins) < 2048
+    assert len(sketch.to_json()) < 20000
+    for q in (0.5, 0.9, 0.99):
+        assert sketch.quantile(q) == pytest.approx(exact_quantile(values, q), rel=0.011)
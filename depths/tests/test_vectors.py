@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from depths.core.vectors import HashingEmbedder, VectorIndex
+
+
+def test_embedder_is_normalized_and_accent_insensitive():
+    embedder = HashingEmbedder(dim=256)
+    texts = ["Qual o valor da consulta?", "qual o VALOR da consulta", "Bom dia", ""]
+    embedder.fit(texts)
+    vectors = embedder.embed(texts)
+    assert vectors.dtype == np.float32 and vectors.shape == (4, 256)
+    np.testing.assert_allclose(np.linalg.norm(vectors[:3], axis=1), 1.0, rtol=1e-5)
+    assert vectors[0] @ vectors[1] == pytest.approx(1.0, abs=1e-5)
+    assert vectors[0] @ vectors[2] < 0.5
+    assert not vectors[3].any()
+
+
+def test_index_grows_persists_and_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(3000, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    index = VectorIndex(tmp_path / "idx", dim=32, chunk_rows=500)
+    for start in range(0, 3000, 700):
+        index.append(range(start + 10, min(start + 700, 3000) + 10), vectors[start:start + 700])
+    assert len(index) == 3000
+
+    reopened = VectorIndex(tmp_path / "idx", dim=32)
+    queries = vectors[:5] + 0.01
+    ids, scores = reopened.search(queries, k=3)
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :3] + 10
+    np.testing.assert_array_equal(ids, expected)
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+    with pytest.raises(ValueError):
+        VectorIndex(tmp_path / "idx", dim=64)
+
+
+def test_search_pads_when_fewer_than_k(tmp_path):
+    index = VectorIndex(tmp_path / "idx", dim=4)
+    ids, scores = index.search(np.ones((1, 4), dtype=np.float32) / 2, k=2)
+    assert ids.tolist() == [[-1, -1]] and np.isneginf(scores).all()
+    index.append([7], np.array([[1, 0, 0, 0]], dtype=np.float32))
+    ids, _ = index.search(np.array([[1, 0, 0, 0]], dtype=np.float32), k=2)
+    assert ids.tolist() == [[7, -1]]